@@ -6,7 +6,7 @@ from backend.models import get_user_by_id
 import os
 from datetime import timedelta
 from dotenv import load_dotenv # <--- 1. Importar librería
-from backend.extensions import cache
+from backend.extensions import cache, build_cache_config
 
 # 2. Cargar variables de entorno al inicio
 load_dotenv()
@@ -26,10 +26,23 @@ app.title = "Pívot"
 
 server = app.server
 
-cache.init_app(server, config={
-    'CACHE_TYPE': 'SimpleCache',
-    'CACHE_DEFAULT_TIMEOUT': 300
-})
+# Caché compartido entre workers (FileSystemCache o Redis, ver backend/extensions.py)
+cache.init_app(server, config=build_cache_config())
+
+# Una conexión por request, liberada en el teardown (ver backend/db_pool.py)
+from backend import db_pool
+db_pool.init_app(server)
+
+# Descarga de los reportes Excel generados en segundo plano (ver backend/report_export.py)
+from backend import report_export
+report_export.init_app(server)
+
+# Esquema al día antes de atender requests (ver backend/migrations.py)
+from backend.migrations import run_migrations
+try:
+    run_migrations()
+except Exception as e:
+    print(f"⚠️ Error aplicando migraciones: {e}")
 
 # --- CONFIGURACIÓN DE SEGURIDAD (MEJORADA) ---
 # 3. Leemos desde el .env. 
@@ -53,4 +66,12 @@ login_manager.login_view = '/login'
 from backend.models import get_user_by_id
 @login_manager.user_loader
 def load_user(user_id):
-    return get_user_by_id(user_id)
\ No newline at end of file
+    return get_user_by_id(user_id)
+
+# Planificador de precios en segundo plano (ver backend/market_scheduler.py)
+from backend.market_scheduler import start_scheduler
+start_scheduler(server)
+
+# Snapshot diario de patrimonio de todos los usuarios (ver backend/snapshot_job.py)
+from backend.snapshot_job import start_snapshot_job
+start_snapshot_job(server)
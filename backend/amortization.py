@@ -0,0 +1,175 @@
+# backend/amortization.py
+"""
+Motor de amortización de financiamientos (tabla installments), vectorizado.
+
+Antes la cuota (fórmula PMT) estaba copiada en tres lugares: en
+data_manager.calculate_installment_value (llamada fila por fila con iterrows
+desde get_credit_summary_data), dos veces en pages/accounts/accounts_credit.py
+y, con otra fórmula (interés plano), dentro de get_accounts_by_category con un
+apply por cuenta que volvía a filtrar todo el DataFrame.
+
+Ahora todo sale de aquí, con numpy sobre TODOS los financiamientos del usuario:
+- quota_values: cuota fija (PMT sobre la tasa anual / 12; tasa 0 -> monto / cuotas).
+- summarize: cuota, cuotas restantes, lo que falta pagar, y cuánto de eso es
+  capital (saldo insoluto, fórmula cerrada) y cuánto interés.
+- schedule: tabla de pagos completa (una fila por cuota de cada financiamiento)
+  con interés, capital, saldo y fecha estimada de las cuotas pendientes.
+
+Uso manual:
+    python -m backend.amortization 1000 24 12      # monto, tasa anual %, cuotas
+"""
+import sys
+from datetime import date
+
+import numpy as np
+import pandas as pd
+
+DEFAULT_PAYMENT_DAY = 15
+
+
+def _rates(annual_rate):
+    return np.asarray(annual_rate, dtype=np.float64) / 12 / 100
+
+
+def quota_values(amount, annual_rate, total_quotas):
+    """Cuota fija por financiamiento (escalares o arreglos). Sin cuotas -> 0."""
+    amount = np.asarray(amount, dtype=np.float64)
+    n = np.asarray(total_quotas, dtype=np.float64)
+    i = _rates(annual_rate)
+    growth = np.power(1 + i, n)
+    with np.errstate(divide='ignore', invalid='ignore'):
+        pmt = amount * i * growth / (growth - 1)
+        flat = amount / n
+    # Tasa 0 (o denominador 0): reparto lineal del monto
+    quota = np.where((i > 0) & (growth != 1), pmt, flat)
+    return np.where(n > 0, quota, 0.0)
+
+
+def _balance_after(amount, i, quota, paid):
+    """Saldo de capital después de `paid` cuotas (fórmula cerrada)."""
+    growth = np.power(1 + i, paid)
+    with np.errstate(divide='ignore', invalid='ignore'):
+        compounded = amount * growth - quota * (growth - 1) / i
+    return np.where(i > 0, compounded, amount - quota * paid)
+
+
+def _columns(df):
+    amount = pd.to_numeric(df['total_amount'], errors='coerce').fillna(0).to_numpy(np.float64)
+    rate = pd.to_numeric(df['interest_rate'], errors='coerce').fillna(0).to_numpy(np.float64)
+    total = pd.to_numeric(df['total_quotas'], errors='coerce').fillna(0).to_numpy(np.int64)
+    paid = pd.to_numeric(df['paid_quotas'], errors='coerce').fillna(0).to_numpy(np.int64)
+    return amount, rate, total, np.clip(paid, 0, np.maximum(total, 0))
+
+
+def summarize(df):
+    """
+    Copia de `df` (filas de installments) con:
+    quota_value, remaining_quotas, remaining_balance (cuotas que faltan × cuota),
+    principal_remaining, interest_remaining y total_financed (cuota × cuotas).
+    """
+    out = df.copy()
+    if df.empty:
+        for col in ('quota_value', 'remaining_quotas', 'remaining_balance', 'principal_remaining',
+                    'interest_remaining', 'total_financed'):
+            out[col] = pd.Series(dtype=np.float64)
+        return out
+
+    amount, rate, total, paid = _columns(df)
+    quota = quota_values(amount, rate, total)
+    remaining = np.maximum(total - paid, 0)
+    pending = quota * remaining
+    principal = np.where(remaining > 0, np.maximum(_balance_after(amount, _rates(rate), quota, paid), 0), 0.0)
+
+    out['quota_value'] = quota
+    out['remaining_quotas'] = remaining
+    out['remaining_balance'] = pending
+    out['principal_remaining'] = principal
+    out['interest_remaining'] = np.maximum(pending - principal, 0)
+    out['total_financed'] = np.where(total > 0, quota * total, amount)
+    return out
+
+
+def pending_by_account(df):
+    """{account_id: lo que falta pagar} sumando todos los financiamientos de cada cuenta."""
+    if df.empty:
+        return {}
+    return summarize(df).groupby('account_id')['remaining_balance'].sum().to_dict()
+
+
+def due_dates(payment_day, offsets, today):
+    """
+    Fecha del cobro número `offsets` (0 = el próximo, hoy incluido) para un día
+    de cobro mensual; si el mes es más corto se usa su último día. Vectorizado.
+    """
+    day = np.clip(np.asarray(payment_day, dtype=np.int64), 1, 31)
+    # La próxima cuota cae este mes si el día de cobro no pasó, si no el siguiente
+    this_month_dim = pd.Timestamp(today).days_in_month
+    passed = np.minimum(day, this_month_dim) < today.day
+    months = today.year * 12 + (today.month - 1) + passed.astype(np.int64) + offsets
+    first = pd.to_datetime(pd.DataFrame({'year': months // 12, 'month': months % 12 + 1, 'day': 1}))
+    return first + pd.to_timedelta(np.minimum(day, first.dt.days_in_month.to_numpy()) - 1, unit='D')
+
+
+def schedule(df, today=None):
+    """
+    Tabla de pagos de todos los financiamientos: una fila por cuota con
+    [installment_id, account_id, name, quota_number, payment, interest, principal,
+     balance, paid, due_date]. due_date solo para las cuotas pendientes.
+    """
+    columns = ['installment_id', 'account_id', 'name', 'quota_number', 'payment', 'interest',
+               'principal', 'balance', 'paid', 'due_date']
+    if df.empty:
+        return pd.DataFrame(columns=columns)
+    today = today or date.today()
+
+    amount, rate, total, paid = _columns(df)
+    total = np.maximum(total, 0)
+    quota = quota_values(amount, rate, total)
+    i = _rates(rate)
+
+    # Una fila por cuota: repetimos cada financiamiento `total` veces
+    idx = np.repeat(np.arange(len(df)), total)
+    if len(idx) == 0:
+        return pd.DataFrame(columns=columns)
+    k = np.arange(len(idx)) - np.repeat(np.cumsum(total) - total, total) + 1
+
+    before = _balance_after(amount[idx], i[idx], quota[idx], k - 1)
+    after = _balance_after(amount[idx], i[idx], quota[idx], k)
+    interest = np.where(i[idx] > 0, before * i[idx], 0.0)
+    is_paid = k <= paid[idx]
+
+    pay_day = (pd.to_numeric(df['payment_day'], errors='coerce').fillna(DEFAULT_PAYMENT_DAY).to_numpy()
+               if 'payment_day' in df else np.full(len(df), DEFAULT_PAYMENT_DAY))
+    due = pd.Series([None] * len(idx), dtype=object)
+    pending = ~is_paid
+    if pending.any():
+        due[pending] = due_dates(pay_day[idx][pending], (k - paid[idx] - 1)[pending], today).dt.date.to_numpy()
+
+    return pd.DataFrame({
+        'installment_id': df['id'].to_numpy()[idx] if 'id' in df else idx,
+        'account_id': df['account_id'].to_numpy()[idx] if 'account_id' in df else None,
+        'name': df['name'].to_numpy()[idx] if 'name' in df else None,
+        'quota_number': k,
+        'payment': quota[idx],
+        'interest': interest,
+        'principal': quota[idx] - interest,
+        'balance': np.maximum(after, 0),
+        'paid': is_paid,
+        'due_date': due.to_numpy(),
+    }, columns=columns)
+
+
+if __name__ == "__main__":
+    # Autochequeo: tabla de un préstamo y coherencia con el resumen
+    amount, rate, n = (float(a) for a in (sys.argv[1:4] if len(sys.argv) > 3 else (1000, 24, 12)))
+    demo = pd.DataFrame([{'id': 1, 'account_id': 1, 'name': 'Demo', 'total_amount': amount,
+                          'interest_rate': rate, 'total_quotas': int(n), 'paid_quotas': 0,
+                          'payment_day': DEFAULT_PAYMENT_DAY}])
+    table = schedule(demo)
+    print(table.to_string(index=False, float_format=lambda v: f"{v:,.2f}"))
+    summary = summarize(demo).iloc[0]
+    print(f"\nCuota: {summary['quota_value']:,.2f} | Total: {summary['total_financed']:,.2f} | "
+          f"Interés: {table['interest'].sum():,.2f}")
+    assert abs(table['principal'].sum() - amount) < 1e-6, "El capital amortizado no suma el monto"
+    assert abs(table['balance'].iloc[-1]) < 1e-6, "El saldo final no es 0"
+    print("✅ Tabla consistente")
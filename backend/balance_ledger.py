@@ -0,0 +1,275 @@
+# backend/balance_ledger.py
+"""
+Libro de movimientos de saldo (tabla balance_ledger).
+
+Antes accounts.current_balance (y abono_reserve.balance) solo se movía de forma
+incremental en _adjust_account_balance: un SELECT del tipo/saldo y luego un
+UPDATE por llamada, sin forma de saber si el saldo guardado seguía siendo la
+suma de lo que se le aplicó (una escritura a medias o un UPDATE a mano dejaba
+el saldo corrido para siempre).
+
+Ahora cada cambio de saldo deja un asiento (seq, user_id, account_id, delta,
+kind) DENTRO de la misma transacción que mueve el saldo:
+- seq es la clave autoincremental: el orden exacto en que se aplicaron.
+- account_id es texto: el id de la cuenta o 'RESERVE' (reserva de abono).
+- kind: 'Income'/'Expense' (o 'reversal:...' al revertir), 'opening' (saldo
+  inicial de una cuenta nueva o existente al migrar), 'manual' (edición directa
+  del saldo), 'card_payment', 'repair'.
+- adjust() aplica el cambio en el saldo y el asiento sin leer antes la cuenta:
+  el signo según el tipo (tarjeta o no) lo resuelve el CASE en SQL.
+
+El saldo de cualquier cuenta sale del libro con un solo SUM(delta) agrupado, y
+verify() lo compara contra el guardado para todas las cuentas de todos los
+usuarios (dos consultas y un merge en pandas).
+
+Uso manual:
+    python -m backend.balance_ledger                  # verifica todos los usuarios
+    python -m backend.balance_ledger --user 3         # solo un usuario
+    python -m backend.balance_ledger --repair         # saldo guardado := saldo del libro
+    python -m backend.balance_ledger --adopt          # el libro acepta el saldo guardado (asiento 'repair')
+"""
+import sys
+from datetime import datetime
+
+import numpy as np
+import pandas as pd
+
+from backend import concurrency
+
+RESERVE = 'RESERVE'
+TOLERANCE = 0.005
+
+_COLUMNS = "(user_id, account_id, delta, kind, created_at)"
+# Mismo criterio de signo que _adjust_account_balance: en tarjetas el gasto SUMA deuda
+_SIGNED = "CASE WHEN type = 'Credit' THEN ? ELSE ? END"
+# Disponible de la fila (tarjeta: límite - deuda; el resto: saldo), igual que _check_sufficient_funds
+_AVAILABLE = "CASE WHEN type = 'Credit' THEN COALESCE(credit_limit, 0) - current_balance ELSE current_balance END"
+
+
+def _now():
+    return datetime.now().strftime('%Y-%m-%d %H:%M:%S')
+
+
+def signed_changes(amount, trans_type, is_reversal=False):
+    """(cambio si la cuenta es tarjeta, cambio si no lo es) de un movimiento."""
+    base = -amount if is_reversal else amount
+    return (base, -base) if trans_type == 'Expense' else (-base, base)
+
+
+def _guard(min_available):
+    """Condición de fondos para el WHERE: el disponible de la fila al momento de escribir."""
+    return "" if min_available is None else f" AND {_AVAILABLE} >= ?"
+
+
+def adjust(cursor, user_id, account_id, amount, trans_type, is_reversal=False, min_available=None):
+    """
+    Mueve el saldo de una cuenta y deja su asiento (sin SELECT previo). Cuenta inexistente: no hace nada.
+    min_available: el UPDATE solo aplica si la cuenta tiene al menos ese disponible al
+    escribir; si no, StaleRow (ver backend/concurrency.py).
+    """
+    credit_change, other_change = signed_changes(amount, trans_type, is_reversal)
+    kind = f"reversal:{trans_type}" if is_reversal else trans_type
+    params = (credit_change, other_change, account_id, user_id)
+    cursor.execute(f"UPDATE accounts SET current_balance = current_balance + {_SIGNED} "
+                   f"WHERE id = ? AND user_id = ?{_guard(min_available)}",
+                   params if min_available is None else params + (min_available,))
+    if min_available is not None:
+        concurrency.expect_row(cursor, "El disponible de la cuenta")
+    cursor.execute(f"INSERT INTO balance_ledger {_COLUMNS} "
+                   f"SELECT user_id, CAST(id AS TEXT), {_SIGNED}, ?, ? FROM accounts WHERE id = ? AND user_id = ?",
+                   (credit_change, other_change, kind, _now(), account_id, user_id))
+
+
+def adjust_many(cursor, user_id, changes, kind, min_available=None):
+    """
+    Varios cambios ya agrupados por cuenta [(account_id, cambio si es tarjeta, cambio si no)]:
+    un UPDATE y un asiento por cuenta, enviados con executemany.
+    min_available {account_id: disponible mínimo}: esas cuentas van con la condición de
+    fondos en su UPDATE (una por una, para saber cuál no aplicó) y StaleRow si no alcanza.
+    """
+    guards = {str(a): float(v) for a, v in (min_available or {}).items()}
+    now = _now()
+    free = [(c, o, a, user_id) for a, c, o in changes if str(a) not in guards]
+    if free:
+        cursor.executemany(f"UPDATE accounts SET current_balance = current_balance + {_SIGNED} WHERE id = ? AND user_id = ?",
+                           free)
+    deltas = {str(a): (c, o) for a, c, o in changes}
+    for acc, needed in guards.items():
+        c, o = deltas.get(acc, (0.0, 0.0))
+        cursor.execute(f"UPDATE accounts SET current_balance = current_balance + {_SIGNED} "
+                       f"WHERE id = ? AND user_id = ?{_guard(needed)}", (c, o, acc, user_id, needed))
+        concurrency.expect_row(cursor, "El disponible de la cuenta")
+    if changes:
+        cursor.executemany(f"INSERT INTO balance_ledger {_COLUMNS} "
+                           f"SELECT user_id, CAST(id AS TEXT), {_SIGNED}, ?, ? FROM accounts WHERE id = ? AND user_id = ?",
+                           [(c, o, kind, now, a, user_id) for a, c, o in changes])
+
+
+def record(cursor, user_id, account_id, delta, kind):
+    """Asiento de un cambio ya aplicado (ej. la reserva de abono)."""
+    cursor.execute(f"INSERT INTO balance_ledger {_COLUMNS} VALUES (?, ?, ?, ?, ?)",
+                   (user_id, str(account_id), delta, kind, _now()))
+
+
+def record_set(cursor, user_id, account_id, new_balance, kind='manual'):
+    """
+    Antes de fijar un saldo a mano (editar cuenta/reserva): asiento por la
+    diferencia contra el saldo guardado. Si no cambia no deja asiento.
+    """
+    if str(account_id) == RESERVE:
+        cursor.execute("SELECT COALESCE(SUM(balance), 0) FROM abono_reserve WHERE user_id = ?", (user_id,))
+        delta = float(new_balance) - float(cursor.fetchone()[0] or 0)
+        if delta:
+            record(cursor, user_id, RESERVE, delta, kind)
+        return
+    cursor.execute(f"INSERT INTO balance_ledger {_COLUMNS} "
+                   f"SELECT user_id, CAST(id AS TEXT), ? - COALESCE(current_balance, 0), ?, ? FROM accounts "
+                   f"WHERE id = ? AND user_id = ? AND COALESCE(current_balance, 0) <> ?",
+                   (new_balance, kind, _now(), account_id, user_id, new_balance))
+
+
+def record_opening(cursor, user_id, account_id=None):
+    """Saldo inicial de una cuenta recién creada (sin account_id: la última del usuario)."""
+    sql = (f"INSERT INTO balance_ledger {_COLUMNS} "
+           f"SELECT user_id, CAST(id AS TEXT), COALESCE(current_balance, 0), 'opening', ? FROM accounts WHERE user_id = ? AND id = ")
+    if account_id is None:
+        cursor.execute(sql + "(SELECT MAX(id) FROM accounts WHERE user_id = ?)", (_now(), user_id, user_id))
+    else:
+        cursor.execute(sql + "?", (_now(), user_id, account_id))
+
+
+def forget(cursor, user_id, account_id=None):
+    """Borra los asientos de una cuenta (o de todo el usuario) junto con ella."""
+    if account_id is None:
+        cursor.execute("DELETE FROM balance_ledger WHERE user_id = ?", (user_id,))
+    else:
+        cursor.execute("DELETE FROM balance_ledger WHERE user_id = ? AND account_id = ?", (user_id, str(account_id)))
+
+
+def seed(cursor):
+    """Asiento 'opening' con el saldo actual de cada cuenta y reserva (al crear el libro)."""
+    now = _now()
+    cursor.execute(f"INSERT INTO balance_ledger {_COLUMNS} "
+                   f"SELECT user_id, CAST(id AS TEXT), COALESCE(current_balance, 0), 'opening', ? FROM accounts",
+                   (now,))
+    cursor.execute(f"INSERT INTO balance_ledger {_COLUMNS} "
+                   f"SELECT user_id, ?, SUM(COALESCE(balance, 0)), 'opening', ? FROM abono_reserve GROUP BY user_id",
+                   (RESERVE, now))
+
+
+def _user_filter(user_ids, column='user_id'):
+    if user_ids is None:
+        return "1 = 1", []
+    params = [str(u) for u in user_ids]
+    return f"{column} IN ({','.join('?' * len(params))})", params
+
+
+def _frame(cursor, sql, params, columns):
+    cursor.execute(sql, params)
+    df = pd.DataFrame(cursor.fetchall(), columns=columns)
+    df['user_id'] = df['user_id'].astype(str)
+    df['account_id'] = df['account_id'].astype(str)
+    df[columns[-1]] = pd.to_numeric(df[columns[-1]], errors='coerce').fillna(0.0)
+    return df
+
+
+def balances(conn, user_ids=None):
+    """Saldo de cada cuenta según el libro (un solo SUM agrupado): [user_id, account_id, ledger]."""
+    where, params = _user_filter(user_ids)
+    return _frame(conn.cursor(),
+                  f"SELECT user_id, account_id, SUM(delta) FROM balance_ledger WHERE {where} GROUP BY user_id, account_id",
+                  params, ['user_id', 'account_id', 'ledger'])
+
+
+def stored_balances(conn, user_ids=None):
+    """Saldo guardado de cada cuenta y de la reserva: [user_id, account_id, stored]."""
+    where, params = _user_filter(user_ids)
+    return _frame(conn.cursor(),
+                  f"SELECT user_id, CAST(id AS TEXT), current_balance FROM accounts WHERE {where} "
+                  f"UNION ALL SELECT user_id, '{RESERVE}', SUM(balance) FROM abono_reserve WHERE {where} GROUP BY user_id",
+                  params + params, ['user_id', 'account_id', 'stored'])
+
+
+def verify(conn, user_ids=None, tolerance=TOLERANCE):
+    """
+    Cuentas cuyo saldo guardado no coincide con el libro:
+    DataFrame [user_id, account_id, stored, ledger, drift] (drift = guardado - libro).
+    Los asientos de cuentas que ya no existen no cuentan.
+    """
+    stored = stored_balances(conn, user_ids)
+    merged = stored.merge(balances(conn, user_ids), on=['user_id', 'account_id'], how='left')
+    merged['ledger'] = merged['ledger'].fillna(0.0)
+    merged['drift'] = (merged['stored'] - merged['ledger']).round(2)
+    bad = merged[np.abs(merged['stored'] - merged['ledger']) >= tolerance]
+    return bad.sort_values(['user_id', 'account_id']).reset_index(drop=True)
+
+
+def repair(cursor, mismatches, adopt=False):
+    """
+    Corrige las diferencias de verify():
+    - por defecto el saldo guardado pasa a ser el del libro;
+    - adopt=True deja un asiento 'repair' para que el libro acepte el saldo guardado.
+    Retorna los usuarios tocados.
+    """
+    if mismatches.empty:
+        return []
+    if adopt:
+        now = _now()
+        cursor.executemany(f"INSERT INTO balance_ledger {_COLUMNS} VALUES (?, ?, ?, 'repair', ?)",
+                           [(u, a, float(d), now) for u, a, d in
+                            mismatches[['user_id', 'account_id', 'drift']].itertuples(index=False)])
+    else:
+        reserve = mismatches['account_id'] == RESERVE
+        accounts = mismatches[~reserve]
+        if not accounts.empty:
+            cursor.executemany("UPDATE accounts SET current_balance = ? WHERE id = ? AND user_id = ?",
+                               [(float(l), a, u) for u, a, l in
+                                accounts[['user_id', 'account_id', 'ledger']].itertuples(index=False)])
+        if reserve.any():
+            cursor.executemany("UPDATE abono_reserve SET balance = ? WHERE user_id = ?",
+                               [(float(l), u) for u, l in
+                                mismatches[reserve][['user_id', 'ledger']].itertuples(index=False)])
+    return sorted(set(mismatches['user_id']))
+
+
+def history(conn, user_id, account_id):
+    """Asientos de una cuenta en orden con el saldo acumulado: [seq, created_at, kind, delta, balance]."""
+    df = pd.read_sql_query(
+        "SELECT seq, created_at, kind, delta FROM balance_ledger WHERE user_id = ? AND account_id = ? ORDER BY seq",
+        conn, params=(str(user_id), str(account_id)))
+    df['balance'] = df['delta'].cumsum()
+    return df
+
+
+if __name__ == "__main__":
+    import time
+    from app import server
+    from backend.data_manager import get_connection
+    from backend.cache_deps import invalidate
+
+    args = sys.argv[1:]
+    target = [args[args.index('--user') + 1]] if '--user' in args else None
+    fix, adopt = '--repair' in args, '--adopt' in args
+
+    with server.app_context():
+        conn = get_connection()
+        try:
+            t0 = time.perf_counter()
+            mismatches = verify(conn, target)
+            for row in mismatches.head(20).itertuples():
+                print(f"  ✗ usuario {row.user_id} cuenta {row.account_id}: guardado={row.stored:,.2f} "
+                      f"libro={row.ledger:,.2f} (diferencia {row.drift:+,.2f})")
+            print(f"{len(mismatches)} cuentas desincronizadas ({time.perf_counter() - t0:.2f}s)")
+            if mismatches.empty or not (fix or adopt):
+                sys.exit(1 if len(mismatches) else 0)
+
+            users = repair(conn.cursor(), mismatches, adopt=adopt)
+            conn.commit()
+        finally:
+            conn.close()
+
+        if not adopt:
+            # Cambió el saldo guardado: lo que está en caché de esos usuarios quedó viejo
+            for uid in users:
+                invalidate(uid, 'accounts', 'abono_reserve')
+        print(f"✅ {len(mismatches)} cuentas corregidas ({'asiento repair' if adopt else 'saldo := libro'})")
@@ -0,0 +1,114 @@
+# backend/cache_deps.py
+"""
+Caché por usuario con dependencias por tabla.
+
+Cada función memoizada declara qué tablas lee. La clave de caché incluye el
+user_id y la "versión" actual de cada una de esas tablas para ese usuario.
+Una escritura solo cambia la versión de las tablas que tocó (y solo para ese
+usuario), así las entradas viejas quedan huérfanas y expiran solas sin
+obligar a los demás usuarios a recalcular todo.
+"""
+import functools
+import hashlib
+import inspect
+import uuid
+
+from backend.extensions import cache
+
+# Tablas compartidas entre usuarios (no llevan user_id): su versión es global.
+GLOBAL_TABLES = {'market_cache'}
+
+# Registro de funciones memoizadas -> tablas que leen (útil para invalidar todo).
+_REGISTRY = {}
+
+
+def _version_key(user_id, table):
+    if table in GLOBAL_TABLES:
+        return f"pivot:v:{table}"
+    return f"pivot:v:{user_id}:{table}"
+
+
+def _new_token():
+    return uuid.uuid4().hex[:12]
+
+
+def _current_versions(user_id, tables):
+    """Devuelve la versión vigente de cada tabla. Si no existe (o fue expulsada), crea una nueva."""
+    keys = [_version_key(user_id, t) for t in tables]
+    values = list(cache.get_many(*keys)) if keys else []
+    for i, val in enumerate(values):
+        if val is None:
+            # add() no pisa un token que otro proceso haya creado en paralelo
+            cache.add(keys[i], _new_token(), timeout=0)
+            values[i] = cache.get(keys[i])
+    return values
+
+
+def table_versions(user_id, tables):
+    """Versión vigente de cada tabla para ese usuario (sirve para armar claves de caché propias)."""
+    return tuple(_current_versions(user_id, tuple(tables)))
+
+
+def _entry_key(fn, arguments, versions):
+    raw = repr((sorted((k, repr(v)) for k, v in arguments.items()), versions))
+    digest = hashlib.md5(raw.encode('utf-8')).hexdigest()
+    return f"pivot:m:{fn.__module__}.{fn.__qualname__}:{arguments.get('user_id')}:{digest}"
+
+
+def user_cached(*tables, timeout=300, user_arg='user_id'):
+    """
+    Reemplazo de @cache.memoize para funciones por usuario.
+    tables: tablas que lee la función (ej. 'transactions', 'accounts').
+    user_arg: nombre del parámetro que trae el user_id.
+    """
+    def decorator(fn):
+        sig = inspect.signature(fn)
+
+        @functools.wraps(fn)
+        def wrapper(*args, **kwargs):
+            bound = sig.bind(*args, **kwargs)
+            bound.apply_defaults()
+            arguments = dict(bound.arguments)
+            arguments['user_id'] = arguments.get(user_arg)
+            try:
+                versions = _current_versions(arguments['user_id'], tables)
+                key = _entry_key(fn, arguments, versions)
+                hit = cache.get(key)
+            except Exception:
+                # Sin contexto de app o backend caído: calculamos directo
+                return fn(*args, **kwargs)
+
+            if hit is not None:
+                return hit[0]
+
+            value = fn(*args, **kwargs)
+            try:
+                # Guardamos en tupla para poder cachear también resultados None
+                cache.set(key, (value,), timeout=timeout)
+            except Exception as e:
+                print(f"⚠️ No se pudo guardar en caché {fn.__name__}: {e}")
+            return value
+
+        wrapper.tables = tuple(tables)
+        wrapper.uncached = fn
+        _REGISTRY[fn.__qualname__] = wrapper
+        return wrapper
+    return decorator
+
+
+def invalidate(user_id, *tables):
+    """Sube la versión de las tablas indicadas solo para este usuario (o global si aplica)."""
+    if not tables:
+        return
+    try:
+        cache.set_many({_version_key(user_id, t): _new_token() for t in set(tables)}, timeout=0)
+    except Exception as e:
+        print(f"⚠️ Error invalidando caché ({tables}): {e}")
+
+
+def invalidate_user(user_id):
+    """Invalida todas las tablas conocidas de un usuario (login/logout)."""
+    tables = set()
+    for wrapper in _REGISTRY.values():
+        tables.update(wrapper.tables)
+    invalidate(user_id, *(tables - GLOBAL_TABLES))
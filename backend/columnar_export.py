@@ -0,0 +1,495 @@
+# backend/columnar_export.py
+"""
+Exportación / importación columnar (Parquet) de los datos de un usuario.
+
+El Excel de /reportes es cómodo para leer pero lento de escribir y pesado.
+Para respaldos y para cargar los datos en herramientas de análisis (pandas,
+DuckDB, Polars...) se genera un .zip con un Parquet por tabla:
+
+    manifest.json                 formato, usuario, rango de fechas, filas por tabla
+    accounts.parquet              estado actual de las cuentas (sin filtro de fechas)
+    investments.parquet           posiciones actuales (sin filtro de fechas)
+    transactions.parquet          movimientos del rango
+    investment_transactions.parquet
+    historical_net_worth.parquet
+
+- Las filas salen de la base con fetchmany y se escriben como record batches
+  (pyarrow.parquet.ParquetWriter): la memoria no depende del tamaño del usuario.
+- Mismo filtro de fechas que el Excel (report_export.date_bounds).
+- Las fechas se guardan tal cual (texto ISO 'YYYY-MM-DD[ HH:MM]') para que
+  exportar -> importar no pierda nada.
+
+La importación (import_dataset) lee los Parquet por lotes y agrega al usuario
+lo que no tenga:
+- Cuentas: se emparejan por (nombre, tipo); las que no existen se crean con
+  el saldo exportado. Los saldos de cuentas existentes NO se tocan.
+- Posiciones: igual que las cuentas, por ticker; las que el usuario ya tiene
+  NO se tocan. Respaldos sin investments.parquet: las posiciones que falten se
+  rehacen desde las operaciones (unidades netas × último costo promedio).
+- Movimientos e inversiones: sin duplicar lo existente (misma huella + número
+  de ocurrencia que el importador de extractos), con executemany, rollups
+  agrupados y el caché del libro marcado desde el primer día importado.
+  Los movimientos de cuentas que no vienen en el respaldo no se importan y
+  se cuentan en el resumen ('skipped').
+- Historial de patrimonio: los días que ya existen se conservan.
+
+Usa pyarrow (en requirements.txt). Si falta en una instalación, /reportes
+muestra la opción Parquet deshabilitada en vez de fallar (ver parquet_available).
+
+Uso manual:
+    python -m backend.columnar_export --user 3 --from 2020-01-01 --to 2025-12-31 respaldo.zip
+    python -m backend.columnar_export --user 3 --import respaldo.zip
+"""
+import json
+import sys
+import time
+import zipfile
+from datetime import datetime
+from pathlib import Path
+
+import numpy as np
+import pandas as pd
+
+from backend import rollups, ledger_history, balance_ledger
+from backend.report_export import FETCH_ROWS, date_bounds
+
+FORMAT_VERSION = 1
+BATCH_ROWS = 50_000
+
+# Columnas exportadas por tabla (sin user_id) y su tipo en Arrow
+TABLES = {
+    'accounts': [('id', 'int'), ('name', 'str'), ('type', 'str'), ('current_balance', 'float'),
+                 ('bank_name', 'str'), ('credit_limit', 'float'), ('payment_day', 'int'),
+                 ('cutoff_day', 'int'), ('interest_rate', 'float'), ('display_order', 'int'),
+                 ('deferred_balance', 'float')],
+    'investments': [('id', 'int'), ('ticker', 'str'), ('shares', 'float'), ('avg_price', 'float'),
+                    ('total_investment', 'float'), ('asset_type', 'str'), ('account_id', 'int'),
+                    ('display_order', 'int')],
+    'transactions': [('id', 'int'), ('date', 'str'), ('name', 'str'), ('amount', 'float'),
+                     ('category', 'str'), ('type', 'str'), ('account_id', 'int'), ('subcategory', 'str')],
+    'investment_transactions': [('id', 'int'), ('date', 'str'), ('ticker', 'str'), ('type', 'str'),
+                                ('shares', 'float'), ('price', 'float'), ('total_transaction', 'float'),
+                                ('avg_cost_at_trade', 'float'), ('realized_pl', 'float')],
+    'historical_net_worth': [('date', 'str'), ('net_worth', 'float')],
+}
+DATED_TABLES = ('transactions', 'investment_transactions', 'historical_net_worth')
+
+# Reporte del formulario de /reportes -> tablas exportadas
+# (las operaciones llevan las posiciones: sin ellas el respaldo no se puede reimportar completo)
+REPORT_TABLES = {
+    'transactions': ('transactions',),
+    'investments_current': ('investments',),
+    'investments_history': ('investment_transactions', 'investments'),
+    'net_worth': ('historical_net_worth',),
+    'accounts': ('accounts',),
+}
+
+# Columnas que identifican un movimiento al deduplicar
+_DEDUPE_KEYS = {
+    'transactions': ['date', 'amount', 'type', 'name', 'category', 'account_id'],
+    'investment_transactions': ['date', 'ticker', 'type', 'shares', 'price'],
+}
+
+
+def parquet_available():
+    """¿Está pyarrow instalado? (la página de reportes solo ofrece Parquet si lo está)."""
+    try:
+        _pyarrow()
+    except RuntimeError:
+        return False
+    return True
+
+
+def _pyarrow():
+    try:
+        import pyarrow as pa
+        import pyarrow.parquet as pq
+    except ImportError:
+        raise RuntimeError("La exportación Parquet requiere pyarrow (pip install pyarrow).")
+    return pa, pq
+
+
+def _schema(pa, table):
+    types = {'int': pa.int64(), 'float': pa.float64(), 'str': pa.string()}
+    return pa.schema([(name, types[kind]) for name, kind in TABLES[table]])
+
+
+# --- EXPORTACIÓN ---
+
+def _column(pa, values, arrow_type):
+    """Columna de un lote -> pa.Array. Valores que no encajan en el tipo (ej. 'RESERVE' en account_id) -> nulo."""
+    try:
+        return pa.array(values, type=arrow_type)
+    except (pa.ArrowInvalid, pa.ArrowTypeError, TypeError, ValueError):
+        if pa.types.is_string(arrow_type):
+            return pa.array([None if v is None else str(v) for v in values], type=arrow_type)
+        coerced = pd.to_numeric(pd.Series(values, dtype=object), errors='coerce')
+        if pa.types.is_integer(arrow_type):
+            coerced = coerced.round().astype('Int64')
+        return pa.array(coerced, type=arrow_type, from_pandas=True)
+
+
+def _export_table(pa, pq, zf, conn, table, user_id, start_date, end_date, on_rows=None):
+    columns = [name for name, _ in TABLES[table]]
+    where, params = date_bounds(start_date, end_date) if table in DATED_TABLES else ("", [])
+    order = " ORDER BY date, id" if table in DATED_TABLES else " ORDER BY id"
+    cursor = conn.cursor()
+    cursor.execute(f"SELECT {', '.join(columns)} FROM {table} WHERE user_id = ? {where}{order}",
+                   [user_id] + params)
+
+    schema = _schema(pa, table)
+    rows = 0
+    # Los Parquet ya van comprimidos: el zip solo los agrupa (ZIP_STORED)
+    with zf.open(f"{table}.parquet", 'w', force_zip64=True) as fh:
+        with pq.ParquetWriter(pa.PythonFile(fh, mode='w'), schema, compression='zstd') as writer:
+            while True:
+                batch = cursor.fetchmany(FETCH_ROWS)
+                if not batch:
+                    break
+                arrays = [_column(pa, list(col), field.type) for col, field in zip(zip(*batch), schema)]
+                writer.write_batch(pa.RecordBatch.from_arrays(arrays, schema=schema))
+                rows += len(batch)
+                if on_rows:
+                    on_rows(rows)
+    return rows
+
+
+def build_dataset(path, user_id, tables=None, start_date=None, end_date=None, conn=None, on_progress=None):
+    """
+    Escribe el .zip con un Parquet por tabla. tables: nombres de TABLES o claves del
+    formulario de reportes (None = todas). Retorna {tabla: filas} ({} si no había datos).
+    """
+    pa, pq = _pyarrow()
+    wanted = set(tables or TABLES)
+    selected = [t for t in TABLES if t in wanted or any(t in REPORT_TABLES.get(k, ()) for k in wanted)]
+
+    own_conn = conn is None
+    if own_conn:
+        from backend.data_manager import get_connection
+        conn = get_connection()
+
+    path = Path(path)
+    tmp_path = path.with_suffix(path.suffix + ".part")
+    written = {}
+    try:
+        with zipfile.ZipFile(tmp_path, 'w', compression=zipfile.ZIP_STORED) as zf:
+            for n, table in enumerate(selected):
+                if on_progress:
+                    on_progress(n / len(selected), f"Exportando '{table}'...")
+                written[table] = _export_table(
+                    pa, pq, zf, conn, table, user_id, start_date, end_date,
+                    on_rows=(lambda r, n=n, t=table: on_progress(n / len(selected), f"'{t}': {r:,} filas"))
+                    if on_progress else None)
+            zf.writestr('manifest.json', json.dumps({
+                'format': 'pivot-dataset', 'version': FORMAT_VERSION, 'user_id': str(user_id),
+                'exported_at': datetime.now().isoformat(timespec='seconds'),
+                'start_date': str(start_date)[:10] if start_date else None,
+                'end_date': str(end_date)[:10] if end_date else None,
+                'rows': written,
+            }, indent=2))
+        if not any(written.values()):
+            return {}
+        tmp_path.replace(path)
+        return written
+    finally:
+        if own_conn:
+            conn.close()
+        tmp_path.unlink(missing_ok=True)
+
+
+# --- IMPORTACIÓN ---
+
+def _key_frame(df, table):
+    """Columnas de la huella normalizadas (igual para lo leído del Parquet y de la base)."""
+    kinds = dict(TABLES[table])
+    out = {}
+    for col in _DEDUPE_KEYS[table]:
+        values = df[col]
+        if col == 'date':
+            out[col] = values.astype(str).str.slice(0, 16).to_numpy()
+        elif kinds[col] == 'float':
+            out[col] = np.round(pd.to_numeric(values, errors='coerce').fillna(0).to_numpy(float) * 1e6).astype(np.int64)
+        elif kinds[col] == 'int':
+            out[col] = pd.to_numeric(values, errors='coerce').fillna(-1).astype(np.int64).to_numpy()
+        else:
+            out[col] = values.fillna('').astype(str).str.strip().to_numpy()
+    return pd.DataFrame(out)
+
+
+def _hashes(df, table):
+    return pd.Series(pd.util.hash_pandas_object(_key_frame(df, table), index=False).values, index=df.index)
+
+
+def _existing(cursor, table, user_id, first_day, last_day):
+    columns = _DEDUPE_KEYS[table]
+    cursor.execute(f"SELECT {', '.join(columns)} FROM {table} WHERE user_id = ? AND date >= ? AND date <= ?",
+                   (user_id, first_day, last_day))
+    rows = cursor.fetchall()
+    if not rows:
+        return pd.MultiIndex.from_arrays([[], []])
+    keys = _hashes(pd.DataFrame(rows, columns=columns), table)
+    return pd.MultiIndex.from_arrays([keys.values, keys.groupby(keys).cumcount().values])
+
+
+def _read_batches(pq, pa, zf, table):
+    """DataFrames de hasta BATCH_ROWS filas de <tabla>.parquet (vacío si el zip no la trae)."""
+    name = f"{table}.parquet"
+    if name not in zf.namelist():
+        return
+    with zf.open(name) as fh:
+        pf = pq.ParquetFile(pa.PythonFile(fh, mode='r'))
+        for batch in pf.iter_batches(batch_size=BATCH_ROWS):
+            yield batch.to_pandas()
+
+
+def _in_range(df, start_date, end_date):
+    day = df['date'].astype(str).str.slice(0, 10)
+    mask = pd.Series(True, index=df.index)
+    if start_date:
+        mask &= day >= str(start_date)[:10]
+    if end_date:
+        mask &= day <= str(end_date)[:10]
+    return df[mask]
+
+
+def _import_accounts(cursor, user_id, df, same_user=False):
+    """
+    {id exportado: id local}. Respaldo del mismo usuario: primero por id. Después por
+    (nombre, tipo), cada cuenta local una sola vez (puede haber nombres repetidos);
+    las que sobren se crean.
+    """
+    cursor.execute("SELECT id, name, type FROM accounts WHERE user_id = ? ORDER BY id", (user_id,))
+    local_rows = cursor.fetchall()
+    rows = df.astype(object).where(df.notna(), None).sort_values('id').to_dict('records')
+
+    mapping = {}
+    if same_user:
+        local_ids = {acc_id for acc_id, _, _ in local_rows}
+        mapping = {int(r['id']): int(r['id']) for r in rows if int(r['id']) in local_ids}
+    free = {}
+    for acc_id, name, acc_type in local_rows:
+        if acc_id not in mapping.values():
+            free.setdefault((name, acc_type), []).append(acc_id)
+
+    created = 0
+    columns = [name for name, _ in TABLES['accounts'] if name != 'id']
+    for row in rows:
+        if int(row['id']) in mapping:
+            continue
+        candidates = free.get((row['name'], row['type']))
+        if candidates:
+            mapping[int(row['id'])] = candidates.pop(0)
+            continue
+        cursor.execute(f"INSERT INTO accounts (user_id, {', '.join(columns)}) "
+                       f"VALUES (?, {', '.join('?' * len(columns))})",
+                       [user_id] + [row[c] for c in columns])
+        cursor.execute("SELECT MAX(id) FROM accounts WHERE user_id = ? AND name = ? AND type = ?",
+                       (user_id, row['name'], row['type']))
+        mapping[int(row['id'])] = cursor.fetchone()[0]
+        balance_ledger.record_opening(cursor, user_id, mapping[int(row['id'])])
+        created += 1
+    return mapping, created
+
+
+def _import_positions(cursor, user_id, df, account_map):
+    """Crea las posiciones (por ticker) que el usuario no tiene. Retorna cuántas creó."""
+    cursor.execute("SELECT ticker FROM investments WHERE user_id = ?", (user_id,))
+    local = {r[0] for r in cursor.fetchall()}
+    rows = df.astype(object).where(df.notna(), None).sort_values('id').to_dict('records')
+
+    created = 0
+    columns = [name for name, _ in TABLES['investments'] if name != 'id']
+    for row in rows:
+        if not row['ticker'] or row['ticker'] in local:
+            continue
+        if row['account_id'] is not None:
+            row['account_id'] = account_map.get(int(row['account_id']))
+        cursor.execute(f"INSERT INTO investments (user_id, {', '.join(columns)}) "
+                       f"VALUES (?, {', '.join('?' * len(columns))})",
+                       [user_id] + [row[c] for c in columns])
+        local.add(row['ticker'])
+        created += 1
+    return created
+
+
+def _rebuild_missing_positions(cursor, user_id):
+    """
+    Tickers con operaciones pero sin posición (respaldo sin investments.parquet):
+    unidades netas y el costo promedio de la última operación (el mismo que
+    dejan add_buy/add_sale). Retorna cuántas posiciones creó.
+    """
+    cursor.execute("""
+        SELECT t.ticker, t.type, t.shares, t.avg_cost_at_trade FROM investment_transactions t
+        WHERE t.user_id = ? AND NOT EXISTS (
+            SELECT 1 FROM investments i WHERE i.user_id = t.user_id AND i.ticker = t.ticker)
+        ORDER BY t.ticker, t.date, t.id
+    """, (user_id,))
+    trades = pd.DataFrame(cursor.fetchall(), columns=['ticker', 'type', 'shares', 'avg_cost'])
+    if trades.empty:
+        return 0
+    trades['delta'] = np.where(trades['type'] == 'BUY', 1.0, -1.0) * trades['shares'].astype(float)
+    positions = trades.groupby('ticker', sort=True).agg(shares=('delta', 'sum'), avg_price=('avg_cost', 'last'))
+    positions = positions[positions['shares'] > 1e-9]
+
+    from backend.data_manager import detect_asset_type
+    cursor.execute("SELECT MAX(display_order) FROM investments WHERE user_id = ?", (user_id,))
+    order = cursor.fetchone()[0] or 0
+    rows = []
+    for n, (ticker, pos) in enumerate(positions.iterrows(), start=1):
+        avg = float(pos['avg_price'] or 0)
+        rows.append((user_id, ticker, float(pos['shares']), avg, float(pos['shares']) * avg,
+                     detect_asset_type(ticker), order + n))
+    if rows:
+        cursor.executemany("""
+            INSERT INTO investments (user_id, ticker, shares, avg_price, total_investment, asset_type, display_order)
+            VALUES (?, ?, ?, ?, ?, ?, ?)
+        """, rows)
+    return len(rows)
+
+
+def _import_dated(pq, pa, zf, cursor, table, user_id, start_date, end_date, account_map=None):
+    """Inserta los lotes que no existan. Retorna (insertadas, duplicadas, omitidas, primer día)."""
+    columns = [name for name, _ in TABLES[table] if name != 'id']
+    inserted = duplicates = skipped = 0
+    first_day = None
+    seen = pd.Series(dtype=np.int64)
+
+    for df in _read_batches(pq, pa, zf, table):
+        df = _in_range(df, start_date, end_date)
+        if account_map is not None:
+            # Movimientos de cuentas que no vinieron en el respaldo no tienen dónde ir: se cuentan
+            known = df['account_id'].isna() | df['account_id'].isin(list(account_map))
+            skipped += int((~known).sum())
+            df = df[known].copy()
+            df['account_id'] = df['account_id'].map(account_map).astype(object).where(df['account_id'].notna(), None)
+        if df.empty:
+            continue
+
+        keys = _hashes(df, table)
+        prior = seen.reindex(keys.values).fillna(0).astype(np.int64).values
+        occurrence = keys.groupby(keys).cumcount() + prior
+        seen = seen.add(keys.value_counts(), fill_value=0).astype(np.int64)
+        existing = _existing(cursor, table, user_id, df['date'].min(), df['date'].max())
+        is_dup = pd.MultiIndex.from_arrays([keys.values, occurrence.values]).isin(existing)
+        new = df[~is_dup]
+        duplicates += int(is_dup.sum())
+        if new.empty:
+            continue
+
+        values = new[columns].astype(object).where(new[columns].notna(), None)
+        cursor.executemany(
+            f"INSERT INTO {table} (user_id, {', '.join(columns)}) VALUES (?, {', '.join('?' * len(columns))})",
+            [[user_id] + row for row in values.values.tolist()])
+
+        if table == 'transactions':
+            groups = (new.assign(month=new['date'].str.slice(0, 7), subcategory=new['subcategory'].fillna(''))
+                      .groupby(['month', 'type', 'category', 'subcategory'])['amount']
+                      .agg(amount_sum='sum', n='count').reset_index())
+            rollups.apply_groups(cursor, user_id, [
+                (g.month, g.type, g.category, g.subcategory, float(g.amount_sum), int(g.n))
+                for g in groups.itertuples()])
+
+        inserted += len(new)
+        day = str(new['date'].min())[:10]
+        first_day = day if first_day is None else min(first_day, day)
+    return inserted, duplicates, skipped, first_day
+
+
+def import_dataset(source, user_id, start_date=None, end_date=None, conn=None):
+    """
+    Agrega al usuario el contenido de un .zip de build_dataset (ruta o archivo binario).
+    NO hace commit (lo hace data_manager.import_user_dataset). Retorna un resumen por tabla.
+    """
+    pa, pq = _pyarrow()
+    with zipfile.ZipFile(source) as zf:
+        try:
+            manifest = json.loads(zf.read('manifest.json'))
+        except KeyError:
+            raise ValueError("El archivo no es un respaldo de Pívot (falta manifest.json).")
+        if manifest.get('format') != 'pivot-dataset' or manifest.get('version', 0) > FORMAT_VERSION:
+            raise ValueError("Formato de respaldo no soportado.")
+
+        cursor = conn.cursor()
+        summary = {'accounts_created': 0, 'positions_created': 0}
+        account_map = {}
+        same_user = str(manifest.get('user_id')) == str(user_id)
+        for df in _read_batches(pq, pa, zf, 'accounts'):
+            mapping, created = _import_accounts(cursor, user_id, df, same_user)
+            account_map.update(mapping)
+            summary['accounts_created'] += created
+        for df in _read_batches(pq, pa, zf, 'investments'):
+            summary['positions_created'] += _import_positions(cursor, user_id, df, account_map)
+
+        first_days = []
+        for table in ('transactions', 'investment_transactions'):
+            inserted, duplicates, skipped, first_day = _import_dated(
+                pq, pa, zf, cursor, table, user_id, start_date, end_date,
+                account_map=account_map if table == 'transactions' else None)
+            summary[table] = {'inserted': inserted, 'duplicates': duplicates, 'skipped': skipped}
+            if first_day:
+                first_days.append(first_day)
+        if summary['investment_transactions']['inserted']:
+            summary['positions_created'] += _rebuild_missing_positions(cursor, user_id)
+
+        snapshots = 0
+        for df in _read_batches(pq, pa, zf, 'historical_net_worth'):
+            df = _in_range(df, start_date, end_date).dropna(subset=['net_worth'])
+            if df.empty:
+                continue
+            days = df['date'].astype(str).str.slice(0, 10)
+            # Los días que ya tienen snapshot se conservan
+            cursor.execute("SELECT date FROM historical_net_worth WHERE user_id = ? AND date >= ? AND date <= ?",
+                           (user_id, days.min(), days.max()))
+            new = ~days.isin({str(r[0])[:10] for r in cursor.fetchall()})
+            cursor.executemany("""
+                INSERT INTO historical_net_worth (user_id, date, net_worth) VALUES (?, ?, ?)
+                ON CONFLICT (user_id, date) DO NOTHING
+            """, [(user_id, d, float(v)) for d, v in zip(days[new], df['net_worth'][new])])
+            snapshots += int(new.sum())
+        summary['historical_net_worth'] = snapshots
+
+        if first_days:
+            ledger_history.mark_dirty(cursor, user_id, min(first_days))
+        summary['first_day'] = min(first_days) if first_days else None
+    return summary
+
+
+if __name__ == "__main__":
+    from app import server
+
+    args = sys.argv[1:]
+
+    def option(flag, default=None):
+        if flag in args:
+            i = args.index(flag)
+            value = args[i + 1]
+            del args[i:i + 2]
+            return value
+        return default
+
+    uid = int(option('--user', '1'))
+    start, end = option('--from'), option('--to')
+    source = option('--import')
+    with server.app_context():
+        from backend.data_manager import get_connection
+        from backend.cache_deps import invalidate
+        from backend import networth_history
+
+        t0 = time.perf_counter()
+        if source:
+            conn = get_connection()
+            try:
+                result = import_dataset(source, uid, start, end, conn=conn)
+                conn.commit()
+            finally:
+                conn.close()
+            invalidate(uid, 'transactions', 'accounts', 'investments', 'investment_transactions', 'historical_net_worth')
+            networth_history.reset(uid)
+            print(f"✅ Importado en {time.perf_counter() - t0:.2f}s: {result}")
+        else:
+            out = Path(args[0] if args else f"Pivot_{uid}_{datetime.now():%Y-%m-%d}.zip")
+            result = build_dataset(out, uid, None, start, end)
+            if result:
+                print(f"✅ {out} ({out.stat().st_size / 1e6:.1f} MB) en {time.perf_counter() - t0:.2f}s: {result}")
+            else:
+                print("⚠️ Sin datos en el rango.")
@@ -0,0 +1,85 @@
+# backend/concurrency.py
+"""
+Escrituras concurrentes sobre la misma fila (saldos de cuentas y posiciones de inversión).
+
+Antes, con varios workers de gunicorn:
+- _check_sufficient_funds (y journal.validate) leían el saldo y el UPDATE de
+  después aplicaba el delta sin condición: dos gastos simultáneos contra la
+  misma tarjeta pasaban los dos la validación del límite.
+- add_buy/add_sale/undo_investment_transaction leían shares/avg_price y
+  escribían los valores ya calculados: la segunda escritura pisaba la primera.
+
+Ahora:
+- Saldos: el UPDATE que descuenta lleva la condición de fondos en el WHERE
+  (min_available en balance_ledger.adjust/adjust_many). Se evalúa contra la
+  fila vigente al escribir: Postgres re-evalúa el WHERE después de esperar el
+  lock de la fila y SQLite tiene un solo escritor a la vez. Si no aplica -> StaleRow.
+- Posiciones: investments tiene columna version (migración 010). El UPDATE es
+  compare-and-set (WHERE version = la leída) y sube la versión; si otro
+  escribió en medio -> StaleRow. Toda escritura a investments sube la versión.
+- @retrying repite la función completa (nueva unidad de trabajo: relee y
+  revalida, así el segundo gasto recibe el "Fondos insuficientes" de siempre)
+  ante StaleRow, "database is locked" de SQLite o serialización/deadlock de
+  Postgres, con espera aleatoria creciente.
+Solo chocan las escrituras a la MISMA fila: no hay lock global de la app.
+
+Uso manual (prueba de estrés multihilo sobre una base temporal):
+    python -m pytest tests/test_concurrency.py
+"""
+import functools
+import os
+import random
+import sqlite3
+import time
+
+RETRIES = int(os.getenv("WRITE_RETRIES", "8"))
+BACKOFF_SECONDS = float(os.getenv("WRITE_RETRY_BACKOFF", "0.01"))
+RETRY_EXHAUSTED_MSG = "Otra operación modificó los mismos datos al mismo tiempo. Intenta de nuevo."
+
+# Postgres: serialization_failure, deadlock_detected, lock_not_available
+_PG_RETRY_CODES = {'40001', '40P01', '55P03'}
+
+
+class StaleRow(Exception):
+    """Un UPDATE condicional no encontró la fila como se leyó/validó (otro la cambió en medio)."""
+
+
+def expect_row(cursor, what="La fila"):
+    """Tras un UPDATE condicional: si no tocó ninguna fila, StaleRow."""
+    if cursor.rowcount == 0:
+        raise StaleRow(f"{what} cambió durante la escritura")
+
+
+def is_retryable(exc):
+    """¿El error viene de chocar con otra escritura (y conviene repetir la operación)?"""
+    if isinstance(exc, StaleRow):
+        return True
+    if isinstance(exc, sqlite3.OperationalError):
+        msg = str(exc).lower()
+        return 'locked' in msg or 'busy' in msg
+    return getattr(exc, 'pgcode', None) in _PG_RETRY_CODES
+
+
+def retrying(fn):
+    """
+    Repite fn (que retorna (ok, mensaje)) mientras choque con otra escritura.
+    fn hace su rollback y deja pasar los errores reintentables
+    (`if concurrency.is_retryable(e): raise`); cada intento es una unidad de
+    trabajo nueva. Solo para funciones de nivel superior (callbacks), no
+    anidadas en otra transacción. Agotados los intentos: (False, mensaje).
+    """
+    @functools.wraps(fn)
+    def wrapper(*args, **kwargs):
+        last = None
+        for attempt in range(RETRIES):
+            try:
+                return fn(*args, **kwargs)
+            except Exception as e:
+                if not is_retryable(e):
+                    raise
+                last = e
+                time.sleep(random.uniform(0, BACKOFF_SECONDS * 2 ** attempt))
+        print(f"⚠️ {fn.__name__}: sin éxito tras {RETRIES} intentos ({last})")
+        return False, RETRY_EXHAUSTED_MSG
+    return wrapper
+
@@ -1,4 +1,3 @@
-import sqlite3
 import pandas as pd
 import os
 from datetime import date, datetime, timezone
@@ -6,13 +5,18 @@ import calendar
 import finnhub
 import time
 import json
+import zipfile
 from dotenv import load_dotenv
 from pathlib import Path
 from flask_login import current_user
 from sqlalchemy import create_engine, text
 from functools import lru_cache
 import time
-from backend.extensions import cache
+from backend.cache_deps import user_cached, invalidate, invalidate_user
+from backend.db_pool import get_sqlite_connection, get_scoped_connection, ScopedConnectionMixin, on_commit
+from backend.sql_dialect import register_query, to_pyformat, SQLITE, POSTGRES
+from backend import market_data, market_scheduler, rollups, networth_history, ledger_history, snapshot_job, statement_import
+from backend import columnar_export, amortization, payment_calendar, balance_ledger, journal, concurrency
 from flask_login import current_user
 
 # --- CONFIGURACIÓN BASE ---
@@ -24,6 +28,7 @@ RENDER_DB_URL = os.getenv("DATABASE_URL")
 
 # Detectar si estamos en Postgres
 IS_POSTGRES = RENDER_DB_URL is not None and "postgres" in RENDER_DB_URL
+DIALECT = POSTGRES if IS_POSTGRES else SQLITE
 
 DB_DIR = "data"
 DB_PATH = os.path.join(DB_DIR, "pivot.db")
@@ -35,6 +40,7 @@ if api_key:
 else:
     print("⚠️ ADVERTENCIA: No se encontró FINNHUB_API_KEY en el archivo .env")
     finnhub_client = None 
+market_data.set_finnhub_client(finnhub_client)
 # --- CLASES ADAPTADORAS (Para compatibilidad SQLite -> Postgres) ---
 
 # --- CLASES ADAPTADORAS MEJORADAS ---
@@ -42,34 +48,26 @@ else:
 # --- FUNCIÓN MAESTRA DE LIMPIEZA ---
 # En backend/data_manager.py
 
-def clear_all_caches():
+def clear_all_caches(user_id=None):
     """
-    Borra la memoria de todas las funciones pesadas.
+    Invalida todas las tablas cacheadas del usuario (se usa en login/logout).
+    Las escrituras normales usan _after_write(), que solo invalida lo que tocaron.
     """
-    try:
-        # 1. Borrar datos de Dashboard Principal
-        cache.delete_memoized(get_dashboard_metrics)
-        cache.delete_memoized(get_transactions_df)
-        cache.delete_memoized(get_monthly_summary)
-        cache.delete_memoized(get_category_summary)
-        
-        # 2. Borrar datos de Patrimonio y Cuentas
-        cache.delete_memoized(get_net_worth_breakdown)
-        cache.delete_memoized(get_stocks_data)
-        
-        # 3. NUEVO: Borrar datos de Distribución (Funciones internas con guion bajo)
-        cache.delete_memoized(_get_fixed_costs_df_cached)
-        cache.delete_memoized(_get_savings_goals_df_cached)
-        cache.delete_memoized(_get_distribution_rules_cached)
-        cache.delete_memoized(_get_income_events_df_cached)
-        cache.delete_memoized(_get_full_networth_history_cached)
-        cache.delete_memoized(get_account_options)
-        cache.delete_memoized(get_account_balance_cached)
-        cache.delete_memoized(get_user_distribution_accounts)
-        capture_daily_snapshot()
-        print("🧹 Caché limpiado: Datos frescos listos.")
-    except Exception as e:
-        print(f"⚠️ Error limpiando caché: {e}")
+    uid = user_id or get_uid()
+    if uid:
+        invalidate_user(uid)
+
+
+def _after_write(user_id, *tables):
+    """
+    Invalida SOLO las tablas que tocó la escritura y solo para ese usuario.
+    El snapshot diario de patrimonio lo hace el job en lote (backend/snapshot_job.py);
+    el gráfico usa el valor en vivo para HOY, así que no hace falta esperarlo.
+    Si la escritura está anidada en otra (commit diferido), la invalidación
+    espera al commit real del caller externo: antes, otro request podía volver
+    a cachear los datos viejos entre la invalidación y el commit.
+    """
+    on_commit(lambda: invalidate(user_id, *tables))
 
 
 class PostgresCursorWrapper:
@@ -77,8 +75,8 @@ class PostgresCursorWrapper:
         self.cursor = original_cursor
 
     def execute(self, sql, params=None):
-        # Traducción de sintaxis SQLite (?) a Postgres (%s)
-        sql = sql.replace('?', '%s')
+        # Traducción de sintaxis SQLite (?) a Postgres (%s), cacheada y respetando literales
+        sql = to_pyformat(sql, params is not None)
         try:
             return self.cursor.execute(sql, params)
         except Exception as e:
@@ -86,7 +84,7 @@ class PostgresCursorWrapper:
             raise e
 
     def executemany(self, sql, params_list):
-        sql = sql.replace('?', '%s')
+        sql = to_pyformat(sql)
         return self.cursor.executemany(sql, params_list)
 
     # --- MÉTODOS REQUERIDOS POR PANDAS Y EL SISTEMA ---
@@ -117,16 +115,18 @@ class PostgresCursorWrapper:
     def __iter__(self): return self.cursor.__iter__()
     def __next__(self): return self.cursor.__next__()
 
-class PostgresConnectionWrapper:
+class PostgresConnectionWrapper(ScopedConnectionMixin):
+    # commit()/rollback()/close() vienen de ScopedConnectionMixin: la conexión se
+    # comparte durante el request y vuelve al pool una sola vez (ver db_pool.py)
     def __init__(self, original_conn):
         self.conn = original_conn
 
     def cursor(self):
         return PostgresCursorWrapper(self.conn.cursor())
 
-    def commit(self): return self.conn.commit()
-    def rollback(self): return self.conn.rollback()
-    def close(self): return self.conn.close()
+    def _real_commit(self): return self.conn.commit()
+    def _real_rollback(self): return self.conn.rollback()
+    def really_close(self): return self.conn.close()
     
     # Context Manager
     def __enter__(self): return self
@@ -149,7 +149,7 @@ def check_column_exists(cursor, table_name, column_name):
         cursor.execute("""
             SELECT column_name 
             FROM information_schema.columns 
-            WHERE table_name=%s AND column_name=%s
+            WHERE table_name=? AND column_name=?
         """, (table_name, column_name))
         return cursor.fetchone() is not None
     else:
@@ -169,14 +169,13 @@ def get_connection():
     if pg_engine:
         # 1. Modo PRODUCCIÓN (PostgreSQL con Pool)
         try:
-            # Obtenemos una conexión del pool existente (¡Instantáneo!)
-            raw_conn = pg_engine.raw_connection()
-            return PostgresConnectionWrapper(raw_conn)
+            # Una sola conexión del pool por request: los helpers anidados la reutilizan
+            return get_scoped_connection('pg', lambda: PostgresConnectionWrapper(pg_engine.raw_connection()))
         except Exception as e:
             raise ConnectionError(f"Error conectando a Postgres: {e}")
     else:
-        # 2. Modo DESARROLLO LOCAL (SQLite)
-        return sqlite3.connect(os.path.join("data", "pivot.db"))
+        # 2. Modo DESARROLLO LOCAL (SQLite): conexión reutilizada por hilo (ver db_pool.py)
+        return get_sqlite_connection(os.path.join("data", "pivot.db"))
     
 
 def get_uid():
@@ -229,8 +228,9 @@ def add_account(name, acc_type, balance, bank_name="-", credit_limit=0, payment_
             INSERT INTO accounts (user_id, name, type, current_balance, bank_name, credit_limit, payment_day, cutoff_day, interest_rate, display_order, deferred_balance)
             VALUES (?, ?, ?, ?, ?, ?, ?, ?, ?, ?, ?)
         """, (uid, name, acc_type, balance, bank_name, credit_limit, payment_day, cutoff_day, interest_rate, new_order, deferred_balance))
+        balance_ledger.record_opening(cursor, uid)
         conn.commit()
-        clear_all_caches()
+        _after_write(uid, 'accounts', 'card_terms')
         return True, "Cuenta creada exitosamente."
     except Exception as e:
         return False, f"Error al crear: {str(e)}"
@@ -242,6 +242,8 @@ def update_account(account_id, name, acc_type, balance, bank_name, credit_limit,
     cursor = conn.cursor()
     uid = get_uid()
     try:
+        # Si el saldo se editó a mano, queda el asiento por la diferencia
+        balance_ledger.record_set(cursor, uid, account_id, balance)
         # Añadimos "AND user_id = ?" para seguridad: nadie edita lo que no es suyo
         cursor.execute("""
             UPDATE accounts 
@@ -249,6 +251,7 @@ def update_account(account_id, name, acc_type, balance, bank_name, credit_limit,
             WHERE id = ? AND user_id = ?
         """, (name, acc_type, balance, bank_name, credit_limit, payment_day, cutoff_day, interest_rate, deferred_balance, account_id, uid))
         conn.commit()
+        _after_write(uid, 'accounts', 'card_terms')
         return True, "Cuenta actualizada."
     except Exception as e:
         return False, str(e)
@@ -261,17 +264,21 @@ def delete_account(account_id):
     uid = get_uid()
     try:
         # Solo borrar si pertenece al usuario
+        rollups.subtract_where(cursor, "account_id = ? AND user_id = ?", (account_id, uid))
+        ledger_history.mark_dirty(cursor, uid)
         cursor.execute("DELETE FROM transactions WHERE account_id = ? AND user_id = ?", (account_id, uid))
         cursor.execute("DELETE FROM installments WHERE account_id = ? AND user_id = ?", (account_id, uid))
         cursor.execute("DELETE FROM accounts WHERE id = ? AND user_id = ?", (account_id, uid))
+        balance_ledger.forget(cursor, uid, account_id)
         conn.commit()
+        _after_write(uid, 'transactions', 'installments', 'accounts', 'card_terms')
         return True, "Cuenta eliminada."
     except Exception as e: return False, str(e)
     finally: conn.close()
 
-def get_accounts_by_category(category_group):
+def get_accounts_by_category(category_group, user_id=None):
     conn = get_connection()
-    uid = get_uid()
+    uid = user_id or get_uid()
     try:
         # Filtramos por usuario
         df = pd.read_sql_query("SELECT * FROM accounts WHERE user_id = ? ORDER BY display_order ASC", conn, params=(uid,))
@@ -285,19 +292,9 @@ def get_accounts_by_category(category_group):
             # También filtramos installments por usuario
             installments_df = pd.read_sql_query("SELECT * FROM installments WHERE user_id = ?", conn, params=(uid,))
             
-            def calc_total_installments(acc_id):
-                if installments_df.empty: return 0.0
-                my_installs = installments_df[installments_df['account_id'] == acc_id]
-                total = 0.0
-                for _, row in my_installs.iterrows():
-                    if row['total_quotas'] > 0:
-                        total_with_int = row['total_amount'] * (1 + (row['interest_rate'] / 100))
-                        quota_val = total_with_int / row['total_quotas']
-                        remaining = row['total_quotas'] - row['paid_quotas']
-                        total += quota_val * remaining
-                return total
-
-            df['installments_pending_total'] = df['id'].apply(calc_total_installments)
+            # Misma cuota (PMT) que el resumen de crédito y el detalle de la tarjeta
+            pending = amortization.pending_by_account(installments_df)
+            df['installments_pending_total'] = df['id'].map(pending).fillna(0.0)
         else:
             df = df[df['type'] != 'Credit']
             
@@ -331,8 +328,9 @@ def change_account_order(account_id, direction, category_group):
         conn.execute("UPDATE accounts SET display_order = ? WHERE id = ? AND user_id = ?", (int(order1), int(id2), uid))
         conn.commit()
         conn.close()
+        invalidate(uid, 'accounts')
 
-@cache.memoize(timeout=60)
+@user_cached('accounts', 'abono_reserve', timeout=60)
 def get_account_options(user_id): # <--- AHORA PIDE USER_ID
     conn = get_connection()
     # uid = get_uid() (BORRAR ESTO)
@@ -352,7 +350,7 @@ def get_account_options(user_id): # <--- AHORA PIDE USER_ID
     except: pass
     
     # Reserva (Usuario específico)
-    try: res = get_credit_abono_reserve()
+    try: res = get_credit_abono_reserve(uid)
     except: res = 0.0
     options.append({'label': f"Reserva de Abono\nDisponible: ${res:,.2f}", 'value': 'RESERVE'})
     
@@ -361,14 +359,14 @@ def get_account_options(user_id): # <--- AHORA PIDE USER_ID
 
 # --- EN backend/data_manager.py (NUEVA FUNCIÓN) ---
 
-@cache.memoize(timeout=60)
+@user_cached('accounts', 'abono_reserve', timeout=60)
 def get_account_balance_cached(account_id, user_id):
     """Obtiene el saldo de una cuenta rápidamente con caché."""
     if not account_id: return 0.0
     
     # Caso especial Reserva
     if account_id == 'RESERVE':
-        return get_credit_abono_reserve() # Esta ya debería estar optimizada o ser rápida
+        return get_credit_abono_reserve(user_id) # Esta ya debería estar optimizada o ser rápida
         
     conn = get_connection()
     try:
@@ -439,6 +437,7 @@ def batch_update_account_orders(id_list):
                 (index + 1, acc_id, uid)
             )
         conn.commit()
+        invalidate(uid, 'accounts')
         return True, "Orden guardado."
     except Exception as e:
         return False, str(e)
@@ -495,30 +494,17 @@ def get_debit_bank_summary():
 def calculate_installment_value(amount, rate, total_quotas):
     """
     Calcula el valor de una cuota individual usando la misma lógica para todo el sistema.
-    Maneja Tasa 0 correctamente.
+    Maneja Tasa 0 correctamente. (Ver backend/amortization.py)
     """
-    if total_quotas == 0: return 0.0
-    
-    if rate > 0:
-        # Fórmula de Amortización (PMT)
-        i = rate / 12 / 100
-        n = total_quotas
-        denominator = ((1 + i) ** n) - 1
-        if denominator != 0:
-            numerator = i * ((1 + i) ** n)
-            q_val = amount * (numerator / denominator)
-            return q_val
-    
-    # Si Tasa es 0 o cálculo falla
-    return amount / total_quotas
+    return float(amortization.quota_values(amount, rate or 0, total_quotas or 0))
 
 
-def get_credit_summary_data():
+def get_credit_summary_data(user_id=None):
     """
     Métricas de Crédito corregidas para usar la fórmula exacta de cuotas.
     """
     conn = get_connection()
-    uid = get_uid()
+    uid = user_id or get_uid()
     summary = {'total_limit': 0.0, 'total_debt': 0.0, 'total_installments': 0.0}
     try:
         # 1. Totales de Tarjetas
@@ -531,19 +517,8 @@ def get_credit_summary_data():
         
         # 2. Cálculo Preciso de Cuotas Pendientes
         installments_df = pd.read_sql_query("SELECT * FROM installments WHERE user_id = ?", conn, params=(uid,))
-        total_pending_value = 0.0
-        
-        # Iteramos y calculamos usando la función unificada
-        for _, inst_row in installments_df.iterrows():
-            tq = inst_row['total_quotas']
-            pq = inst_row['paid_quotas']
-            
-            if tq > 0 and pq < tq:
-                # Usamos la función helper para que coincida con el frontend
-                q_val = calculate_installment_value(inst_row['total_amount'], inst_row['interest_rate'], tq)
-                
-                remaining_quotas = tq - pq
-                total_pending_value += q_val * remaining_quotas
+        # Todas las cuotas pendientes de una pasada (cuota × cuotas restantes)
+        total_pending_value = float(amortization.summarize(installments_df)['remaining_balance'].sum())
         
         summary['total_installments'] = total_pending_value
         
@@ -551,6 +526,18 @@ def get_credit_summary_data():
         conn.close()
     return summary
 
+def get_upcoming_payments(start_date=None, end_date=None, kinds=None, user_id=None):
+    """
+    Próximos vencimientos (tarjetas, cuotas y costos fijos) entre start_date y end_date.
+    Sale del calendario precalculado (backend/payment_calendar.py).
+    """
+    uid = user_id or get_uid()
+    try:
+        return payment_calendar.upcoming(uid, start_date, end_date, kinds)
+    except Exception as e:
+        print(f"⚠️ Error armando calendario de pagos: {e}")
+        return pd.DataFrame(columns=payment_calendar.COLUMNS + ['label'])
+
 def get_asset_type_summary():
     """Calcula el saldo total agrupado por el tipo de cuenta (Debit, Cash)."""
     conn = get_connection()
@@ -585,6 +572,7 @@ def add_installment(account_id, name, amount, rate, total_q, paid_q, pay_day):
             VALUES (?, ?, ?, ?, ?, ?, ?, ?)
         """, (uid, account_id, name, amount, rate, total_q, paid_q, pay_day))
         conn.commit()
+        _after_write(uid, 'installments')
         return True, "Financiamiento agregado."
     except Exception as e:
         return False, str(e)
@@ -603,6 +591,7 @@ def update_installment(inst_id, name, amount, rate, total_q, paid_q, pay_day):
             WHERE id = ? AND user_id = ?
         """, (name, amount, rate, total_q, paid_q, pay_day, inst_id, uid))
         conn.commit()
+        _after_write(uid, 'installments')
         return True, "Financiamiento actualizado."
     except Exception as e:
         return False, str(e)
@@ -626,20 +615,35 @@ def delete_installment(installment_id):
     try:
         cursor.execute("DELETE FROM installments WHERE id = ? AND user_id = ?", (installment_id, uid))
         conn.commit()
+        _after_write(uid, 'installments')
         return True, "Eliminado."
     except Exception as e: return False, str(e)
     finally: conn.close()
 # --- TRANSACCIONES Y ANALYTICS ---
 # backend/data_manager.py
 
-@cache.memoize(timeout=60)
+# Categorías que el usuario marcó como excluidas (no cuentan en ingresos/gastos)
+_EXCLUDED_CATEGORIES_SQL = "SELECT name FROM categories WHERE user_id = ? AND is_excluded = 1 AND name IS NOT NULL"
+
+# Lee del resumen mensual pre-agregado (ver backend/rollups.py): O(categorías del mes)
+Q_DASHBOARD_METRICS = register_query('dashboard_metrics', f"""
+    SELECT 
+        SUM(CASE WHEN type = 'Income' THEN amount_sum ELSE 0 END) as total_income,
+        SUM(CASE WHEN type = 'Expense' THEN amount_sum ELSE 0 END) as total_expense
+    FROM transaction_rollups 
+    WHERE user_id = ? 
+      AND month = ?
+      AND category NOT IN ({_EXCLUDED_CATEGORIES_SQL})
+""")
+
+@user_cached('transactions', 'categories', timeout=60)
 def get_dashboard_metrics(user_id, selected_month_str=None):
     """
     Calcula Ingresos y Gastos del mes directamente en SQL.
     Mucho más rápido que procesar Pandas.
     """
     conn = get_connection()
-    uid = get_uid()
+    uid = user_id
     
     try:
         # 1. Definir fechas de inicio y fin del mes
@@ -652,29 +656,11 @@ def get_dashboard_metrics(user_id, selected_month_str=None):
         else:
             month_filter = selected_month_str
 
-        # 2. Obtener categorías excluidas (para no sumar transferencias)
-        excluded = get_excluded_categories_list()
-        if excluded:
-            placeholders = ','.join([f"'{x}'" for x in excluded])
-            exclude_clause = f"AND category NOT IN ({placeholders})"
-        else:
-            exclude_clause = ""
-
-        # 3. QUERY OPTIMIZADA
-        # Suma condicional en una sola consulta
-        query = f"""
-            SELECT 
-                SUM(CASE WHEN type = 'Income' THEN amount ELSE 0 END) as total_income,
-                SUM(CASE WHEN type = 'Expense' THEN amount ELSE 0 END) as total_expense
-            FROM transactions 
-            WHERE user_id = %s 
-              AND TO_CHAR(date::DATE, 'YYYY-MM') = %s
-              {exclude_clause}
-        """
-        
+        # 2. QUERY OPTIMIZADA (ver Q_DASHBOARD_METRICS): suma condicional en una sola
+        # consulta, excluyendo en SQL las categorías marcadas (transferencias, etc.)
         # Ejecutar (usamos cursor directo para velocidad, sin Pandas)
         cursor = conn.cursor()
-        cursor.execute(query, (uid, month_filter))
+        cursor.execute(Q_DASHBOARD_METRICS.render(DIALECT), (uid, month_filter, uid))
         res = cursor.fetchone()
         
         income = res[0] if res and res[0] else 0.0
@@ -719,6 +705,7 @@ def _check_sufficient_funds(cursor, account_id, amount, user_id):
 
 # backend/data_manager.py
 
+@concurrency.retrying
 def add_transaction(date, name, amount, category, trans_type, account_id, subcategory=None):
     conn = get_connection()
     cursor = conn.cursor()
@@ -741,44 +728,44 @@ def add_transaction(date, name, amount, category, trans_type, account_id, subcat
                 if not has_funds: return False, error_msg
 
         # 3. INSERTAR LA TRANSACCIÓN (Usamos db_account_id que es None o Número)
-        cursor.execute("""
-            INSERT INTO transactions (user_id, date, name, amount, category, type, account_id, subcategory) 
-            VALUES (?, ?, ?, ?, ?, ?, ?, ?)
-        """, (uid, date, name, amount, category, trans_type, db_account_id, subcategory))
+        _insert_transaction(cursor, uid, date, name, amount, category, trans_type, db_account_id, subcategory)
         
         # 4. ACTUALIZAR SALDO (Aquí usamos el account_id ORIGINAL: 'RESERVE')
-        # Esto asegura que entre al IF correcto en _adjust_account_balance
-        _adjust_account_balance(cursor, account_id, amount, trans_type, is_reversal=False, user_id=uid)
+        # Esto asegura que entre al IF correcto en _adjust_account_balance.
+        # Un gasto vuelve a exigir los fondos en el UPDATE (otro worker pudo gastarlos recién)
+        _adjust_account_balance(cursor, account_id, amount, trans_type, is_reversal=False, user_id=uid,
+                                check_funds=(trans_type == 'Expense'))
         
         conn.commit()
-        clear_all_caches()
+        _after_write(uid, 'transactions', 'accounts', 'abono_reserve')
         return True, "Registrado."
-    except Exception as e: return False, str(e)
+    except Exception as e:
+        if concurrency.is_retryable(e): raise
+        return False, str(e)
     finally: conn.close()
 
-@cache.memoize(timeout=60)
+_TRANSACTIONS_BASE_SQL = """
+    SELECT t.*, a.name as account_name 
+    FROM transactions t 
+    LEFT JOIN accounts a ON t.account_id = a.id
+    WHERE t.user_id = ? 
+"""
+Q_TRANSACTIONS_ALL = register_query('transactions_all', _TRANSACTIONS_BASE_SQL + " ORDER BY t.date DESC")
+Q_TRANSACTIONS_RANGE = register_query(
+    'transactions_range', _TRANSACTIONS_BASE_SQL + " AND t.date BETWEEN ? AND ? ORDER BY t.date DESC")
+
+@user_cached('transactions', 'accounts', timeout=60)
 def get_transactions_df(user_id, start_date=None, end_date=None):
     conn = get_connection()
     uid = user_id
     try:
-        # Query base
-        sql = """
-            SELECT t.*, a.name as account_name 
-            FROM transactions t 
-            LEFT JOIN accounts a ON t.account_id = a.id
-            WHERE t.user_id = %s 
-        """
-        params = [uid]
-
         # FILTRO DINÁMICO DE FECHAS (Optimización Clave)
         if start_date and end_date:
-            sql += " AND t.date BETWEEN %s AND %s"
-            params.extend([start_date, end_date])
-        
-        sql += " ORDER BY t.date DESC"
+            query, params = Q_TRANSACTIONS_RANGE, (uid, start_date, end_date)
+        else:
+            query, params = Q_TRANSACTIONS_ALL, (uid,)
 
-        # Nota: Si usas el wrapper que convierte ? a %s, ajusta aquí si es necesario
-        df = pd.read_sql_query(sql, conn, params=params)
+        df = pd.read_sql_query(query.render(DIALECT), conn, params=params)
 
         if not df.empty:
             df['account_name'] = df['account_name'].fillna('Reserva de Abono')
@@ -791,6 +778,116 @@ def get_transactions_df(user_id, start_date=None, end_date=None):
     return df
 
 
+# --- TABLA PAGINADA DE /transacciones (paginación, orden y filtro en el servidor) ---
+# Columna visible de la tabla -> expresión SQL. Solo estas columnas se pueden
+# ordenar/filtrar (lista blanca: nunca se interpola texto del usuario).
+# Las expresiones no devuelven NULL para que el cursor (keyset) compare bien.
+_TRANSACTION_TABLE_COLUMNS = {
+    'date_display': "t.date",
+    'type_label': ("CASE t.type WHEN 'Expense' THEN 'Gasto' WHEN 'Income' THEN 'Ingreso' "
+                   "WHEN 'Transfer' THEN 'Mov. Interno' ELSE t.type END"),
+    'category': "t.category",
+    'subcategory': "COALESCE(t.subcategory, '')",
+    'amount': "t.amount",
+    'name': "t.name",
+}
+_TEXT_FILTER_OPS = {'contains', 'datestartswith'}
+_COMPARE_FILTER_OPS = {'=', '!=', '<', '<=', '>', '>='}
+
+_TRANSACTIONS_PAGE_SQL = """
+    SELECT t.id, t.date, t.name, t.amount, t.category, t.type, t.account_id,
+           COALESCE(t.subcategory, '') AS subcategory,
+           COALESCE(a.name, 'Reserva de Abono') AS account_name,
+           {sort_expr} AS sort_key
+    FROM transactions t
+    LEFT JOIN accounts a ON t.account_id = a.id
+    WHERE {where}
+    ORDER BY {sort_expr} {direction}, t.id {direction}
+    LIMIT ? OFFSET ?
+"""
+_TRANSACTIONS_COUNT_SQL = "SELECT COUNT(*) FROM transactions t WHERE {where}"
+
+
+def _like_escape(value):
+    """Escapa los comodines de LIKE (% y _) y la barra, para usar con ESCAPE '\\'."""
+    return str(value).replace('\\', '\\\\').replace('%', '\\%').replace('_', '\\_')
+
+
+def _transaction_filter_sql(filters):
+    """[(columna, operador, valor)] -> (lista de condiciones SQL, params). Ignora lo desconocido."""
+    clauses, params = [], []
+    for column, op, value in filters or ():
+        expr = _TRANSACTION_TABLE_COLUMNS.get(column)
+        if expr is None or value is None:
+            continue
+        # El texto del usuario va literal: "50%" o "a_b" no son comodines (mismo ESCAPE en SQLite y Postgres)
+        if op == 'contains':
+            clauses.append(f"LOWER({expr}) LIKE ? ESCAPE '\\'")
+            params.append(f"%{_like_escape(str(value).lower())}%")
+        elif op == 'datestartswith':
+            clauses.append(f"{expr} LIKE ? ESCAPE '\\'")
+            params.append(f"{_like_escape(value)}%")
+        elif op in _COMPARE_FILTER_OPS:
+            if column == 'amount':
+                try:
+                    value = float(value)
+                except (TypeError, ValueError):
+                    continue
+            else:
+                value = str(value)
+            clauses.append(f"{expr} {op} ?")
+            params.append(value)
+    return clauses, params
+
+
+@user_cached('transactions', 'accounts', timeout=60)
+def get_transactions_page(user_id, page_size=10, offset=0, sort_by=None, filters=None, after=None):
+    """
+    Una página de la tabla de transacciones + el total que cumple los filtros.
+    sort_by: (columna, 'asc'|'desc'); por defecto la fecha más reciente primero.
+    filters: [(columna, operador, valor)] ya parseados del filter_query de la tabla.
+    after: (sort_key, id) de la última fila de la página anterior. Si viene, la
+           página se busca por keyset (WHERE clave < cursor) en vez de OFFSET,
+           así avanzar de página no relee las filas ya mostradas.
+    Retorna {'rows': [dict], 'total': int, 'last_key': (sort_key, id) | None}.
+    """
+    column, direction = sort_by or ('date_display', 'desc')
+    sort_expr = _TRANSACTION_TABLE_COLUMNS.get(column, "t.date")
+    direction = 'ASC' if str(direction).lower() == 'asc' else 'DESC'
+
+    clauses, params = _transaction_filter_sql(filters)
+    where = " AND ".join(["t.user_id = ?"] + clauses)
+    count_params = [user_id] + params
+
+    page_where, page_params = where, list(count_params)
+    if after is not None:
+        cmp = '>' if direction == 'ASC' else '<'
+        page_where += f" AND ({sort_expr} {cmp} ? OR ({sort_expr} = ? AND t.id {cmp} ?))"
+        page_params += [after[0], after[0], after[1]]
+        offset = 0
+
+    conn = get_connection()
+    try:
+        cursor = conn.cursor()
+        cursor.execute(_TRANSACTIONS_COUNT_SQL.format(where=where), count_params)
+        total = cursor.fetchone()[0] or 0
+
+        cursor.execute(
+            _TRANSACTIONS_PAGE_SQL.format(sort_expr=sort_expr, where=page_where, direction=direction),
+            page_params + [int(page_size), int(max(offset, 0))]
+        )
+        names = [d[0] for d in cursor.description]
+        rows = [dict(zip(names, r)) for r in cursor.fetchall()]
+    except Exception as e:
+        print(f"Error get_transactions_page: {e}")
+        return {'rows': [], 'total': 0, 'last_key': None}
+    finally:
+        conn.close()
+
+    last_key = (rows[-1]['sort_key'], rows[-1]['id']) if rows else None
+    return {'rows': rows, 'total': total, 'last_key': last_key}
+
+
 def get_net_worth():
     conn = get_connection()
     try:
@@ -831,57 +928,73 @@ def get_net_worth():
 # backend/data_manager.py
 
 # backend/data_manager.py
-@cache.memoize(timeout=120)
+Q_MONTHLY_SUMMARY = register_query('monthly_summary', f"""
+    SELECT 
+        month as "Month",
+        type, 
+        SUM(amount_sum) as amount
+    FROM transaction_rollups
+    WHERE user_id = ?
+      AND category NOT IN ({_EXCLUDED_CATEGORIES_SQL})
+    GROUP BY month, type
+    ORDER BY month ASC
+""")
+
+@user_cached('transactions', 'categories', timeout=120)
 def get_monthly_summary(user_id):
-    """Flujo de caja mensual AGRUPADO POR SQL."""
+    """Flujo de caja mensual desde el resumen pre-agregado (transaction_rollups)."""
     conn = get_connection()
-    uid = get_uid()
+    uid = user_id
     try:
-        # Excluir categorías internas
-        excluded = get_excluded_categories_list()
-        excl_clause = ""
-        if excluded:
-            safe_excl = ','.join([f"'{x}'" for x in excluded]) # Simplificado para el ejemplo
-            excl_clause = f"AND category NOT IN ({safe_excl})"
-
-        query = f"""
-            SELECT 
-                TO_CHAR(date::DATE, 'YYYY-MM') as "Month",
-                type, 
-                SUM(amount) as amount
-            FROM transactions
-            WHERE user_id = %s {excl_clause}
-            GROUP BY 1, 2
-            ORDER BY 1 ASC
-        """
-        return pd.read_sql_query(query, conn, params=(uid,))
+        # Excluye categorías internas en SQL (ver Q_MONTHLY_SUMMARY)
+        return pd.read_sql_query(Q_MONTHLY_SUMMARY.render(DIALECT), conn, params=(uid, uid))
     finally:
         conn.close()
 
 
 
-@cache.memoize(timeout=120)
+Q_CATEGORY_SUMMARY = register_query('category_summary', f"""
+    SELECT category, SUM(amount_sum) as amount
+    FROM transaction_rollups
+    WHERE user_id = ? 
+      AND type = 'Expense'
+      AND category NOT IN ({_EXCLUDED_CATEGORIES_SQL})
+    GROUP BY category
+    ORDER BY amount DESC
+""")
+
+@user_cached('transactions', 'categories', timeout=120)
 def get_category_summary(user_id):
-    """Gastos por categoría AGRUPADOS POR SQL."""
+    """Gastos por categoría desde el resumen pre-agregado (transaction_rollups)."""
     conn = get_connection()
-    uid = get_uid()
+    uid = user_id
     try:
-        excluded = get_excluded_categories_list()
-        excl_clause = ""
-        if excluded:
-            safe_excl = ','.join([f"'{x}'" for x in excluded])
-            excl_clause = f"AND category NOT IN ({safe_excl})"
+        return pd.read_sql_query(Q_CATEGORY_SUMMARY.render(DIALECT), conn, params=(uid, uid))
+    finally:
+        conn.close()
 
-        query = f"""
-            SELECT category, SUM(amount) as amount
-            FROM transactions
-            WHERE user_id = %s 
-              AND type = 'Expense'
-              {excl_clause}
-            GROUP BY category
-            ORDER BY amount DESC
-        """
-        return pd.read_sql_query(query, conn, params=(uid,))
+
+Q_CATEGORY_BREAKDOWN = register_query('category_breakdown', f"""
+    SELECT type, category, subcategory, SUM(amount_sum) as amount
+    FROM transaction_rollups
+    WHERE user_id = ?
+      AND category NOT IN ({_EXCLUDED_CATEGORIES_SQL})
+    GROUP BY type, category, subcategory
+""")
+
+@user_cached('transactions', 'categories', timeout=120)
+def get_category_breakdown(user_id):
+    """
+    Totales por (type, category, subcategory) de todo el historial, sin categorías
+    excluidas. Alimenta los pies del dashboard sin leer la tabla transactions.
+    """
+    conn = get_connection()
+    uid = user_id
+    try:
+        return pd.read_sql_query(Q_CATEGORY_BREAKDOWN.render(DIALECT), conn, params=(uid, uid))
+    except Exception as e:
+        print(f"Error get_category_breakdown: {e}")
+        return pd.DataFrame(columns=['type', 'category', 'subcategory', 'amount'])
     finally:
         conn.close()
 
@@ -895,6 +1008,7 @@ def add_iou(name, amount, iou_type, due_date, person_name=None, description=None
             VALUES (?, ?, ?, ?, ?, ?, ?, ?, ?)
         """, (uid, name, amount, iou_type, amount, date.today().strftime('%Y-%m-%d'), due_date, person_name, description))
         conn.commit()
+        _after_write(uid, 'iou')
         return True, "Registrado."
     except Exception as e: return False, str(e)
     finally: conn.close()
@@ -922,6 +1036,7 @@ def delete_iou(iou_id):
         # Eliminación física, ya que son cuentas informales
         cursor.execute("DELETE FROM iou WHERE id = ?", (iou_id,))
         conn.commit()
+        _after_write(get_uid(), 'iou')
         return True, "Elemento eliminado."
     except Exception as e:
         return False, f"Error al eliminar: {str(e)}"
@@ -959,6 +1074,7 @@ def update_iou(iou_id, name, new_original_amount, iou_type, due_date, person_nam
             WHERE id = ?
         """, (name, new_original_amount, iou_type, due_date, person_name, description, new_current_amount, status, iou_id))
         conn.commit()
+        _after_write(get_uid(), 'iou')
         return True, "Cuenta pendiente actualizada exitosamente."
     except Exception as e:
         return False, f"Error al actualizar: {str(e)}"
@@ -1008,9 +1124,25 @@ def get_transaction_by_id(trans_id):
 
 # backend/data_manager.py
 
-# backend/data_manager.py
+def _insert_transaction(cursor, user_id, date, name, amount, category, trans_type, account_id=None, subcategory=None):
+    """INSERT en transactions + su suma en transaction_rollups (y el caché del libro), en la misma transacción."""
+    cursor.execute("""
+        INSERT INTO transactions (user_id, date, name, amount, category, type, account_id, subcategory) 
+        VALUES (?, ?, ?, ?, ?, ?, ?, ?)
+    """, (user_id, date, name, amount, category, trans_type, account_id, subcategory))
+    rollups.apply(cursor, user_id, date, trans_type, category, subcategory, amount)
+    ledger_history.mark_dirty(cursor, user_id, date)
+
+
+def _rollup_remove(cursor, trans, user_id):
+    """Resta del resumen mensual una transacción (dict de get_transaction_by_id) antes de borrarla/editarla."""
+    rollups.apply(cursor, user_id, trans['date'], trans['type'], trans['category'],
+                  trans.get('subcategory'), trans['amount'], sign=-1)
+    ledger_history.mark_dirty(cursor, user_id, trans['date'])
 
-def _adjust_account_balance(cursor, account_id, amount, trans_type, is_reversal=False, user_id=None):
+
+def _adjust_account_balance(cursor, account_id, amount, trans_type, is_reversal=False, user_id=None, check_funds=False):
+    # check_funds: el UPDATE exige que el monto siga disponible al escribir (ver backend/concurrency.py)
     if user_id is None: return 
 
     # --- CASO ESPECIAL: RESERVA DE ABONO ---
@@ -1037,34 +1169,19 @@ def _adjust_account_balance(cursor, account_id, amount, trans_type, is_reversal=
         
         # 4. Actualizar
         print(f"DEBUG: Aplicando cambio de {change} a la reserva.")
-        cursor.execute("UPDATE abono_reserve SET balance = balance + ? WHERE user_id = ?", (change, user_id))
+        if check_funds:
+            cursor.execute("UPDATE abono_reserve SET balance = balance + ? WHERE user_id = ? AND balance >= ?", (change, user_id, amount))
+            concurrency.expect_row(cursor, "El saldo de la reserva")
+        else:
+            cursor.execute("UPDATE abono_reserve SET balance = balance + ? WHERE user_id = ?", (change, user_id))
+        balance_ledger.record(cursor, user_id, 'RESERVE', change, f"reversal:{trans_type}" if is_reversal else trans_type)
         return
 
     # --- CASO NORMAL: CUENTAS BANCARIAS Y TARJETAS ---
-    # (El resto de la función se queda igual, solo asegúrate de no borrarla)
-    cursor.execute("SELECT type, current_balance FROM accounts WHERE id = ? AND user_id = ?", (account_id, user_id))
-    res = cursor.fetchone()
-    if not res: 
-        print(f"DEBUG: Cuenta {account_id} no encontrada.")
-        return 
-    
-    acc_type, current = res
-    factor = -1 if is_reversal else 1
-    
-    change = 0.0
-
-    if acc_type == 'Credit':
-        if trans_type == 'Expense':
-            change = amount * factor      
-        else: 
-            change = amount * factor * -1 
-    else:
-        if trans_type == 'Expense':
-            change = amount * factor * -1 
-        else:
-            change = amount * factor      
-        
-    cursor.execute("UPDATE accounts SET current_balance = current_balance + ? WHERE id = ? AND user_id = ?", (change, account_id, user_id))
+    # Sin SELECT previo: el signo según el tipo (en tarjetas el gasto suma deuda) lo
+    # resuelve SQL, y el cambio queda asentado en balance_ledger en la misma transacción.
+    balance_ledger.adjust(cursor, user_id, account_id, amount, trans_type, is_reversal,
+                          min_available=amount if check_funds else None)
 # backend/data_manager.py
 
 def delete_transaction(trans_id):
@@ -1090,11 +1207,12 @@ def delete_transaction(trans_id):
             user_id=uid
         )
         
-        # 3. Eliminar el registro definitivamente
+        # 3. Eliminar el registro definitivamente (y su suma del resumen mensual)
+        _rollup_remove(cursor, trans, uid)
         cursor.execute("DELETE FROM transactions WHERE id = ? AND user_id = ?", (trans_id, uid))
         
         conn.commit()
-        clear_all_caches()
+        _after_write(uid, 'transactions', 'accounts', 'abono_reserve')
         return True, "Transacción eliminada y saldo corregido."
     except Exception as e:
         conn.rollback()
@@ -1123,11 +1241,10 @@ def get_abono_balance():
 # ... (Al final del archivo) ...
 
 
-def get_credit_abono_reserve():
-    """Obtiene la reserva del usuario actual."""
-    setup_abono_reserve() # Aseguramos que la tabla esté bien
+def get_credit_abono_reserve(user_id=None):
+    """Obtiene la reserva del usuario (por defecto, el usuario actual)."""
     conn = get_connection()
-    uid = get_uid()
+    uid = user_id or get_uid()
     try:
         cur = conn.cursor()
         # Buscamos POR USER_ID, no por ID fijo
@@ -1140,12 +1257,12 @@ def get_credit_abono_reserve():
 
 def update_credit_abono_reserve(amount):
     """Actualiza la reserva del usuario actual (INSERT O UPDATE)."""
-    setup_abono_reserve()
     conn = get_connection()
     uid = get_uid()
     try:
         cursor = conn.cursor()
         
+        balance_ledger.record_set(cursor, uid, 'RESERVE', amount)
         # Verificar si ya existe fila para este usuario
         cursor.execute("SELECT id FROM abono_reserve WHERE user_id = ?", (uid,))
         row = cursor.fetchone()
@@ -1158,6 +1275,7 @@ def update_credit_abono_reserve(amount):
             cursor.execute("INSERT INTO abono_reserve (user_id, balance) VALUES (?, ?)", (uid, amount))
             
         conn.commit()
+        _after_write(uid, 'abono_reserve')
         return True, "Reserva de abono actualizada."
     except Exception as e:
         return False, str(e)
@@ -1166,12 +1284,12 @@ def update_credit_abono_reserve(amount):
 
 def update_credit_abono_reserve(amount):
     """Actualiza la reserva del usuario actual (INSERT O UPDATE)."""
-    setup_abono_reserve()
     conn = get_connection()
     uid = get_uid()
     try:
         cursor = conn.cursor()
         
+        balance_ledger.record_set(cursor, uid, 'RESERVE', amount)
         # Verificar si ya existe fila para este usuario
         cursor.execute("SELECT id FROM abono_reserve WHERE user_id = ?", (uid,))
         row = cursor.fetchone()
@@ -1184,6 +1302,7 @@ def update_credit_abono_reserve(amount):
             cursor.execute("INSERT INTO abono_reserve (user_id, balance) VALUES (?, ?)", (uid, amount))
             
         conn.commit()
+        _after_write(uid, 'abono_reserve')
         return True, "Reserva de abono actualizada."
     except Exception as e:
         return False, str(e)
@@ -1192,28 +1311,6 @@ def update_credit_abono_reserve(amount):
 
 
 
-def setup_abono_reserve():
-    conn = get_connection()
-    cursor = conn.cursor()
-    
-    id_type = "SERIAL PRIMARY KEY" if IS_POSTGRES else "INTEGER PRIMARY KEY AUTOINCREMENT"
-    
-    cursor.execute(f"""
-        CREATE TABLE IF NOT EXISTS abono_reserve (
-            id {id_type},
-            user_id INTEGER,
-            balance REAL DEFAULT 0.0
-        )
-    """)
-    
-    if not check_column_exists(cursor, 'abono_reserve', 'user_id'):
-        print("⚠️ Migrando tabla abono_reserve: Agregando user_id...")
-        cursor.execute("ALTER TABLE abono_reserve ADD COLUMN user_id INTEGER")
-        cursor.execute("UPDATE abono_reserve SET user_id = 1 WHERE id = 1")
-    
-    conn.commit()
-    conn.close()
-
 # ... (Al final del archivo, junto a las funciones de resumen de crédito) ...
 # backend/data_manager.py
 
@@ -1309,39 +1406,6 @@ from datetime import datetime, timedelta # Asegúrate de tener estos imports
 
 # ... (otras funciones) ...
 
-# --- 1. GESTIÓN DE TABLA CACHÉ (Versión Blindada) ---
-def create_market_cache_table():
-    conn = get_connection()
-    cursor = conn.cursor()
-    
-    cursor.execute("PRAGMA table_info(market_cache)")
-    columns = [info[1] for info in cursor.fetchall()]
-    
-    # AGREGAR 'company_name' a la validación para recrear la tabla si falta
-    if columns and 'company_name' not in columns:
-        print("⚠️ Actualizando estructura de tabla market_cache (Adding company_name)...")
-        cursor.execute("DROP TABLE market_cache")
-        columns = [] 
-
-    cursor.execute("""
-    CREATE TABLE IF NOT EXISTS market_cache (
-        ticker TEXT PRIMARY KEY,
-        company_name TEXT,  -- <--- NUEVA COLUMNA
-        price REAL, day_change REAL, day_change_pct REAL,
-        day_high REAL, day_low REAL, fiftyTwo_high REAL, fiftyTwo_low REAL,
-        market_cap REAL, 
-        shares_outstanding REAL, 
-        pe_ratio REAL, 
-        peg_ratio REAL, 
-        dividend_yield REAL, 
-        beta REAL,
-        sector TEXT, country TEXT, summary TEXT,
-        news TEXT, sentiment TEXT,
-        last_updated TIMESTAMP DEFAULT CURRENT_TIMESTAMP
-    )
-    """)
-    conn.commit()
-    conn.close()
 # backend/data_manage
 # backend/data_manager.py
 # backend/data_manager.py
@@ -1372,7 +1436,7 @@ def clean_ticker_display(raw_ticker):
             
     return clean
 
-@cache.memoize(timeout=300)
+@user_cached('investments', 'market_cache', timeout=300)
 def get_stocks_data(user_id, force_refresh=False):
     """
     Obtiene el portafolio del usuario actual combinando:
@@ -1392,76 +1456,27 @@ def get_stocks_data(user_id, force_refresh=False):
         my_tickers = df_investments['ticker'].unique().tolist()
         
         # 2. Lógica de Actualización de Caché (GLOBAL)
-        # Verificamos si tenemos datos en market_cache, independientemente de quién los pidió antes
-        tickers_to_fetch = []
-        
-        if force_refresh:
-            tickers_to_fetch = my_tickers
-        else:
-            # Consultamos qué tickers ya tienen datos válidos (usamos 'beta' como testigo)
-            if my_tickers:
-                placeholders = ','.join(['?'] * len(my_tickers))
-                query_check = f"SELECT ticker, beta FROM market_cache WHERE ticker IN ({placeholders})"
-                try:
-                    cached = pd.read_sql_query(query_check, conn, params=my_tickers)
-                    # Si beta es nulo, asumimos que falta info financiera y recargamos
-                    valid_cached = cached[cached['beta'].notnull()]['ticker'].tolist()
-                    tickers_to_fetch = [t for t in my_tickers if t not in valid_cached]
-                except:
-                    tickers_to_fetch = my_tickers
+        # Cada grupo (precio, perfil, métricas, noticias) tiene su marca y su TTL:
+        # solo se baja lo vencido (o todo si se forzó)
+        force = market_data.ALL_GROUPS if force_refresh else ()
+        try:
+            plan = market_data.stale_groups(conn, my_tickers, force=force)
+        except Exception as e:
+            print(f"⚠️ No se pudo revisar frescura de market_cache: {e}")
+            plan = {t: market_data.ALL_GROUPS for t in my_tickers}
 
         # 3. Consultar API Finnhub (Solo para lo que falta o si se forzó)
-        if tickers_to_fetch and finnhub_client:
-            print(f"🔄 Finnhub Updating: {tickers_to_fetch}")
-            cursor = conn.cursor()
-            
-            for t in tickers_to_fetch:
-                try:
-                    # A. Precio en vivo
-                    q = finnhub_client.quote(t)
-                    if q['c'] == 0: continue 
-                    
-                    # B. Perfil de empresa
-                    try: p = finnhub_client.company_profile2(symbol=t)
-                    except: p = {}
-                    real_name = p.get('name', t)
-                    
-                    # C. Métricas financieras
-                    try: 
-                        metrics_res = finnhub_client.company_basic_financials(t, 'all')
-                        m = metrics_res.get('metric', {})
-                    except: m = {}
-
-                    # D. Noticias
-                    try: 
-                        _today = datetime.now().strftime('%Y-%m-%d')
-                        news = finnhub_client.company_news(t, _from=_today, to=_today)[:3]
-                    except: news = []
-
-                    # INSERT OR REPLACE en la tabla GLOBAL (market_cache)
-                    # No usamos user_id aquí porque el precio de Apple es igual para todos
-                    cursor.execute("""
-                    INSERT OR REPLACE INTO market_cache (
-                        ticker, company_name, price, day_change, day_change_pct, day_high, day_low, 
-                        fiftyTwo_high, fiftyTwo_low, 
-                        market_cap, pe_ratio, dividend_yield, beta,
-                        sector, country, summary, news, sentiment, last_updated
-                    ) 
-                    VALUES (?,?,?,?,?,?,?,?,?,?,?,?,?,?,?,?,?,?, datetime('now','localtime'))
-                    """, (
-                        t, real_name,
-                        q.get('c', 0), q.get('d', 0), q.get('dp', 0), q.get('h', 0), q.get('l', 0),
-                        m.get('52WeekHigh', 0), m.get('52WeekLow', 0), 
-                        p.get('marketCapitalization', 0), 
-                        m.get('pfcfShareTTM', 0) if m.get('peBasicExclExtraTTM') is None else m.get('peBasicExclExtraTTM', 0),
-                        m.get('dividendYieldIndicatedAnnual', 0), m.get('beta', 0),
-                        p.get('finnhubIndustry', 'N/A'), p.get('country', 'N/A'), p.get('currency', 'USD'), 
-                        json.dumps(news), json.dumps({})
-                    ))
-                    conn.commit()
-                    time.sleep(0.2) # Pequeña pausa para no saturar API
-                except Exception as e: 
-                    print(f"❌ Error API {t}: {e}")
+        # Si el planificador está vivo, él baja lo que falta: aquí solo leemos la DB
+        if plan and market_scheduler.is_running():
+            market_scheduler.wake()
+        elif plan and finnhub_client:
+            print(f"🔄 Finnhub Updating: {plan}")
+            # En paralelo, con límite de cuota y un solo commit (ver backend/market_data.py)
+            res = market_data.refresh_plan(plan, conn=conn)
+            for t, err in res['errors'].items():
+                print(f"❌ Error API {t}: {err}")
+            if res['updated']:
+                invalidate(None, 'market_cache')
 
         # 4. LEER DATOS COMBINADOS (User + Global)
         # Unimos las inversiones DEL USUARIO con el caché GLOBAL
@@ -1549,7 +1564,8 @@ def get_data_timestamp():
         if not table_exists: 
             return "Nunca"
 
-        cursor.execute("SELECT MAX(last_updated) FROM market_cache")
+        # La etiqueta es de precios: usamos la marca del grupo quote (last_updated en filas viejas)
+        cursor.execute("SELECT MAX(COALESCE(quote_updated_at, last_updated)) FROM market_cache")
         res = cursor.fetchone()
         
         if res and res[0]:
@@ -1578,7 +1594,7 @@ def get_data_timestamp():
     finally:
         conn.close()
 
-@cache.memoize(timeout=60)
+@user_cached('accounts', 'abono_reserve', 'iou', 'investments', 'market_cache', timeout=60)
 def get_net_worth_breakdown(user_id, force_refresh=False):
     conn = get_connection()
     uid = user_id
@@ -1590,7 +1606,7 @@ def get_net_worth_breakdown(user_id, force_refresh=False):
         credit = df_acc[df_acc['type'] == 'Credit']['current_balance'].sum()
         
         # Reserva
-        res = get_credit_abono_reserve()
+        res = get_credit_abono_reserve(uid)
         
         # IOU
         df_iou = pd.read_sql_query("SELECT type, current_amount FROM iou WHERE user_id = ? AND status='Pending'", conn, params=(uid,))
@@ -1663,12 +1679,15 @@ def update_transaction(trans_id, new_date, new_name, new_amount, new_category, n
             SET date = ?, name = ?, amount = ?, category = ?, type = ?, account_id = ?, subcategory = ?
             WHERE id = ? AND user_id = ?
         """, (new_date, new_name, new_amount, new_category, new_type, db_new_account_id, new_subcategory, trans_id, uid))
+        _rollup_remove(cursor, old_trans, uid)
+        rollups.apply(cursor, uid, new_date, new_type, new_category, new_subcategory, new_amount)
+        ledger_history.mark_dirty(cursor, uid, min(str(new_date)[:10], str(old_trans['date'])[:10]))
 
         # 4. Aplicar nuevo saldo (Usando ID lógico new_account_id)
         _adjust_account_balance(cursor, new_account_id, new_amount, new_type, is_reversal=False, user_id=uid)
         
         conn.commit()
-        clear_all_caches()
+        _after_write(uid, 'transactions', 'accounts', 'abono_reserve')
         return True, "Actualizado."
     except Exception as e:
         conn.rollback()
@@ -1694,6 +1713,7 @@ def add_custom_category(name):
     try:
         conn.execute("INSERT INTO categories (user_id, name) VALUES (?, ?)", (uid, name))
         conn.commit()
+        invalidate(uid, 'categories')
         return True, "Creada."
     except: return False, "Error."
     finally: conn.close()
@@ -1764,161 +1784,166 @@ def import_historical_data(df):
         # (Opcional: podrías decidir no borrar si quieres cargas incrementales)
         cursor.execute("DELETE FROM historical_net_worth WHERE user_id = ?", (uid,))
         
-        count = 0
-        for _, row in df.iterrows():
-            # Asumimos formato YYYY-MM-DD
-            d_val = pd.to_datetime(row['Date']).strftime('%Y-%m-%d')
-            nw_val = float(row['Net_Worth'])
-            
-            cursor.execute("INSERT INTO historical_net_worth (user_id, date, net_worth) VALUES (?, ?, ?)", 
-                           (uid, d_val, nw_val))
-            count += 1
+        # Normalización vectorizada (antes: iterrows + un INSERT por fila)
+        days = pd.to_datetime(df['Date'], errors='coerce').dt.strftime('%Y-%m-%d')
+        values = pd.to_numeric(df['Net_Worth'], errors='coerce')
+        valid = days.notna() & values.notna()
+        rows = list(zip([uid] * int(valid.sum()), days[valid].tolist(), values[valid].astype(float).tolist()))
+
+        # Fechas repetidas en el archivo: gana la última (índice único user_id+date)
+        cursor.executemany("""
+            INSERT INTO historical_net_worth (user_id, date, net_worth) VALUES (?, ?, ?)
+            ON CONFLICT (user_id, date) DO UPDATE SET net_worth = excluded.net_worth
+        """, rows)
+        count = len(rows)
             
         conn.commit()
+        invalidate(uid, 'historical_net_worth')
+        # Se reemplazó el historial completo: la serie guardada ya no sirve
+        networth_history.reset(uid)
         return True, f"Se importaron {count} registros históricos."
     except Exception as e:
         return False, f"Error DB: {str(e)}"
     finally:
         conn.close()
 
-# backend/data_manager.py
-
-# --- OPTIMIZACIÓN HISTORIAL PATRIMONIO ---
 
-@cache.memoize(timeout=300)
-def _get_full_networth_history_cached(user_id):
+def import_bank_statement(contents, filename, account_id, category=None, dayfirst=True):
+    """
+    Importa un extracto bancario (CSV / OFX / XLSX) del dcc.Upload a una cuenta.
+    Lectura por bloques y sin duplicar lo ya registrado (ver backend/statement_import.py).
+    El saldo se ajusta UNA vez con el neto del archivo, no fila por fila.
+    """
+    uid = get_uid()
+    if not uid: return False, "Sesión no válida."
+    if not contents: return False, "No se recibió ningún archivo."
     conn = get_connection()
     try:
-        # 1. Obtener Histórico CONGELADO...
-        df_db = pd.read_sql_query(
-            "SELECT date, net_worth FROM historical_net_worth WHERE user_id = ? ORDER BY date ASC", 
-            conn, params=(user_id,)
-        )
-        
-        if not df_db.empty:
-            df_db['date'] = pd.to_datetime(df_db['date']).dt.date
-
-        # 2. Calcular el Valor EN VIVO de Hoy
-        # --- CORRECCIÓN AQUÍ: Pasar user_id ---
-        nw_data = get_net_worth_breakdown(user_id, force_refresh=False) 
-        current_val = nw_data['net_worth']
-        today_date = date.today()
+        cursor = conn.cursor()
+        db_account_id = None if account_id == 'RESERVE' else account_id
+        if db_account_id is not None:
+            cursor.execute("SELECT 1 FROM accounts WHERE id = ? AND user_id = ?", (db_account_id, uid))
+            if not cursor.fetchone(): return False, "Cuenta no encontrada."
 
-        # 3. Integrar "Hoy" al DataFrame
-        # Si ya existe un registro de hoy en DB (porque se guardó snapshot hace rato),
-        # lo sobrescribimos con el valor en vivo para el gráfico.
-        row_today = pd.DataFrame([{'date': today_date, 'net_worth': current_val}])
-        
-        if df_db.empty:
-            df_final = row_today
-        else:
-            # Eliminar si ya existe hoy para poner la versión más fresca
-            df_db = df_db[df_db['date'] < today_date]
-            df_final = pd.concat([df_db, row_today], ignore_index=True)
+        chunks = statement_import.iter_chunks(statement_import.open_upload(contents), filename)
+        stats = statement_import.import_rows(cursor, uid, db_account_id, chunks,
+                                             category or statement_import.DEFAULT_CATEGORY, dayfirst)
 
-        # 4. RELLENO DE HUECOS (Forward Fill) - LA PARTE CLAVE
-        # Creamos un índice con TODOS los días desde el inicio hasta hoy
-        min_date = df_final['date'].min()
-        idx = pd.date_range(min_date, today_date)
-        
-        # Indexamos por fecha
-        df_final = df_final.set_index('date')
-        
-        # Reindexamos para crear las filas vacías de los días que no entraste
-        df_final = df_final.reindex(idx.date)
-        
-        # ffill(): Copia el valor anterior hacia adelante en los huecos
-        df_final['net_worth'] = df_final['net_worth'].ffill()
-        
-        # Reset index para devolver formato normal
-        df_final = df_final.reset_index().rename(columns={'index': 'date'})
-        
-        # Calcular variación diaria (net_change) sobre la serie ya rellena
-        df_final['net_change'] = df_final['net_worth'].diff().fillna(0)
-        
-        return df_final
+        if stats['inserted']:
+            net = round(stats['net'], 2)
+            if net:
+                _adjust_account_balance(cursor, account_id, abs(net), 'Income' if net > 0 else 'Expense',
+                                        is_reversal=False, user_id=uid)
+            ledger_history.mark_dirty(cursor, uid, stats['first_day'])
 
+        conn.commit()
+        if stats['inserted']:
+            _after_write(uid, 'transactions', 'accounts', 'abono_reserve')
+
+        msg = f"Se importaron {stats['inserted']} movimientos."
+        if stats['duplicates']: msg += f" {stats['duplicates']} ya existían."
+        if stats['invalid']: msg += f" {stats['invalid']} filas sin fecha o monto válidos."
+        return True, msg
+    except ValueError as e:
+        conn.rollback()
+        return False, str(e)
     except Exception as e:
-        print(f"Error calculando historial ffill: {e}")
-        return pd.DataFrame()
+        conn.rollback()
+        return False, f"Error al importar: {str(e)}"
     finally:
         conn.close()
 
-    
-
-# --- EN backend/data_manager.py ---
-
-# --- EN backend/data_manager.py ---
-
-def capture_daily_snapshot():
+def import_user_dataset(contents, filename, start_date=None, end_date=None):
+    """
+    Agrega al usuario un respaldo .zip (Parquet) exportado desde /reportes.
+    Solo entra lo que no existe (ver backend/columnar_export.py).
+    """
+    uid = get_uid()
+    if not uid: return False, "Sesión no válida."
+    if not contents: return False, "No se recibió ningún archivo."
+    if not str(filename or '').lower().endswith('.zip'):
+        return False, "El respaldo debe ser el .zip exportado en formato Parquet."
     conn = get_connection()
     try:
-        # 1. Obtener UID PRIMERO
-        uid = get_uid()
-        if not uid: return # Seguridad
-
-        # 2. Obtener el valor real de HOY (Pasando el UID)
-        data = get_net_worth_breakdown(uid, force_refresh=False) # <--- CORRECCIÓN
-        current_nw = data['net_worth']
-        
-        date_str = date.today().strftime('%Y-%m-%d')
-        
-        cursor = conn.cursor()
-        
-        # 2. Verificar si ya existe registro de hoy
-        cursor.execute("SELECT id FROM historical_net_worth WHERE user_id = ? AND date = ?", (uid, date_str))
-        row = cursor.fetchone()
-        
-        if row:
-            # ACTUALIZAR: El día no ha acabado, seguimos ajustando el valor de hoy
-            cursor.execute("UPDATE historical_net_worth SET net_worth = ? WHERE id = ?", (current_nw, row[0]))
-        else:
-            # INSERTAR: Primer movimiento del día
-            cursor.execute("INSERT INTO historical_net_worth (user_id, date, net_worth) VALUES (?, ?, ?)", (uid, date_str, current_nw))
-            
+        summary = columnar_export.import_dataset(statement_import.open_upload(contents), uid,
+                                                 start_date, end_date, conn=conn)
         conn.commit()
-        
-        # 3. Importante: Limpiar caché del historial para que el gráfico se actualice
-        # Usamos delete_memoized directamente sobre la función interna
-        try:
-            cache.delete_memoized(_get_full_networth_history_cached)
-        except:
-            pass
-            
+        invalidate(uid, 'transactions', 'accounts', 'card_terms', 'investments', 'investment_transactions',
+                   'historical_net_worth')
+        networth_history.reset(uid)
+
+        tx, inv = summary['transactions'], summary['investment_transactions']
+        msg = (f"Respaldo importado: {tx['inserted']} movimientos, {inv['inserted']} operaciones de inversión, "
+               f"{summary['historical_net_worth']} días de patrimonio.")
+        if summary['accounts_created']: msg += f" {summary['accounts_created']} cuentas nuevas."
+        if summary['positions_created']: msg += f" {summary['positions_created']} posiciones nuevas."
+        if tx['duplicates'] or inv['duplicates']: msg += f" {tx['duplicates'] + inv['duplicates']} ya existían."
+        if tx['skipped']: msg += f" ⚠️ {tx['skipped']} movimientos omitidos: su cuenta no venía en el respaldo."
+        return True, msg
+    except zipfile.BadZipFile:
+        conn.rollback()
+        return False, "El archivo no es un .zip válido."
+    except (ValueError, RuntimeError) as e:
+        conn.rollback()
+        return False, str(e)
     except Exception as e:
-        print(f"⚠️ Error en auto-snapshot: {e}")
+        conn.rollback()
+        return False, f"Error al importar: {str(e)}"
     finally:
         conn.close()
 
+# backend/data_manager.py
+
+# --- OPTIMIZACIÓN HISTORIAL PATRIMONIO ---
+# La serie diaria (rellenada con ffill) vive en backend/networth_history.py:
+# se guarda por usuario en el caché y se actualiza de forma incremental.
+
+def capture_daily_snapshot(user_id=None):
+    """
+    Guarda YA el patrimonio de hoy de un usuario (normalmente lo hace el job en lote
+    cada SNAPSHOT_INTERVAL para todos, ver backend/snapshot_job.py).
+    """
+    uid = user_id or get_uid()
+    if not uid: return  # Seguridad
+    try:
+        snapshot_job.run_batch(user_ids=[uid])
+    except Exception as e:
+        print(f"⚠️ Error en snapshot: {e}")
+
 
 # --- EN backend/data_manager.py ---
 
-def get_historical_networth_trend(start_date=None, end_date=None):
+def get_historical_networth_trend(start_date=None, end_date=None, max_points=None, use_ledger=True, user_id=None):
     """
-    Función LIGERA: Solo filtra el DataFrame que ya está en memoria.
-    CORREGIDA: Maneja correctamente la comparación entre Timestamp y datetime.date.
+    Historial de patrimonio [date, net_worth, net_change] entre start_date y end_date.
+    HOY usa el valor en vivo; los días sin snapshot siguen el movimiento reconstruido
+    desde el libro (use_ledger) o repiten el valor anterior.
+    max_points: reduce la ventana a ~N puntos (LTTB) para los gráficos.
+    user_id: para llamadas fuera de un request (ej. exportación en segundo plano).
     """
+    uid = user_id or get_uid()
+    if not uid: return pd.DataFrame()
+
+    try:
+        # Mismo cálculo (memoizado) que el panel de patrimonio del dashboard
+        today_value = get_net_worth_breakdown(uid, force_refresh=False)['net_worth']
+        ledger = (lambda lo, hi: ledger_history.networth_values(uid, lo, hi)) if use_ledger else None
+        return networth_history.window(uid, start_date, end_date, max_points=max_points,
+                                       today_value=today_value, ledger=ledger)
+    except Exception as e:
+        print(f"Error calculando historial de patrimonio: {e}")
+        return pd.DataFrame()
+
+
+def get_ledger_networth_trend(start_date=None, end_date=None):
+    """Patrimonio diario reconstruido SOLO desde el libro de movimientos (sin snapshots)."""
     uid = get_uid()
-    
-    # 1. Llamada instantánea al Caché
-    df = _get_full_networth_history_cached(uid)
-    
-    if df.empty: return df
-    
-    # 2. Filtrado Rápido en Memoria
-    # El DataFrame 'df' viene con la columna 'date' como objetos datetime.date (por la lógica del ffill)
-    # Por lo tanto, debemos convertir start_date y end_date a .date() antes de comparar.
-    
-    if start_date:
-        # pd.to_datetime convierte string a Timestamp, y .date() lo pasa al formato compatible
-        s_date = pd.to_datetime(start_date).date()
-        df = df[df['date'] >= s_date]
-    
-    if end_date:
-        e_date = pd.to_datetime(end_date).date()
-        df = df[df['date'] <= e_date]
-        
-    return df
+    if not uid: return pd.DataFrame()
+    try:
+        return ledger_history.daily_networth(uid, start_date, end_date)
+    except Exception as e:
+        print(f"Error reconstruyendo patrimonio desde el libro: {e}")
+        return pd.DataFrame()
 
 def _get_price_finnhub(ticker_symbol, avg_price_fallback=0):
     """
@@ -2089,7 +2114,7 @@ def add_stock(ticker, shares, total_investment, asset_type="Stock", account_id=N
         """, (uid, ticker.upper(), shares, avg_price, total_investment, asset_type, account_id, new_order))
         
         conn.commit()
-        clear_all_caches()
+        _after_write(uid, 'investments')
         return True, f"Agregado: {clean_ticker_display(ticker)} ({asset_type})"
     except Exception as e:
         return False, str(e)
@@ -2123,12 +2148,12 @@ def update_investment(inv_id, new_shares, new_total_investment):
         # 2. Actualizar la DB con los 3 valores proporcionados por el usuario/cálculo
         cursor.execute("""
             UPDATE investments 
-            SET shares = ?, total_investment = ?, avg_price = ?
+            SET shares = ?, total_investment = ?, avg_price = ?, version = version + 1
             WHERE id = ?
         """, (new_shares, new_total_investment, new_avg_price, inv_id))
         
         conn.commit()
-        clear_all_caches()
+        _after_write(get_uid(), 'investments')
         # 🚨 MENSAJE CORREGIDO: Devolver el nuevo costo promedio para confirmar el cambio.
         return True, f"Posición actualizada. Nuevo Costo Promedio: ${new_avg_price:,.2f}"
     except Exception as e:
@@ -2144,6 +2169,7 @@ def delete_investment(inv_id):
     try:
         conn.execute("DELETE FROM investments WHERE id = ? AND user_id = ?", (inv_id, uid))
         conn.commit()
+        _after_write(uid, 'investments')
         return True, "Eliminado."
     except Exception as e: return False, str(e)
     finally: conn.close()
@@ -2153,10 +2179,9 @@ def get_stock_historical_data(ticker, time_period='1Y'):
     """
     Obtiene datos históricos (cierre ajustado) para un ticker y periodo.
     time_period: '1D', '1W', '1M', '3M', 'YTD', '1Y', '5Y'
+    Las velas se guardan en price_history: cambiar de periodo es una consulta
+    local más, como mucho, una llamada incremental a la API.
     """
-    if not finnhub_client:
-        return pd.DataFrame()
-
     clean_ticker = str(ticker).strip().upper()
     today = int(time.time())
 
@@ -2191,17 +2216,14 @@ def get_stock_historical_data(ticker, time_period='1Y'):
             return pd.DataFrame()
             
     try:
-        # Llamada a la API
-        response = finnhub_client.stock_candles(clean_ticker, res, start_time, today)
-
-        if response and response['s'] == 'ok':
-            # 'c' = close price, 't' = timestamp (seconds)
+        # Lectura desde price_history (solo se pide a Finnhub el tramo que falta)
+        candles = market_data.get_candles(clean_ticker, res, start_time, today)
+        if not candles.empty:
+            # 'close' = precio de cierre, 'ts' = timestamp (segundos)
             df = pd.DataFrame({
-                'date': pd.to_datetime(response['t'], unit='s'),
-                'price': response['c']
+                'date': pd.to_datetime(candles['ts'], unit='s'),
+                'price': candles['close']
             })
-            # Filtrar si la fecha está antes del rango (puede pasar con Finnhub)
-            df = df[df['date'] >= pd.to_datetime(start_time, unit='s')]
             return df.set_index('date')
             
     except Exception as e:
@@ -2253,6 +2275,7 @@ def add_realized_pl_adjustment(ticker, realized_pl):
             VALUES (?, ?, ?, ?, 'Ajuste manual')
         """, (uid, date.today().strftime('%Y-%m-%d'), ticker.upper(), realized_pl))
         conn.commit()
+        _after_write(uid, 'pl_adjustments')
         return True, "Registrado."
     except Exception as e: return False, str(e)
     finally: conn.close()
@@ -2285,6 +2308,7 @@ def get_investments_for_sale_dropdown():
 
 # backend/data_manager.py (Nueva Función)
 
+@concurrency.retrying
 def undo_investment_transaction(trade_id):
     """Anula una transacción verificando que pertenezca al usuario."""
     conn = get_connection()
@@ -2303,7 +2327,7 @@ def undo_investment_transaction(trade_id):
         price = trade['price']
         
         # 2. Obtener posición actual
-        cursor.execute("SELECT shares, avg_price, total_investment FROM investments WHERE ticker = ? AND user_id = ?", (ticker, uid))
+        cursor.execute("SELECT shares, avg_price, total_investment, version FROM investments WHERE ticker = ? AND user_id = ?", (ticker, uid))
         pos = cursor.fetchone()
         
         # Si la posición ya no existe (ej. vendió todo), la recreamos si es reversión de venta
@@ -2328,7 +2352,9 @@ def undo_investment_transaction(trade_id):
 
         # 4. Update o Insert en Investments
         if pos:
-            cursor.execute("UPDATE investments SET shares=?, avg_price=?, total_investment=? WHERE ticker=? AND user_id=?", (new_shares, new_avg, new_total_inv, ticker, uid))
+            cursor.execute("UPDATE investments SET shares=?, avg_price=?, total_investment=?, version = version + 1 "
+                           "WHERE ticker=? AND user_id=? AND version=?", (new_shares, new_avg, new_total_inv, ticker, uid, pos[3]))
+            concurrency.expect_row(cursor, "La posición")
         else:
             # Si se había borrado la posición, la revivimos
             # Nota: Necesitamos un display_order, usamos 0 por defecto
@@ -2336,10 +2362,13 @@ def undo_investment_transaction(trade_id):
 
         # 5. Borrar del historial
         cursor.execute("DELETE FROM investment_transactions WHERE id = ?", (trade_id,))
+        ledger_history.mark_dirty(cursor, uid, trade['date'])
         conn.commit()
+        _after_write(uid, 'investments', 'investment_transactions')
         return True, "Revertido."
     except Exception as e:
         conn.rollback()
+        if concurrency.is_retryable(e): raise
         return False, str(e)
     finally: conn.close()
 
@@ -2372,6 +2401,7 @@ def update_pl_adjustment(adj_id, new_pl, new_ticker):
         cursor = conn.cursor()
         cursor.execute("UPDATE pl_adjustments SET realized_pl=?, ticker=? WHERE id=? AND user_id=?", (new_pl, new_ticker.upper(), adj_id, uid))
         conn.commit()
+        _after_write(uid, 'pl_adjustments')
         return True, "Actualizado."
     except Exception as e: return False, str(e)
     finally: conn.close()
@@ -2421,6 +2451,7 @@ def get_investment_by_id(inv_id):
 
 # ... (Las funciones auxiliares get_investment_by_ticker, get_simulator_ticker_data, etc., se mantienen) ...
 
+@concurrency.retrying
 def add_buy(ticker, shares_bought, buy_price):
     """Registra una compra y actualiza la posición del usuario."""
     conn = get_connection()
@@ -2429,8 +2460,8 @@ def add_buy(ticker, shares_bought, buy_price):
     date_bought = date.today().strftime('%Y-%m-%d')
     
     try:
-        # 1. Buscar si el usuario YA tiene este activo
-        cursor.execute("SELECT shares, avg_price, total_investment FROM investments WHERE ticker = ? AND user_id = ?", (ticker, uid))
+        # 1. Buscar si el usuario YA tiene este activo (con su versión, para el compare-and-set)
+        cursor.execute("SELECT shares, avg_price, total_investment, version FROM investments WHERE ticker = ? AND user_id = ?", (ticker, uid))
         pos_data = cursor.fetchone()
         
         total_transaction = shares_bought * buy_price
@@ -2442,18 +2473,20 @@ def add_buy(ticker, shares_bought, buy_price):
             avg_cost_at_trade = buy_price 
         else:
             # Actualizar posición existente del usuario
-            shares_current, avg_cost_current, total_inv_current = pos_data
+            shares_current, avg_cost_current, total_inv_current, version = pos_data
             
             new_total_inv = total_inv_current + total_transaction
             new_shares_total = shares_current + shares_bought
             new_avg_price = new_total_inv / new_shares_total
             avg_cost_at_trade = new_avg_price 
             
+            # Solo si nadie tocó la posición desde que la leímos (si no, se reintenta todo)
             cursor.execute("""
                 UPDATE investments 
-                SET shares = ?, avg_price = ?, total_investment = ?
-                WHERE ticker = ? AND user_id = ?
-            """, (new_shares_total, new_avg_price, new_total_inv, ticker, uid))
+                SET shares = ?, avg_price = ?, total_investment = ?, version = version + 1
+                WHERE ticker = ? AND user_id = ? AND version = ?
+            """, (new_shares_total, new_avg_price, new_total_inv, ticker, uid, version))
+            concurrency.expect_row(cursor, "La posición")
             
         # 2. Registrar en Historial (Con user_id)
         cursor.execute("""
@@ -2462,15 +2495,17 @@ def add_buy(ticker, shares_bought, buy_price):
         """, (uid, date_bought, ticker, shares_bought, buy_price, total_transaction, avg_cost_at_trade))
         
         conn.commit()
-        clear_all_caches()
+        _after_write(uid, 'investments', 'investment_transactions')
         return True, f"Compra registrada."
     except Exception as e:
         conn.rollback()
+        if concurrency.is_retryable(e): raise
         return False, f"Error DB: {str(e)}"
     finally:
         conn.close()
 
 
+@concurrency.retrying
 def add_sale(ticker, shares_sold, sale_price):
     """Registra una venta y calcula P/L para el usuario."""
     conn = get_connection()
@@ -2480,13 +2515,13 @@ def add_sale(ticker, shares_sold, sale_price):
     
     try:
         # 1. Verificar propiedad del activo
-        cursor.execute("SELECT shares, avg_price, total_investment FROM investments WHERE ticker = ? AND user_id = ?", (ticker, uid))
+        cursor.execute("SELECT shares, avg_price, total_investment, version FROM investments WHERE ticker = ? AND user_id = ?", (ticker, uid))
         pos = cursor.fetchone()
         
         if not pos or pos[0] < shares_sold:
             return False, "Unidades insuficientes."
             
-        shares_current, avg_cost, total_inv = pos
+        shares_current, avg_cost, total_inv, version = pos
         
         # 2. Calcular P/L
         realized_pl = (sale_price - avg_cost) * shares_sold
@@ -2503,15 +2538,19 @@ def add_sale(ticker, shares_sold, sale_price):
         # El costo promedio NO cambia en una venta, solo el total invertido baja
         new_total_investment = avg_cost * new_shares 
         
+        # Compare-and-set: si otra compra/venta cambió la posición, se reintenta con los datos nuevos
         cursor.execute("""
-            UPDATE investments SET shares = ?, total_investment = ? WHERE ticker = ? AND user_id = ?
-        """, (new_shares, new_total_investment, ticker, uid))
+            UPDATE investments SET shares = ?, total_investment = ?, version = version + 1
+            WHERE ticker = ? AND user_id = ? AND version = ?
+        """, (new_shares, new_total_investment, ticker, uid, version))
+        concurrency.expect_row(cursor, "La posición")
         
         conn.commit()
-        clear_all_caches()
+        _after_write(uid, 'investments', 'investment_transactions')
         return True, f"Venta registrada. P&L: ${realized_pl:,.2f}"
     except Exception as e:
         conn.rollback()
+        if concurrency.is_retryable(e): raise
         return False, str(e)
     finally:
         conn.close()
@@ -2528,7 +2567,7 @@ def delete_sale(sale_id):
     
     try:
         # 1. Obtener los datos de la venta a anular
-        df_sale = pd.read_sql_query("SELECT ticker, shares, type FROM investment_transactions WHERE id = ?", conn, params=(sale_id,))
+        df_sale = pd.read_sql_query("SELECT ticker, shares, type, date FROM investment_transactions WHERE id = ?", conn, params=(sale_id,))
         if df_sale.empty or df_sale.iloc[0]['type'] != 'SELL':
             return False, "Venta no encontrada o no es una venta."
             
@@ -2539,13 +2578,15 @@ def delete_sale(sale_id):
         # 2. Restaurar las unidades en la tabla 'investments'
         # Nota: Asumimos que el costo promedio NO cambia al anular una venta
         cursor.execute("""
-            UPDATE investments SET shares = shares + ? WHERE ticker = ?
+            UPDATE investments SET shares = shares + ?, version = version + 1 WHERE ticker = ?
         """, (shares_to_restore, ticker))
         
         # 3. Eliminar el registro de la venta
         cursor.execute("DELETE FROM investment_transactions WHERE id = ?", (sale_id,))
+        ledger_history.mark_dirty(cursor, get_uid(), sale['date'])
         
         conn.commit()
+        _after_write(get_uid(), 'investments', 'investment_transactions')
         return True, f"Venta de {ticker} anulada. {shares_to_restore} unidades restauradas."
         
     except Exception as e:
@@ -2728,15 +2769,13 @@ def make_iou_payment(iou_id, payment_amount, account_id=None):
             # Manejo de Reserva vs Cuenta Normal
             db_acc_id = None if account_id == 'RESERVE' else account_id
             
-            cursor.execute("""
-                INSERT INTO transactions (date, name, amount, category, type, account_id) 
-                VALUES (?, ?, ?, ?, ?, ?)
-            """, (date_today, trans_name, payment_amount, 'Deudas/Cobros', trans_type, db_acc_id))
+            _insert_transaction(cursor, get_uid(), date_today, trans_name, payment_amount, 'Deudas/Cobros', trans_type, db_acc_id)
 
             _adjust_account_balance(cursor, account_id, payment_amount, trans_type, is_reversal=False)
             msg += " Movimiento registrado en cuenta."
 
         conn.commit()
+        _after_write(get_uid(), 'iou', 'transactions', 'accounts', 'abono_reserve')
         # ✅ ESTE ES EL RETORNO CLAVE DE 4 VALORES
         return True, msg, new_amount, new_status
         
@@ -2754,10 +2793,11 @@ def make_iou_payment(iou_id, payment_amount, account_id=None):
 
 # --- EN backend/data_manager.py ---
 
+@concurrency.retrying
 def process_card_payment(card_id, amount, source_id=None):
     """
-    Procesa el pago de una tarjeta de crédito.
-    CORREGIDO: Ahora pasa user_id a _adjust_account_balance para que el saldo cambie.
+    Procesa el pago de una tarjeta de crédito (asiento de 1 o 2 patas, ver backend/journal.py).
+    Desde la reserva solo baja su saldo; desde una cuenta queda también la transacción de salida.
     """
     conn = get_connection()
     cursor = conn.cursor()
@@ -2765,67 +2805,39 @@ def process_card_payment(card_id, amount, source_id=None):
     date_today = date.today().strftime('%Y-%m-%d')
     
     try:
-        # 1. Validar Tarjeta
-        cursor.execute("SELECT name, current_balance FROM accounts WHERE id = ? AND user_id = ?", (card_id, uid))
-        res = cursor.fetchone()
-        if not res: return False, "Tarjeta no encontrada."
-        card_name, current_debt = res
+        # 1. Tarjeta y origen en un solo SELECT
+        accounts = journal.load_accounts(cursor, uid, [card_id, source_id])
+        card = accounts.get(str(card_id))
+        if not card: return False, "Tarjeta no encontrada."
         
         source_name = "Origen Externo"
+        legs = []
         
         # 2. Manejo del Origen de Fondos
         if source_id:
-            if source_id == "RESERVE":
-                # A. PAGO DESDE RESERVA
-                # Usamos user_id para buscar la reserva correcta
-                cursor.execute("SELECT balance FROM abono_reserve WHERE user_id = ?", (uid,))
-                res_res = cursor.fetchone()
-                reserve_bal = res_res[0] if res_res else 0.0
-                
-                if amount > reserve_bal + 0.01:
-                    return False, f"Saldo insuficiente en Reserva (${reserve_bal:,.2f})."
-                
-                cursor.execute("UPDATE abono_reserve SET balance = balance - ? WHERE user_id = ?", (amount, uid))
-                source_name = "Reserva de Abono"
-                
-            else:
-                # B. PAGO DESDE CUENTA BANCARIA
-                cursor.execute("SELECT name, current_balance, type FROM accounts WHERE id = ? AND user_id = ?", (source_id, uid))
-                res_acc = cursor.fetchone()
-                if not res_acc: return False, "Cuenta de origen no encontrada."
-                acc_name, acc_bal, acc_type = res_acc
-                
-                if amount > acc_bal + 0.01:
-                    return False, f"Saldo insuficiente en {acc_name} (${acc_bal:,.2f})."
-                
-                # Registrar GASTO en la cuenta de origen
-                # 🚨 CORRECCIÓN: PASAMOS user_id=uid
-                _adjust_account_balance(cursor, source_id, amount, 'Expense', is_reversal=False, user_id=uid)
-                
-                # Registrar transacción de salida
-                cursor.execute("""
-                    INSERT INTO transactions (user_id, date, name, amount, category, type, account_id, subcategory) 
-                    VALUES (?, ?, ?, ?, 'Transferencia/Pago', 'Expense', ?, 'Pago Tarjeta')
-                """, (uid, date_today, f"Pago a {card_name}", amount, source_id))
-                
-                source_name = acc_name
+            source = accounts.get(str(source_id))
+            if not source: return False, "Cuenta de origen no encontrada."
+            source_name = source['name']
+            out_leg = {'account_id': source_id, 'amount': amount, 'effect': 'Expense'}
+            if source_id != "RESERVE":
+                out_leg.update(name=f"Pago a {card['name']}", category='Transferencia/Pago', subcategory='Pago Tarjeta', date=date_today)
+            legs.append(out_leg)
 
         # 3. APLICAR PAGO A LA TARJETA (Disminuir deuda)
-        # 🚨 CORRECCIÓN: PASAMOS user_id=uid
-        _adjust_account_balance(cursor, card_id, amount, 'Income', is_reversal=False, user_id=uid)
+        legs.append({'account_id': card_id, 'amount': amount, 'effect': 'Income', 'check_funds': False,
+                     'name': f"Pago desde {source_name}", 'category': 'Transferencia/Pago',
+                     'subcategory': 'Abono/Pago', 'date': date_today})
         
-        # Registrar transacción de entrada en la tarjeta
-        cursor.execute("""
-            INSERT INTO transactions (user_id, date, name, amount, category, type, account_id, subcategory) 
-            VALUES (?, ?, ?, ?, 'Transferencia/Pago', 'Income', ?, 'Abono/Pago')
-        """, (uid, date_today, f"Pago desde {source_name}", amount, card_id))
+        ok, msg = journal.post_journal_entry(cursor, uid, legs, 'card_payment', tolerance=0.01, accounts=accounts)
+        if not ok: return False, msg
         
         conn.commit()
-        clear_all_caches() # Limpiamos caché para que se vea reflejado al instante
+        _after_write(uid, 'transactions', 'accounts', 'abono_reserve') # Limpiamos caché para que se vea reflejado al instante
         return True, f"Pago de ${amount:,.2f} aplicado ({source_name})."
         
     except Exception as e:
         conn.rollback()
+        if concurrency.is_retryable(e): raise
         return False, f"Error al procesar pago: {str(e)}"
     finally:
         conn.close()
@@ -2833,117 +2845,44 @@ def process_card_payment(card_id, amount, source_id=None):
 
 # --- EN backend/data_manager.py ---
 
+@concurrency.retrying
 def add_transfer(date_val, name, amount, source_acc_id, dest_acc_id):
     conn = get_connection()
     cursor = conn.cursor()
     uid = get_uid()
 
     try:
-        # 1. Validar fondos en origen
-        has_funds, error_msg = _check_sufficient_funds(cursor, source_acc_id, amount, uid)
-        if not has_funds:
-            return False, error_msg
-
-        # 2. Obtener NOMBRES de las cuentas (Para la subcategoría)
-        cursor.execute("SELECT name FROM accounts WHERE id = ? AND user_id = ?", (source_acc_id, uid))
-        res_src = cursor.fetchone()
-        src_name = res_src[0] if res_src else "Cuenta Origen"
-
-        cursor.execute("SELECT name FROM accounts WHERE id = ? AND user_id = ?", (dest_acc_id, uid))
-        res_dest = cursor.fetchone()
-        dest_name = res_dest[0] if res_dest else "Cuenta Destino"
+        # 1. Ambas cuentas en un solo SELECT (nombres para la subcategoría)
+        accounts = journal.load_accounts(cursor, uid, [source_acc_id, dest_acc_id])
+        src_name = accounts.get(str(source_acc_id), {}).get('name', "Cuenta Origen")
+        dest_name = accounts.get(str(dest_acc_id), {}).get('name', "Cuenta Destino")
 
         # Detalle adicional si el usuario escribió algo
         user_detail = f": {name}" if name and name != "-" else ""
 
-        # ---------------------------------------------------------
-        # MOVIMIENTO 1: SALIDA (De la cuenta Origen)
-        # ---------------------------------------------------------
-        trans_name_out = f"Transferencia a {dest_name}{user_detail}"
-        cursor.execute("""
-            INSERT INTO transactions (user_id, date, name, amount, category, type, account_id, subcategory)
-            VALUES (?, ?, ?, ?, 'Transferencia', 'Transfer', ?, ?)
-        """, (uid, date_val, trans_name_out, amount, source_acc_id, f"Salida: {dest_name}"))
-
-        # Matemáticamente restamos ('Expense')
-        _adjust_account_balance(cursor, source_acc_id, amount, "Expense", is_reversal=False, user_id=uid)
-
-        # ---------------------------------------------------------
-        # MOVIMIENTO 2: ENTRADA (A la cuenta Destino)
-        # ---------------------------------------------------------
-        trans_name_in = f"Transferencia desde {src_name}{user_detail}"
-        cursor.execute("""
-            INSERT INTO transactions (user_id, date, name, amount, category, type, account_id, subcategory)
-            VALUES (?, ?, ?, ?, 'Transferencia', 'Transfer', ?, ?)
-        """, (uid, date_val, trans_name_in, amount, dest_acc_id, f"Entrada: {src_name}"))
-
-        # Matemáticamente sumamos ('Income')
-        _adjust_account_balance(cursor, dest_acc_id, amount, "Income", is_reversal=False, user_id=uid)
+        # 2. SALIDA (Origen, resta) + ENTRADA (Destino, suma) en un solo asiento; valida fondos del origen
+        legs = [
+            {'account_id': source_acc_id, 'amount': amount, 'effect': 'Expense', 'date': date_val,
+             'name': f"Transferencia a {dest_name}{user_detail}", 'category': 'Transferencia',
+             'type': 'Transfer', 'subcategory': f"Salida: {dest_name}"},
+            {'account_id': dest_acc_id, 'amount': amount, 'effect': 'Income', 'date': date_val,
+             'name': f"Transferencia desde {src_name}{user_detail}", 'category': 'Transferencia',
+             'type': 'Transfer', 'subcategory': f"Entrada: {src_name}"},
+        ]
+        ok, msg = journal.post_journal_entry(cursor, uid, legs, 'transfer', accounts=accounts)
+        if not ok:
+            return False, msg
 
         conn.commit()
-        clear_all_caches()
+        _after_write(uid, 'transactions', 'accounts')
         return True, "Transferencia realizada con éxito."
         
     except Exception as e:
         conn.rollback()
+        if concurrency.is_retryable(e): raise
         return False, f"Error en transferencia: {e}"
     finally:
         conn.close()
-
-def create_fixed_costs_table():
-    conn = get_connection()
-    cursor = conn.cursor()
-    
-    # Definir sintaxis ID según DB
-    id_type = "SERIAL PRIMARY KEY" if IS_POSTGRES else "INTEGER PRIMARY KEY AUTOINCREMENT"
-    
-    cursor.execute(f"""
-    CREATE TABLE IF NOT EXISTS fixed_costs (
-        id {id_type},
-        user_id INTEGER,
-        name TEXT NOT NULL,
-        amount REAL NOT NULL, 
-        frequency INTEGER DEFAULT 1, 
-        current_allocation REAL DEFAULT 0.0,
-        due_day INTEGER,
-        description TEXT,
-        is_percentage INTEGER DEFAULT 0,
-        min_amount REAL DEFAULT 0.0,
-        target_account_id INTEGER
-    )
-    """)
-    conn.commit()
-    conn.close()
-# 1. CREAR TABLA
-def create_savings_table():
-    conn = get_connection()
-    cursor = conn.cursor()
-    
-    # Determinar tipo de ID según la base de datos
-    id_type = "SERIAL PRIMARY KEY" if IS_POSTGRES else "INTEGER PRIMARY KEY AUTOINCREMENT"
-    
-    try:
-        cursor.execute(f"""
-        CREATE TABLE IF NOT EXISTS savings_goals (
-            id {id_type},
-            user_id INTEGER,
-            name TEXT NOT NULL,
-            target_amount REAL NOT NULL, 
-            current_saved REAL DEFAULT 0.0,
-            target_date TEXT, -- YYYY-MM-DD
-            icon TEXT,        -- Para futuro (ej. 'car-front', 'plane')
-            display_order INTEGER DEFAULT 0,
-            target_account_id INTEGER,       -- Agregado para evitar migraciones fallidas
-            contribution_mode TEXT DEFAULT 'Date',
-            fixed_contribution REAL DEFAULT 0.0,
-            percentage_contribution REAL DEFAULT 0.0
-        )
-        """)
-        conn.commit()
-    except Exception as e:
-        print(f"Error creando tabla savings_goals: {e}")
-    finally:
-        conn.close()
 from werkzeug.security import generate_password_hash, check_password_hash
 
 # EJECUTAR AL IMPORTAR (Justo debajo de check_and_update_users_table)
@@ -3090,6 +3029,13 @@ def update_last_login(user_id):
 
 # En backend/data_manager.py
 
+# En Postgres el id nuevo sale por RETURNING (cursor.lastrowid lo lee con fetchone)
+Q_INSERT_USER = register_query('insert_user', """
+    INSERT INTO users (username, password_hash, email, display_name, created_at) 
+    VALUES (?, ?, ?, ?, ?)
+    {returning_id}
+""")
+
 def register_user(username, password, email, display_name=None):
     conn = get_connection()
     cursor = conn.cursor()
@@ -3106,10 +3052,8 @@ def register_user(username, password, email, display_name=None):
 
         hashed_pw = generate_password_hash(password.strip(), method='pbkdf2:sha256')
         
-        cursor.execute("""
-            INSERT INTO users (username, password_hash, email, display_name, created_at) 
-            VALUES (?, ?, ?, ?, date('now'))
-        """, (clean_username, hashed_pw, clean_email, clean_display))
+        cursor.execute(Q_INSERT_USER.render(DIALECT),
+                       (clean_username, hashed_pw, clean_email, clean_display, date.today().strftime('%Y-%m-%d')))
         
         new_uid = cursor.lastrowid
         
@@ -3150,10 +3094,10 @@ def register_user(username, password, email, display_name=None):
         conn.close()
 
 
-def get_excluded_categories_list():
+def get_excluded_categories_list(user_id=None):
     """Retorna una lista de nombres de categorías que deben excluirse de los gráficos."""
     conn = get_connection()
-    uid = get_uid()
+    uid = user_id or get_uid()
     try:
         # Seleccionamos las marcadas como excluidas en la DB
         df = pd.read_sql_query("SELECT name FROM categories WHERE user_id = ? AND is_excluded = 1", conn, params=(uid,))
@@ -3196,12 +3140,15 @@ def admin_delete_user(user_id_to_delete):
     try:
         # 1. Borrar Transacciones
         cursor.execute("DELETE FROM transactions WHERE user_id = ?", (user_id_to_delete,))
+        cursor.execute("DELETE FROM transaction_rollups WHERE user_id = ?", (user_id_to_delete,))
+        ledger_history.mark_dirty(cursor, user_id_to_delete)
         # 2. Borrar Inversiones e historial
         cursor.execute("DELETE FROM investments WHERE user_id = ?", (user_id_to_delete,))
         cursor.execute("DELETE FROM investment_transactions WHERE user_id = ?", (user_id_to_delete,))
         cursor.execute("DELETE FROM pl_adjustments WHERE user_id = ?", (user_id_to_delete,))
         # 3. Borrar Cuentas, Cuotas, IOU
         cursor.execute("DELETE FROM accounts WHERE user_id = ?", (user_id_to_delete,))
+        balance_ledger.forget(cursor, user_id_to_delete)
         cursor.execute("DELETE FROM installments WHERE user_id = ?", (user_id_to_delete,))
         cursor.execute("DELETE FROM iou WHERE user_id = ?", (user_id_to_delete,))
         # 4. Borrar Categorias y Subcategorias personalizadas
@@ -3214,6 +3161,7 @@ def admin_delete_user(user_id_to_delete):
         cursor.execute("DELETE FROM users WHERE id = ?", (user_id_to_delete,))
         
         conn.commit()
+        clear_all_caches(user_id_to_delete)
         return True, f"Usuario ID {user_id_to_delete} y todos sus datos eliminados."
         
     except Exception as e:
@@ -3238,7 +3186,7 @@ def add_fixed_cost(name, amount, frequency, due_day=1, current_allocation=0.0, i
             VALUES (?, ?, ?, ?, ?, ?, ?, ?)
         """, (uid, name, amount, frequency, current_allocation, due_day, is_percentage, min_amount))
         conn.commit()
-        clear_all_caches()
+        _after_write(uid, 'fixed_costs')
         return True, "Costo agregado."
     except Exception as e: return False, str(e)
     finally: conn.close()
@@ -3253,14 +3201,14 @@ def update_fixed_cost(fc_id, name, amount, frequency, due_day, current_allocatio
             WHERE id=? AND user_id=?
         """, (name, amount, frequency, due_day, current_allocation, is_percentage, min_amount, fc_id, uid))
         conn.commit()
-        clear_all_caches()
+        _after_write(uid, 'fixed_costs')
         return True, "Actualizado."
     except Exception as e: return False, str(e)
     finally: conn.close()
 
 # --- OPTIMIZACIÓN COSTOS FIJOS ---
 
-@cache.memoize(timeout=300)
+@user_cached('fixed_costs', timeout=300)
 def _get_fixed_costs_df_cached(user_id):
     """Función interna que SÍ usa caché porque recibe user_id explícito."""
     conn = get_connection()
@@ -3272,9 +3220,9 @@ def _get_fixed_costs_df_cached(user_id):
     except: return pd.DataFrame()
     finally: conn.close()
 
-def get_fixed_costs_df():
+def get_fixed_costs_df(user_id=None):
     """Función pública que obtiene el ID y llama a la versión cacheada."""
-    uid = get_uid()
+    uid = user_id or get_uid()
     return _get_fixed_costs_df_cached(uid)
 
 def delete_fixed_cost(fc_id):
@@ -3283,7 +3231,7 @@ def delete_fixed_cost(fc_id):
     try:
         conn.execute("DELETE FROM fixed_costs WHERE id=? AND user_id=?", (fc_id, uid))
         conn.commit()
-        clear_all_caches()
+        _after_write(uid, 'fixed_costs')
         return True, "Eliminado."
     except Exception as e: return False, str(e)
     finally: conn.close()
@@ -3295,7 +3243,7 @@ def update_fixed_cost_allocation(fc_id, new_allocation):
     try:
         conn.execute("UPDATE fixed_costs SET current_allocation = ? WHERE id = ? AND user_id = ?", (new_allocation, fc_id, uid))
         conn.commit()
-        clear_all_caches()
+        _after_write(uid, 'fixed_costs')
         return True, "Saldo actualizado."
     except Exception as e: return False, str(e)
     finally: conn.close()
@@ -3396,7 +3344,7 @@ def update_distribution_rule(rule_id, name, alloc_type, value):
             WHERE id=? AND user_id=?
         """, (name, alloc_type, value, rule_id, uid))
         conn.commit()
-        clear_all_caches()
+        _after_write(uid, 'distribution_rules')
         return True, "Regla actualizada."
     except Exception as e: return False, str(e)
     finally: conn.close()
@@ -3413,7 +3361,7 @@ def add_saving_goal(name, target_amount, current_saved, target_date=None,
             VALUES (?, ?, ?, ?, ?, ?, ?, ?)
         """, (uid, name, target_amount, current_saved, target_date, mode, fixed_val, pct_val))
         conn.commit()
-        clear_all_caches()
+        _after_write(uid, 'savings_goals')
         return True, "Meta creada."
     except Exception as e: return False, str(e)
     finally: conn.close()
@@ -3431,7 +3379,7 @@ def update_saving_goal(goal_id, name, target_amount, current_saved, target_date,
             WHERE id=? AND user_id=?
         """, (name, target_amount, current_saved, target_date, mode, fixed_val, pct_val, goal_id, uid))
         conn.commit()
-        clear_all_caches()
+        _after_write(uid, 'savings_goals')
         return True, "Meta actualizada."
     except Exception as e: return False, str(e)
     finally: conn.close()
@@ -3442,22 +3390,22 @@ def delete_saving_goal(goal_id):
     try:
         conn.execute("DELETE FROM savings_goals WHERE id=? AND user_id=?", (goal_id, uid))
         conn.commit()
-        clear_all_caches()  
+        _after_write(uid, 'savings_goals')  
         return True, "Meta eliminada."
     except Exception as e: return False, str(e)
     finally: conn.close()
 
 # --- OPTIMIZACIÓN METAS DE AHORRO ---
 
-@cache.memoize(timeout=300)
+@user_cached('savings_goals', timeout=300)
 def _get_savings_goals_df_cached(user_id):
     conn = get_connection()
     try:
         return pd.read_sql_query("SELECT * FROM savings_goals WHERE user_id = ?", conn, params=(user_id,))
     finally: conn.close()
 
-def get_savings_goals_df():
-    uid = get_uid()
+def get_savings_goals_df(user_id=None):
+    uid = user_id or get_uid()
     return _get_savings_goals_df_cached(uid)
 # Preferencia de cuenta para Savings
 # backend/data_manager.py
@@ -3506,7 +3454,7 @@ def add_distribution_rule(cat_type, name, alloc_type, value, target_acc):
             VALUES (?, ?, ?, ?, ?, ?)
         """, (uid, cat_type, name, alloc_type, value, target_acc))
         conn.commit()
-        clear_all_caches()
+        _after_write(uid, 'distribution_rules')
         return True, "Regla agregada."
     
     except Exception as e: return False, str(e)
@@ -3518,14 +3466,14 @@ def delete_distribution_rule(rule_id):
     try:
         conn.execute("DELETE FROM distribution_rules WHERE id=? AND user_id=?", (rule_id, uid))
         conn.commit()
-        clear_all_caches()
+        _after_write(uid, 'distribution_rules')
         return True, "Eliminado."
     except Exception as e: return False, str(e)
     finally: conn.close()
 
 # --- OPTIMIZACIÓN REGLAS DE DISTRIBUCIÓN ---
 
-@cache.memoize(timeout=300)
+@user_cached('distribution_rules', timeout=300)
 def _get_distribution_rules_cached(user_id, cat_type):
     conn = get_connection()
     try:
@@ -3557,9 +3505,10 @@ def update_item_target_account(table_name, item_id, account_id):
 
 # --- EN backend/data_manager.py ---
 
+@concurrency.retrying
 def execute_distribution_process(income_total, source_account_id, distribution_data):
     """
-    Ejecuta el reparto masivo CONSOLIDANDO las transacciones.
+    Ejecuta el reparto masivo CONSOLIDANDO las transacciones (un asiento, ver backend/journal.py).
     """
     conn = get_connection()
     cursor = conn.cursor()
@@ -3573,11 +3522,9 @@ def execute_distribution_process(income_total, source_account_id, distribution_d
     try:
         # 🚨 CORRECCIÓN: Convertir a float nativo
         total_needed = float(sum(d['amount'] for d in distribution_data))
-        
-        has_funds, msg = _check_sufficient_funds(cursor, source_account_id, total_needed, uid)
-        if not has_funds: return False, msg
 
         consolidated_moves = {}
+        allocations = {'FC': {}, 'SV': {}}
 
         for item in distribution_data:
             # 🚨 CORRECCIÓN: Asegurar que cada item sea float
@@ -3585,80 +3532,62 @@ def execute_distribution_process(income_total, source_account_id, distribution_d
             
             if amount <= 0: continue
             
-            iid = item['id']
             itype = item['type']
             target_acc = item.get('target_acc')
 
-            # A. Actualizar Tablas Internas
-            if itype == 'FC':
-                cursor.execute("UPDATE fixed_costs SET current_allocation = COALESCE(current_allocation, 0) + ? WHERE id=? AND user_id=?", (amount, iid, uid))
-            elif itype == 'SV':
-                cursor.execute("UPDATE savings_goals SET current_saved = COALESCE(current_saved, 0) + ? WHERE id=? AND user_id=?", (amount, iid, uid))
+            # A. Apartados internos (se aplican juntos después del asiento)
+            if itype in allocations:
+                allocations[itype][item['id']] = allocations[itype].get(item['id'], 0.0) + amount
             
             # B. Agrupar
             if target_acc and str(target_acc) != str(source_account_id):
                 key = (target_acc, itype)
-                if key not in consolidated_moves:
-                    consolidated_moves[key] = 0.0
-                consolidated_moves[key] += amount
+                consolidated_moves[key] = consolidated_moves.get(key, 0.0) + amount
 
-        # 3. EJECUTAR TRANSFERENCIAS REALES
+        # Salida y entrada por grupo; el origen debe cubrir TODO el reparto (también lo que se queda en él)
+        legs = []
         for (target_acc, itype), total_amt in consolidated_moves.items():
-            
-            # 🚨 CORRECCIÓN FINAL: Asegurar float también aquí
-            total_amt = float(total_amt)
-            
             group_label = group_names.get(itype, itype)
-            
-            # A. SALIDA
-            cursor.execute("""
-                INSERT INTO transactions (user_id, date, name, amount, category, type, account_id, subcategory)
-                VALUES (?, ?, ?, ?, 'Distribución', 'Transfer', ?, ?)
-            """, (uid, timestamp_val, f"Distr: {group_label}", total_amt, source_account_id, f"Salida: {group_label}"))
-            
-            _adjust_account_balance(cursor, source_account_id, total_amt, 'Expense', False, uid)
-            
-            # B. ENTRADA
-            cursor.execute("""
-                INSERT INTO transactions (user_id, date, name, amount, category, type, account_id, subcategory)
-                VALUES (?, ?, ?, ?, 'Distribución', 'Transfer', ?, ?)
-            """, (uid, timestamp_val, f"Recibido: {group_label}", total_amt, target_acc, f"Entrada: {group_label}"))
-            
-            _adjust_account_balance(cursor, target_acc, total_amt, 'Income', False, uid)
+            legs.append({'account_id': source_account_id, 'amount': total_amt, 'effect': 'Expense', 'date': timestamp_val,
+                         'name': f"Distr: {group_label}", 'category': 'Distribución', 'type': 'Transfer',
+                         'subcategory': f"Salida: {group_label}"})
+            legs.append({'account_id': target_acc, 'amount': total_amt, 'effect': 'Income', 'date': timestamp_val,
+                         'name': f"Recibido: {group_label}", 'category': 'Distribución', 'type': 'Transfer',
+                         'subcategory': f"Entrada: {group_label}"})
+
+        ok, msg = journal.post_journal_entry(cursor, uid, legs, 'distribution', require={source_account_id: total_needed})
+        if not ok: return False, msg
+
+        if allocations['FC']:
+            cursor.executemany("UPDATE fixed_costs SET current_allocation = COALESCE(current_allocation, 0) + ? WHERE id=? AND user_id=?",
+                               [(amt, iid, uid) for iid, amt in allocations['FC'].items()])
+        if allocations['SV']:
+            cursor.executemany("UPDATE savings_goals SET current_saved = COALESCE(current_saved, 0) + ? WHERE id=? AND user_id=?",
+                               [(amt, iid, uid) for iid, amt in allocations['SV'].items()])
 
         conn.commit()
-        clear_all_caches()
+        _after_write(uid, 'transactions', 'accounts', 'fixed_costs', 'savings_goals')
         return True, f"Reparto exitoso de ${total_needed:,.2f}"
         
     except Exception as e:
         conn.rollback()
+        if concurrency.is_retryable(e): raise
         return False, f"Error en distribución: {e}"
     finally:
         conn.close()
 # 1. Función auxiliar para verificar/crear la subcategoría
-def _ensure_subcategory_exists(category_name, subcategory_name, user_id):
-    conn = get_connection()
-    cursor = conn.cursor()
-    try:
-        # Verificar si existe la subcategoría para ese usuario y categoría padre
-        cursor.execute("""
-            SELECT id FROM subcategories 
-            WHERE user_id = ? AND name = ? AND parent_category = ?
-        """, (user_id, subcategory_name, category_name))
-        
-        if not cursor.fetchone():
-            # Si no existe, crearla
-            cursor.execute("""
-                INSERT INTO subcategories (user_id, name, parent_category) 
-                VALUES (?, ?, ?)
-            """, (user_id, subcategory_name, category_name))
-            conn.commit()
-    except Exception as e:
-        print(f"Error asegurando subcategoría: {e}")
-    finally:
-        conn.close()
+def _ensure_subcategory_exists(cursor, category_name, subcategory_name, user_id):
+    """Crea la subcategoría si falta, dentro de la transacción del que llama."""
+    cursor.execute("""
+        INSERT INTO subcategories (user_id, name, parent_category)
+        SELECT CAST(? AS INTEGER), ?, ?
+        WHERE NOT EXISTS (
+            SELECT 1 FROM subcategories WHERE user_id = ? AND name = ? AND parent_category = ?
+        )
+    """, (user_id, subcategory_name, category_name, user_id, subcategory_name, category_name))
 
 # 2. Función Principal: Pagar Costo Fijo
+@concurrency.retrying
 def pay_fixed_cost_balance(fc_id, amount, account_id):
     """
     Registra el pago de un Costo Fijo:
@@ -3678,22 +3607,15 @@ def pay_fixed_cost_balance(fc_id, amount, account_id):
         
         fc_name = fc[0]
         
-        # B. Validar Fondos en la cuenta real
-        has_funds, msg = _check_sufficient_funds(cursor, account_id, amount, uid)
-        if not has_funds: return False, msg
+        # B. Gasto real (valida fondos de la cuenta y mueve su saldo en el mismo asiento)
+        ok, msg = journal.post_journal_entry(cursor, uid, [
+            {'account_id': account_id, 'amount': amount, 'effect': 'Expense', 'date': date_val,
+             'name': f"Pago: {fc_name}", 'category': 'Costos Fijos', 'subcategory': fc_name},
+        ], 'fixed_cost_payment')
+        if not ok: return False, msg
 
         # C. Asegurar que exista la Subcategoría (Nombre del FC) dentro de 'Costos Fijos'
-        # Nota: Hacemos esto fuera de la transacción principal o dentro, aquí usamos la lógica auxiliar
-        _ensure_subcategory_exists("Costos Fijos", fc_name, uid)
-
-        # D. Registrar la Transacción (Gasto Real)
-        cursor.execute("""
-            INSERT INTO transactions (user_id, date, name, amount, category, type, account_id, subcategory)
-            VALUES (?, ?, ?, ?, 'Costos Fijos', 'Expense', ?, ?)
-        """, (uid, date_val, f"Pago: {fc_name}", amount, account_id, fc_name))
-        
-        # E. Actualizar Saldo Real de la Cuenta Bancaria
-        _adjust_account_balance(cursor, account_id, amount, 'Expense', is_reversal=False, user_id=uid)
+        _ensure_subcategory_exists(cursor, "Costos Fijos", fc_name, uid)
         
         # F. Descontar del "Apartado Virtual" (Allocation) del Costo Fijo
         # Usamos MAX(0, ...) para que no quede negativo si pagas de más por alguna razón, 
@@ -3705,17 +3627,19 @@ def pay_fixed_cost_balance(fc_id, amount, account_id):
         """, (amount, fc_id, uid))
 
         conn.commit()
-        clear_all_caches()
+        _after_write(uid, 'transactions', 'accounts', 'fixed_costs', 'subcategories')
         return True, f"Pago de {fc_name} registrado exitosamente."
         
     except Exception as e:
         conn.rollback()
+        if concurrency.is_retryable(e): raise
         return False, f"Error al pagar costo fijo: {str(e)}"
     finally:
         conn.close()
 
 # --- EN backend/data_manager.py ---
 
+@concurrency.retrying
 def process_savings_withdrawal(goal_id, amount, account_id, is_transfer=False, 
                                dest_acc_id=None, category=None, subcategory=None, note=None):
     """
@@ -3739,26 +3663,16 @@ def process_savings_withdrawal(goal_id, amount, account_id, is_transfer=False,
         # Validación básica (opcional, se puede permitir quedar en negativo si se desea)
         # if amount > current_saved: return False, "El monto excede lo ahorrado."
 
-        # B. PROCESAR EL MOVIMIENTO DE DINERO
+        # B. PROCESAR EL MOVIMIENTO DE DINERO (un asiento; como antes, sin validar fondos)
         if is_transfer:
             # Opción 1: Transferencia entre cuentas
             if not dest_acc_id: return False, "Falta cuenta destino."
-            
-            # Reutilizamos la lógica de transferencia (pero paso a paso para mantener la transacción abierta)
-            # Retiro Origen
-            cursor.execute("""
-                INSERT INTO transactions (user_id, date, name, amount, category, type, account_id, subcategory)
-                VALUES (?, ?, ?, ?, 'Transferencia', 'Expense', ?, 'Retiro de Ahorro')
-            """, (uid, date_val, f"Retiro Meta: {goal_name}", amount, account_id))
-            _adjust_account_balance(cursor, account_id, amount, 'Expense', False, uid)
-            
-            # Ingreso Destino
-            cursor.execute("""
-                INSERT INTO transactions (user_id, date, name, amount, category, type, account_id, subcategory)
-                VALUES (?, ?, ?, ?, 'Transferencia', 'Income', ?, 'Retiro de Ahorro')
-            """, (uid, date_val, f"Ingreso Meta: {goal_name}", amount, dest_acc_id))
-            _adjust_account_balance(cursor, dest_acc_id, amount, 'Income', False, uid)
-            
+            legs = [
+                {'account_id': account_id, 'amount': amount, 'effect': 'Expense', 'check_funds': False, 'date': date_val,
+                 'name': f"Retiro Meta: {goal_name}", 'category': 'Transferencia', 'subcategory': 'Retiro de Ahorro'},
+                {'account_id': dest_acc_id, 'amount': amount, 'effect': 'Income', 'date': date_val,
+                 'name': f"Ingreso Meta: {goal_name}", 'category': 'Transferencia', 'subcategory': 'Retiro de Ahorro'},
+            ]
             action_msg = "Transferencia realizada"
 
         else:
@@ -3767,18 +3681,16 @@ def process_savings_withdrawal(goal_id, amount, account_id, is_transfer=False,
             
             # Verificar subcategoría si se seleccionó una
             if subcategory:
-                _ensure_subcategory_exists(category, subcategory, uid)
+                _ensure_subcategory_exists(cursor, category, subcategory, uid)
             
             trans_name = f"{goal_name}: {note}" if note else f"Gasto de Meta: {goal_name}"
-            
-            cursor.execute("""
-                INSERT INTO transactions (user_id, date, name, amount, category, type, account_id, subcategory)
-                VALUES (?, ?, ?, ?, ?, 'Expense', ?, ?)
-            """, (uid, date_val, trans_name, amount, category, account_id, subcategory))
-            
-            _adjust_account_balance(cursor, account_id, amount, 'Expense', False, uid)
+            legs = [{'account_id': account_id, 'amount': amount, 'effect': 'Expense', 'check_funds': False, 'date': date_val,
+                     'name': trans_name, 'category': category, 'subcategory': subcategory}]
             action_msg = "Gasto registrado"
 
+        ok, msg = journal.post_journal_entry(cursor, uid, legs, 'savings_withdrawal')
+        if not ok: return False, msg
+
         # C. ACTUALIZAR LA META (Restar lo gastado/movido)
         # Usamos MAX(0, ...) para evitar negativos si prefieres, o lo dejas libre.
         cursor.execute("""
@@ -3788,10 +3700,12 @@ def process_savings_withdrawal(goal_id, amount, account_id, is_transfer=False,
         """, (amount, goal_id, uid))
         
         conn.commit()
+        _after_write(uid, 'transactions', 'accounts', 'savings_goals', 'subcategories')
         return True, f"{action_msg} y meta actualizada."
 
     except Exception as e:
         conn.rollback()
+        if concurrency.is_retryable(e): raise
         return False, f"Error: {str(e)}"
     finally:
         conn.close()
@@ -3824,7 +3738,7 @@ def add_income_event(name, amount, date_val):
         conn.execute("INSERT INTO income_events (user_id, name, amount, event_date) VALUES (?, ?, ?, ?)", 
                      (uid, name, amount, date_val))
         conn.commit()
-        clear_all_caches()
+        _after_write(uid, 'income_events')
         return True, "Evento agregado."
     except Exception as e: return False, str(e)
     finally: conn.close()
@@ -3835,14 +3749,14 @@ def delete_income_event(event_id):
     try:
         conn.execute("DELETE FROM income_events WHERE id = ? AND user_id = ?", (event_id, uid))
         conn.commit()
-        clear_all_caches()
+        _after_write(uid, 'income_events')
         return True, "Eliminado."
     except: return False, "Error"
     finally: conn.close()
 
 # --- OPTIMIZACIÓN ESTABILIZADOR ---
 
-@cache.memoize(timeout=300)
+@user_cached('income_events', timeout=300)
 def _get_income_events_df_cached(user_id):
     conn = get_connection()
     try:
@@ -3877,7 +3791,7 @@ def update_income_event(event_id, name, amount, date_val):
             WHERE id = ? AND user_id = ?
         """, (name, amount, date_val, event_id, uid))
         conn.commit()
-        clear_all_caches()
+        _after_write(uid, 'income_events')
         return True, "Evento actualizado."
     except Exception as e: return False, str(e)
     finally: conn.close()
@@ -3892,14 +3806,19 @@ from dateutil.relativedelta import relativedelta # Asegúrate de tener dateutil
 # En backend/data_manager.py
 
 # En backend/data_manager.py
-@cache.memoize(timeout=300)
 def calculate_stabilizer_projection(base_salary_monthly, current_stabilizer_balance, frequency='monthly'):
+    """Función pública: obtiene el ID y llama a la versión cacheada (por usuario)."""
+    uid = get_uid()
+    return _calculate_stabilizer_projection_cached(uid, base_salary_monthly, current_stabilizer_balance, frequency)
+
+@user_cached('income_events', timeout=300)
+def _calculate_stabilizer_projection_cached(user_id, base_salary_monthly, current_stabilizer_balance, frequency='monthly'):
     """
     Proyecta usando la lógica de "Mínimo Sostenible" (Cuello de botella).
     Calcula el máximo retiro posible que asegura que el saldo NUNCA baje de cero
     en ningún punto del futuro.
     """
-    events_df = get_income_events_df()
+    events_df = _get_income_events_df_cached(user_id)
     
     # 1. CÁLCULO DE TOTALES E IDEALES
     total_bonuses = events_df['amount'].sum() if not events_df.empty else 0
@@ -4030,6 +3949,7 @@ def calculate_stabilizer_projection(base_salary_monthly, current_stabilizer_bala
 # 5. Ejecutar el Retiro (Mover dinero de Caja Chica -> Cuenta Principal)
 # --- EN backend/data_manager.py ---
 
+@concurrency.retrying
 def execute_stabilizer_withdrawal(amount, source_acc_id, dest_acc_id):
     """
     Mueve dinero de la Caja Chica a la cuenta principal.
@@ -4045,123 +3965,118 @@ def execute_stabilizer_withdrawal(amount, source_acc_id, dest_acc_id):
     amount = float(amount)
     
     try:
-        has_funds, msg = _check_sufficient_funds(cursor, source_acc_id, amount, uid)
-        if not has_funds: return False, msg
-        
-        # 1. SALIDA (Caja Chica) -> Type: Transfer
-        cursor.execute("""
-            INSERT INTO transactions (user_id, date, name, amount, category, type, account_id, subcategory)
-            VALUES (?, ?, 'Retiro Estabilizador', ?, 'Distribución', 'Transfer', ?, 'Salida: Caja Chica')
-        """, (uid, timestamp_val, amount, source_acc_id))
-        
-        _adjust_account_balance(cursor, source_acc_id, amount, 'Expense', False, uid)
-        
-        # 2. ENTRADA (Cuenta Principal) -> Type: Transfer
+        # 1. SALIDA (Caja Chica) y 2. ENTRADA (Cuenta Principal), ambas Type: Transfer
+        legs = [{'account_id': source_acc_id, 'amount': amount, 'effect': 'Expense', 'date': timestamp_val,
+                 'name': 'Retiro Estabilizador', 'category': 'Distribución', 'type': 'Transfer',
+                 'subcategory': 'Salida: Caja Chica'}]
         if dest_acc_id:
-             cursor.execute("""
-                INSERT INTO transactions (user_id, date, name, amount, category, type, account_id, subcategory)
-                VALUES (?, ?, 'Ingreso Estabilizador', ?, 'Distribución', 'Transfer', ?, 'Entrada: Salario Base')
-            """, (uid, timestamp_val, amount, dest_acc_id))
-             
-             _adjust_account_balance(cursor, dest_acc_id, amount, 'Income', False, uid)
+            legs.append({'account_id': dest_acc_id, 'amount': amount, 'effect': 'Income', 'date': timestamp_val,
+                         'name': 'Ingreso Estabilizador', 'category': 'Distribución', 'type': 'Transfer',
+                         'subcategory': 'Entrada: Salario Base'})
+        ok, msg = journal.post_journal_entry(cursor, uid, legs, 'stabilizer')
+        if not ok: return False, msg
              
         conn.commit()
-        clear_all_caches()
+        _after_write(uid, 'transactions', 'accounts')
         return True, "Suplemento transferido con éxito."
     except Exception as e:
         conn.rollback()
+        if concurrency.is_retryable(e): raise
         return False, str(e)
     finally: conn.close()
 # --- AGREGAR AL FINAL DE backend/data_manager.py ---
 
+# Segundos que la página sigue consultando un pedido al planificador antes de rendirse
+PRICE_REFRESH_TIMEOUT = 30
+
+
+def _user_tickers(conn, uid):
+    df = pd.read_sql_query("SELECT DISTINCT ticker FROM investments WHERE user_id = ?", conn, params=(uid,))
+    return df['ticker'].tolist()
+
+
+def _price_refresh_message(uid, tickers, updated, errors):
+    """
+    Evalúa un ciclo de precios para los tickers del usuario.
+    Solo cuentan como éxito los tickers que el ciclo realmente actualizó
+    (los omitidos o sin cotización no).
+    """
+    updated = [t for t in tickers if t in set(updated)]
+    errors = [f"{t}: {e}" for t, e in errors.items() if t in tickers]
+    success_count = len(updated)
+
+    if success_count == len(tickers):
+        _after_write(uid, 'market_cache')
+        return True, f"Precios actualizados ({success_count}/{len(tickers)})."
+    elif success_count > 0:
+        _after_write(uid, 'market_cache')
+        return True, f"Actualización parcial ({success_count}/{len(tickers)}). Fallaron {len(tickers) - success_count} activos."
+    else:
+        # Si fallaron todos, probablemente es error de conexión o límite de API
+        error_detail = errors[0] if errors else "Sin respuesta"
+        return False, f"Fallo de conexión con el Mercado. ({error_detail})"
+
+
 def manual_price_refresh():
     """
-    Fuerza la actualización de precios y retorna el estado de la conexión.
-    Retorna: (Success: bool, Message: str)
+    Fuerza la actualización de precios de los activos del usuario.
+    Con planificador solo deja el pedido y retorna al toque: la página consulta
+    price_refresh_result(pending) hasta que el ciclo termine (no bloquea un worker).
+    Sin planificador actualiza aquí mismo.
+    Retorna: (Success: bool, Message: str, pending: marca del pedido o None)
     """
     if not finnhub_client:
-        return False, "Error: API Key no configurada en .env"
+        return False, "Error: API Key no configurada en .env", None
 
     conn = get_connection()
     uid = get_uid()
     
     try:
         # 1. Obtener tickers del usuario
-        df = pd.read_sql_query("SELECT DISTINCT ticker FROM investments WHERE user_id = ?", conn, params=(uid,))
-        tickers = df['ticker'].tolist()
+        tickers = _user_tickers(conn, uid)
         
         if not tickers:
-            return True, "No tienes activos para actualizar."
+            return True, "No tienes activos para actualizar.", None
 
-        # 2. Intentar actualizar (Capturando errores de red)
-        success_count = 0
-        errors = []
-        
-        cursor = conn.cursor()
-        for t in tickers:
-            try:
-                # Llamada a la API
-                q = finnhub_client.quote(t)
-                
-                # Validación básica de respuesta
-                if q['c'] == 0 and q['d'] is None:
-                    # A veces devuelve 0 si el ticker está mal, pero no es error de red
-                    continue 
-
-                # Guardar en Caché Global
-                cursor.execute("""
-                UPDATE market_cache 
-                SET price=%s, day_change=%s, day_change_pct=%s, day_high=%s, day_low=%s, last_updated=CURRENT_TIMESTAMP
-                WHERE ticker=%s
-            """, (q['c'], q['d'], q['dp'], q['h'], q['l'], t))
-                
-                # Si no existía (ej. se borró el caché), insertamos lo básico
-                if cursor.rowcount == 0:
-                    cursor.execute("""
-                    INSERT INTO market_cache (ticker, price, day_change, day_change_pct, last_updated)
-                    VALUES (%s, %s, %s, %s, CURRENT_TIMESTAMP)
-                    """, (t, q['c'], q['d'], q['dp']))
-                
-                success_count += 1
-                time.sleep(0.1) # Respetar límites de API
-                
-            except Exception as e:
-                errors.append(f"{t}: {str(e)}")
+        # 2. Si hay planificador, le dejamos el pedido y la página consulta el resultado
+        if market_scheduler.is_running():
+            requested_at = market_scheduler.request_refresh(market_data.QUOTE)
+            return True, "Actualizando precios...", requested_at
 
-        conn.commit()
-        
-        # 3. Evaluar resultados
-        if success_count == len(tickers):
-            clear_all_caches()
-            return True, f"Precios actualizados ({success_count}/{len(tickers)})."
-        elif success_count > 0:
-            clear_all_caches()
-            return True, f"Actualización parcial. Fallaron {len(errors)} activos."
-        else:
-            # Si fallaron todos, probablemente es error de conexión o límite de API
-            error_detail = errors[0] if errors else "Sin respuesta"
-            return False, f"Fallo de conexión con el Mercado. ({error_detail})"
+        # 3. Sin planificador: actualizamos solo precios aquí (en paralelo, un solo commit)
+        res = market_data.refresh_tickers(tickers, groups=(market_data.QUOTE,), conn=conn)
+        return (*_price_refresh_message(uid, tickers, res['updated'], res['errors']), None)
 
     except Exception as e:
-        return False, f"Error interno: {str(e)}"
+        return False, f"Error interno: {str(e)}", None
     finally:
         conn.close()
 
-# --- EN backend/data_manager.py ---
 
-def check_users_periodicity_column():
-    """Asegura que la columna periodicity_preference exista en la tabla users."""
+def price_refresh_result(requested_at):
+    """
+    Resultado de un pedido hecho con manual_price_refresh (no bloquea).
+    Retorna None mientras el ciclo del planificador no termine, o (Success, Message).
+    """
+    status = market_scheduler.finished_refresh(requested_at)
+    if status is None:
+        if time.time() - requested_at > PRICE_REFRESH_TIMEOUT:
+            return False, "El mercado está tardando en responder. Intenta en unos minutos."
+        return None
+
     conn = get_connection()
-    cursor = conn.cursor()
+    uid = get_uid()
     try:
-        if not check_column_exists(cursor, 'users', 'periodicity_preference'):
-            print("⚠️ Migrando tabla users: Agregando periodicity_preference...")
-            cursor.execute("ALTER TABLE users ADD COLUMN periodicity_preference TEXT DEFAULT 'monthly'")
-            conn.commit()
+        tickers = _user_tickers(conn, uid)
     except Exception as e:
-        print(f"Error checking users schema: {e}")
+        return False, f"Error interno: {str(e)}"
     finally:
         conn.close()
+    if not tickers:
+        return True, "No tienes activos para actualizar."
+    return _price_refresh_message(uid, tickers, status.get('updated_tickers', []), status.get('errors', {}))
+
+# --- EN backend/data_manager.py ---
 
 def get_user_periodicity():
     """Recupera la preferencia de periodicidad (monthly/biweekly)."""
@@ -4169,14 +4084,9 @@ def get_user_periodicity():
     uid = get_uid()
     try:
         cur = conn.cursor()
-        try:
-            cur.execute("SELECT periodicity_preference FROM users WHERE id = ?", (uid,))
-        except:
-            # Si falla la primera vez, es porque falta la columna. La creamos y reintentamos.
-            conn.rollback()
-            check_users_periodicity_column()
-            cur.execute("SELECT periodicity_preference FROM users WHERE id = ?", (uid,))
-            
+        # La columna la agrega la migración 002 (backend/migrations.py)
+        cur.execute("SELECT periodicity_preference FROM users WHERE id = ?", (uid,))
+
         res = cur.fetchone()
         return res[0] if res and res[0] else 'monthly'
     finally: conn.close()
@@ -0,0 +1,259 @@
+# backend/db_pool.py
+"""
+Conexiones reutilizables: una por hilo en SQLite y una por request en Postgres.
+
+Antes cada get_connection() abría una conexión nueva: un render del dashboard
+abría más de diez, y en Postgres cada helper anidado (get_net_worth_breakdown ->
+get_credit_abono_reserve -> ...) sacaba otra conexión del pool de 5.
+
+SQLite (desarrollo local): cada hilo mantiene UNA conexión abierta por archivo.
+- PRAGMAs al abrir: WAL (lectores no bloquean al escritor), synchronous=NORMAL
+  (seguro con WAL y mucho más rápido) y busy_timeout (espera en vez de fallar
+  con "database is locked").
+- cached_statements más grande: el caché de sentencias preparadas de sqlite3
+  vive en la conexión, así que recién sirve cuando la conexión se reutiliza.
+
+Postgres: dentro de un request la conexión se guarda en flask.g y se devuelve
+al pool UNA vez, en el teardown del request. Fuera de un request (hilos de
+fondo) se devuelve apenas el último usuario la suelta.
+
+En ambos casos las llamadas anidadas comparten conexión y transacción:
+- close() no cierra de verdad: baja un contador de uso.
+- commit() en una llamada anidada se difiere hasta que el usuario más externo
+  suelta la conexión; si nadie confirmó nada, lo pendiente se descarta
+  (rollback), igual que pasaba al cerrar una conexión real.
+- on_commit(fn): lo que depende de que la escritura ya esté confirmada (ej.
+  invalidar el caché) se encola en la conexión si el commit quedó diferido y
+  corre después del commit real del usuario más externo; si se descarta, no corre.
+
+El contrato para los callers no cambia: conn = get_connection() ... conn.close().
+"""
+import os
+import sqlite3
+import threading
+
+from flask import g, has_request_context
+
+BUSY_TIMEOUT_MS = int(os.getenv("SQLITE_BUSY_TIMEOUT_MS", "5000"))
+STATEMENT_CACHE_SIZE = int(os.getenv("SQLITE_STATEMENT_CACHE", "256"))
+
+_local = threading.local()
+
+
+class ScopedConnectionMixin:
+    """Contador de uso + commit diferido para conexiones compartidas entre llamadas anidadas."""
+
+    _depth = 0
+    _commit_pending = False
+
+    def _acquire(self):
+        self._depth += 1
+        if self._depth == 1:
+            _active().append(self)
+        return self
+
+    def _queued(self):
+        if '_after_commit' not in self.__dict__:
+            self._after_commit = []
+        return self._after_commit
+
+    def commit(self):
+        if self._depth > 1:
+            # Llamada anidada: confirma el usuario más externo al soltar la conexión
+            self._commit_pending = True
+            return None
+        self._commit_pending = False
+        result = self._real_commit()
+        self._run_after_commit()
+        return result
+
+    def rollback(self):
+        self._commit_pending = False
+        self._queued().clear()
+        return self._real_rollback()
+
+    def _run_after_commit(self):
+        queued, self._after_commit = self._queued(), []
+        for fn in queued:
+            try:
+                fn()
+            except Exception as e:
+                print(f"⚠️ Error después del commit: {e}")
+
+    def close(self):
+        if self._depth > 0:
+            self._depth -= 1
+        if self._depth == 0:
+            self._finish()
+
+    def _finish(self):
+        """Cierra la unidad de trabajo: confirma lo diferido o descarta lo no confirmado."""
+        try:
+            if self._commit_pending:
+                self.commit()
+            else:
+                self.rollback()
+        except Exception as e:
+            print(f"⚠️ Error cerrando unidad de trabajo: {e}")
+        self._commit_pending = False
+        self._queued().clear()
+        active = _active()
+        if self in active:
+            active.remove(self)
+        self._on_idle()
+
+    def _on_idle(self):
+        """Hook: qué hacer cuando nadie usa la conexión (por defecto, seguir abierta)."""
+
+
+def _active():
+    """Conexiones de este hilo con una unidad de trabajo abierta (alguien las tiene tomadas)."""
+    active = getattr(_local, 'active', None)
+    if active is None:
+        active = _local.active = []
+    return active
+
+
+def on_commit(fn):
+    """
+    Corre fn cuando la escritura en curso quede confirmada.
+    Si la conexión está tomada por una llamada externa (commit diferido), fn se
+    encola y corre tras el commit real; si la unidad termina en rollback, se
+    descarta. Sin unidad de trabajo pendiente, corre ya.
+    """
+    for conn in _active():
+        if conn._depth > 1 or conn._commit_pending:
+            conn._queued().append(fn)
+            return
+    fn()
+
+
+class PooledConnection(ScopedConnectionMixin, sqlite3.Connection):
+    """sqlite3.Connection que vuelve al pool del hilo en vez de cerrarse."""
+
+    def _real_commit(self):
+        return sqlite3.Connection.commit(self)
+
+    def _real_rollback(self):
+        if self.in_transaction:
+            return sqlite3.Connection.rollback(self)
+
+    def really_close(self):
+        sqlite3.Connection.close(self)
+
+
+def _open(path):
+    conn = sqlite3.connect(
+        path,
+        factory=PooledConnection,
+        timeout=BUSY_TIMEOUT_MS / 1000,
+        cached_statements=STATEMENT_CACHE_SIZE,
+    )
+    conn.execute("PRAGMA journal_mode=WAL")
+    conn.execute("PRAGMA synchronous=NORMAL")
+    conn.execute(f"PRAGMA busy_timeout={BUSY_TIMEOUT_MS}")
+    return conn
+
+
+def get_sqlite_connection(path):
+    """Retorna la conexión de este hilo para `path` (la abre si hace falta)."""
+    pool = getattr(_local, 'conns', None)
+    if pool is None:
+        pool = _local.conns = {}
+    conn = pool.get(path)
+    if conn is None:
+        conn = pool[path] = _open(path)
+    return conn._acquire()
+
+
+def get_scoped_connection(key, open_conn):
+    """
+    Conexión compartida por el request actual (o por el hilo, fuera de un request).
+    open_conn() debe devolver un objeto con ScopedConnectionMixin y really_close().
+    Fuera de un request, la conexión se cierra de verdad al quedar sin usuarios.
+    """
+    if has_request_context():
+        scope = g.setdefault('_pivot_conns', {})
+        conn = scope.get(key)
+        if conn is None:
+            conn = scope[key] = open_conn()
+        return conn._acquire()
+
+    scope = getattr(_local, 'scoped', None)
+    if scope is None:
+        scope = _local.scoped = {}
+    conn = scope.get(key)
+    if conn is None:
+        conn = open_conn()
+
+        def release(conn=conn):
+            scope.pop(key, None)
+            conn.really_close()
+        conn._on_idle = release
+        scope[key] = conn
+    return conn._acquire()
+
+
+def release_request_connections(exc=None):
+    """
+    Teardown del request: cierra la unidad de trabajo de cada conexión usada
+    (aunque algún caller haya olvidado close()) y devuelve las de Postgres al pool.
+    """
+    for conn in (g.pop('_pivot_conns', None) or {}).values():
+        conn._depth = 0
+        conn._finish()
+        try:
+            conn.really_close()
+        except Exception as e:
+            print(f"⚠️ Error devolviendo conexión al pool: {e}")
+
+    # En SQLite la conexión sigue viva para el próximo request del hilo, pero limpia
+    for conn in (getattr(_local, 'conns', None) or {}).values():
+        if conn._depth:
+            conn._depth = 0
+            conn._finish()
+
+
+def init_app(server):
+    """Registra la liberación de conexiones al final de cada request."""
+    server.teardown_request(release_request_connections)
+
+
+def close_thread_connections():
+    """Cierra de verdad las conexiones SQLite de este hilo (ej. al terminar un hilo de fondo)."""
+    pool = getattr(_local, 'conns', None) or {}
+    for conn in pool.values():
+        try:
+            conn.really_close()
+        except Exception:
+            pass
+    pool.clear()
+
+
+if __name__ == "__main__":
+    # Micro-benchmark: costo de obtener una conexión + una consulta simple
+    import tempfile
+    import time
+
+    N = 2000
+    with tempfile.TemporaryDirectory() as tmp:
+        path = os.path.join(tmp, "bench.db")
+        setup = sqlite3.connect(path)
+        setup.execute("CREATE TABLE t (id INTEGER PRIMARY KEY, v REAL)")
+        setup.executemany("INSERT INTO t (v) VALUES (?)", [(i,) for i in range(1000)])
+        setup.commit()
+        setup.close()
+
+        def bench(acquire):
+            start = time.perf_counter()
+            for i in range(N):
+                conn = acquire()
+                conn.execute("SELECT v FROM t WHERE id = ?", (i % 1000 + 1,)).fetchone()
+                conn.close()
+            return (time.perf_counter() - start) / N * 1e6
+
+        before = bench(lambda: sqlite3.connect(path))
+        after = bench(lambda: get_sqlite_connection(path))
+        print(f"sqlite3.connect() por llamada : {before:8.1f} µs")
+        print(f"get_sqlite_connection()       : {after:8.1f} µs  ({before / after:.0f}x)")
+        close_thread_connections()
@@ -1,5 +1,41 @@
 # backend/extensions.py
+import os
 from flask_caching import Cache
 
 # Creamos la instancia del caché aquí, pero sin configurarla todavía.
-cache = Cache()
\ No newline at end of file
+cache = Cache()
+
+
+def build_cache_config():
+    """
+    Arma la configuración de Flask-Caching según el entorno (.env).
+
+    El caché debe ser COMPARTIDO entre los workers de gunicorn: si cada proceso
+    tuviera el suyo (SimpleCache), una invalidación solo llegaría al worker que
+    atendió la escritura. Las claves llevan versión por tabla (ver cache_deps.py),
+    así que basta con que todos los procesos lean el mismo backend.
+
+    - CACHE_REDIS_URL (o REDIS_URL) -> RedisCache (requiere `pip install redis`)
+    - Por defecto                   -> FileSystemCache en CACHE_DIR (data/cache)
+    - CACHE_TYPE=SimpleCache        -> memoria local por proceso (solo desarrollo)
+    """
+    cache_type = os.getenv("CACHE_TYPE")
+    redis_url = os.getenv("CACHE_REDIS_URL") or os.getenv("REDIS_URL")
+    timeout = int(os.getenv("CACHE_DEFAULT_TIMEOUT", "300"))
+
+    config = {'CACHE_DEFAULT_TIMEOUT': timeout}
+
+    if cache_type == 'SimpleCache':
+        config['CACHE_TYPE'] = 'SimpleCache'
+    elif redis_url and cache_type in (None, 'RedisCache'):
+        config.update({
+            'CACHE_TYPE': 'RedisCache',
+            'CACHE_REDIS_URL': redis_url,
+        })
+    else:
+        config.update({
+            'CACHE_TYPE': 'FileSystemCache',
+            'CACHE_DIR': os.getenv("CACHE_DIR", os.path.join("data", "cache")),
+            'CACHE_THRESHOLD': int(os.getenv("CACHE_THRESHOLD", "5000")),
+        })
+    return config
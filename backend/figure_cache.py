@@ -0,0 +1,60 @@
+# backend/figure_cache.py
+"""
+Caché de figuras Plotly ya serializadas.
+
+Con los datos cacheados, lo que más tarda en un callback de gráficos es armar
+la figura (px.pie/px.bar aplican plantilla, validan cada propiedad, etc.).
+Aquí se guarda el JSON final de la figura con clave
+(user_id, tipo de figura, versión de las tablas que la alimentan, extras como
+el rango de fechas). Cuando una escritura sube la versión de esas tablas (ver
+cache_deps.invalidate) la clave cambia y la figura se vuelve a construir.
+
+Uso:
+    fig = cached_figure(uid, 'cashflow', ('transactions', 'categories'),
+                        lambda: build_cashflow(df))
+"""
+import hashlib
+import json
+import os
+
+from backend.extensions import cache
+from backend.cache_deps import table_versions
+
+FIGURE_TTL = int(os.getenv("FIGURE_CACHE_TTL", "600"))
+
+
+def input_digest(value):
+    """Huella corta de una entrada grande de un callback (ej. el JSON de un dcc.Store)."""
+    return hashlib.md5(str(value).encode('utf-8')).hexdigest()
+
+
+def figure_key(user_id, kind, tables, extra=()):
+    versions = table_versions(user_id, tables)
+    digest = hashlib.md5(repr((versions, extra)).encode('utf-8')).hexdigest()
+    return f"pivot:fig:{user_id}:{kind}:{digest}"
+
+
+def cached_figure(user_id, kind, tables, build, extra=(), timeout=FIGURE_TTL):
+    """
+    Retorna la figura de `kind` desde el caché (como dict listo para dcc.Graph)
+    o la construye con build() y guarda su JSON.
+    tables: tablas cuyos cambios invalidan la figura.
+    extra: otras partes de la clave (rango de fechas, huella de la entrada...).
+    """
+    try:
+        key = figure_key(user_id, kind, tables, extra)
+        hit = cache.get(key)
+    except Exception:
+        # Sin contexto de app o backend caído: construimos directo
+        return build()
+
+    if hit is not None:
+        return json.loads(hit)
+
+    fig = build()
+    try:
+        payload = fig.to_json() if hasattr(fig, 'to_json') else json.dumps(fig)
+        cache.set(key, payload, timeout=timeout)
+    except Exception as e:
+        print(f"⚠️ No se pudo guardar la figura '{kind}' en caché: {e}")
+    return fig
@@ -0,0 +1,163 @@
+# backend/journal.py
+"""
+Asientos de varias patas (transferencias, repartos, pagos de tarjeta, retiros).
+
+Antes execute_distribution_process, add_transfer, execute_stabilizer_withdrawal,
+process_card_payment y process_savings_withdrawal armaban cada movimiento a
+mano: un INSERT por transacción (con su UPSERT al resumen mensual) y un
+_adjust_account_balance por pata, que además leía la cuenta antes de cada
+UPDATE. Un reparto en 4 grupos eran 8 INSERT, 8 SELECT y 8 UPDATE sobre la
+misma cuenta origen.
+
+Ahora el que llama arma la lista de patas y post_journal_entry() hace, dentro
+de la transacción del que llama (no hace commit):
+1. Lee TODAS las cuentas involucradas en un solo SELECT y valida fondos una
+   vez por cuenta origen (suma de sus salidas).
+2. Inserta todas las transacciones con un solo executemany y suma al resumen
+   mensual los grupos ya agregados (rollups.apply_groups).
+3. Agrupa los cambios de saldo por cuenta: un UPDATE (y un asiento en
+   balance_ledger) por cuenta, no por pata. El UPDATE de cada origen validado
+   repite la condición de fondos (ver backend/concurrency.py).
+Si la validación falla no se escribe nada.
+
+Pata (dict):
+    account_id   id de la cuenta, 'RESERVE' (reserva de abono) o None (externo, sin saldo)
+    amount       monto positivo
+    effect       'Expense' (sale dinero / sube deuda de tarjeta) o 'Income'
+    check_funds  valida fondos si es salida (por defecto True)
+    name, category, type, subcategory, date
+                 si trae name, se registra la transacción (type por defecto = effect)
+"""
+from collections import defaultdict
+from datetime import date as _date
+
+from backend import rollups, ledger_history, balance_ledger, concurrency
+
+RESERVE = balance_ledger.RESERVE
+
+
+def load_accounts(cursor, user_id, account_ids):
+    """{id (str): {'type', 'current_balance', 'credit_limit', 'name'}} de varias cuentas en un SELECT (+ la reserva)."""
+    ids = sorted({str(a) for a in account_ids if a is not None and str(a) != RESERVE})
+    info = {}
+    if ids:
+        cursor.execute(f"SELECT id, type, current_balance, credit_limit, name FROM accounts "
+                       f"WHERE user_id = ? AND id IN ({','.join('?' * len(ids))})", [user_id] + ids)
+        for acc_id, acc_type, balance, limit, name in cursor.fetchall():
+            info[str(acc_id)] = {'type': acc_type, 'current_balance': float(balance or 0),
+                                 'credit_limit': float(limit or 0), 'name': name}
+    if any(a is not None and str(a) == RESERVE for a in account_ids):
+        cursor.execute("SELECT COALESCE(SUM(balance), 0) FROM abono_reserve WHERE user_id = ?", (user_id,))
+        info[RESERVE] = {'type': RESERVE, 'current_balance': float(cursor.fetchone()[0] or 0),
+                         'credit_limit': 0.0, 'name': "Reserva de Abono"}
+    return info
+
+
+def _available(acc):
+    if acc['type'] == 'Credit':
+        return acc['credit_limit'] - acc['current_balance']
+    return acc['current_balance']
+
+
+def _funds_error(acc, available):
+    # Mismos mensajes que _check_sufficient_funds
+    if acc['type'] == 'Credit':
+        return f"Límite excedido en {acc['name']}. Disp: ${available:,.2f}"
+    if acc['type'] == RESERVE:
+        return f"Saldo insuficiente en Reserva (${available:,.2f})."
+    return f"Fondos insuficientes en {acc['name']}. Disp: ${available:,.2f}"
+
+
+def _needed(legs, require=None):
+    """(cuentas tocadas, {cuenta origen: monto a cubrir}) de un asiento."""
+    needed = defaultdict(float)
+    touched = set()
+    for leg in legs:
+        acc = leg.get('account_id')
+        if acc is None:
+            continue
+        touched.add(str(acc))
+        if leg['effect'] == 'Expense' and leg.get('check_funds', True):
+            needed[str(acc)] += float(leg['amount'])
+    for acc, amount in (require or {}).items():
+        touched.add(str(acc))
+        needed[str(acc)] = max(needed[str(acc)], float(amount))
+    return touched, needed
+
+
+def validate(cursor, user_id, legs, require=None, tolerance=0.0, accounts=None):
+    """
+    Valida fondos una vez por cuenta origen: suma de sus salidas (o lo que pida
+    `require` {cuenta: monto}, si es mayor). Retorna (True, "OK") o (False, mensaje).
+    """
+    touched, needed = _needed(legs, require)
+    accounts = accounts if accounts is not None else load_accounts(cursor, user_id, touched)
+    for acc in touched:
+        if acc not in accounts:
+            return False, "Cuenta no encontrada."
+    for acc, amount in needed.items():
+        available = _available(accounts[acc])
+        if amount > available + tolerance:
+            return False, _funds_error(accounts[acc], available)
+    return True, "OK"
+
+
+def post_journal_entry(cursor, user_id, legs, kind, require=None, tolerance=0.0, accounts=None):
+    """
+    Valida y escribe un asiento completo (ver docstring del módulo).
+    kind: etiqueta del asiento en balance_ledger ('transfer', 'distribution', ...).
+    accounts: resultado de load_accounts si el que llama ya lo leyó.
+    Retorna (True, "OK") o (False, mensaje) sin haber escrito nada.
+    """
+    legs = [leg for leg in legs if float(leg['amount']) > 0]
+    ok, msg = validate(cursor, user_id, legs, require, tolerance, accounts)
+    if not ok:
+        return False, msg
+
+    today = _date.today().strftime('%Y-%m-%d')
+    rows, groups = [], defaultdict(lambda: [0.0, 0])
+    deltas = defaultdict(lambda: [0.0, 0.0])
+    for leg in legs:
+        amount = float(leg['amount'])
+        acc = leg.get('account_id')
+        if leg.get('name'):
+            trans_date = leg.get('date') or today
+            trans_type = leg.get('type') or leg['effect']
+            subcategory = leg.get('subcategory')
+            db_acc = None if acc is None or str(acc) == RESERVE else acc
+            rows.append((user_id, trans_date, leg['name'], amount, leg['category'], trans_type, db_acc, subcategory))
+            group = groups[(rollups.month_of(trans_date), trans_type, leg['category'], subcategory or '')]
+            group[0] += amount
+            group[1] += 1
+        if acc is not None:
+            credit_change, other_change = balance_ledger.signed_changes(amount, leg['effect'])
+            deltas[str(acc)][0] += credit_change
+            deltas[str(acc)][1] += other_change
+
+    if rows:
+        cursor.executemany("""
+            INSERT INTO transactions (user_id, date, name, amount, category, type, account_id, subcategory)
+            VALUES (?, ?, ?, ?, ?, ?, ?, ?)
+        """, rows)
+        rollups.apply_groups(cursor, user_id, [key + tuple(val) for key, val in groups.items()])
+        ledger_history.mark_dirty(cursor, user_id, min(str(r[1])[:10] for r in rows))
+
+    # Los orígenes validados vuelven a exigir sus fondos en el propio UPDATE: si otra
+    # escritura los gastó entre la lectura y aquí -> StaleRow (ver backend/concurrency.py)
+    guards = {acc: amount - tolerance for acc, amount in _needed(legs, require)[1].items() if amount > 0}
+    reserve = deltas.pop(RESERVE, None)
+    reserve_guard = guards.pop(RESERVE, None)
+    if reserve is not None and reserve[1]:
+        # En la reserva un ingreso suma y un gasto resta (igual que las cuentas que no son tarjeta)
+        if reserve_guard is None:
+            cursor.execute("UPDATE abono_reserve SET balance = balance + ? WHERE user_id = ?", (reserve[1], user_id))
+            if cursor.rowcount == 0:
+                cursor.execute("INSERT INTO abono_reserve (user_id, balance) VALUES (?, ?)", (user_id, reserve[1]))
+        else:
+            cursor.execute("UPDATE abono_reserve SET balance = balance + ? WHERE user_id = ? AND balance >= ?",
+                           (reserve[1], user_id, reserve_guard))
+            concurrency.expect_row(cursor, "El saldo de la reserva")
+        balance_ledger.record(cursor, user_id, RESERVE, reserve[1], kind)
+    balance_ledger.adjust_many(cursor, user_id, [(acc, c, o) for acc, (c, o) in deltas.items() if c or o], kind,
+                               min_available=guards)
+    return True, "OK"
@@ -0,0 +1,444 @@
+# backend/ledger_history.py
+"""
+Patrimonio diario reconstruido desde el libro de movimientos.
+
+historical_net_worth solo tiene puntos donde alguien escribió (snapshot) o
+importó datos; entre medio el gráfico repetía el último valor. Aquí se rehace
+el patrimonio de cualquier día a partir de:
+    - transactions               -> efectivo (cuentas Debit/Cash, reserva) y tarjetas
+    - investment_transactions    -> unidades por ticker
+    - price_history (velas 'D')  -> precio de cierre de cada día
+anclado al estado ACTUAL (saldos y posiciones de hoy):
+    saldo(d) = saldo_inicial + Σ movimientos hasta d
+    saldo_inicial = saldo_hoy - Σ todos los movimientos
+Todo es vectorizado: un arreglo por día (np.add.at + cumsum) y una matriz
+días × tickers para las unidades.
+
+Caché por (usuario, día) en la tabla ledger_daily (efectivo e inversiones con
+velas). Un movimiento fechado D borra solo los días >= D (mark_dirty, dentro de
+la misma transacción que lo escribe). Cada fila guarda una firma del estado
+inicial (saldos/unidades iniciales, cobertura de precios): si alguien edita un
+saldo a mano o aparecen velas nuevas hacia atrás, la firma cambia y lo
+guardado deja de usarse (son segundos recalcular aunque sean años).
+Las lecturas (networth_values) no escriben: toman las filas con la firma
+vigente y calculan en memoria lo que falte. El caché lo completa rebuild_all()
+en el turno del snapshot diario (backend/snapshot_job.py).
+Solo se guardan días cerrados (antes de hoy y con vela de todos los tickers);
+hoy usa el precio en vivo de market_cache, igual que get_net_worth_breakdown.
+
+IOU pendientes se suman desde su fecha de creación (no hay historial de pagos).
+
+Uso manual:
+    python -m backend.ledger_history                  # precalcula el caché de todos los usuarios
+    python -m backend.ledger_history --user 3         # solo un usuario
+    python -m backend.ledger_history --fetch-prices   # antes baja velas diarias faltantes (Finnhub)
+"""
+import hashlib
+import json
+import sys
+import time
+from datetime import date
+
+import numpy as np
+import pandas as pd
+
+PRICE_RESOLUTION = 'D'
+_EPOCH = date(1970, 1, 1).toordinal()
+
+# Efecto de cada movimiento en el patrimonio (igual que _adjust_account_balance):
+# - Reserva (account_id NULL): Ingreso suma, el resto resta
+# - Cuentas: Gasto resta (en tarjeta sube la deuda), el resto suma. Las transferencias
+#   se guardan como 'Transfer' y el sentido va en la subcategoría ('Salida: ...')
+_EFFECTS_SQL = """
+    SELECT SUBSTR(t.date, 1, 10) AS day,
+           SUM(CASE
+                 WHEN t.account_id IS NULL THEN
+                     CASE WHEN t.type = 'Income' THEN t.amount ELSE -t.amount END
+                 WHEN t.type = 'Expense' OR (t.type = 'Transfer' AND t.subcategory LIKE 'Salida%') THEN -t.amount
+                 ELSE t.amount
+               END) AS effect
+    FROM transactions t
+    LEFT JOIN accounts a ON a.id = t.account_id AND a.user_id = t.user_id
+    WHERE t.user_id = ? AND t.date IS NOT NULL
+      AND (t.account_id IS NULL OR a.type IN ('Debit', 'Cash', 'Credit'))
+    GROUP BY SUBSTR(t.date, 1, 10)
+"""
+
+_TRADES_SQL = """
+    SELECT SUBSTR(date, 1, 10) AS day, ticker,
+           SUM(CASE WHEN type = 'BUY' THEN shares ELSE -shares END) AS delta
+    FROM investment_transactions
+    WHERE user_id = ?
+    GROUP BY SUBSTR(date, 1, 10), ticker
+"""
+
+_UPSERT_SQL = """
+    INSERT INTO ledger_daily (user_id, date, cash, investments, state_key)
+    VALUES (?, ?, ?, ?, ?)
+    ON CONFLICT (user_id, date) DO UPDATE SET
+        cash = excluded.cash, investments = excluded.investments, state_key = excluded.state_key
+"""
+
+
+def _ordinal(value):
+    if isinstance(value, (int, np.integer)):
+        return int(value)
+    if isinstance(value, date):
+        return value.toordinal()
+    return date.fromisoformat(str(value)[:10]).toordinal()
+
+
+def _iso(ordinal):
+    return date.fromordinal(int(ordinal)).isoformat()
+
+
+def mark_dirty(cursor, user_id, day=None):
+    """Descarta el caché desde `day` (los días anteriores no cambian). Sin `day`: todo el usuario."""
+    if day is None:
+        cursor.execute("DELETE FROM ledger_daily WHERE user_id = ?", (user_id,))
+    else:
+        cursor.execute("DELETE FROM ledger_daily WHERE user_id = ? AND date >= ?", (user_id, str(day)[:10]))
+
+
+# --- ESTADO DEL USUARIO ---
+
+def _load_state(cursor, user_id):
+    """Movimientos agregados por día + anclas de hoy + cobertura de precios."""
+    cursor.execute(_EFFECTS_SQL, (user_id,))
+    rows = cursor.fetchall()
+    eff_days = np.array([_ordinal(r[0]) for r in rows], dtype=np.int64)
+    eff_vals = np.array([float(r[1] or 0) for r in rows], dtype=np.float64)
+
+    cursor.execute("""
+        SELECT COALESCE(SUM(CASE WHEN type IN ('Debit', 'Cash') THEN current_balance
+                                 WHEN type = 'Credit' THEN -current_balance ELSE 0 END), 0)
+        FROM accounts WHERE user_id = ?
+    """, (user_id,))
+    cash_now = float(cursor.fetchone()[0] or 0)
+    cursor.execute("SELECT COALESCE(SUM(balance), 0) FROM abono_reserve WHERE user_id = ?", (user_id,))
+    cash_now += float(cursor.fetchone()[0] or 0)
+
+    cursor.execute(_TRADES_SQL, (user_id,))
+    trades = [(_ordinal(r[0]), r[1], float(r[2] or 0)) for r in cursor.fetchall()]
+
+    cursor.execute("""
+        SELECT ticker, SUM(shares), SUM(shares * avg_price) FROM investments
+        WHERE user_id = ? GROUP BY ticker
+    """, (user_id,))
+    positions = {r[0]: (float(r[1] or 0), float(r[2] or 0)) for r in cursor.fetchall()}
+
+    tickers = sorted(set(positions) | {t for _, t, _ in trades})
+    col = {t: i for i, t in enumerate(tickers)}
+    shares_now = np.array([positions.get(t, (0.0, 0.0))[0] for t in tickers])
+    # Precio de respaldo = costo promedio (lo mismo que usa get_stocks_data sin cotización)
+    avg_price = np.array([positions[t][1] / positions[t][0] if positions.get(t, (0, 0))[0] else 0.0
+                          for t in tickers])
+
+    trade_days = np.array([d for d, _, _ in trades], dtype=np.int64)
+    trade_cols = np.array([col[t] for _, t, _ in trades], dtype=np.int64)
+    trade_vals = np.array([v for _, _, v in trades], dtype=np.float64)
+    trade_total = np.zeros(len(tickers))
+    np.add.at(trade_total, trade_cols, trade_vals)
+
+    live_price = np.zeros(len(tickers))
+    coverage = {}
+    if tickers:
+        marks = ",".join("?" * len(tickers))
+        cursor.execute(f"SELECT ticker, price FROM market_cache WHERE ticker IN ({marks})", tickers)
+        for t, price in cursor.fetchall():
+            live_price[col[t]] = float(price or 0)
+        cursor.execute(f"""
+            SELECT ticker, MIN(ts), MAX(ts) FROM price_history
+            WHERE resolution = ? AND ticker IN ({marks}) GROUP BY ticker
+        """, [PRICE_RESOLUTION] + tickers)
+        coverage = {t: (int(lo) // 86400 + _EPOCH, int(hi) // 86400 + _EPOCH) for t, lo, hi in cursor.fetchall()}
+
+    cursor.execute("""
+        SELECT type, current_amount, date_created FROM iou WHERE user_id = ? AND status = 'Pending'
+    """, (user_id,))
+    ious = []
+    for i_type, amount, created in cursor.fetchall():
+        try:
+            start = _ordinal(created) if created else 0
+        except (ValueError, TypeError):
+            start = 0
+        ious.append((start, float(amount or 0) * (1 if i_type == 'Receivable' else -1 if i_type == 'Payable' else 0)))
+
+    open_cash = cash_now - float(eff_vals.sum())
+    open_shares = shares_now - trade_total
+    covered = np.array([t in coverage for t in tickers], dtype=bool)
+
+    # Firma del estado inicial: si cambia, lo guardado ya no sirve
+    signature = json.dumps([
+        round(open_cash, 2),
+        [(t, round(float(s), 6)) for t, s in zip(tickers, open_shares)],
+        sorted((t, c[0]) for t, c in coverage.items()),
+    ])
+    today = date.today().toordinal()
+    last_candle = min((c[1] for c in coverage.values()), default=today)
+
+    first_days = [int(eff_days.min())] if len(eff_days) else []
+    first_days += [int(trade_days.min())] if len(trade_days) else []
+
+    return {
+        'eff_days': eff_days, 'eff_vals': eff_vals, 'open_cash': open_cash,
+        'tickers': tickers, 'coverage': coverage, 'covered': covered,
+        'trade_days': trade_days, 'trade_cols': trade_cols, 'trade_vals': trade_vals,
+        'open_shares': open_shares, 'avg_price': avg_price, 'live_price': live_price,
+        'ious': ious,
+        'key': hashlib.sha1(signature.encode()).hexdigest(),
+        'final_day': min(today - 1, last_candle),
+        'first_day': min(first_days) if first_days else today,
+    }
+
+
+# --- CÁLCULO VECTORIZADO ---
+
+def _cumulative(base, days, vals, lo, hi):
+    """base + Σ vals con día <= d, para cada d en [lo, hi]."""
+    out = np.zeros(hi - lo + 1)
+    before = days < lo
+    inside = ~before & (days <= hi)
+    np.add.at(out, days[inside] - lo, vals[inside])
+    return base + vals[before].sum() + np.cumsum(out)
+
+
+def _shares(state, lo, hi):
+    """Matriz días × tickers con las unidades al cierre de cada día."""
+    k = len(state['tickers'])
+    days, cols, vals = state['trade_days'], state['trade_cols'], state['trade_vals']
+    out = np.zeros((hi - lo + 1, k))
+    before = days < lo
+    inside = ~before & (days <= hi)
+    np.add.at(out, (days[inside] - lo, cols[inside]), vals[inside])
+    base = state['open_shares'].copy()
+    np.add.at(base, cols[before], vals[before])
+    return base + np.cumsum(out, axis=0)
+
+
+def _candle_prices(cursor, ticker, lo, hi):
+    """Cierre de cada día en [lo, hi] (último cierre conocido; antes de la primera vela, la primera)."""
+    lo_ts, hi_ts = (lo - _EPOCH) * 86400, (hi - _EPOCH + 1) * 86400
+    cursor.execute("""
+        SELECT ts, close FROM price_history
+        WHERE ticker = ? AND resolution = ? AND ts < ?
+          AND ts >= COALESCE((SELECT MAX(ts) FROM price_history
+                              WHERE ticker = ? AND resolution = ? AND ts <= ?), 0)
+        ORDER BY ts
+    """, (ticker, PRICE_RESOLUTION, hi_ts, ticker, PRICE_RESOLUTION, lo_ts))
+    rows = cursor.fetchall()
+    if not rows:
+        return None
+    c_days = np.array([int(r[0]) // 86400 + _EPOCH for r in rows], dtype=np.int64)
+    closes = np.array([float(r[1] or 0) for r in rows])
+    idx = np.searchsorted(c_days, np.arange(lo, hi + 1), side='right') - 1
+    return closes[np.clip(idx, 0, None)]
+
+
+def _fallback_prices(state):
+    """Precio en vivo de market_cache; sin cotización, el costo promedio."""
+    return np.where(state['live_price'] > 0, state['live_price'], state['avg_price'])
+
+
+def _compute(cursor, state, lo, hi):
+    """(efectivo, inversiones de tickers con velas) por día en [lo, hi]."""
+    cash = _cumulative(state['open_cash'], state['eff_days'], state['eff_vals'], lo, hi)
+    covered = np.flatnonzero(state['covered'])
+    if not len(covered):
+        return cash, np.zeros(hi - lo + 1)
+
+    shares = _shares(state, lo, hi)[:, covered]
+    prices = np.tile(_fallback_prices(state)[covered], (hi - lo + 1, 1))
+    for pos, j in enumerate(covered):
+        candles = _candle_prices(cursor, state['tickers'][j], lo, hi)
+        if candles is not None:
+            prices[:, pos] = candles
+
+    today = date.today().toordinal()
+    if lo <= today <= hi:
+        # Hoy: precio en vivo (como get_net_worth_breakdown)
+        prices[today - lo] = _fallback_prices(state)[covered]
+    return cash, (shares * prices).sum(axis=1)
+
+
+def _uncovered_values(state, lo, hi):
+    """Tickers sin velas guardadas: unidades de cada día × precio actual (no se guarda en caché)."""
+    uncovered = np.flatnonzero(~state['covered'])
+    if not len(uncovered):
+        return np.zeros(hi - lo + 1)
+    return _shares(state, lo, hi)[:, uncovered] @ _fallback_prices(state)[uncovered]
+
+
+def _iou_values(state, lo, hi):
+    if not state['ious']:
+        return np.zeros(hi - lo + 1)
+    starts = np.array([s for s, _ in state['ious']], dtype=np.int64)
+    amounts = np.array([a for _, a in state['ious']])
+    order = np.argsort(starts)
+    running = np.concatenate([[0.0], np.cumsum(amounts[order])])
+    return running[np.searchsorted(starts[order], np.arange(lo, hi + 1), side='right')]
+
+
+def _stored(cursor, user_id, key, lo, hi, final):
+    """(efectivo, inversiones) guardados en ledger_daily con la firma vigente; NaN donde falta el día."""
+    n = hi - lo + 1
+    cash = np.full(n, np.nan)
+    inv = np.full(n, np.nan)
+    if lo <= final:
+        cursor.execute("""
+            SELECT date, cash, investments FROM ledger_daily
+            WHERE user_id = ? AND state_key = ? AND date >= ? AND date <= ?
+        """, (user_id, key, _iso(lo), _iso(min(hi, final))))
+        for day, c, i in cursor.fetchall():
+            pos = _ordinal(day) - lo
+            cash[pos], inv[pos] = c, i
+    return cash, inv
+
+
+def networth_values(user_id, lo, hi, conn=None, state=None):
+    """
+    Arreglo con el patrimonio reconstruido de cada día en [lo, hi] (ordinales).
+    Solo lee: usa las filas de ledger_daily con la firma vigente y calcula en
+    memoria los días que falten. El caché lo escribe rebuild().
+    """
+    own_conn = conn is None
+    if own_conn:
+        from backend.data_manager import get_connection
+        conn = get_connection()
+    try:
+        cursor = conn.cursor()
+        state = state or _load_state(cursor, user_id)
+        cash, inv = _stored(cursor, user_id, state['key'], lo, hi, state['final_day'])
+
+        missing = np.flatnonzero(np.isnan(cash))
+        if len(missing):
+            start = lo + int(missing[0])
+            cash[start - lo:], inv[start - lo:] = _compute(cursor, state, start, hi)
+
+        # Parte en vivo (barata): tickers sin velas e IOU
+        return cash + inv + _uncovered_values(state, lo, hi) + _iou_values(state, lo, hi)
+    finally:
+        if own_conn:
+            conn.close()
+
+
+def rebuild(user_id, conn=None):
+    """
+    Escribe el caché del usuario: descarta las filas con otra firma (saldo
+    editado a mano, velas nuevas, etc.) y guarda los días cerrados que falten.
+    Corre en el turno del snapshot diario (backend/snapshot_job.py), nunca en
+    una lectura. Retorna la cantidad de días escritos.
+    """
+    own_conn = conn is None
+    if own_conn:
+        from backend.data_manager import get_connection
+        conn = get_connection()
+    try:
+        cursor = conn.cursor()
+        state = _load_state(cursor, user_id)
+        key, lo, final = state['key'], state['first_day'], state['final_day']
+        cursor.execute("DELETE FROM ledger_daily WHERE user_id = ? AND state_key <> ?", (user_id, key))
+
+        rows = []
+        if lo <= final:
+            cash, inv = _stored(cursor, user_id, key, lo, final, final)
+            missing = np.flatnonzero(np.isnan(cash))
+            if len(missing):
+                start = lo + int(missing[0])
+                cash[start - lo:], inv[start - lo:] = _compute(cursor, state, start, final)
+                rows = [(user_id, _iso(lo + i), float(cash[i]), float(inv[i]), key) for i in missing]
+                cursor.executemany(_UPSERT_SQL, rows)
+        conn.commit()
+        return len(rows)
+    except Exception:
+        conn.rollback()
+        raise
+    finally:
+        if own_conn:
+            conn.close()
+
+
+def rebuild_all(conn=None):
+    """rebuild() de todos los usuarios. Retorna {user_id: días escritos} (solo los que escribieron)."""
+    own_conn = conn is None
+    if own_conn:
+        from backend.data_manager import get_connection
+        conn = get_connection()
+    try:
+        cursor = conn.cursor()
+        cursor.execute("SELECT id FROM users ORDER BY id")
+        written = {}
+        for (uid,) in cursor.fetchall():
+            try:
+                days = rebuild(uid, conn=conn)
+            except Exception as e:
+                print(f"⚠️ Error reconstruyendo patrimonio del usuario {uid}: {e}")
+                continue
+            if days:
+                written[uid] = days
+        return written
+    finally:
+        if own_conn:
+            conn.close()
+
+
+def daily_networth(user_id, start_date=None, end_date=None, conn=None):
+    """DataFrame [date, net_worth, net_change] reconstruido para [start_date, end_date]."""
+    today = date.today().toordinal()
+    own_conn = conn is None
+    if own_conn:
+        from backend.data_manager import get_connection
+        conn = get_connection()
+    try:
+        state = _load_state(conn.cursor(), user_id)
+        lo = state['first_day'] if start_date is None else _ordinal(start_date)
+        hi = min(_ordinal(end_date), today) if end_date else today
+        if hi < lo:
+            return pd.DataFrame(columns=['date', 'net_worth', 'net_change'])
+        # Un día extra al inicio para que net_change del primer día sea real
+        values = networth_values(user_id, lo - 1, hi, conn=conn, state=state)
+    finally:
+        if own_conn:
+            conn.close()
+    return pd.DataFrame({
+        'date': [date.fromordinal(d) for d in range(lo, hi + 1)],
+        'net_worth': values[1:],
+        'net_change': np.diff(values),
+    })
+
+
+def _fetch_prices(conn, user_id):
+    """Baja (una vez) las velas diarias que falten de los tickers del usuario."""
+    from backend import market_data
+
+    state = _load_state(conn.cursor(), user_id)
+    start_ts = (state['first_day'] - _EPOCH) * 86400
+    for ticker in state['tickers']:
+        market_data.get_candles(ticker, PRICE_RESOLUTION, start_ts, int(time.time()), conn=conn)
+
+
+if __name__ == "__main__":
+    from backend.data_manager import get_connection
+
+    args = sys.argv[1:]
+    target = int(args[args.index('--user') + 1]) if '--user' in args else None
+
+    conn = get_connection()
+    try:
+        cursor = conn.cursor()
+        if target is None:
+            cursor.execute("SELECT id FROM users ORDER BY id")
+            users = [r[0] for r in cursor.fetchall()]
+        else:
+            users = [target]
+        for uid in users:
+            if '--fetch-prices' in args:
+                _fetch_prices(conn, uid)
+            t0 = time.perf_counter()
+            written = rebuild(uid, conn=conn)
+            df = daily_networth(uid, conn=conn)
+            took = time.perf_counter() - t0
+            last = f"{df['net_worth'].iloc[-1]:,.2f}" if not df.empty else "-"
+            print(f"✅ Usuario {uid}: {len(df)} días reconstruidos ({written} guardados) en {took:.2f}s (hoy: {last})")
+    finally:
+        conn.close()
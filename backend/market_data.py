@@ -0,0 +1,426 @@
+# backend/market_data.py
+"""
+Motor de actualización de datos de mercado (Finnhub -> market_cache).
+
+Reemplaza los loops seriales de get_stocks_data / manual_price_refresh:
+- Las llamadas a la API corren en un pool de hilos acotado.
+- Un token bucket compartido respeta la cuota de Finnhub (llamadas/minuto).
+- Cada endpoint tiene su propia política de reintentos con backoff.
+- Todo lo descargado se guarda con un UPSERT por lotes y un solo commit.
+- Cada grupo de campos (quote, profile, metrics, news) tiene su propia marca
+  de frescura (<grupo>_updated_at) y su TTL: solo se baja lo que venció.
+  (Las columnas y la tabla price_history las crea backend/migrations.py.)
+
+También guarda velas OHLC en price_history: los gráficos se sirven desde la
+base de datos y a la API solo se le pide el tramo que falta.
+
+El cliente de Finnhub se inyecta (set_finnhub_client o parámetro client=),
+así se puede usar un cliente falso sin tocar la red.
+"""
+import json
+import os
+import random
+import threading
+import time
+from concurrent.futures import ThreadPoolExecutor
+from datetime import datetime, timedelta, timezone
+
+# Cuota de Finnhub (plan gratis: 60 llamadas/min). Se puede ajustar por .env
+CALLS_PER_MINUTE = int(os.getenv("FINNHUB_CALLS_PER_MINUTE", "60"))
+BURST = int(os.getenv("FINNHUB_BURST", "5"))
+MAX_WORKERS = int(os.getenv("MARKET_DATA_WORKERS", "4"))
+
+# Grupos de datos que se pueden pedir por ticker
+QUOTE, PROFILE, METRICS, NEWS = 'quote', 'profile', 'metrics', 'news'
+ALL_GROUPS = (QUOTE, PROFILE, METRICS, NEWS)
+
+# Reintentos por endpoint: (intentos, espera base en segundos)
+RETRY_POLICY = {
+    QUOTE: (3, 0.5),
+    PROFILE: (2, 0.5),
+    METRICS: (2, 0.5),
+    NEWS: (1, 0.5),
+    'candles': (3, 0.5),
+}
+
+# TTL (segundos) de cada grupo antes de considerarlo vencido
+_FUNDAMENTALS_TTL = os.getenv("MARKET_FUNDAMENTALS_TTL", "86400")
+GROUP_TTL = {
+    QUOTE: int(os.getenv("MARKET_QUOTE_TTL", "300")),
+    PROFILE: int(os.getenv("MARKET_PROFILE_TTL", _FUNDAMENTALS_TTL)),
+    METRICS: int(os.getenv("MARKET_METRICS_TTL", _FUNDAMENTALS_TTL)),
+    NEWS: int(os.getenv("MARKET_NEWS_TTL", "3600")),
+}
+
+# Columnas de market_cache que llena cada grupo
+GROUP_COLUMNS = {
+    QUOTE: ('price', 'day_change', 'day_change_pct', 'day_high', 'day_low'),
+    PROFILE: ('company_name', 'market_cap', 'sector', 'country', 'summary'),
+    METRICS: ('fiftyTwo_high', 'fiftyTwo_low', 'pe_ratio', 'dividend_yield', 'beta'),
+    NEWS: ('news', 'sentiment'),
+}
+
+# Marca de frescura de cada grupo
+GROUP_STAMP = {g: f"{g}_updated_at" for g in ALL_GROUPS}
+
+TS_FORMAT = '%Y-%m-%d %H:%M:%S'
+
+# Cada cuánto se vuelve a pedir la cola de velas (la última vela sigue cambiando)
+CANDLE_TTL = {
+    '5': 300, '15': 300, '30': 600, '60': 900,
+    'D': int(os.getenv("MARKET_CANDLE_TTL", "3600")), 'W': 86400, 'M': 86400,
+}
+
+
+class TokenBucket:
+    """Limitador de tasa thread-safe: `rate` tokens por segundo, hasta `capacity` acumulados."""
+
+    def __init__(self, rate, capacity):
+        self.rate = float(rate)
+        self.capacity = max(1, int(capacity))
+        self._tokens = float(self.capacity)
+        self._last = time.monotonic()
+        self._lock = threading.Lock()
+
+    def acquire(self):
+        """Bloquea hasta que haya un token disponible."""
+        while True:
+            with self._lock:
+                now = time.monotonic()
+                self._tokens = min(self.capacity, self._tokens + (now - self._last) * self.rate)
+                self._last = now
+                if self._tokens >= 1:
+                    self._tokens -= 1
+                    return
+                wait = (1 - self._tokens) / self.rate
+            time.sleep(wait)
+
+
+_limiter = TokenBucket(CALLS_PER_MINUTE / 60.0, BURST)
+_executor = ThreadPoolExecutor(max_workers=MAX_WORKERS, thread_name_prefix="pivot-mkt")
+_client = None
+
+
+def set_finnhub_client(client):
+    """Define el cliente que usa el motor (finnhub.Client o uno falso para pruebas)."""
+    global _client
+    _client = client
+
+
+def get_finnhub_client():
+    return _client
+
+
+def _utc_now_str():
+    # Guardamos en UTC (get_data_timestamp convierte a hora local al mostrar)
+    return datetime.now(timezone.utc).strftime(TS_FORMAT)
+
+
+def stale_groups(conn, tickers, groups=ALL_GROUPS, force=(), now=None):
+    """
+    Decide qué grupos hay que bajar para cada ticker según su marca y su TTL.
+    force: grupos que se piden sí o sí (ej. botón "Actualizar" -> (QUOTE,)).
+    Retorna {ticker: (grupos vencidos,)} solo con los tickers que tienen algo vencido.
+    """
+    tickers = list(dict.fromkeys(t for t in tickers if t))
+    if not tickers:
+        return {}
+
+    now = now or datetime.now(timezone.utc)
+    cutoffs = {g: (now - timedelta(seconds=GROUP_TTL[g])).strftime(TS_FORMAT) for g in groups}
+
+    placeholders = ','.join(['?'] * len(tickers))
+    stamp_cols = ', '.join(GROUP_STAMP[g] for g in groups)
+    cursor = conn.cursor()
+    cursor.execute(f"SELECT ticker, {stamp_cols} FROM market_cache WHERE ticker IN ({placeholders})", tickers)
+    stamps = {row[0]: row[1:] for row in cursor.fetchall()}
+
+    plan = {}
+    for t in tickers:
+        row = stamps.get(t)
+        todo = []
+        for i, g in enumerate(groups):
+            # En Postgres llega datetime y en SQLite texto: str()[:19] deja ambos comparables
+            if g in force or row is None or row[i] is None or str(row[i])[:19] < cutoffs[g]:
+                todo.append(g)
+        if todo:
+            plan[t] = tuple(todo)
+    return plan
+
+
+def _is_retryable(error):
+    # Sin status_code = error de red/timeout -> vale la pena reintentar.
+    # 429 (límite) y 5xx también; el resto de 4xx (ticker inválido, sin acceso) no.
+    status = getattr(error, 'status_code', None)
+    return status is None or status == 429 or status >= 500
+
+
+def _call(group, fn, *args, **kwargs):
+    """Ejecuta una llamada a la API respetando la cuota y la política de reintentos del endpoint."""
+    attempts, base_wait = RETRY_POLICY[group]
+    for attempt in range(attempts):
+        _limiter.acquire()
+        try:
+            return fn(*args, **kwargs)
+        except Exception as e:
+            if attempt == attempts - 1 or not _is_retryable(e):
+                raise
+            # Backoff exponencial con jitter para no sincronizar los hilos
+            time.sleep(base_wait * (2 ** attempt) + random.uniform(0, base_wait))
+
+
+def _fetch_ticker(client, ticker, groups):
+    """
+    Descarga los grupos pedidos para un ticker.
+    Retorna (ticker, {grupo: valores}, error). Si la cotización viene vacía
+    (ticker inválido o sin datos) retorna valores None sin error.
+    """
+    values = {}
+    try:
+        if QUOTE in groups:
+            q = _call(QUOTE, client.quote, ticker)
+            if not q or not q.get('c'):
+                return ticker, None, None
+            values[QUOTE] = (q.get('c', 0), q.get('d', 0), q.get('dp', 0), q.get('h', 0), q.get('l', 0))
+    except Exception as e:
+        return ticker, None, str(e)
+
+    # Los grupos secundarios son opcionales: si fallan se conserva lo que ya había en caché.
+    # Si el error es definitivo (ej. 403 sin acceso) se marca igual como fresco (valor None)
+    # para no repetir la llamada hasta que venza su TTL.
+    def secondary(group, fetch):
+        try:
+            values[group] = fetch()
+        except Exception as e:
+            print(f"⚠️ Finnhub {group} {ticker}: {e}")
+            if not _is_retryable(e):
+                values[group] = None
+
+    def profile():
+        p = _call(PROFILE, client.company_profile2, symbol=ticker) or {}
+        return (
+            p.get('name', ticker), p.get('marketCapitalization', 0),
+            p.get('finnhubIndustry', 'N/A'), p.get('country', 'N/A'), p.get('currency', 'USD'),
+        )
+
+    def metrics():
+        m = (_call(METRICS, client.company_basic_financials, ticker, 'all') or {}).get('metric', {}) or {}
+        pe = m.get('pfcfShareTTM', 0) if m.get('peBasicExclExtraTTM') is None else m.get('peBasicExclExtraTTM', 0)
+        return (
+            m.get('52WeekHigh', 0), m.get('52WeekLow', 0), pe,
+            m.get('dividendYieldIndicatedAnnual', 0), m.get('beta', 0),
+        )
+
+    def news():
+        _today = datetime.now().strftime('%Y-%m-%d')
+        items = (_call(NEWS, client.company_news, ticker, _from=_today, to=_today) or [])[:3]
+        return (json.dumps(items), json.dumps({}))
+
+    for group, fetch in ((PROFILE, profile), (METRICS, metrics), (NEWS, news)):
+        if group in groups:
+            secondary(group, fetch)
+
+    if not values:
+        return ticker, None, None
+    return ticker, values, None
+
+
+def _upsert_rows(conn, fetched):
+    """
+    Guarda los resultados en market_cache con UPSERT por lotes y un solo commit.
+    Solo se pisan las columnas de los grupos que sí se descargaron; los grupos
+    con valor None (error definitivo) solo actualizan su marca.
+    """
+    # Agrupamos por forma de fila (grupos con datos, grupos solo-marca) para un executemany por forma
+    batches = {}
+    for ticker, values in fetched.items():
+        key = (tuple(g for g in ALL_GROUPS if values.get(g) is not None),
+               tuple(g for g in ALL_GROUPS if g in values))
+        batches.setdefault(key, []).append((ticker, values))
+
+    now_utc = _utc_now_str()
+    cursor = conn.cursor()
+    try:
+        for (groups, stamped), items in batches.items():
+            cols = [c for g in groups for c in GROUP_COLUMNS[g]]
+            stamps = [GROUP_STAMP[g] for g in stamped] + ['last_updated']
+            all_cols = ['ticker'] + cols + stamps
+            updates = ', '.join(f"{c} = excluded.{c}" for c in cols + stamps)
+            sql = f"""
+                INSERT INTO market_cache ({', '.join(all_cols)})
+                VALUES ({', '.join(['?'] * len(all_cols))})
+                ON CONFLICT(ticker) DO UPDATE SET {updates}
+            """
+            params = [
+                (ticker,) + tuple(v for g in groups for v in values[g]) + (now_utc,) * len(stamps)
+                for ticker, values in items
+            ]
+            cursor.executemany(sql, params)
+        conn.commit()
+    except Exception:
+        conn.rollback()
+        raise
+
+
+def refresh_tickers(tickers, groups=ALL_GROUPS, client=None, conn=None):
+    """
+    Actualiza market_cache para los tickers dados en paralelo, bajando siempre `groups`.
+
+    groups: subconjunto de ALL_GROUPS a descargar (ej. (QUOTE,) para solo precios).
+    client: cliente Finnhub a usar (por defecto el definido con set_finnhub_client).
+    conn: conexión a usar (por defecto data_manager.get_connection()).
+
+    Retorna dict con 'updated' (lista), 'skipped' (lista, sin cotización) y
+    'errors' ({ticker: mensaje}).
+    """
+    groups = tuple(g for g in ALL_GROUPS if g in groups)
+    plan = {t: groups for t in dict.fromkeys(t for t in tickers if t)}
+    return refresh_plan(plan, client=client, conn=conn)
+
+
+def refresh_stale(tickers, groups=ALL_GROUPS, force=(), client=None, conn=None):
+    """Como refresh_tickers, pero solo baja los grupos vencidos de cada ticker (ver stale_groups)."""
+    own_conn = conn is None
+    if own_conn:
+        from backend.data_manager import get_connection
+        conn = get_connection()
+    try:
+        plan = stale_groups(conn, tickers, groups=groups, force=force)
+        return refresh_plan(plan, client=client, conn=conn)
+    finally:
+        if own_conn:
+            conn.close()
+
+
+def refresh_plan(plan, client=None, conn=None):
+    """Ejecuta un plan {ticker: (grupos,)}: descarga en paralelo y guarda todo con un solo commit."""
+    client = client or _client
+    result = {'updated': [], 'skipped': [], 'errors': {}}
+    if not plan:
+        return result
+    if client is None:
+        result['errors'] = {t: "API Key no configurada" for t in plan}
+        return result
+
+    futures = [_executor.submit(_fetch_ticker, client, t, groups) for t, groups in plan.items()]
+
+    fetched = {}
+    for fut in futures:
+        ticker, values, error = fut.result()
+        if error:
+            result['errors'][ticker] = error
+        elif values is None:
+            result['skipped'].append(ticker)
+        else:
+            fetched[ticker] = values
+
+    if fetched:
+        own_conn = conn is None
+        if own_conn:
+            from backend.data_manager import get_connection
+            conn = get_connection()
+        try:
+            _upsert_rows(conn, fetched)
+            result['updated'] = list(fetched)
+        except Exception as e:
+            print(f"❌ Error guardando market_cache: {e}")
+            result['errors'].update({t: str(e) for t in fetched})
+        finally:
+            if own_conn:
+                conn.close()
+
+    return result
+
+
+# --- HISTÓRICO DE PRECIOS (VELAS) ---
+
+def _candle_fetch_range(coverage, start, end, resolution, now):
+    """
+    Decide qué pedir a la API para cubrir [start, end] (como mucho UNA llamada).
+    Retorna (desde, hasta) o None si la DB ya alcanza.
+    """
+    if coverage is None:
+        return start, end
+    first_ts, last_ts, fetched_at = coverage
+    head_missing = start < first_ts
+    tail_stale = end > last_ts and now - fetched_at >= CANDLE_TTL.get(resolution, 3600)
+    if head_missing:
+        # Una sola llamada que cubre desde el nuevo inicio hasta donde haga falta
+        return start, (end if tail_stale else first_ts)
+    if tail_stale:
+        return last_ts, end
+    return None
+
+
+def get_candles(ticker, resolution, start, end, client=None, conn=None):
+    """
+    Velas de `ticker` en `resolution` ('5', '30', 'D', ...) entre start y end (unix).
+    Lee de price_history y solo pide a Finnhub el tramo faltante (cabeza o cola).
+    Retorna DataFrame con columnas ts, open, high, low, close, volume.
+    """
+    import pandas as pd
+
+    client = client or _client
+    own_conn = conn is None
+    if own_conn:
+        from backend.data_manager import get_connection
+        conn = get_connection()
+    try:
+        cursor = conn.cursor()
+        cursor.execute(
+            "SELECT first_ts, last_ts, fetched_at FROM price_history_coverage WHERE ticker = ? AND resolution = ?",
+            (ticker, resolution))
+        coverage = cursor.fetchone()
+
+        now = int(time.time())
+        fetch = _candle_fetch_range(coverage, start, end, resolution, now) if client else None
+        if fetch:
+            try:
+                _store_candles(conn, ticker, resolution, fetch, coverage, client, now)
+            except Exception as e:
+                print(f"Error fetching historical data for {ticker}: {e}")
+
+        return pd.read_sql_query(
+            "SELECT ts, open, high, low, close, volume FROM price_history "
+            "WHERE ticker = ? AND resolution = ? AND ts >= ? AND ts <= ? ORDER BY ts",
+            conn, params=(ticker, resolution, start, end))
+    finally:
+        if own_conn:
+            conn.close()
+
+
+def _store_candles(conn, ticker, resolution, fetch, coverage, client, now):
+    """Pide un tramo a la API, lo guarda (UPSERT) y extiende la cobertura, todo en un commit."""
+    frm, to = fetch
+    resp = _call('candles', client.stock_candles, ticker, resolution, frm, to) or {}
+    rows = []
+    if resp.get('s') == 'ok':
+        cols = [resp.get(k) or [] for k in ('t', 'o', 'h', 'l', 'c', 'v')]
+        rows = [(ticker, resolution, int(t), o, h, l, c, v) for t, o, h, l, c, v in zip(*cols)]
+    elif resp.get('s') != 'no_data':
+        raise ValueError(f"Respuesta inesperada de stock_candles: {resp.get('s')}")
+
+    first_ts = min(frm, coverage[0]) if coverage else frm
+    last_ts = max(to, coverage[1]) if coverage else to
+
+    cursor = conn.cursor()
+    try:
+        if rows:
+            # La última vela del tramo anterior puede haber cambiado: se pisa
+            cursor.executemany("""
+                INSERT INTO price_history (ticker, resolution, ts, open, high, low, close, volume)
+                VALUES (?, ?, ?, ?, ?, ?, ?, ?)
+                ON CONFLICT(ticker, resolution, ts) DO UPDATE SET
+                    open = excluded.open, high = excluded.high, low = excluded.low,
+                    close = excluded.close, volume = excluded.volume
+            """, rows)
+        cursor.execute("""
+            INSERT INTO price_history_coverage (ticker, resolution, first_ts, last_ts, fetched_at)
+            VALUES (?, ?, ?, ?, ?)
+            ON CONFLICT(ticker, resolution) DO UPDATE SET
+                first_ts = excluded.first_ts, last_ts = excluded.last_ts, fetched_at = excluded.fetched_at
+        """, (ticker, resolution, first_ts, last_ts, now))
+        conn.commit()
+    except Exception:
+        conn.rollback()
+        raise
@@ -0,0 +1,185 @@
+# backend/market_scheduler.py
+"""
+Planificador en segundo plano de datos de mercado.
+
+market_cache es global, así que un solo hilo puede mantener frescos los
+tickers de TODOS los usuarios (SELECT DISTINCT ticker FROM investments) y los
+callbacks de las páginas solo leen de la base de datos.
+
+En cada tick se bajan solo los grupos vencidos de cada ticker según su marca
+<grupo>_updated_at y el TTL del grupo (ver market_data.GROUP_TTL): precios
+cada pocos minutos, noticias cada hora, perfil y métricas una vez al día.
+
+Con varios workers de gunicorn, cada proceso arranca su hilo pero solo el que
+tiene el "lease" en el caché compartido trabaja. Al terminar un ciclo se sube
+la versión de market_cache (las páginas recalculan con los datos nuevos) y se
+publica el estado en STATUS_KEY.
+"""
+import os
+import threading
+import time
+import uuid
+
+from backend.extensions import cache
+from backend.cache_deps import invalidate
+from backend import market_data
+
+TICK_SECONDS = int(os.getenv("MARKET_SCHEDULER_TICK", "15"))
+LEASE_SECONDS = max(TICK_SECONDS * 4, 60)
+
+LEADER_KEY = "pivot:mkt:leader"
+STATUS_KEY = "pivot:mkt:status"
+REQUEST_KEY = "pivot:mkt:request"
+
+_token = uuid.uuid4().hex
+_wake = threading.Event()
+_thread = None
+_start_lock = threading.Lock()
+# Tickers que fallaron o vinieron sin cotización (ej. ticker inválido): no reintentar en cada tick
+_failed = {}
+
+
+def _acquire_lease():
+    """Retorna True si este proceso es (o pasa a ser) el líder del planificador."""
+    try:
+        cache.add(LEADER_KEY, _token, timeout=LEASE_SECONDS)
+        if cache.get(LEADER_KEY) != _token:
+            return False
+        cache.set(LEADER_KEY, _token, timeout=LEASE_SECONDS)  # renovamos el lease
+        return True
+    except Exception as e:
+        print(f"⚠️ Scheduler: no se pudo tomar el lease: {e}")
+        return False
+
+
+def is_running():
+    """True si hay algún planificador vivo (en este u otro proceso)."""
+    try:
+        return cache.get(LEADER_KEY) is not None
+    except Exception:
+        return False
+
+
+def get_status():
+    """
+    Último ciclo publicado o None:
+    {'finished_at', 'updated', 'updated_tickers', 'skipped', 'errors', 'calls', 'request_at'}
+    """
+    try:
+        return cache.get(STATUS_KEY)
+    except Exception:
+        return None
+
+
+def request_refresh(group=market_data.QUOTE):
+    """
+    Pide al líder que baje ya un grupo para todos los tickers (ej. botón "Actualizar").
+    No espera: retorna la marca de tiempo del pedido para consultar después
+    con finished_refresh() (la página hace polling, no bloquea un worker).
+    """
+    requested_at = time.time()
+    try:
+        cache.set(REQUEST_KEY, {'group': group, 'at': requested_at}, timeout=LEASE_SECONDS)
+    except Exception as e:
+        print(f"⚠️ Scheduler: no se pudo registrar el pedido: {e}")
+    _wake.set()
+    return requested_at
+
+
+def finished_refresh(requested_at):
+    """
+    Estado del ciclo que atendió el pedido hecho en requested_at, o None si
+    todavía no terminó. Un ciclo que ya estaba corriendo al pedir no cuenta:
+    solo el que leyó el pedido (o uno posterior) publica request_at >= requested_at.
+    """
+    status = get_status()
+    if status and (status.get('request_at') or 0) >= requested_at:
+        return status
+    return None
+
+
+def run_cycle(now=None):
+    """
+    Un ciclo del planificador: baja los grupos vencidos de todos los tickers.
+    Retorna el estado publicado (o None si no había nada que hacer).
+    """
+    from backend.data_manager import get_connection
+
+    now = now or time.time()
+    request = cache.get(REQUEST_KEY)
+    if request:
+        cache.delete(REQUEST_KEY)
+    force = (request['group'],) if request and request.get('group') in market_data.ALL_GROUPS else ()
+
+    conn = get_connection()
+    try:
+        cursor = conn.cursor()
+        cursor.execute("SELECT DISTINCT ticker FROM investments WHERE ticker IS NOT NULL")
+        tickers = [row[0] for row in cursor.fetchall()]
+
+        plan = market_data.stale_groups(conn, tickers, force=force)
+        if not request:
+            retry_after = market_data.GROUP_TTL[market_data.QUOTE]
+            plan = {t: g for t, g in plan.items() if now - _failed.get(t, 0) >= retry_after}
+        if not plan and not request:
+            return None
+
+        res = market_data.refresh_plan(plan, conn=conn)
+    finally:
+        conn.close()
+
+    for t in res['skipped'] + list(res['errors']):
+        _failed[t] = now
+    for t in res['updated']:
+        _failed.pop(t, None)
+
+    if res['updated']:
+        invalidate(None, 'market_cache')
+    status = {
+        'updated': len(res['updated']),
+        'updated_tickers': list(res['updated']),
+        'skipped': list(res['skipped']),
+        'errors': res['errors'],
+        'calls': sum(len(g) for g in plan.values()),
+        'finished_at': time.time(),
+        'request_at': request['at'] if request else None,
+    }
+    cache.set(STATUS_KEY, status, timeout=0)
+    if res['errors']:
+        print(f"⚠️ Scheduler: {len(res['errors'])} tickers con error")
+    return status
+
+
+def _loop(app):
+    while True:
+        try:
+            with app.app_context():
+                if _acquire_lease():
+                    run_cycle()
+        except Exception as e:
+            print(f"⚠️ Error en scheduler de mercado: {e}")
+        _wake.wait(TICK_SECONDS)
+        _wake.clear()
+
+
+def wake():
+    """Despierta el hilo local antes del próximo tick (ej. se agregó un ticker nuevo)."""
+    _wake.set()
+
+
+def start_scheduler(app):
+    """
+    Arranca el hilo del planificador (una vez por proceso).
+    Se desactiva con MARKET_SCHEDULER=off o si no hay cliente de Finnhub.
+    """
+    global _thread
+    if os.getenv("MARKET_SCHEDULER", "on").lower() in ("off", "0", "false"):
+        return False
+    if market_data.get_finnhub_client() is None:
+        return False
+    with _start_lock:
+        if _thread is not None and _thread.is_alive():
+            return True
+        _thread = threading.Thread(target=_loop, args=(app,), name="pivot-market-scheduler", daemon=True)
+        _thread.start()
+    return True
@@ -0,0 +1,486 @@
+# backend/migrations.py
+"""
+Migraciones versionadas del esquema (SQLite y Postgres).
+
+Reemplaza los check_column_exists/ALTER TABLE sueltos que corrían en medio de
+las consultas (setup_abono_reserve en cada lectura de la reserva, la columna
+periodicity_preference, las marcas de market_cache, etc.).
+
+Cada migración tiene un número de versión y se aplica UNA vez: la tabla
+schema_migrations guarda cuáles ya corrieron. Para agregar un cambio de
+esquema se agrega una función al final de MIGRATIONS con el siguiente número;
+nunca se edita una migración ya publicada.
+
+Se ejecuta al arrancar la app (app.py) o a mano:
+    python -m backend.migrations           # aplica las pendientes
+    python -m backend.migrations --check   # verifica (EXPLAIN) que las consultas calientes usen índices
+tests/test_migrations.py hace lo mismo sobre una base temporal (y revisa que
+los índices existan en Postgres).
+"""
+import sys
+from datetime import datetime
+
+# Clave del advisory lock de Postgres (varios workers arrancando a la vez)
+_PG_LOCK_KEY = 7401
+
+
+def _pk(dialect):
+    return "SERIAL PRIMARY KEY" if dialect == 'postgres' else "INTEGER PRIMARY KEY AUTOINCREMENT"
+
+
+def _add_column(cursor, table, column, ddl):
+    """Agrega la columna solo si falta (tablas creadas por versiones viejas de la app)."""
+    from backend.data_manager import check_column_exists
+
+    if check_column_exists(cursor, table, column):
+        return False
+    print(f"🔄 Migrando tabla '{table}': Agregando {column}...")
+    cursor.execute(f"ALTER TABLE {table} ADD COLUMN {column} {ddl}")
+    return True
+
+
+# --- MIGRACIONES ---
+
+def m001_base_tables(cursor, dialect):
+    """Tablas base (instalaciones nuevas). IF NOT EXISTS: no toca las que ya existen."""
+    pk = _pk(dialect)
+    tables = {
+        'users': f"""
+            id {pk},
+            username TEXT NOT NULL UNIQUE,
+            password_hash TEXT NOT NULL,
+            email TEXT,
+            created_at TIMESTAMP DEFAULT CURRENT_TIMESTAMP""",
+        'accounts': f"""
+            id {pk},
+            user_id INTEGER DEFAULT 1,
+            name TEXT NOT NULL,
+            type TEXT NOT NULL,
+            current_balance REAL DEFAULT 0.0,
+            bank_name TEXT,
+            credit_limit REAL DEFAULT 0.0,
+            payment_day INTEGER,
+            cutoff_day INTEGER,
+            interest_rate REAL DEFAULT 0.0,
+            display_order INTEGER DEFAULT 0,
+            deferred_balance REAL DEFAULT 0.0""",
+        'transactions': f"""
+            id {pk},
+            user_id INTEGER DEFAULT 1,
+            date TEXT NOT NULL,
+            name TEXT NOT NULL,
+            amount REAL NOT NULL,
+            category TEXT NOT NULL,
+            type TEXT NOT NULL,
+            account_id INTEGER,
+            subcategory TEXT""",
+        'goals': f"""
+            id {pk},
+            user_id INTEGER DEFAULT 1,
+            name TEXT,
+            target_amount REAL,
+            target_date TEXT,
+            current_amount REAL DEFAULT 0""",
+        'investments': f"""
+            id {pk},
+            user_id INTEGER DEFAULT 1,
+            ticker TEXT,
+            shares REAL,
+            avg_price REAL,
+            asset_type TEXT,
+            account_id INTEGER,
+            total_investment REAL DEFAULT 0.0,
+            display_order INTEGER DEFAULT 0""",
+        'installments': f"""
+            id {pk},
+            user_id INTEGER DEFAULT 1,
+            account_id INTEGER,
+            name TEXT,
+            total_amount REAL,
+            interest_rate REAL,
+            total_quotas INTEGER,
+            paid_quotas INTEGER,
+            payment_day INTEGER""",
+        'iou': f"""
+            id {pk},
+            user_id INTEGER DEFAULT 1,
+            name TEXT,
+            amount REAL,
+            type TEXT,
+            current_amount REAL,
+            date_created TEXT,
+            due_date TEXT,
+            status TEXT,
+            person_name TEXT,
+            description TEXT""",
+        'subcategories': f"""
+            id {pk},
+            user_id INTEGER DEFAULT 1,
+            name TEXT NOT NULL,
+            parent_category TEXT NOT NULL""",
+        'categories': f"""
+            id {pk},
+            user_id INTEGER DEFAULT 1,
+            name TEXT NOT NULL""",
+        'history_snapshots': f"""
+            id {pk},
+            user_id INTEGER DEFAULT 1,
+            date TEXT NOT NULL,
+            net_worth REAL NOT NULL,
+            difference REAL DEFAULT 0.0,
+            period_type TEXT""",
+        'investment_transactions': f"""
+            id {pk},
+            user_id INTEGER DEFAULT 1,
+            date TEXT NOT NULL,
+            ticker TEXT NOT NULL,
+            type TEXT NOT NULL,
+            shares REAL NOT NULL,
+            price REAL NOT NULL,
+            total_transaction REAL NOT NULL,
+            avg_cost_at_trade REAL DEFAULT 0.0,
+            realized_pl REAL DEFAULT 0.0""",
+        'pl_adjustments': f"""
+            id {pk},
+            user_id INTEGER DEFAULT 1,
+            date TEXT NOT NULL,
+            ticker TEXT NOT NULL,
+            realized_pl REAL NOT NULL,
+            description TEXT""",
+        'abono_reserve': f"""
+            id {pk},
+            user_id INTEGER DEFAULT 1,
+            balance REAL DEFAULT 0.0""",
+        # Global (sin user_id): el precio de AAPL es igual para todos
+        'market_cache': """
+            ticker TEXT PRIMARY KEY,
+            company_name TEXT,
+            price REAL, day_change REAL, day_change_pct REAL,
+            day_high REAL, day_low REAL, fiftyTwo_high REAL, fiftyTwo_low REAL,
+            market_cap REAL, shares_outstanding REAL, pe_ratio REAL, peg_ratio REAL,
+            dividend_yield REAL, beta REAL, sector TEXT, country TEXT, summary TEXT,
+            news TEXT, sentiment TEXT,
+            last_updated TIMESTAMP DEFAULT CURRENT_TIMESTAMP""",
+        'fixed_costs': f"""
+            id {pk},
+            user_id INTEGER,
+            name TEXT NOT NULL,
+            amount REAL NOT NULL,
+            frequency INTEGER DEFAULT 1,
+            current_allocation REAL DEFAULT 0.0,
+            due_day INTEGER,
+            description TEXT,
+            is_percentage INTEGER DEFAULT 0,
+            min_amount REAL DEFAULT 0.0,
+            target_account_id INTEGER""",
+        'savings_goals': f"""
+            id {pk},
+            user_id INTEGER,
+            name TEXT NOT NULL,
+            target_amount REAL NOT NULL,
+            current_saved REAL DEFAULT 0.0,
+            target_date TEXT,
+            icon TEXT,
+            display_order INTEGER DEFAULT 0,
+            target_account_id INTEGER,
+            contribution_mode TEXT DEFAULT 'Date',
+            fixed_contribution REAL DEFAULT 0.0,
+            percentage_contribution REAL DEFAULT 0.0""",
+        'distribution_rules': f"""
+            id {pk},
+            user_id INTEGER,
+            category_type TEXT,
+            name TEXT,
+            allocation_type TEXT,
+            value REAL,
+            target_account_id INTEGER""",
+        'income_events': f"""
+            id {pk},
+            user_id INTEGER,
+            name TEXT NOT NULL,
+            amount REAL NOT NULL,
+            event_date TEXT NOT NULL""",
+        'historical_net_worth': f"""
+            id {pk},
+            user_id INTEGER,
+            date TEXT,
+            net_worth REAL""",
+    }
+    for table, columns in tables.items():
+        cursor.execute(f"CREATE TABLE IF NOT EXISTS {table} ({columns}\n)")
+
+
+def m002_legacy_columns(cursor, dialect):
+    """Columnas que versiones anteriores agregaban con ALTER TABLE sueltos."""
+    # Multi-usuario: los datos viejos quedan del admin (id 1)
+    for table in ('accounts', 'transactions', 'goals', 'investments', 'installments',
+                  'iou', 'subcategories', 'categories', 'history_snapshots',
+                  'investment_transactions', 'pl_adjustments', 'abono_reserve'):
+        if _add_column(cursor, table, 'user_id', "INTEGER DEFAULT 1 REFERENCES users(id)"):
+            cursor.execute(f"UPDATE {table} SET user_id = 1 WHERE user_id IS NULL")
+
+    _add_column(cursor, 'categories', 'is_excluded', "INTEGER DEFAULT 0")
+
+    for column, ddl in (
+        ('display_name', "TEXT"),
+        ('last_login', "TEXT"),
+        ('fc_fund_account_id', "INTEGER"),
+        ('sv_fund_account_id', "INTEGER"),
+        ('inv_fund_account_id', "INTEGER"),
+        ('gf_fund_account_id', "INTEGER"),
+        ('income_account_id', "INTEGER"),
+        ('last_total_income', "REAL DEFAULT 0.0"),
+        ('stabilizer_account_id', "INTEGER"),
+        ('stabilizer_base_salary', "REAL DEFAULT 0.0"),
+        ('periodicity_preference', "TEXT DEFAULT 'monthly'"),
+    ):
+        _add_column(cursor, 'users', column, ddl)
+
+
+def m003_market_cache_group_stamps(cursor, dialect):
+    """Marca de frescura por grupo de campos en market_cache (ver market_data.GROUP_TTL)."""
+    for group in ('quote', 'profile', 'metrics', 'news'):
+        _add_column(cursor, 'market_cache', f"{group}_updated_at", "TIMESTAMP")
+
+
+def m004_price_history(cursor, dialect):
+    """Velas OHLC locales + rango ya pedido a la API (ver market_data.get_candles)."""
+    cursor.execute("""
+    CREATE TABLE IF NOT EXISTS price_history (
+        ticker TEXT NOT NULL,
+        resolution TEXT NOT NULL,
+        ts BIGINT NOT NULL,
+        open REAL, high REAL, low REAL, close REAL, volume REAL,
+        PRIMARY KEY (ticker, resolution, ts)
+    )""")
+    cursor.execute("""
+    CREATE TABLE IF NOT EXISTS price_history_coverage (
+        ticker TEXT NOT NULL,
+        resolution TEXT NOT NULL,
+        first_ts BIGINT NOT NULL,
+        last_ts BIGINT NOT NULL,
+        fetched_at BIGINT NOT NULL,
+        PRIMARY KEY (ticker, resolution)
+    )""")
+
+
+# Índices para los filtros calientes: casi todo filtra por user_id + (date|type|ticker|account_id)
+HOT_PATH_INDEXES = {
+    'idx_transactions_user_date': "transactions (user_id, date)",
+    'idx_transactions_account': "transactions (account_id)",
+    'idx_accounts_user_type': "accounts (user_id, type)",
+    'idx_investments_user_ticker': "investments (user_id, ticker)",
+    'idx_investments_ticker': "investments (ticker)",
+    'idx_inv_tx_user_ticker': "investment_transactions (user_id, ticker)",
+    'idx_inv_tx_user_date': "investment_transactions (user_id, date)",
+    'idx_hnw_user_date': "historical_net_worth (user_id, date)",
+    'idx_categories_user_name': "categories (user_id, name)",
+    'idx_subcategories_user_parent': "subcategories (user_id, parent_category)",
+    'idx_installments_account': "installments (account_id)",
+    'idx_iou_user_status': "iou (user_id, status)",
+    'idx_pl_adjustments_user_ticker': "pl_adjustments (user_id, ticker)",
+    'idx_abono_reserve_user': "abono_reserve (user_id)",
+    'idx_fixed_costs_user': "fixed_costs (user_id)",
+    'idx_savings_goals_user': "savings_goals (user_id)",
+    'idx_distribution_rules_user': "distribution_rules (user_id)",
+    'idx_income_events_user_date': "income_events (user_id, event_date)",
+}
+
+
+def m005_hot_path_indexes(cursor, dialect):
+    for name, target in HOT_PATH_INDEXES.items():
+        cursor.execute(f"CREATE INDEX IF NOT EXISTS {name} ON {target}")
+
+
+def m006_transaction_rollups(cursor, dialect):
+    """Resumen mensual por (tipo, categoría, subcategoría); se llena con lo ya registrado."""
+    from backend import rollups
+
+    cursor.execute("""
+    CREATE TABLE IF NOT EXISTS transaction_rollups (
+        user_id INTEGER NOT NULL,
+        month TEXT NOT NULL,
+        type TEXT NOT NULL,
+        category TEXT NOT NULL,
+        subcategory TEXT NOT NULL DEFAULT '',
+        amount_sum REAL NOT NULL DEFAULT 0,
+        count INTEGER NOT NULL DEFAULT 0,
+        PRIMARY KEY (user_id, month, type, category, subcategory)
+    )""")
+    rollups.rebuild(cursor)
+
+
+def m007_ledger_daily(cursor, dialect):
+    """Patrimonio diario reconstruido desde el libro (caché por usuario y día, ver backend/ledger_history.py)."""
+    cursor.execute("""
+    CREATE TABLE IF NOT EXISTS ledger_daily (
+        user_id INTEGER NOT NULL,
+        date TEXT NOT NULL,
+        cash REAL NOT NULL DEFAULT 0,
+        investments REAL NOT NULL DEFAULT 0,
+        state_key TEXT NOT NULL,
+        PRIMARY KEY (user_id, date)
+    )""")
+
+
+def m008_unique_daily_snapshot(cursor, dialect):
+    """Un snapshot por (usuario, día): se borran duplicados (gana el último) y la clave pasa a ser única."""
+    cursor.execute("""
+        DELETE FROM historical_net_worth
+        WHERE id NOT IN (SELECT MAX(id) FROM historical_net_worth GROUP BY user_id, date)
+    """)
+    cursor.execute("CREATE UNIQUE INDEX IF NOT EXISTS ux_hnw_user_date ON historical_net_worth (user_id, date)")
+    # El índice no único de la migración 005 queda cubierto por el único
+    cursor.execute("DROP INDEX IF EXISTS idx_hnw_user_date")
+
+
+
+def m009_balance_ledger(cursor, dialect):
+    """Libro de movimientos de saldo (backend/balance_ledger.py), arrancando con el saldo actual de cada cuenta."""
+    from backend import balance_ledger
+
+    cursor.execute(f"""
+    CREATE TABLE IF NOT EXISTS balance_ledger (
+        seq {_pk(dialect)},
+        user_id INTEGER NOT NULL,
+        account_id TEXT NOT NULL,
+        delta REAL NOT NULL,
+        kind TEXT NOT NULL,
+        created_at TEXT NOT NULL
+    )""")
+    cursor.execute("CREATE INDEX IF NOT EXISTS idx_balance_ledger_account ON balance_ledger (user_id, account_id)")
+    balance_ledger.seed(cursor)
+
+
+def m010_row_versions(cursor, dialect):
+    """Versión por fila para los UPDATE compare-and-set de posiciones (backend/concurrency.py)."""
+    if _add_column(cursor, 'investments', 'version', "INTEGER DEFAULT 0"):
+        cursor.execute("UPDATE investments SET version = 0 WHERE version IS NULL")
+
+MIGRATIONS = [
+    (1, 'base_tables', m001_base_tables),
+    (2, 'legacy_columns', m002_legacy_columns),
+    (3, 'market_cache_group_stamps', m003_market_cache_group_stamps),
+    (4, 'price_history', m004_price_history),
+    (5, 'hot_path_indexes', m005_hot_path_indexes),
+    (6, 'transaction_rollups', m006_transaction_rollups),
+    (7, 'ledger_daily', m007_ledger_daily),
+    (8, 'unique_daily_snapshot', m008_unique_daily_snapshot),
+    (9, 'balance_ledger', m009_balance_ledger),
+    (10, 'row_versions', m010_row_versions),
+]
+
+
+# --- RUNNER ---
+
+def _applied_versions(cursor):
+    cursor.execute("SELECT version FROM schema_migrations")
+    return {row[0] for row in cursor.fetchall()}
+
+
+def run_migrations(conn=None):
+    """
+    Aplica en orden las migraciones pendientes. Cada una corre en su propia
+    transacción junto con su registro en schema_migrations.
+    Retorna la lista de versiones aplicadas.
+    """
+    from backend.data_manager import get_connection, DIALECT
+
+    own_conn = conn is None
+    if own_conn:
+        conn = get_connection()
+    applied_now = []
+    try:
+        cursor = conn.cursor()
+        cursor.execute("""
+        CREATE TABLE IF NOT EXISTS schema_migrations (
+            version INTEGER PRIMARY KEY,
+            name TEXT NOT NULL,
+            applied_at TEXT NOT NULL
+        )""")
+        conn.commit()
+
+        if not set(v for v, _, _ in MIGRATIONS) - _applied_versions(cursor):
+            return applied_now
+
+        for version, name, fn in MIGRATIONS:
+            # Bloqueo para que dos workers no apliquen la misma migración a la vez
+            if DIALECT == 'postgres':
+                cursor.execute("SELECT pg_advisory_xact_lock(?)", (_PG_LOCK_KEY,))
+            else:
+                cursor.execute("BEGIN IMMEDIATE")
+            try:
+                if version in _applied_versions(cursor):
+                    conn.rollback()
+                    continue
+                print(f"🛠️ Migración {version:03d}: {name}")
+                fn(cursor, DIALECT)
+                cursor.execute(
+                    "INSERT INTO schema_migrations (version, name, applied_at) VALUES (?, ?, ?)",
+                    (version, name, datetime.now().strftime('%Y-%m-%d %H:%M:%S')))
+                conn.commit()
+                applied_now.append(version)
+            except Exception:
+                conn.rollback()
+                raise
+        return applied_now
+    finally:
+        if own_conn:
+            conn.close()
+
+
+# --- VERIFICACIÓN DE ÍNDICES ---
+
+# Consultas calientes -> índice que deberían usar (EXPLAIN QUERY PLAN de SQLite)
+HOT_QUERIES = [
+    ("SELECT t.*, a.name FROM transactions t LEFT JOIN accounts a ON t.account_id = a.id "
+     "WHERE t.user_id = ? AND t.date BETWEEN ? AND ? ORDER BY t.date DESC", 3, 'idx_transactions_user_date'),
+    ("SELECT type, SUM(amount) FROM transactions WHERE user_id = ? GROUP BY type", 1, 'idx_transactions_user_date'),
+    ("SELECT shares, avg_price, total_investment FROM investments WHERE ticker = ? AND user_id = ?", 2,
+     'idx_investments_user_ticker'),
+    ("SELECT i.*, c.price FROM investments i LEFT JOIN market_cache c ON i.ticker = c.ticker WHERE i.user_id = ?", 1,
+     'idx_investments_user_ticker'),
+    ("SELECT date, net_worth FROM historical_net_worth WHERE user_id = ? ORDER BY date ASC", 1, 'ux_hnw_user_date'),
+    ("SELECT date, net_worth FROM historical_net_worth WHERE user_id = ? AND date >= ? ORDER BY date ASC", 2,
+     'ux_hnw_user_date'),
+    ("SELECT * FROM investment_transactions WHERE user_id = ? ORDER BY date DESC", 1, 'idx_inv_tx_user_date'),
+    ("SELECT type, current_balance FROM accounts WHERE user_id = ? AND type = ?", 2, 'idx_accounts_user_type'),
+    ("SELECT name FROM categories WHERE user_id = ? AND is_excluded = 1", 1, 'idx_categories_user_name'),
+]
+
+
+def check_hot_query_indexes(conn):
+    """
+    Corre EXPLAIN QUERY PLAN (SQLite) de HOT_QUERIES y retorna {consulta: plan}
+    de las que NO usan el índice esperado.
+    """
+    failures = {}
+    cursor = conn.cursor()
+    for sql, n_params, index in HOT_QUERIES:
+        cursor.execute("EXPLAIN QUERY PLAN " + sql, (None,) * n_params)
+        plan = " | ".join(str(row[-1]) for row in cursor.fetchall())
+        if index not in plan:
+            failures[sql] = plan
+    return failures
+
+
+if __name__ == "__main__":
+    from backend.data_manager import get_connection, DIALECT
+
+    if "--check" in sys.argv:
+        if DIALECT != 'sqlite':
+            # En Postgres el planner elige seq scan en tablas chicas: el chequeo no es concluyente
+            print("El chequeo de índices solo corre en SQLite.")
+            sys.exit(0)
+        conn = get_connection()
+        try:
+            failures = check_hot_query_indexes(conn)
+        finally:
+            conn.close()
+        print(f"{len(HOT_QUERIES) - len(failures)}/{len(HOT_QUERIES)} consultas calientes usan su índice")
+        for sql, plan in failures.items():
+            print(f"  ✗ {sql}\n    -> {plan}")
+        sys.exit(1 if failures else 0)
+
+    applied = run_migrations()
+    print(f"Migraciones aplicadas: {applied or 'ninguna (esquema al día)'}")
@@ -0,0 +1,259 @@
+# backend/networth_history.py
+"""
+Motor del historial de patrimonio (serie diaria densa por usuario).
+
+Antes cada cambio del selector de fechas recargaba TODO historical_net_worth,
+lo reindexaba día a día con ffill y diff en pandas y filtraba comparando
+objetos date en Python.
+
+Ahora, por usuario, se guarda en el caché compartido una serie compacta:
+    {'start': ordinal del primer día, 'values': np.ndarray float64 (un valor
+     por día, huecos ya rellenados hacia adelante), 'observed': np.ndarray bool
+     (días con snapshot real), 'last_row': ordinal de la última fila guardada,
+     'version': versión de historical_net_worth}
+- Cuando cambia la versión de la tabla (un snapshot nuevo) solo se leen las
+  filas desde last_row en adelante y se agregan al final (incremental).
+- Una ventana [start, end] es aritmética de índices sobre la serie densa
+  (día - start), sin filtrar fila por fila.
+- Para el gráfico se puede reducir la ventana a N puntos con LTTB
+  (Largest-Triangle-Three-Buckets), que conserva los picos y valles visibles.
+- Los días sin snapshot pueden seguir el movimiento real del libro
+  (backend/ledger_history.py) en vez de repetir el último valor: se toma la
+  diferencia snapshot - libro del último día con snapshot y se suma al libro.
+
+Si se reescriben días viejos (importación, reconstrucción) hay que llamar a
+invalidate_from(user_id, día) o reset(user_id).
+"""
+from datetime import date
+
+import numpy as np
+import pandas as pd
+
+from backend.extensions import cache
+from backend.cache_deps import table_versions
+
+SERIES_TTL = 24 * 3600
+_EMPTY = np.empty(0, dtype=np.float64)
+
+
+def _series_key(user_id):
+    return f"pivot:nwh:{user_id}"
+
+
+def _to_ordinal(value):
+    if isinstance(value, date):
+        return value.toordinal()
+    return pd.to_datetime(value).date().toordinal()
+
+
+def _ffill(values):
+    """Rellena NaN con el último valor válido anterior (vectorizado)."""
+    mask = np.isnan(values)
+    if not mask.any():
+        return values
+    idx = np.where(~mask, np.arange(len(values)), 0)
+    np.maximum.accumulate(idx, out=idx)
+    return values[idx]
+
+
+def _densify(days, vals, start, tail_value=np.nan):
+    """Filas (ordinal, valor) ordenadas -> (arreglo diario desde `start` hasta el último día, días con dato)."""
+    out = np.full(int(days[-1]) - start + 1, np.nan)
+    # Con fechas repetidas gana la última fila (igual que el UPDATE del snapshot)
+    out[days - start] = vals
+    observed = ~np.isnan(out)
+    if not observed[0]:
+        out[0] = tail_value
+    return _ffill(out), observed
+
+
+def _load_rows(conn, user_id, since=None):
+    cursor = conn.cursor()
+    sql = "SELECT date, net_worth FROM historical_net_worth WHERE user_id = ?"
+    params = [user_id]
+    if since is not None:
+        sql += " AND date >= ?"
+        params.append(date.fromordinal(since).isoformat())
+    cursor.execute(sql + " ORDER BY date ASC", params)
+    rows = cursor.fetchall()
+    if not rows:
+        return np.empty(0, dtype=np.int64), _EMPTY
+    days = np.fromiter((_to_ordinal(str(r[0])[:10]) for r in rows), dtype=np.int64, count=len(rows))
+    vals = np.fromiter((np.nan if r[1] is None else float(r[1]) for r in rows), dtype=np.float64, count=len(rows))
+    return days, vals
+
+
+def get_series(user_id, conn=None):
+    """Serie diaria del usuario (del caché, actualizada de forma incremental si hace falta)."""
+    version = table_versions(user_id, ('historical_net_worth',))[0]
+    series = cache.get(_series_key(user_id))
+    if series is not None and 'observed' not in series:
+        series = None  # Formato anterior (sin máscara de días observados)
+    if series is not None and series['version'] == version:
+        return series
+
+    own_conn = conn is None
+    if own_conn:
+        from backend.data_manager import get_connection
+        conn = get_connection()
+    try:
+        days = None
+        if series is not None and series['start'] is not None:
+            # Incremental: el último día guardado puede haber cambiado (snapshot de hoy), se relee
+            since = series['last_row']
+            days, vals = _load_rows(conn, user_id, since)
+            if len(days):
+                start = series['start']
+                keep = series['values'][:since - start]
+                tail = keep[-1] if len(keep) else np.nan
+                fresh, observed = _densify(days, vals, since, tail_value=tail)
+                series = {'start': start, 'values': np.concatenate([keep, fresh]),
+                          'observed': np.concatenate([series['observed'][:since - start], observed]),
+                          'last_row': int(days[-1])}
+        if days is None or len(days) == 0:
+            # Sin serie previa (o se borraron filas viejas): carga completa
+            days, vals = _load_rows(conn, user_id)
+            if len(days) == 0:
+                series = {'start': None, 'values': _EMPTY, 'observed': _EMPTY.astype(bool), 'last_row': None}
+            else:
+                start = int(days[0])
+                values, observed = _densify(days, vals, start)
+                series = {'start': start, 'values': values, 'observed': observed, 'last_row': int(days[-1])}
+    finally:
+        if own_conn:
+            conn.close()
+
+    series['version'] = version
+    try:
+        cache.set(_series_key(user_id), series, timeout=SERIES_TTL)
+    except Exception as e:
+        print(f"⚠️ No se pudo guardar el historial de patrimonio en caché: {e}")
+    return series
+
+
+def invalidate_from(user_id, day=None):
+    """
+    Descarta la serie guardada desde `day` (date/str) en adelante para que se relea.
+    Sin `day` descarta toda la serie (ej. al importar un historial completo).
+    """
+    key = _series_key(user_id)
+    series = cache.get(key) if day is not None else None
+    if series is None or series['start'] is None:
+        cache.delete(key)
+        return
+    cut = _to_ordinal(day)
+    if cut <= series['start']:
+        cache.delete(key)
+        return
+    series['values'] = series['values'][:cut - series['start']]
+    series['observed'] = series['observed'][:cut - series['start']]
+    series['last_row'] = min(series['last_row'], cut)
+    # Forzamos la relectura desde el corte en la próxima consulta
+    series['version'] = None
+    cache.set(key, series, timeout=SERIES_TTL)
+
+
+def reset(user_id):
+    invalidate_from(user_id, None)
+
+
+def lttb(x, y, n_out):
+    """
+    Largest-Triangle-Three-Buckets: índices de `n_out` puntos que preservan la forma.
+    x, y: arreglos numpy del mismo largo (x creciente).
+    """
+    n = len(x)
+    if n_out >= n or n_out < 3:
+        return np.arange(n)
+    x = x.astype(np.float64)
+    edges = np.linspace(1, n - 1, n_out - 1).astype(np.int64)
+    selected = np.empty(n_out, dtype=np.int64)
+    selected[0], selected[-1] = 0, n - 1
+    a = 0
+    for i in range(n_out - 2):
+        lo, hi = edges[i], edges[i + 1]
+        # Promedio del bucket siguiente (el último bucket apunta al punto final)
+        nlo, nhi = hi, (edges[i + 2] if i + 2 < len(edges) else n)
+        avg_x, avg_y = x[nlo:nhi].mean(), y[nlo:nhi].mean()
+        area = np.abs((x[a] - avg_x) * (y[lo:hi] - y[a]) - (x[a] - x[lo:hi]) * (avg_y - y[a]))
+        a = lo + int(np.argmax(area))
+        selected[i + 1] = a
+    return selected
+
+
+def window(user_id, start_date=None, end_date=None, max_points=None, today_value=None, ledger=None, conn=None):
+    """
+    DataFrame [date, net_worth, net_change] para [start_date, end_date] (fechas incluidas),
+    con días sin snapshot rellenados con el último valor y hoy = today_value si viene.
+    ledger: función (día_desde, día_hasta) -> arreglo diario del patrimonio según el libro;
+    si viene, los días sin snapshot siguen su movimiento en vez de quedar planos.
+    max_points: si la ventana tiene más días, se reduce con LTTB (net_change pasa a ser
+    la variación respecto del punto anterior mostrado).
+    """
+    columns = ['date', 'net_worth', 'net_change']
+    series = get_series(user_id, conn=conn)
+    today = date.today().toordinal()
+
+    start, values, observed = series['start'], series['values'], series['observed']
+    if start is None:
+        if today_value is None:
+            return pd.DataFrame(columns=columns)
+        start, values, observed = today, np.array([float(today_value)]), np.array([True])
+
+    # Serie lógica: guardada hasta ayer, rellenada hasta hoy, y hoy = valor en vivo
+    last = start + len(values) - 1
+    if today_value is not None and start <= today:
+        keep = max(0, today - start)
+        stored = values[:keep]
+        pad = (today - start) - len(stored)
+        fill = stored[-1] if len(stored) else np.nan
+        values = np.concatenate([stored, np.full(pad, fill), [float(today_value)]])
+        observed = np.concatenate([observed[:keep], np.zeros(pad, dtype=bool), [True]])
+        last = today
+    elif last < today:
+        values = np.concatenate([values, np.full(today - last, values[-1])])
+        observed = np.concatenate([observed, np.zeros(today - last, dtype=bool)])
+        last = today
+
+    lo = max(start, _to_ordinal(start_date)) if start_date else start
+    hi = min(last, _to_ordinal(end_date)) if end_date else last
+    if hi < lo:
+        return pd.DataFrame(columns=columns)
+
+    # Se incluye el día anterior a la ventana para el net_change del primer día
+    first = lo - 1 if lo > start else lo
+    seg = values[first - start:hi - start + 1]
+    if ledger is not None:
+        seg = _follow_ledger(values, observed, start, first, hi, ledger, seg)
+    prev, seg = (seg[0], seg[1:]) if first < lo else (seg[0], seg)
+    change = np.diff(seg, prepend=prev)
+    days = np.arange(lo, hi + 1)
+
+    if max_points and len(seg) > max_points:
+        keep = lttb(days, seg, int(max_points))
+        first_change = change[keep[0]]
+        days, seg = days[keep], seg[keep]
+        change = np.diff(seg, prepend=seg[0] - first_change)
+
+    return pd.DataFrame({
+        'date': [date.fromordinal(int(d)) for d in days],
+        'net_worth': seg,
+        'net_change': np.nan_to_num(change),
+    })
+
+
+def _follow_ledger(values, observed, start, first, hi, ledger, seg):
+    """Días sin snapshot en [first, hi] = libro + (snapshot - libro) del último día con snapshot."""
+    seen = np.flatnonzero(observed[:first - start + 1])
+    anchor = start + int(seen[-1]) if len(seen) else first
+    if observed[anchor - start:hi - start + 1].all():
+        return seg
+    try:
+        book = np.asarray(ledger(anchor, hi), dtype=np.float64)
+    except Exception as e:
+        print(f"⚠️ No se pudo reconstruir el historial desde el libro: {e}")
+        return seg
+    full = values[anchor - start:hi - start + 1]
+    offset = _ffill(np.where(observed[anchor - start:hi - start + 1], full - book, np.nan))
+    blended = np.where(np.isnan(offset), full, book + offset)
+    return blended[first - anchor:]
@@ -0,0 +1,321 @@
+# backend/payment_calendar.py
+"""
+Calendario de próximos pagos (tarjetas, cuotas de financiamientos y costos fijos).
+
+Antes cada página calculaba "la próxima fecha" por su cuenta:
+accounts_credit.py tenía su helper de fecha candidata para el pago de la
+tarjeta y fixed_costs.py sacaba la necesidad mensual fila por fila con
+df.apply(calc_need, axis=1). No había una vista de todo lo que vence.
+
+Ahora, por usuario, se arma de una pasada vectorizada (numpy/pandas) la lista
+de obligaciones de los próximos N meses:
+- Tarjetas: corte (cutoff_day) y pago (payment_day) de cada mes. El monto del
+  próximo pago (exigible = deuda - cuotas pendientes) se completa al consultar,
+  porque el saldo cambia con cada transacción.
+- Financiamientos: cada cuota pendiente con su fecha y monto (backend/amortization.py).
+- Costos fijos: cada `frequency` meses en su due_day. No se guarda fecha de
+  inicio, así que se toma el próximo due_day y de ahí cada `frequency` meses.
+  Los de porcentaje usan su mínimo asegurado (igual que la necesidad mensual).
+
+La lista se guarda en el caché compartido con la versión de 'installments',
+'fixed_costs' y 'card_terms' (días de corte/pago de las tarjetas, la bumpean
+add/update/delete_account) y el día de hoy: solo se recalcula cuando cambian
+esas filas o cambia el día, no con cada transacción. El job del snapshot
+diario la precalcula para todos los usuarios con precompute() (un SELECT por
+tabla para todos y una sola pasada).
+
+Uso manual:
+    python -m backend.payment_calendar --user 1            # próximos HORIZON_MONTHS meses
+    python -m backend.payment_calendar --user 1 --months 3
+    python -m backend.payment_calendar --all               # precálculo de todos los usuarios
+"""
+import hashlib
+import os
+import sys
+import time
+from datetime import date
+
+import numpy as np
+import pandas as pd
+
+from backend.extensions import cache
+from backend.cache_deps import table_versions
+from backend import amortization
+
+HORIZON_MONTHS = int(os.getenv("PAYMENT_CALENDAR_MONTHS", "6"))
+CALENDAR_TTL = 24 * 3600
+CALENDAR_TABLES = ('installments', 'fixed_costs', 'card_terms')
+
+KIND_LABELS = {
+    'card_payment': "Pago de tarjeta",
+    'card_cutoff': "Corte de tarjeta",
+    'installment': "Cuota",
+    'fixed_cost': "Costo fijo",
+}
+COLUMNS = ['user_id', 'date', 'kind', 'source_id', 'account_id', 'name', 'amount', 'detail']
+
+
+def next_due(day_of_month, today=None):
+    """Próxima fecha (hoy incluido) de un día de cobro mensual; meses cortos usan su último día."""
+    today = today or date.today()
+    return amortization.due_dates([int(day_of_month or 1)], np.zeros(1, dtype=np.int64), today).dt.date.iloc[0]
+
+
+def monthly_need(df):
+    """Aporte mensual de los costos fijos: monto (o mínimo si es porcentaje) / frecuencia."""
+    if df.empty:
+        return 0.0
+    return float(_fixed_cost_base(df).div(_frequency(df)).sum())
+
+
+def _fixed_cost_base(df):
+    is_pct = pd.to_numeric(df.get('is_percentage', 0), errors='coerce').fillna(0).astype(bool)
+    amount = pd.to_numeric(df['amount'], errors='coerce').fillna(0)
+    minimum = pd.to_numeric(df['min_amount'], errors='coerce').fillna(0) if 'min_amount' in df else 0.0
+    return amount.where(~is_pct, minimum)
+
+
+def _frequency(df):
+    return pd.to_numeric(df['frequency'], errors='coerce').fillna(1).clip(lower=1).astype(np.int64)
+
+
+def _occurrences(days, every, months, today):
+    """Para cada fila: fechas de su día de cobro cada `every` meses dentro del horizonte."""
+    every = np.maximum(np.asarray(every, dtype=np.int64), 1)
+    counts = -(-months // every)  # ceil
+    idx = np.repeat(np.arange(len(every)), counts)
+    step = np.arange(len(idx)) - np.repeat(np.cumsum(counts) - counts, counts)
+    dates = amortization.due_dates(np.asarray(days)[idx], step * every[idx], today)
+    return idx, dates.to_numpy()
+
+
+def _events(frame, idx, dates, kind, name, amount=None, account_id=None, detail=None):
+    def pick(values):
+        return np.asarray(values, dtype=object)[idx] if values is not None else np.full(len(idx), None, dtype=object)
+    return pd.DataFrame({
+        'user_id': frame['user_id'].astype(str).to_numpy()[idx],
+        'date': dates,
+        'kind': kind,
+        'source_id': frame['id'].to_numpy()[idx],
+        'account_id': pick(account_id),
+        'name': frame[name].to_numpy()[idx],
+        'amount': np.asarray(amount, dtype=np.float64)[idx] if amount is not None else np.full(len(idx), np.nan),
+        'detail': pick(detail),
+    }, columns=COLUMNS)
+
+
+def build_calendar(cards, installments, fixed_costs, months=HORIZON_MONTHS, today=None):
+    """
+    Obligaciones de los próximos `months` meses (uno o varios usuarios, según
+    traigan los frames) ordenadas por fecha. Columnas: COLUMNS.
+    """
+    today = today or date.today()
+    horizon = pd.Timestamp(today) + pd.DateOffset(months=months)
+    parts = []
+
+    cards = cards[cards['type'] == 'Credit'] if not cards.empty else cards
+    for kind, column in (('card_payment', 'payment_day'), ('card_cutoff', 'cutoff_day')):
+        rows = cards[pd.to_numeric(cards[column], errors='coerce').fillna(0) > 0] if not cards.empty else cards
+        if rows.empty:
+            continue
+        idx, dates = _occurrences(rows[column].astype(np.int64).to_numpy(), np.ones(len(rows)), months, today)
+        parts.append(_events(rows, idx, dates, kind, 'name', account_id=rows['id'].to_numpy(),
+                             detail=rows['bank_name'].fillna('-').to_numpy()))
+
+    if not installments.empty:
+        plan = amortization.schedule(installments, today=today)
+        plan = plan[~plan['paid'].astype(bool)]
+        if not plan.empty:
+            users = installments.set_index('id')['user_id'].astype(str)
+            totals = installments.set_index('id')['total_quotas']
+            parts.append(pd.DataFrame({
+                'user_id': plan['installment_id'].map(users).to_numpy(),
+                'date': pd.to_datetime(plan['due_date']).to_numpy(),
+                'kind': 'installment',
+                'source_id': plan['installment_id'].to_numpy(),
+                'account_id': plan['account_id'].to_numpy().astype(object),
+                'name': plan['name'].to_numpy(),
+                'amount': plan['payment'].to_numpy(),
+                'detail': (plan['quota_number'].astype(str) + "/" +
+                           plan['installment_id'].map(totals).astype(str)).to_numpy(),
+            }, columns=COLUMNS))
+
+    if not fixed_costs.empty:
+        every = _frequency(fixed_costs).to_numpy()
+        days = pd.to_numeric(fixed_costs['due_day'], errors='coerce').fillna(1).astype(np.int64).to_numpy()
+        idx, dates = _occurrences(days, every, months, today)
+        freq_txt = np.where(every == 1, "Mensual", np.char.add("Cada ", np.char.add(every.astype(str), " meses")))
+        parts.append(_events(fixed_costs, idx, dates, 'fixed_cost', 'name',
+                             amount=_fixed_cost_base(fixed_costs).to_numpy(), detail=freq_txt))
+
+    if not parts:
+        return pd.DataFrame(columns=COLUMNS)
+    events = pd.concat(parts, ignore_index=True)
+    events['date'] = pd.to_datetime(events['date'])
+    events = events[events['date'] <= horizon]
+    return events.sort_values(['user_id', 'date', 'kind'], kind='stable').reset_index(drop=True)
+
+
+def _load(conn, user_ids=None):
+    """Filas de cuentas de crédito, financiamientos y costos fijos (de todos o de esos usuarios)."""
+    queries = {
+        'cards': "SELECT id, user_id, name, type, bank_name, payment_day, cutoff_day FROM accounts WHERE type = 'Credit'",
+        'installments': "SELECT * FROM installments WHERE 1 = 1",
+        'fixed_costs': "SELECT * FROM fixed_costs WHERE 1 = 1",
+    }
+    params = []
+    if user_ids is not None:
+        params = [str(u) for u in user_ids]
+        marks = ','.join('?' * len(params))
+        queries = {k: f"{sql} AND user_id IN ({marks})" for k, sql in queries.items()}
+    return {k: pd.read_sql_query(sql, conn, params=params) for k, sql in queries.items()}
+
+
+def _calendar_key(user_id, months, today, versions):
+    digest = hashlib.md5(repr(versions).encode('utf-8')).hexdigest()[:12]
+    return f"pivot:cal:{user_id}:{months}:{today.isoformat()}:{digest}"
+
+
+def _pending_by_account(installments):
+    return {str(k): v for k, v in amortization.pending_by_account(installments).items()}
+
+
+def _build_entries(user_ids, months, conn, today):
+    """{user_id: {'events': DataFrame, 'pending': {account_id: cuotas pendientes}}} en una pasada."""
+    own_conn = conn is None
+    if own_conn:
+        from backend.data_manager import get_connection
+        conn = get_connection()
+    try:
+        frames = _load(conn, user_ids)
+    finally:
+        if own_conn:
+            conn.close()
+
+    events = build_calendar(frames['cards'], frames['installments'], frames['fixed_costs'], months, today)
+    installments = frames['installments']
+    inst_users = installments['user_id'].astype(str)
+    users = set(str(u) for u in user_ids) if user_ids is not None else set(events['user_id']) | set(inst_users)
+    by_user = dict(tuple(events.groupby('user_id', sort=False))) if not events.empty else {}
+    by_user_inst = dict(tuple(installments.groupby(inst_users))) if not installments.empty else {}
+
+    return {uid: {'events': by_user.get(uid, events.iloc[0:0]).reset_index(drop=True),
+                  'pending': _pending_by_account(by_user_inst.get(uid, installments.iloc[0:0]))}
+            for uid in users}
+
+
+def precompute(user_ids=None, months=HORIZON_MONTHS, conn=None, today=None):
+    """
+    Arma el calendario de todos los usuarios (o de `user_ids`) en una pasada y
+    lo deja en caché. Retorna {user_id: DataFrame}.
+    """
+    today = today or date.today()
+    entries = _build_entries(user_ids, months, conn, today)
+    try:
+        cache.set_many({_calendar_key(uid, months, today, table_versions(uid, CALENDAR_TABLES)): entry
+                        for uid, entry in entries.items()}, timeout=CALENDAR_TTL)
+    except Exception as e:
+        print(f"⚠️ No se pudo guardar el calendario de pagos en caché: {e}")
+    return {uid: entry['events'] for uid, entry in entries.items()}
+
+
+def _get_entry(user_id, months, today, conn=None):
+    try:
+        key = _calendar_key(user_id, months, today, table_versions(user_id, CALENDAR_TABLES))
+        entry = cache.get(key)
+    except Exception:
+        # Sin contexto de app o caché caído: calculamos directo
+        return _build_entries([user_id], months, conn, today)[user_id]
+    if entry is None:
+        entry = _build_entries([user_id], months, conn, today)[user_id]
+        try:
+            cache.set(key, entry, timeout=CALENDAR_TTL)
+        except Exception as e:
+            print(f"⚠️ No se pudo guardar el calendario de pagos en caché: {e}")
+    return entry
+
+
+def upcoming(user_id, start=None, end=None, kinds=None, conn=None):
+    """
+    Obligaciones del usuario entre `start` y `end` (date/str, por defecto hoy y
+    el fin del horizonte). kinds: filtra por tipo (claves de KIND_LABELS).
+    """
+    today = date.today()
+    start = pd.Timestamp(start or today)
+    end = pd.Timestamp(end) if end else pd.Timestamp(today) + pd.DateOffset(months=HORIZON_MONTHS)
+    # Un rango más largo que el horizonte pide un calendario más largo (otra entrada de caché)
+    months = max(HORIZON_MONTHS, (end.year - today.year) * 12 + end.month - today.month + 1)
+
+    entry = _get_entry(str(user_id), months, today, conn)
+    events = entry['events']
+    dates = events['date'].to_numpy()
+    lo, hi = np.searchsorted(dates, start.to_datetime64(), 'left'), np.searchsorted(dates, end.to_datetime64(), 'right')
+    window = events.iloc[lo:hi].copy()
+    if kinds:
+        window = window[window['kind'].isin(kinds)]
+
+    payments = window['kind'] == 'card_payment'
+    if payments.any():
+        window.loc[payments, 'amount'] = _card_amounts(user_id, window[payments], entry['pending'], conn, today)
+    window['label'] = window['kind'].map(KIND_LABELS)
+    return window.reset_index(drop=True)
+
+
+def _card_amounts(user_id, rows, pending, conn=None, today=None):
+    """
+    Exigible (deuda - cuotas pendientes) solo en el pago que vence en
+    next_due(payment_day): la deuda de hoy se paga ahí. Los ciclos siguientes
+    todavía no están facturados y quedan sin monto (NaN), aunque la ventana
+    pedida empiece después del próximo vencimiento.
+    """
+    own_conn = conn is None
+    if own_conn:
+        from backend.data_manager import get_connection
+        conn = get_connection()
+    try:
+        cursor = conn.cursor()
+        cursor.execute("SELECT id, current_balance, payment_day FROM accounts WHERE type = 'Credit' AND user_id = ?",
+                       (str(user_id),))
+        cards = cursor.fetchall()
+    finally:
+        if own_conn:
+            conn.close()
+    debt = {str(i): float(b or 0) for i, b, _ in cards}
+    due = {str(i): pd.Timestamp(next_due(day, today)) for i, _, day in cards if day}
+
+    accounts = rows['account_id'].astype(str)
+    payable = accounts.map(lambda a: max(debt.get(a, 0.0) - pending.get(a, 0.0), 0.0))
+    is_due = pd.to_datetime(rows['date']).dt.normalize() == pd.to_datetime(accounts.map(due))
+    return payable.where(is_due, np.nan).to_numpy(dtype=np.float64)
+
+
+def totals_by_month(events):
+    """Suma de montos conocidos por mes y tipo (para el resumen de la vista)."""
+    if events.empty:
+        return pd.DataFrame(columns=['month', 'kind', 'amount'])
+    month = events['date'].dt.strftime('%Y-%m')
+    return (events.assign(month=month).groupby(['month', 'kind'], as_index=False)['amount'].sum(min_count=1)
+            .dropna(subset=['amount']))
+
+
+if __name__ == "__main__":
+    from app import server
+
+    args = sys.argv[1:]
+    months = int(args[args.index('--months') + 1]) if '--months' in args else HORIZON_MONTHS
+    with server.app_context():
+        t0 = time.perf_counter()
+        if '--all' in args:
+            calendars = precompute(months=months)
+            total = sum(len(df) for df in calendars.values())
+            print(f"✅ Calendario de {len(calendars)} usuarios ({total} vencimientos) en {time.perf_counter() - t0:.2f}s")
+        else:
+            if '--user' not in args:
+                sys.exit("Uso: python -m backend.payment_calendar --user ID [--months N] | --all")
+            uid = args[args.index('--user') + 1]
+            end = pd.Timestamp(date.today()) + pd.DateOffset(months=months)
+            events = upcoming(uid, end=end)
+            for row in events.itertuples():
+                amount = "—" if pd.isna(row.amount) else f"${row.amount:,.2f}"
+                print(f"{row.date:%Y-%m-%d}  {row.label:<17} {row.name:<25} {amount:>12}  {row.detail or ''}")
+            print(f"✅ {len(events)} vencimientos en {time.perf_counter() - t0:.2f}s")
@@ -0,0 +1,332 @@
+# backend/report_export.py
+"""
+Exportación del Centro de Reportes a Excel, en segundo plano.
+
+Antes el callback de /reportes cargaba TODO el historial con
+get_transactions_df(), filtraba las fechas en pandas y armaba el libro
+completo en un BytesIO dentro del request (un reporte de varios años podía
+bloquear el worker de gunicorn hasta el timeout).
+
+Ahora:
+- start_report() encola el trabajo (backend/tasks.py) y retorna un job_id.
+  El estado {'state', 'progress', 'message', ...} vive en el caché compartido,
+  así cualquier worker puede contestar el polling de la barra de progreso.
+- Las hojas grandes (transacciones, trading) filtran las fechas en SQL y se
+  leen con fetchmany de FETCH_ROWS filas.
+- xlsxwriter en modo constant_memory: cada fila se escribe al disco apenas
+  se completa, la memoria no crece con el tamaño del reporte.
+- El archivo queda en REPORT_DIR y se descarga por /reportes/descargar/<job_id>
+  (send_file, solo el dueño del reporte). Los archivos viejos se borran solos.
+- fmt='parquet' arma en cambio el .zip columnar de backend/columnar_export.py
+  con el mismo rango de fechas.
+
+Uso manual:
+    python -m backend.report_export --user 3 --from 2020-01-01 --to 2025-12-31 transactions net_worth
+"""
+import os
+import sys
+import tempfile
+import time
+import uuid
+from datetime import date
+from pathlib import Path
+
+import pandas as pd
+
+from backend.extensions import cache
+from backend import tasks
+
+REPORT_DIR = Path(os.getenv("REPORT_DIR", os.path.join(tempfile.gettempdir(), "pivot_reports")))
+REPORT_TTL = 3600
+FETCH_ROWS = 2000
+DOWNLOAD_URL = "/reportes/descargar/{job_id}"
+
+# Formatos de salida: extensión del archivo y tipo MIME de la descarga
+FORMATS = {
+    'xlsx': ('xlsx', "application/vnd.openxmlformats-officedocument.spreadsheetml.sheet"),
+    'parquet': ('zip', "application/zip"),
+}
+
+# Hoja de Excel de cada reporte (mismo orden que el formulario)
+SHEET_NAMES = {
+    'transactions': 'Transacciones',
+    'net_worth': 'Historial Patrimonio',
+    'investments_current': 'Portafolio Actual',
+    'investments_history': 'Historial Trading',
+    'accounts': 'Estado Cuentas',
+    'fixed_costs': 'Costos Fijos',
+    'savings': 'Metas Ahorro',
+}
+
+PORTFOLIO_COLUMNS = ['ticker', 'name', 'shares', 'avg_price', 'current_price', 'market_value',
+                     'total_gain', 'asset_type', 'sector']
+
+
+def _status_key(job_id):
+    return f"pivot:report:{job_id}"
+
+
+def _set_status(job_id, **fields):
+    status = cache.get(_status_key(job_id)) or {}
+    status.update(fields)
+    cache.set(_status_key(job_id), status, timeout=REPORT_TTL)
+    return status
+
+
+def get_status(job_id, user_id):
+    """Estado del reporte o None si no existe / no es de ese usuario."""
+    if not job_id:
+        return None
+    status = cache.get(_status_key(job_id))
+    if not status or str(status.get('user_id')) != str(user_id):
+        return None
+    return status
+
+
+def report_path(job_id, fmt='xlsx'):
+    return REPORT_DIR / f"{job_id}.{FORMATS[fmt][0]}"
+
+
+def _cleanup_old_files():
+    """Borra reportes generados hace más de REPORT_TTL (nadie los va a descargar)."""
+    limit = time.time() - REPORT_TTL
+    for path in REPORT_DIR.glob("*"):
+        try:
+            if path.stat().st_mtime < limit:
+                path.unlink()
+        except OSError:
+            pass
+
+
+# --- FUENTES DE DATOS (cabecera + iterador de filas) ---
+
+def date_bounds(start_date, end_date, column='date'):
+    """Filtro de fechas sobre columnas TEXT ('YYYY-MM-DD' o 'YYYY-MM-DD HH:MM'), con el último día completo."""
+    sql, params = "", []
+    if start_date:
+        sql += f" AND {column} >= ?"
+        params.append(str(start_date)[:10])
+    if end_date:
+        sql += f" AND {column} <= ?"
+        params.append(str(end_date)[:10] + " 23:59:59")
+    return sql, params
+
+
+def _count(cursor, sql, params):
+    cursor.execute(f"SELECT COUNT(*) FROM ({sql}) q", params)
+    return int(cursor.fetchone()[0] or 0)
+
+
+def _query_rows(conn, sql, params, drop=()):
+    """(cabecera, total, filas) de una consulta leída con fetchmany (sin columnas `drop`)."""
+    cursor = conn.cursor()
+    total = _count(cursor, sql, params)
+    cursor.execute(sql, params)
+    names = [d[0] for d in cursor.description]
+    keep = [i for i, name in enumerate(names) if name not in drop]
+
+    def rows():
+        while True:
+            batch = cursor.fetchmany(FETCH_ROWS)
+            if not batch:
+                break
+            for row in batch:
+                yield [row[i] for i in keep]
+
+    return [names[i] for i in keep], total, rows()
+
+
+def _frame_rows(df, drop=()):
+    """(cabecera, total, filas) de un DataFrame chico (NaN -> celda vacía)."""
+    df = df.drop(columns=list(drop), errors='ignore')
+    df = df.astype(object).where(df.notna(), None)
+    return list(df.columns), len(df), (list(row) for row in df.itertuples(index=False, name=None))
+
+
+def _transactions(conn, user_id, start_date, end_date):
+    where, params = date_bounds(start_date, end_date, 't.date')
+    sql = f"""
+        SELECT t.*, COALESCE(a.name, 'Reserva de Abono') AS account_name
+        FROM transactions t LEFT JOIN accounts a ON t.account_id = a.id
+        WHERE t.user_id = ? {where}
+        ORDER BY t.date DESC, t.id DESC
+    """
+    return _query_rows(conn, sql, [user_id] + params, drop=('user_id', 'account_id'))
+
+
+def _investment_history(conn, user_id, start_date, end_date):
+    where, params = date_bounds(start_date, end_date)
+    sql = f"SELECT * FROM investment_transactions WHERE user_id = ? {where} ORDER BY date DESC, id DESC"
+    header, total, rows = _query_rows(conn, sql, [user_id] + params, drop=('user_id',))
+    if 'date' in header:
+        i = header.index('date')
+        rows = ([*r[:i], str(r[i])[:10], *r[i + 1:]] for r in rows)
+    return header, total, rows
+
+
+def _net_worth(conn, user_id, start_date, end_date):
+    from backend import data_manager as dm
+    return _frame_rows(dm.get_historical_networth_trend(start_date, end_date, user_id=user_id))
+
+
+def _portfolio(conn, user_id, start_date, end_date):
+    from backend import data_manager as dm
+    df = pd.DataFrame(dm.get_stocks_data(user_id, force_refresh=False) or [])
+    return _frame_rows(df[[c for c in PORTFOLIO_COLUMNS if c in df.columns]])
+
+
+def _accounts(conn, user_id, start_date, end_date):
+    from backend import data_manager as dm
+    df = pd.concat([dm.get_accounts_by_category("Debit", user_id=user_id),
+                    dm.get_accounts_by_category("Credit", user_id=user_id)], ignore_index=True)
+    return _frame_rows(df, drop=('user_id',))
+
+
+def _fixed_costs(conn, user_id, start_date, end_date):
+    from backend import data_manager as dm
+    return _frame_rows(dm.get_fixed_costs_df(user_id=user_id), drop=('user_id',))
+
+
+def _savings(conn, user_id, start_date, end_date):
+    from backend import data_manager as dm
+    return _frame_rows(dm.get_savings_goals_df(user_id=user_id), drop=('user_id',))
+
+
+SOURCES = {
+    'transactions': _transactions,
+    'net_worth': _net_worth,
+    'investments_current': _portfolio,
+    'investments_history': _investment_history,
+    'accounts': _accounts,
+    'fixed_costs': _fixed_costs,
+    'savings': _savings,
+}
+
+
+# --- GENERACIÓN ---
+
+def build_report(path, user_id, reports, start_date=None, end_date=None, conn=None, on_progress=None):
+    """
+    Escribe el Excel en `path` hoja por hoja. Retorna las filas escritas por hoja
+    ({} si no había datos: en ese caso no se deja archivo).
+    on_progress(fracción 0..1, mensaje) se llama cada FETCH_ROWS filas.
+    """
+    import xlsxwriter
+
+    selected = [key for key in SHEET_NAMES if key in reports]
+    own_conn = conn is None
+    if own_conn:
+        from backend.data_manager import get_connection
+        conn = get_connection()
+
+    path = Path(path)
+    tmp_path = path.with_suffix(path.suffix + ".part")
+    workbook = xlsxwriter.Workbook(str(tmp_path), {
+        'constant_memory': True,
+        'default_date_format': 'yyyy-mm-dd',
+        'strings_to_urls': False,
+    })
+    bold = workbook.add_format({'bold': True})
+    written = {}
+    try:
+        for n, key in enumerate(selected):
+            sheet = SHEET_NAMES[key]
+            if on_progress:
+                on_progress(n / len(selected), f"Preparando '{sheet}'...")
+            header, total, rows = SOURCES[key](conn, user_id, start_date, end_date)
+            if not total:
+                continue
+            ws = workbook.add_worksheet(sheet)
+            ws.write_row(0, 0, header, bold)
+            count = 0
+            for count, row in enumerate(rows, start=1):
+                ws.write_row(count, 0, row)
+                if on_progress and count % FETCH_ROWS == 0:
+                    on_progress((n + count / total) / len(selected), f"'{sheet}': {count:,} de {total:,} filas")
+            written[sheet] = count
+        if written:
+            workbook.close()
+            os.replace(tmp_path, path)
+        return written
+    finally:
+        if own_conn:
+            conn.close()
+        # Libro sin hojas o error a mitad de camino: no queda archivo a medias
+        tmp_path.unlink(missing_ok=True)
+
+
+def _run_job(job_id, user_id, reports, start_date, end_date, fmt='xlsx'):
+    started = time.time()
+    _set_status(job_id, state='running', progress=0.0, message="Generando reporte...")
+    if fmt == 'parquet':
+        from backend.columnar_export import build_dataset as build
+    else:
+        build = build_report
+    try:
+        REPORT_DIR.mkdir(parents=True, exist_ok=True)
+        _cleanup_old_files()
+        written = build(report_path(job_id, fmt), user_id, reports, start_date, end_date,
+                        on_progress=lambda p, msg: _set_status(job_id, progress=round(p, 3), message=msg))
+    except Exception as e:
+        print(f"❌ Error generando reporte {job_id}: {e}")
+        _set_status(job_id, state='error', message=f"Error generando el reporte: {e}")
+        return
+    if not written:
+        _set_status(job_id, state='empty', progress=1.0,
+                    message="⚠️ No se encontraron datos en los filtros aplicados. Intenta con un rango más amplio.")
+        return
+    rows = sum(written.values())
+    parts = "hojas" if fmt == 'xlsx' else "tablas"
+    _set_status(job_id, state='done', progress=1.0, rows=rows,
+                message=f"Reporte listo: {len(written)} {parts}, {rows:,} filas ({time.time() - started:.1f}s).")
+
+
+def start_report(user_id, reports, start_date=None, end_date=None, fmt='xlsx'):
+    """Encola el reporte y retorna su job_id (el avance se consulta con get_status)."""
+    fmt = fmt if fmt in FORMATS else 'xlsx'
+    job_id = uuid.uuid4().hex
+    filename = f"Reporte_Pivot_{date.today().strftime('%Y-%m-%d')}.{FORMATS[fmt][0]}"
+    _set_status(job_id, user_id=user_id, state='queued', progress=0.0, filename=filename, fmt=fmt,
+                message="En cola...", url=DOWNLOAD_URL.format(job_id=job_id))
+    tasks.submit_once(f"report:{job_id}", _run_job, job_id, user_id, list(reports), start_date, end_date, fmt)
+    return job_id
+
+
+def init_app(server):
+    """Registra la ruta de descarga de los reportes generados."""
+    from flask import abort, send_file
+    from flask_login import current_user
+
+    @server.route(DOWNLOAD_URL.format(job_id="<job_id>"))
+    def download_report(job_id):
+        if not current_user.is_authenticated:
+            abort(401)
+        status = get_status(job_id, current_user.id)
+        fmt = (status or {}).get('fmt', 'xlsx')
+        path = report_path(job_id, fmt)
+        if not status or status.get('state') != 'done' or not path.exists():
+            abort(404)
+        return send_file(path, as_attachment=True, download_name=status['filename'], mimetype=FORMATS[fmt][1])
+
+
+if __name__ == "__main__":
+    from app import server
+
+    args = sys.argv[1:]
+
+    def option(flag, default=None):
+        if flag in args:
+            i = args.index(flag)
+            value = args[i + 1]
+            del args[i:i + 2]
+            return value
+        return default
+
+    uid = int(option('--user', '1'))
+    start, end = option('--from'), option('--to')
+    reports = args or list(SHEET_NAMES)
+    out = Path(f"Reporte_Pivot_{uid}_{date.today().isoformat()}.xlsx")
+    with server.app_context():
+        t0 = time.perf_counter()
+        result = build_report(out, uid, reports, start, end)
+        print(f"✅ {out} en {time.perf_counter() - t0:.2f}s: {result or 'sin datos'}")
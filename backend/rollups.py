@@ -0,0 +1,132 @@
+# backend/rollups.py
+"""
+Resumen mensual pre-agregado de transacciones (tabla transaction_rollups).
+
+Una fila por (user_id, month, type, category, subcategory) con la suma y la
+cantidad de movimientos. Los gráficos de flujo de caja y de categorías leen de
+aquí (O(meses × categorías)) en vez de re-agrupar toda la tabla transactions.
+
+La tabla se mantiene de forma incremental DENTRO de la misma transacción que
+escribe en transactions (ver data_manager._insert_transaction y compañía), así
+que nunca queda a medio actualizar. subcategory NULL se guarda como '' para que
+la clave única funcione igual en SQLite y Postgres.
+
+Si algo la desincroniza (ej. un UPDATE a mano), se reconstruye con:
+    python -m backend.rollups                 # reconstruye para todos los usuarios
+    python -m backend.rollups --user 3        # solo un usuario
+    python -m backend.rollups --check         # compara contra transactions sin escribir
+"""
+import sys
+
+# Mes = 'YYYY-MM' (las fechas se guardan como texto ISO: 'YYYY-MM-DD[ HH:MM]')
+_MONTH_SQL = "SUBSTR(date, 1, 7)"
+
+_UPSERT_SQL = """
+    INSERT INTO transaction_rollups (user_id, month, type, category, subcategory, amount_sum, count)
+    VALUES (?, ?, ?, ?, ?, ?, ?)
+    ON CONFLICT (user_id, month, type, category, subcategory) DO UPDATE SET
+        amount_sum = transaction_rollups.amount_sum + excluded.amount_sum,
+        count = transaction_rollups.count + excluded.count
+"""
+
+_AGGREGATE_SQL = f"""
+    SELECT user_id, {_MONTH_SQL} AS month, type, category, COALESCE(subcategory, '') AS subcategory,
+           SUM(amount) AS amount_sum, COUNT(*) AS count
+    FROM transactions
+    WHERE {{where}}
+    GROUP BY user_id, {_MONTH_SQL}, type, category, COALESCE(subcategory, '')
+"""
+# Filas que no pueden entrar al resumen (la clave no admite NULL)
+_VALID_ROWS = " AND date IS NOT NULL AND type IS NOT NULL AND category IS NOT NULL"
+
+
+def month_of(date_value):
+    """'YYYY-MM' de una fecha (texto ISO, date o datetime), igual que _MONTH_SQL."""
+    return str(date_value)[:7]
+
+
+def apply(cursor, user_id, date_value, trans_type, category, subcategory, amount, sign=1):
+    """Suma (sign=1) o resta (sign=-1) un movimiento al resumen de su mes."""
+    # Filas leídas con pandas traen NaN en vez de None
+    subcategory = subcategory if isinstance(subcategory, str) else ''
+    cursor.execute(_UPSERT_SQL, (
+        user_id, month_of(date_value), trans_type, category, subcategory,
+        sign * float(amount or 0), sign
+    ))
+    if sign < 0:
+        # Grupos que quedaron sin movimientos no deben aparecer en los gráficos
+        cursor.execute("""
+            DELETE FROM transaction_rollups
+            WHERE user_id = ? AND month = ? AND type = ? AND category = ? AND subcategory = ? AND count <= 0
+        """, (user_id, month_of(date_value), trans_type, category, subcategory))
+
+
+def apply_groups(cursor, user_id, groups):
+    """Suma grupos ya agregados [(month, type, category, subcategory, amount_sum, count)] (importaciones masivas)."""
+    if groups:
+        cursor.executemany(_UPSERT_SQL, [(user_id,) + tuple(g) for g in groups])
+
+
+def subtract_where(cursor, where, params):
+    """
+    Resta del resumen las transacciones que cumplen `where` (antes de un DELETE masivo,
+    ej. borrar una cuenta con todos sus movimientos).
+    """
+    cursor.execute(_AGGREGATE_SQL.format(where=where + _VALID_ROWS), params)
+    for uid, month, t_type, category, subcategory, amount_sum, count in cursor.fetchall():
+        cursor.execute(_UPSERT_SQL, (uid, month, t_type, category, subcategory, -(amount_sum or 0), -count))
+    cursor.execute("DELETE FROM transaction_rollups WHERE count <= 0")
+
+
+def rebuild(cursor, user_id=None):
+    """Recalcula el resumen desde cero (todos los usuarios o uno). Retorna filas escritas."""
+    if user_id is None:
+        cursor.execute("DELETE FROM transaction_rollups")
+        where, params = "1 = 1", ()
+    else:
+        cursor.execute("DELETE FROM transaction_rollups WHERE user_id = ?", (user_id,))
+        where, params = "user_id = ?", (user_id,)
+    cursor.execute(f"""
+        INSERT INTO transaction_rollups (user_id, month, type, category, subcategory, amount_sum, count)
+        {_AGGREGATE_SQL.format(where=where + _VALID_ROWS)}
+    """, params)
+    cursor.execute("SELECT COUNT(*) FROM transaction_rollups" + (" WHERE user_id = ?" if user_id is not None else ""),
+                   (user_id,) if user_id is not None else ())
+    return cursor.fetchone()[0]
+
+
+def diff(cursor, user_id=None):
+    """Grupos donde el resumen no coincide con transactions: [(clave, esperado, guardado)]."""
+    where, params = ("1 = 1", ()) if user_id is None else ("user_id = ?", (user_id,))
+    cursor.execute(_AGGREGATE_SQL.format(where=where + _VALID_ROWS), params)
+    expected = {tuple(r[:5]): (round(r[5] or 0, 2), r[6]) for r in cursor.fetchall()}
+    cursor.execute(
+        "SELECT user_id, month, type, category, subcategory, amount_sum, count FROM transaction_rollups WHERE " + where,
+        params)
+    stored = {tuple(r[:5]): (round(r[5] or 0, 2), r[6]) for r in cursor.fetchall()}
+    return [(key, expected.get(key), stored.get(key))
+            for key in sorted(set(expected) | set(stored), key=repr)
+            if expected.get(key) != stored.get(key)]
+
+
+if __name__ == "__main__":
+    from backend.data_manager import get_connection
+
+    args = sys.argv[1:]
+    target = int(args[args.index('--user') + 1]) if '--user' in args else None
+
+    conn = get_connection()
+    try:
+        cursor = conn.cursor()
+        if '--check' in args:
+            mismatches = diff(cursor, target)
+            for key, expected, stored in mismatches[:20]:
+                print(f"  ✗ {key}: transactions={expected} rollup={stored}")
+            print(f"{len(mismatches)} grupos desincronizados")
+            sys.exit(1 if mismatches else 0)
+
+        rows = rebuild(cursor, target)
+        conn.commit()
+        print(f"✅ transaction_rollups reconstruida: {rows} filas")
+    finally:
+        conn.close()
@@ -0,0 +1,185 @@
+# backend/snapshot_job.py
+"""
+Snapshot diario de patrimonio en lote (todos los usuarios en una pasada).
+
+Antes cada escritura agendaba capture_daily_snapshot() del usuario logueado:
+get_net_worth_breakdown (que podía llamar a Finnhub) + SELECT y luego
+UPDATE/INSERT en historical_net_worth. Quien no entraba a la app no tenía
+punto ese día.
+
+Ahora un hilo en segundo plano corre run_batch() cada SNAPSHOT_INTERVAL:
+- Una sola consulta agregada calcula el patrimonio de todos los usuarios
+  (cuentas, reserva, IOU pendientes e inversiones × market_cache, leído una
+  vez con un JOIN). Es la misma fórmula que get_net_worth_breakdown.
+- UPSERT sobre (user_id, date) (índice único, migración 008): correrlo dos
+  veces el mismo día deja una fila por usuario con el último valor.
+- Solo se escriben (e invalidan) los usuarios cuyo valor cambió.
+- En el mismo turno se precalcula el calendario de próximos pagos de todos
+  los usuarios (backend/payment_calendar.py) y se completa el caché del
+  patrimonio reconstruido (ledger_history.rebuild_all: las lecturas no escriben).
+No llama a la API: los precios los mantiene market_scheduler.
+
+Con varios workers, cada proceso tiene su hilo pero solo uno gana el turno
+de cada intervalo (cache.add sobre una clave por intervalo).
+
+Uso manual:
+    python -m backend.snapshot_job                    # snapshot de hoy para todos
+    python -m backend.snapshot_job --user 3           # solo un usuario
+"""
+import os
+import sys
+import threading
+import time
+import uuid
+from datetime import date
+
+from backend.extensions import cache
+from backend.cache_deps import invalidate
+from backend import payment_calendar, ledger_history, networth_history
+
+SNAPSHOT_INTERVAL = int(os.getenv("SNAPSHOT_INTERVAL", "3600"))
+STATUS_KEY = "pivot:snap:status"
+
+_token = uuid.uuid4().hex
+_thread = None
+_start_lock = threading.Lock()
+
+_NET_WORTH_SQL = """
+    SELECT u.id,
+           COALESCE(acc.cash, 0) + COALESCE(res.balance, 0) + COALESCE(io.net, 0) + COALESCE(inv.value, 0)
+    FROM users u
+    LEFT JOIN (
+        SELECT user_id, SUM(CASE WHEN type IN ('Debit', 'Cash') THEN current_balance
+                                 WHEN type = 'Credit' THEN -current_balance ELSE 0 END) AS cash
+        FROM accounts GROUP BY user_id
+    ) acc ON acc.user_id = u.id
+    LEFT JOIN (
+        SELECT user_id, SUM(balance) AS balance FROM abono_reserve GROUP BY user_id
+    ) res ON res.user_id = u.id
+    LEFT JOIN (
+        SELECT user_id, SUM(CASE WHEN type = 'Receivable' THEN current_amount
+                                 WHEN type = 'Payable' THEN -current_amount ELSE 0 END) AS net
+        FROM iou WHERE status = 'Pending' GROUP BY user_id
+    ) io ON io.user_id = u.id
+    LEFT JOIN (
+        SELECT i.user_id, SUM(i.shares * CASE WHEN c.price > 0 THEN c.price ELSE i.avg_price END) AS value
+        FROM investments i LEFT JOIN market_cache c ON c.ticker = i.ticker
+        GROUP BY i.user_id
+    ) inv ON inv.user_id = u.id
+    WHERE (acc.user_id IS NOT NULL OR res.user_id IS NOT NULL OR io.user_id IS NOT NULL OR inv.user_id IS NOT NULL)
+"""
+
+_UPSERT_SQL = """
+    INSERT INTO historical_net_worth (user_id, date, net_worth) VALUES (?, ?, ?)
+    ON CONFLICT (user_id, date) DO UPDATE SET net_worth = excluded.net_worth
+"""
+
+
+def run_batch(day=None, user_ids=None, conn=None):
+    """
+    Guarda el patrimonio actual como snapshot de `day` (hoy por defecto; un día
+    pasado también descarta la serie de networth_history desde ese día).
+    user_ids: limita a esos usuarios (None = todos). Retorna la lista de usuarios escritos.
+    """
+    day = str(day or date.today().isoformat())[:10]
+    own_conn = conn is None
+    if own_conn:
+        from backend.data_manager import get_connection
+        conn = get_connection()
+    try:
+        cursor = conn.cursor()
+        sql, params = _NET_WORTH_SQL, []
+        if user_ids is not None:
+            if not user_ids:
+                return []
+            sql += f" AND u.id IN ({','.join('?' * len(user_ids))})"
+            params = list(user_ids)
+        cursor.execute(sql, params)
+        current = {uid: round(float(nw or 0), 2) for uid, nw in cursor.fetchall()}
+
+        cursor.execute("SELECT user_id, net_worth FROM historical_net_worth WHERE date = ?", (day,))
+        stored = {uid: nw for uid, nw in cursor.fetchall()}
+
+        # Idempotente: si el valor no cambió no se escribe ni se invalida nada
+        rows = [(uid, day, nw) for uid, nw in current.items()
+                if stored.get(uid) is None or abs(stored[uid] - nw) >= 0.005]
+        if rows:
+            cursor.executemany(_UPSERT_SQL, rows)
+        conn.commit()
+    except Exception:
+        conn.rollback()
+        raise
+    finally:
+        if own_conn:
+            conn.close()
+
+    for uid, _, _ in rows:
+        invalidate(uid, 'historical_net_worth')
+        if day < date.today().isoformat():
+            # Día pasado: la serie en caché solo relee desde su última fila, se recorta desde `day`
+            networth_history.invalidate_from(uid, day)
+    return [uid for uid, _, _ in rows]
+
+
+def get_status():
+    """Última corrida: {'finished_at', 'written', 'took'} o None."""
+    try:
+        return cache.get(STATUS_KEY)
+    except Exception:
+        return None
+
+
+def _run_slot():
+    """Corre el lote si este proceso gana el turno del intervalo actual."""
+    slot = int(time.time() // SNAPSHOT_INTERVAL)
+    if not cache.add(f"pivot:snap:slot:{slot}", _token, timeout=SNAPSHOT_INTERVAL * 2):
+        return None
+    started = time.time()
+    written = run_batch()
+    try:
+        # Mismo turno: calendario de próximos pagos de todos (cambia con el día)
+        payment_calendar.precompute()
+    except Exception as e:
+        print(f"⚠️ Error precalculando calendario de pagos: {e}")
+    try:
+        ledger_history.rebuild_all()
+    except Exception as e:
+        print(f"⚠️ Error completando el caché de patrimonio diario: {e}")
+    status = {'finished_at': time.time(), 'written': len(written), 'took': time.time() - started}
+    cache.set(STATUS_KEY, status, timeout=0)
+    return status
+
+
+def _loop(app):
+    while True:
+        try:
+            with app.app_context():
+                _run_slot()
+        except Exception as e:
+            print(f"⚠️ Error en snapshot diario: {e}")
+        # Despertamos más seguido que el intervalo para no perder el turno si otro worker murió
+        time.sleep(min(SNAPSHOT_INTERVAL, 300))
+
+
+def start_snapshot_job(app):
+    """Arranca el hilo del snapshot diario (una vez por proceso). Se desactiva con SNAPSHOT_JOB=off."""
+    global _thread
+    if os.getenv("SNAPSHOT_JOB", "on").lower() in ("off", "0", "false"):
+        return False
+    with _start_lock:
+        if _thread is not None and _thread.is_alive():
+            return True
+        _thread = threading.Thread(target=_loop, args=(app,), name="pivot-snapshot-job", daemon=True)
+        _thread.start()
+    return True
+
+
+if __name__ == "__main__":
+    from app import server
+
+    args = sys.argv[1:]
+    target = [int(args[args.index('--user') + 1])] if '--user' in args else None
+    with server.app_context():
+        t0 = time.perf_counter()
+        written = run_batch(user_ids=target)
+        print(f"✅ Snapshot de {date.today()}: {len(written)} usuarios actualizados en {time.perf_counter() - t0:.2f}s")
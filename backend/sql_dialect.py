@@ -0,0 +1,126 @@
+# backend/sql_dialect.py
+"""
+Capa mínima de dialecto SQL (SQLite <-> Postgres).
+
+Dos piezas, ambas compiladas una sola vez y cacheadas:
+
+1. to_pyformat(sql): traduce los placeholders `?` al `%s` de psycopg2 respetando
+   literales ('...'), identificadores ("...") y comentarios. Antes se hacía
+   sql.replace('?', '%s') en cada ejecución, lo que rompía literales con `?`.
+   También escapa los `%` (ej. LIKE 'Salida%') que psycopg2 tomaría como formato.
+
+2. Registro de consultas con macros por dialecto. Las consultas se escriben
+   en SQL portable con `?` y macros entre llaves:
+     {returning_id}  -> RETURNING id en Postgres (para cursor.lastrowid)
+   y se renderizan una vez por dialecto con Query.render(dialect).
+   Una macro nueva se agrega a _MACROS junto con la consulta que la usa.
+
+Uso:
+    Q_X = register_query('nombre', "INSERT INTO ... VALUES (?, ?) {returning_id}")
+    cursor.execute(Q_X.render(DIALECT), params)
+
+tests/test_sql_dialect.py ejecuta cada consulta registrada en SQLite y en
+Postgres (TEST_DATABASE_URL o un servidor local de pgserver):
+    python -m pytest tests/test_sql_dialect.py
+"""
+import re
+from functools import lru_cache
+
+SQLITE = 'sqlite'
+POSTGRES = 'postgres'
+
+_MACROS = {
+    'returning_id': {
+        SQLITE: lambda _: "",
+        POSTGRES: lambda _: "RETURNING id",
+    },
+}
+
+_MACRO_RE = re.compile(r"\{(\w+)(?::([^{}]*))?\}")
+
+_REGISTRY = {}
+
+
+def _split(sql):
+    """Parte el SQL en trozos (tipo, texto): 'code', 'literal', 'ident' o 'comment'."""
+    parts = []
+    i, n, start = 0, len(sql), 0
+    while i < n:
+        ch = sql[i]
+        if ch in ("'", '"'):
+            end = i + 1
+            while end < n:
+                if sql[end] == ch:
+                    # Comilla duplicada = comilla escapada dentro del literal
+                    if end + 1 < n and sql[end + 1] == ch:
+                        end += 2
+                        continue
+                    break
+                end += 1
+            parts.append(('code', sql[start:i]))
+            parts.append(('literal' if ch == "'" else 'ident', sql[i:end + 1]))
+            i = start = end + 1
+        elif sql.startswith('--', i):
+            end = sql.find('\n', i)
+            end = n if end == -1 else end
+            parts.append(('code', sql[start:i]))
+            parts.append(('comment', sql[i:end]))
+            i = start = end
+        else:
+            i += 1
+    parts.append(('code', sql[start:]))
+    return [p for p in parts if p[1]]
+
+
+@lru_cache(maxsize=1024)
+def to_pyformat(sql, escape_percent=True):
+    """
+    Traduce `?` -> `%s` solo fuera de literales/comentarios.
+    escape_percent: psycopg2 solo interpreta `%` cuando hay parámetros.
+    """
+    out = []
+    for kind, text in _split(sql):
+        if escape_percent:
+            text = text.replace('%', '%%')
+        if kind == 'code':
+            text = text.replace('?', '%s')
+        out.append(text)
+    return ''.join(out)
+
+
+def count_placeholders(sql):
+    """Cantidad de `?` reales (fuera de literales y comentarios)."""
+    return sum(text.count('?') for kind, text in _split(sql) if kind == 'code')
+
+
+class Query:
+    """Consulta con nombre escrita en SQL portable; se renderiza una vez por dialecto."""
+
+    def __init__(self, name, sql):
+        self.name = name
+        self.sql = sql
+        self._compiled = {}
+
+    def render(self, dialect):
+        text = self._compiled.get(dialect)
+        if text is None:
+            def expand(m):
+                macro, arg = m.group(1), (m.group(2) or '').strip()
+                if macro not in _MACROS:
+                    raise KeyError(f"Macro SQL desconocida '{macro}' en consulta '{self.name}'")
+                return _MACROS[macro][dialect](arg)
+            text = self._compiled[dialect] = _MACRO_RE.sub(expand, self.sql)
+        return text
+
+    def __repr__(self):
+        return f"<Query {self.name}>"
+
+
+def register_query(name, sql):
+    """Registra (o reemplaza) una consulta con nombre y la devuelve."""
+    query = _REGISTRY[name] = Query(name, sql)
+    return query
+
+
+def registered_queries():
+    return dict(_REGISTRY)
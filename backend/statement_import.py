@@ -0,0 +1,374 @@
+# backend/statement_import.py
+"""
+Importador de extractos bancarios (CSV / OFX / XLSX) a transactions.
+
+Pensado para archivos grandes (100k filas) sin picos de memoria:
+- El contenido del dcc.Upload (base64) se decodifica por tramos con
+  Base64Reader: nunca se arma el archivo completo en bytes.
+- Se lee en bloques de CHUNK_ROWS filas (pandas chunksize para CSV, openpyxl
+  read_only para XLSX, un escáner de <STMTTRN> para OFX).
+- Fechas y montos se normalizan de forma vectorizada por bloque (se adivina
+  el formato de fecha con una muestra y se parsea todo el bloque con él).
+- Duplicados: cada fila se resume en un hash (día, monto con signo, nombre
+  normalizado) + número de ocurrencia, y se compara contra las filas que ya
+  existen en la cuenta en ese rango de fechas (reimportar el mismo extracto no
+  duplica nada, pero dos cafés iguales el mismo día sí entran los dos).
+- executemany a transactions y un UPSERT agrupado a transaction_rollups por bloque.
+
+El ajuste de saldo (uno solo por cuenta), el caché del libro y el commit los
+hace data_manager.import_bank_statement, todo en la misma transacción.
+"""
+import base64
+import csv
+import io
+import re
+
+import numpy as np
+import pandas as pd
+
+from backend import rollups
+
+CHUNK_ROWS = 5000
+DEFAULT_CATEGORY = 'Importado'
+SAMPLE_BYTES = 64 * 1024
+
+# Encabezados reconocidos (en minúscula, sin espacios extremos)
+COLUMN_ALIASES = {
+    'date': ('date', 'fecha', 'fecha operacion', 'fecha operación', 'fecha valor', 'transaction date',
+             'posted date', 'posting date', 'dtposted'),
+    'amount': ('amount', 'monto', 'importe', 'valor', 'trnamt'),
+    'debit': ('debit', 'débito', 'debito', 'cargo', 'cargos', 'retiro', 'retiros', 'withdrawal'),
+    'credit': ('credit', 'crédito', 'credito', 'abono', 'abonos', 'depósito', 'deposito', 'deposit'),
+    'name': ('description', 'descripción', 'descripcion', 'concepto', 'detalle', 'name', 'memo',
+             'payee', 'referencia'),
+    'category': ('category', 'categoría', 'categoria'),
+}
+
+# Formatos de fecha a probar (exact=False: la hora que venga después se ignora)
+_DATE_FORMATS_DAYFIRST = ('%Y-%m-%d', '%Y/%m/%d', '%Y%m%d', '%d/%m/%Y', '%d-%m-%Y', '%d.%m.%Y',
+                          '%d/%m/%y', '%d-%m-%y', '%m/%d/%Y', '%m/%d/%y')
+_DATE_FORMATS_MONTHFIRST = ('%Y-%m-%d', '%Y/%m/%d', '%Y%m%d', '%m/%d/%Y', '%m-%d-%Y', '%m/%d/%y',
+                            '%d/%m/%Y', '%d-%m-%Y', '%d.%m.%Y', '%d/%m/%y')
+
+
+class Base64Reader(io.RawIOBase):
+    """Archivo de solo lectura sobre un texto base64 (decodifica por tramos; 4 caracteres = 3 bytes)."""
+
+    def __init__(self, text):
+        self._text = text.strip()
+        self._size = len(self._text) // 4 * 3 - self._text[-2:].count('=')
+        self._pos = 0
+
+    def readable(self):
+        return True
+
+    def seekable(self):
+        return True
+
+    def tell(self):
+        return self._pos
+
+    def seek(self, offset, whence=io.SEEK_SET):
+        base = {io.SEEK_SET: 0, io.SEEK_CUR: self._pos, io.SEEK_END: self._size}[whence]
+        self._pos = max(0, min(base + offset, self._size))
+        return self._pos
+
+    def readinto(self, buffer):
+        n = min(len(buffer), self._size - self._pos)
+        if n <= 0:
+            return 0
+        start, end = self._pos // 3 * 4, (self._pos + n + 2) // 3 * 4
+        skip = self._pos % 3
+        data = base64.b64decode(self._text[start:end])[skip:skip + n]
+        buffer[:len(data)] = data
+        self._pos += len(data)
+        return len(data)
+
+
+def open_upload(contents):
+    """'data:<mime>;base64,<datos>' de dcc.Upload -> archivo binario con buffer (seekable)."""
+    _, _, payload = contents.partition(',')
+    return io.BufferedReader(Base64Reader(payload or contents), buffer_size=1 << 20)
+
+
+# --- LECTURA POR BLOQUES ---
+
+def _text_stream(binary):
+    """Texto con el encoding probable (UTF-8 o, si falla, Latin-1 / Windows-1252)."""
+    sample = binary.peek(SAMPLE_BYTES)[:SAMPLE_BYTES]
+    try:
+        sample.decode('utf-8')
+        encoding = 'utf-8-sig'
+    except UnicodeDecodeError as e:
+        # El corte de la muestra puede partir un carácter multibyte al final
+        encoding = 'utf-8-sig' if e.start >= len(sample) - 3 else 'cp1252'
+    return io.TextIOWrapper(binary, encoding=encoding, errors='replace', newline='')
+
+
+def _canonical_columns(columns):
+    """{columna del archivo: nombre canónico} según COLUMN_ALIASES."""
+    mapping = {}
+    for col in columns:
+        key = str(col).strip().lower()
+        for canonical, aliases in COLUMN_ALIASES.items():
+            if key in aliases and canonical not in mapping.values():
+                mapping[col] = canonical
+                break
+    if 'date' not in mapping.values() or not ({'amount', 'debit', 'credit'} & set(mapping.values())):
+        raise ValueError("El archivo necesita columnas de fecha y monto (o cargo/abono).")
+    return mapping
+
+
+def _iter_csv(binary):
+    text = _text_stream(binary)
+    sample = text.read(SAMPLE_BYTES)
+    try:
+        delimiter = csv.Sniffer().sniff(sample, delimiters=',;\t|').delimiter
+    except csv.Error:
+        delimiter = ','
+    text.seek(0)
+    reader = pd.read_csv(text, sep=delimiter, dtype=str, chunksize=CHUNK_ROWS,
+                         skipinitialspace=True, on_bad_lines='skip')
+    mapping = None
+    for chunk in reader:
+        mapping = mapping or _canonical_columns(chunk.columns)
+        yield chunk[list(mapping)].rename(columns=mapping)
+
+
+def _iter_xlsx(binary):
+    from openpyxl import load_workbook
+
+    wb = load_workbook(binary, read_only=True, data_only=True)
+    try:
+        rows = wb.active.iter_rows(values_only=True)
+        header = None
+        for row in rows:
+            if any(v is not None for v in row):
+                header = [str(v).strip() if v is not None else f"col{i}" for i, v in enumerate(row)]
+                break
+        if header is None:
+            return
+        mapping = _canonical_columns(header)
+        keep = [header.index(col) for col in mapping]
+        names = list(mapping.values())
+        batch = []
+        for row in rows:
+            batch.append([row[i] if i < len(row) else None for i in keep])
+            if len(batch) >= CHUNK_ROWS:
+                yield pd.DataFrame(batch, columns=names)
+                batch = []
+        if batch:
+            yield pd.DataFrame(batch, columns=names)
+    finally:
+        wb.close()
+
+
+_OFX_TRN = re.compile(r'<STMTTRN>(.*?)</STMTTRN>', re.S | re.I)
+_OFX_FIELD = re.compile(r'<(\w+)>([^<\r\n]*)')
+
+
+def _iter_ofx(binary):
+    """Bloques de <STMTTRN> (OFX 1.x SGML u OFX 2.x XML), leyendo el archivo por tramos."""
+    text = _text_stream(binary)
+    buffer, batch = '', []
+    while True:
+        block = text.read(SAMPLE_BYTES)
+        buffer += block
+        last_end = 0
+        for match in _OFX_TRN.finditer(buffer):
+            fields = {k.upper(): v.strip() for k, v in _OFX_FIELD.findall(match.group(1))}
+            batch.append((fields.get('DTPOSTED', '')[:8], fields.get('TRNAMT'),
+                          fields.get('NAME') or fields.get('MEMO') or fields.get('PAYEE')))
+            last_end = match.end()
+        buffer = buffer[last_end:]
+        if len(batch) >= CHUNK_ROWS or (not block and batch):
+            yield pd.DataFrame(batch, columns=['date', 'amount', 'name'])
+            batch = []
+        if not block:
+            break
+
+
+def iter_chunks(binary, filename):
+    """DataFrames de hasta CHUNK_ROWS filas con columnas canónicas (date, amount|debit|credit, name, category)."""
+    ext = str(filename or '').lower().rsplit('.', 1)[-1]
+    if ext in ('csv', 'txt'):
+        return _iter_csv(binary)
+    if ext in ('xlsx', 'xlsm'):
+        return _iter_xlsx(binary)
+    if ext in ('ofx', 'qfx'):
+        return _iter_ofx(binary)
+    raise ValueError("Formato no soportado. Usa CSV, OFX o Excel (.xlsx).")
+
+
+# --- NORMALIZACIÓN VECTORIZADA ---
+
+def parse_dates(values, dayfirst=True):
+    """Serie -> datetime64 (NaT si no se puede). El formato se adivina con una muestra del bloque."""
+    if pd.api.types.is_datetime64_any_dtype(values):
+        return values
+    present = values.dropna()
+    if len(present) and not isinstance(present.iloc[0], str):
+        # Excel ya trae datetime
+        return pd.to_datetime(values, errors='coerce')
+    text = values.astype('string').str.strip()
+    sample = text.dropna().head(50)
+    for fmt in (_DATE_FORMATS_DAYFIRST if dayfirst else _DATE_FORMATS_MONTHFIRST):
+        if len(sample) and pd.to_datetime(sample, format=fmt, exact=False, errors='coerce').notna().all():
+            return pd.to_datetime(text, format=fmt, exact=False, errors='coerce')
+    return pd.to_datetime(text, format='mixed', dayfirst=dayfirst, errors='coerce')
+
+
+def parse_amounts(values):
+    """
+    Serie -> float. Acepta '1.234,56', '1,234.56', '1.234', '$ -12', '(12.00)', '12-'.
+    Separador decimal de cada valor:
+    - con ',' y '.' -> el último; repetido ('1.234.567') -> no hay decimales
+    - uno solo seguido de 3 dígitos ('1.234', '1,234') es ambiguo: manda el
+      formato que muestran los demás valores de la columna; sin pistas, miles
+      (salvo '0.125': con parte entera 0 es decimal)
+    - uno solo seguido de otra cantidad de dígitos -> decimal
+    """
+    if pd.api.types.is_numeric_dtype(values):
+        return values.astype(float)
+    text = values.astype('string').str.strip()
+    negative = (text.str.contains(r'^[^\d]*-', regex=True) | text.str.endswith('-')
+                | (text.str.startswith('(') & text.str.endswith(')')))
+    digits = text.str.replace(r'[^\d,.]', '', regex=True)
+
+    n_comma, n_dot = digits.str.count(','), digits.str.count(r'\.')
+    last_comma, last_dot = digits.str.rfind(','), digits.str.rfind('.')
+    comma_last = (last_comma > last_dot).fillna(False)
+    last_sep = last_comma.where(comma_last, last_dot)
+    sep = pd.Series(np.where(comma_last, ',', '.'), index=digits.index)
+    tail = digits.str.len() - last_sep - 1
+    leading_zero = digits.str.match(r'^0?[.,]').fillna(False)
+
+    mixed = (n_comma > 0) & (n_dot > 0)
+    single = (n_comma + n_dot) == 1
+    ambiguous = single & (tail == 3) & ~leading_zero
+    explicit = (mixed | (single & ~ambiguous)).fillna(False)
+
+    # Formato de la columna según los valores que no dejan dudas
+    votes = sep[explicit].value_counts()
+    column_decimal = votes.idxmax() if len(votes) else None
+
+    decimal = pd.Series(pd.NA, index=digits.index, dtype='string')
+    decimal = decimal.mask(explicit, sep)
+    if column_decimal is not None:
+        decimal = decimal.mask(ambiguous.fillna(False) & (sep == column_decimal), sep)
+
+    comma_decimal = (decimal == ',').fillna(False)
+    dot_decimal = (decimal == '.').fillna(False)
+    normalized = digits.str.replace(',', '', regex=False).str.replace('.', '', regex=False)
+    normalized = normalized.mask(dot_decimal, digits.str.replace(',', '', regex=False))
+    normalized = normalized.mask(comma_decimal,
+                                 digits.str.replace('.', '', regex=False).str.replace(',', '.', regex=False))
+    amounts = pd.to_numeric(normalized, errors='coerce').astype(float)
+    return amounts.where(~negative.fillna(False), -amounts)
+
+
+def normalize_chunk(chunk, default_category=DEFAULT_CATEGORY, dayfirst=True):
+    """Bloque crudo -> DataFrame [day, amount (con signo), name, category] sin filas inválidas."""
+    dates = parse_dates(chunk['date'], dayfirst)
+    if 'amount' in chunk:
+        amounts = parse_amounts(chunk['amount'])
+    else:
+        credit = parse_amounts(chunk['credit']).abs() if 'credit' in chunk else 0.0
+        debit = parse_amounts(chunk['debit']).abs() if 'debit' in chunk else 0.0
+        amounts = pd.Series(np.nan_to_num(credit) - np.nan_to_num(debit), index=chunk.index)
+        both_empty = chunk.reindex(columns=['credit', 'debit']).isna().all(axis=1)
+        amounts = amounts.mask(both_empty)
+
+    names = chunk['name'] if 'name' in chunk else pd.Series('', index=chunk.index)
+    names = names.astype('string').fillna('').str.replace(r'\s+', ' ', regex=True).str.strip().str.slice(0, 200)
+    names = names.mask(names == '', 'Movimiento importado')
+    categories = None
+    if 'category' in chunk:
+        categories = chunk['category'].astype('string').str.strip()
+        categories = categories.mask(categories == '')
+
+    out = pd.DataFrame({
+        'day': dates.dt.strftime('%Y-%m-%d'),
+        'amount': amounts.round(2),
+        'name': names,
+        'category': categories.fillna(default_category) if categories is not None else default_category,
+    })
+    return out[out['day'].notna() & out['amount'].notna() & (out['amount'] != 0)]
+
+
+# --- DEDUPLICACIÓN ---
+
+def _hash_keys(days, amounts, names):
+    """Hash vectorizado (uint64) de (día, centavos con signo, nombre normalizado)."""
+    keys = pd.DataFrame({
+        'day': pd.Series(days).astype(str).str.slice(0, 10).values,
+        'cents': np.round(np.asarray(amounts, dtype=float) * 100).astype(np.int64),
+        'name': pd.Series(names).astype(str).str.lower().str.replace(r'\s+', ' ', regex=True).str.strip().values,
+    })
+    return pd.util.hash_pandas_object(keys, index=False).values
+
+
+def _existing_keys(cursor, user_id, account_id, first_day, last_day):
+    """(hash, ocurrencia) de lo que ya hay en la cuenta entre esos días."""
+    account_sql = "account_id IS NULL" if account_id is None else "account_id = ?"
+    params = [user_id] + ([] if account_id is None else [account_id]) + [first_day, last_day + '~']
+    cursor.execute(f"""
+        SELECT date, amount, type, subcategory, name FROM transactions
+        WHERE user_id = ? AND {account_sql} AND date >= ? AND date < ?
+    """, params)
+    rows = cursor.fetchall()
+    if not rows:
+        return pd.MultiIndex.from_arrays([[], []])
+    df = pd.DataFrame(rows, columns=['date', 'amount', 'type', 'subcategory', 'name'])
+    outflow = (df['type'] == 'Expense') | ((df['type'] == 'Transfer') &
+                                          df['subcategory'].fillna('').str.startswith('Salida'))
+    signed = df['amount'].astype(float).where(~outflow, -df['amount'].astype(float))
+    keys = pd.Series(_hash_keys(df['date'], signed, df['name'].fillna('')))
+    return pd.MultiIndex.from_arrays([keys.values, keys.groupby(keys).cumcount().values])
+
+
+def import_rows(cursor, user_id, account_id, chunks, default_category=DEFAULT_CATEGORY, dayfirst=True):
+    """
+    Inserta los bloques en transactions (+ rollups) sin duplicar lo que ya existe.
+    NO ajusta saldos ni hace commit. Retorna {'inserted', 'duplicates', 'invalid', 'net', 'first_day'}.
+    """
+    stats = {'inserted': 0, 'duplicates': 0, 'invalid': 0, 'net': 0.0, 'first_day': None}
+    seen = pd.Series(dtype=np.int64)  # hash -> ocurrencias ya vistas en bloques anteriores del archivo
+
+    for raw in chunks:
+        df = normalize_chunk(raw, default_category, dayfirst)
+        stats['invalid'] += len(raw) - len(df)
+        if df.empty:
+            continue
+
+        keys = pd.Series(_hash_keys(df['day'], df['amount'], df['name']), index=df.index)
+        prior = seen.reindex(keys.values).fillna(0).astype(np.int64).values
+        occurrence = keys.groupby(keys).cumcount() + prior
+        seen = seen.add(keys.value_counts(), fill_value=0).astype(np.int64)
+
+        existing = _existing_keys(cursor, user_id, account_id, df['day'].min(), df['day'].max())
+        is_dup = pd.MultiIndex.from_arrays([keys.values, occurrence.values]).isin(existing)
+        new = df[~is_dup]
+        stats['duplicates'] += int(is_dup.sum())
+        if new.empty:
+            continue
+
+        types = np.where(new['amount'] < 0, 'Expense', 'Income')
+        abs_amounts = new['amount'].abs()
+        cursor.executemany("""
+            INSERT INTO transactions (user_id, date, name, amount, category, type, account_id, subcategory)
+            VALUES (?, ?, ?, ?, ?, ?, ?, NULL)
+        """, list(zip([user_id] * len(new), (new['day'] + ' 00:00').tolist(), new['name'].tolist(),
+                      abs_amounts.tolist(), new['category'].tolist(), types.tolist(), [account_id] * len(new))))
+
+        groups = (pd.DataFrame({'month': new['day'].str.slice(0, 7), 'type': types,
+                                'category': new['category'], 'amount': abs_amounts})
+                  .groupby(['month', 'type', 'category'])['amount'].agg(amount_sum='sum', n='count').reset_index())
+        rollups.apply_groups(cursor, user_id, [
+            (g.month, g.type, g.category, '', float(g.amount_sum), int(g.n)) for g in groups.itertuples()])
+
+        stats['inserted'] += len(new)
+        stats['net'] += float(new['amount'].sum())
+        first = new['day'].min()
+        stats['first_day'] = first if stats['first_day'] is None else min(stats['first_day'], first)
+    return stats
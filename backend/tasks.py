@@ -0,0 +1,52 @@
+# backend/tasks.py
+"""
+Tareas en segundo plano (fuera del ciclo request/response).
+
+Se usa para trabajo que no debe bloquear un callback de Dash (ej. algo
+pesado que se dispara después de una escritura).
+"""
+import threading
+from concurrent.futures import ThreadPoolExecutor
+
+from flask import current_app
+
+_executor = ThreadPoolExecutor(max_workers=2, thread_name_prefix="pivot-bg")
+_pending = set()
+_lock = threading.Lock()
+
+
+def _get_app():
+    try:
+        return current_app._get_current_object()
+    except RuntimeError:
+        return None
+
+
+def submit_once(key, fn, *args, **kwargs):
+    """
+    Encola fn(*args, **kwargs) en segundo plano dentro del contexto de la app.
+    Si ya hay una tarea con la misma key esperando turno, no se duplica
+    (varias escrituras seguidas generan un solo recálculo).
+    Retorna True si la tarea se encoló.
+    """
+    app = _get_app()
+    with _lock:
+        if key in _pending:
+            return False
+        _pending.add(key)
+
+    def run():
+        # La sacamos al empezar: una escritura durante la ejecución vuelve a encolar
+        with _lock:
+            _pending.discard(key)
+        try:
+            if app is not None:
+                with app.app_context():
+                    fn(*args, **kwargs)
+            else:
+                fn(*args, **kwargs)
+        except Exception as e:
+            print(f"⚠️ Error en tarea de fondo '{key}': {e}")
+
+    _executor.submit(run)
+    return True
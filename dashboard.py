@@ -289,7 +289,7 @@ def load_date_preference(saved_option):
 def manual_dashboard_refresh(n_clicks, signal):
     if not n_clicks: return no_update, no_update, no_update, no_update, no_update
     
-    success, msg = dm.manual_price_refresh()
+    success, msg, _ = dm.manual_price_refresh()
     new_signal = (signal or 0) + 1
     
     if success:
@@ -11,7 +11,7 @@ import io
 from app import app, server
 
 # Importar páginas
-from pages import dashboard, transactions, debts, login, admin, reports
+from pages import dashboard, transactions, debts, login, admin, reports, payments
 from pages.accounts import accounts 
 from pages.investments import investments 
 from pages.distribution import distribution
@@ -266,6 +266,7 @@ def update_sidebar_links(pathname):
         dbc.NavLink([html.I(className="bi bi-receipt me-2"), "Transacciones"], href="/transacciones", active="exact"),
         dbc.NavLink([html.I(className="bi bi-wallet2 me-2"), "Cuentas"], href="/cuentas", active="exact"),
         dbc.NavLink([html.I(className="bi bi-arrow-left-right me-2"), "Deudas"], href="/deudas", active="exact"), 
+        dbc.NavLink([html.I(className="bi bi-calendar-event me-2"), "Próximos Pagos"], href="/pagos", active="exact"),
         dbc.NavLink([html.I(className="bi bi-graph-up me-2"), "Inversiones"], href="/inversiones", active="exact"),
         dbc.NavLink([html.I(className="bi bi-pie-chart me-2"), "Distribución"], href="/distribucion", active="exact"),
         dbc.NavLink([html.I(className="bi bi-file-earmark-text me-2"), "Reportes"], href="/reportes", active="exact"),
@@ -299,6 +300,7 @@ def display_page(pathname):
         elif pathname == "/transacciones": return transactions.layout
         elif pathname == "/cuentas": return accounts.layout
         elif pathname == "/deudas": return debts.layout
+        elif pathname == "/pagos": return payments.layout
         elif pathname == "/inversiones": return investments.layout
         elif pathname == "/distribucion": return distribution.layout
         elif pathname == "/reportes": return reports.layout
@@ -3,8 +3,8 @@ import dash
 from dash import dcc, html, callback, Input, Output, State, no_update, ctx, ALL
 import dash_bootstrap_components as dbc
 import backend.data_manager as dm
+from backend import amortization, payment_calendar
 from datetime import date
-import calendar
 import time
 from utils import ui_helpers
 import plotly.graph_objects as go
@@ -13,67 +13,27 @@ import pandas as pd
 
 # --- HELPERS ---
 
-def get_next_payment_date(day_of_month):
-    today = date.today()
-    try: candidate = date(today.year, today.month, day_of_month)
-    except ValueError: candidate = date(today.year, today.month, calendar.monthrange(today.year, today.month)[1])
-    if candidate < today:
-        next_m, next_y = (today.month + 1, today.year) if today.month < 12 else (1, today.year + 1)
-        try: candidate = date(next_y, next_m, day_of_month)
-        except ValueError: candidate = date(next_y, next_m, calendar.monthrange(next_y, next_m)[1])
-    return candidate
-
 def calculate_total_installments_balance(account_id):
     df = dm.get_installments(account_id)
     if df.empty: return 0.0
-    total_pending_value = 0.0
-    for _, row in df.iterrows():
-        tq = row['total_quotas']
-        if tq > 0:
-            annual_rate = row['interest_rate']
-            amount = row['total_amount']
-            if annual_rate > 0:
-                i = annual_rate / 12 / 100
-                n = tq
-                denominator = ((1 + i) ** n) - 1
-                if denominator != 0:
-                    numerator = i * ((1 + i) ** n)
-                    q_val = amount * (numerator / denominator)
-                else: q_val = amount / tq
-            else: q_val = amount / tq
-            rem_q = tq - row['paid_quotas']
-            total_pending_value += q_val * rem_q
-    return total_pending_value
+    return float(amortization.summarize(df)['remaining_balance'].sum())
 
 def generate_installments_list(account_id):
     df = dm.get_installments(account_id)
     if df.empty:
         return html.Div([html.P("No hay financiamientos activos.", className="text-muted small fst-italic mb-2")], className="text-center py-3")
     
+    # Cuota, saldo y desglose capital/interés de todos los financiamientos de una pasada
+    df = amortization.summarize(df)
     items = []
-    for _, row in df.iterrows():
+    for row in df.to_dict('records'):
         pq = row['paid_quotas']
         tq = row['total_quotas']
         pay_day = row.get('payment_day', 15)
         annual_rate = row['interest_rate'] 
-        amount = row['total_amount']
-
-        if tq > 0:
-            if annual_rate > 0:
-                i = annual_rate / 12 / 100
-                n = tq
-                denominator = ((1 + i) ** n) - 1
-                if denominator != 0:
-                    numerator = i * ((1 + i) ** n)
-                    q_val = amount * (numerator / denominator)
-                else: q_val = amount / tq
-            else: q_val = amount / tq
-            total_debt_calculated = q_val * tq
-        else:
-            q_val = 0
-            total_debt_calculated = amount
-
-        rem_bal = q_val * (tq - pq)
+        q_val = row['quota_value']
+        rem_bal = row['remaining_balance']
+        total_debt_calculated = row['total_financed']
         
         item = dbc.ListGroupItem([
             dbc.Row([
@@ -85,6 +45,7 @@ def generate_installments_list(account_id):
                 dbc.Col([
                     html.Div(f"Deuda Restante: ${rem_bal:,.2f}", className="text-end small fw-bold text-danger"),
                     html.Div(f"Cuota Fija: ${q_val:,.2f}", className="text-end small text-muted"),
+                    html.Small(f"Capital: ${row['principal_remaining']:,.2f} • Interés: ${row['interest_remaining']:,.2f}", className="text-end d-block text-muted", style={"fontSize": "0.7rem"}),
                     html.Small(f"(Total Financ.: ${total_debt_calculated:,.2f})", className="text-end d-block text-muted", style={"fontSize": "0.7rem"})
                 ], width=4),
                 dbc.Col([
@@ -105,7 +66,7 @@ def generate_header_content(row, calculated_installments_total=None):
     if payable < 0: payable = 0
 
     pay_day = int(row['payment_day']) if row['payment_day'] else 1
-    next_pay = get_next_payment_date(pay_day)
+    next_pay = payment_calendar.next_due(pay_day)
     d_left = (next_pay - date.today()).days
     d_str = f"{next_pay.strftime('%d-%m-%Y')} (en {d_left} días)"
     
@@ -470,7 +431,7 @@ def cred_load_cards(v_id, url, signal, search_term):
         payable = debt - inst_pend
         if payable < 0: payable = 0
         pay_day = int(row['payment_day']) if row['payment_day'] else 1
-        d_left = (get_next_payment_date(pay_day) - date.today()).days
+        d_left = (payment_calendar.next_due(pay_day) - date.today()).days
         
         # --- NUEVO: CÁLCULO PARA PROGRESS BAR ---
         if limit > 0:
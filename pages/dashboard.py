@@ -5,8 +5,9 @@ import plotly.graph_objects as go
 import plotly.express as px
 import dash_bootstrap_components as dbc
 import backend.data_manager as dm
+from backend.cache_deps import user_cached
+from backend.figure_cache import cached_figure
 import utils.ui_helpers as ui_helpers
-import pandas as pd
 from datetime import date
 from dateutil.relativedelta import relativedelta
 
@@ -28,6 +29,8 @@ layout = dbc.Container(
         # Stores
         dcc.Store(id='date-range-store', storage_type='local'),
         dcc.Store(id="dashboard-update-signal", data=0), 
+        dcc.Store(id="dashboard-refresh-request", data=None),
+        dcc.Interval(id="dashboard-refresh-interval", interval=1000, disabled=True),
         ui_helpers.get_feedback_toast("dashboard-toast"),
 
         # 1. ENCABEZADO (Siempre visible)
@@ -254,7 +257,8 @@ def load_date_preference(saved_option):
     elif saved_option == 'YTD': start_date = date(today.year, 1, 1)
     elif saved_option == 'ALL':
         try:
-            df_hist = dm.get_historical_networth_trend(start_date="1900-01-01")
+            # Solo interesa la primera fecha: LTTB siempre conserva el primer punto
+            df_hist = dm.get_historical_networth_trend(start_date="1900-01-01", max_points=3, use_ledger=False)
             if not df_hist.empty: start_date = df_hist['date'].min()
             else: start_date = date(today.year, 1, 1)
         except: start_date = date(today.year, 1, 1)
@@ -263,184 +267,299 @@ def load_date_preference(saved_option):
 @callback(
     [Output("dashboard-update-signal", "data"), Output("dashboard-toast", "is_open"),
      Output("dashboard-toast", "children"), Output("dashboard-toast", "icon"),
-     Output("dummy-dash-spinner-target", "children")], 
+     Output("dummy-dash-spinner-target", "children"),
+     Output("dashboard-refresh-request", "data"), Output("dashboard-refresh-interval", "disabled")], 
     Input("btn-refresh-dashboard", "n_clicks"), State("dashboard-update-signal", "data"),
     prevent_initial_call=True
 )
 def manual_dashboard_refresh(n_clicks, signal):
     # print(f"BOTÓN PRESIONADO. Clicks: {n_clicks}")
-    if not n_clicks: return no_update, no_update, no_update, no_update, no_update
-    success, msg = dm.manual_price_refresh()
+    if not n_clicks: return no_update, no_update, no_update, no_update, no_update, no_update, no_update
+    success, msg, pending = dm.manual_price_refresh()
+    # Con planificador solo se dejó el pedido: el intervalo consulta el resultado sin bloquear el worker
+    if pending: return no_update, *ui_helpers.mensaje_alerta_exito("info", msg), "", pending, False
     new_signal = (signal or 0) + 1
-    if success: return new_signal, *ui_helpers.mensaje_alerta_exito("success", msg), ""
-    else: return new_signal, *ui_helpers.mensaje_alerta_exito("danger", msg), ""
+    if success: return new_signal, *ui_helpers.mensaje_alerta_exito("success", msg), "", None, True
+    else: return new_signal, *ui_helpers.mensaje_alerta_exito("danger", msg), "", None, True
+
+@callback(
+    [Output("dashboard-update-signal", "data", allow_duplicate=True),
+     Output("dashboard-toast", "is_open", allow_duplicate=True),
+     Output("dashboard-toast", "children", allow_duplicate=True),
+     Output("dashboard-toast", "icon", allow_duplicate=True),
+     Output("dashboard-refresh-request", "data", allow_duplicate=True),
+     Output("dashboard-refresh-interval", "disabled", allow_duplicate=True)],
+    Input("dashboard-refresh-interval", "n_intervals"),
+    [State("dashboard-refresh-request", "data"), State("dashboard-update-signal", "data")],
+    prevent_initial_call=True
+)
+def poll_dashboard_refresh(n, requested_at, signal):
+    if not requested_at: return no_update, no_update, no_update, no_update, None, True
+    result = dm.price_refresh_result(requested_at)
+    if result is None: return no_update, no_update, no_update, no_update, no_update, no_update
+    success, msg = result
+    new_signal = (signal or 0) + 1
+    return new_signal, *ui_helpers.mensaje_alerta_exito("success" if success else "danger", msg), None, True
 
 # ------------------------------------------------------------------------------
-# 4. CALLBACK DE ELEMENTOS ESTÁTICOS
+# 4. PANELES INDEPENDIENTES
 # ------------------------------------------------------------------------------
-# --- EN pages/dashboard.py ---
-
-# --- EN pages/dashboard.py ---
-
+# Cada panel tiene su propio callback y su propia función memoizada por usuario
+# (con las tablas que lee). Así cada tarjeta se pinta apenas tiene sus datos,
+# una parte lenta (precios de Finnhub) no bloquea las demás, y una escritura
+# solo recalcula los paneles cuyas tablas cambió.
+
+PANEL_INPUTS = [Input("url", "pathname"), Input("dashboard-update-signal", "data")]
+
+# Tablas que alimentan cada gráfico: una escritura en ellas invalida la figura cacheada
+ROLLUP_TABLES = ('transactions', 'categories')
+HISTORY_TABLES = ('historical_net_worth', 'transactions', 'investment_transactions', 'accounts', 'abono_reserve',
+                  'iou', 'investments', 'market_cache')
+# Puntos máximos del gráfico de historial (rangos largos se reducen con LTTB)
+HISTORY_MAX_POINTS = 400
+
+
+@user_cached('accounts', 'abono_reserve', 'iou', 'investments', 'market_cache', timeout=60)
+def networth_panel(user_id):
+    """Totales de patrimonio (activos, pasivos, IOU)."""
+    nw = dm.get_net_worth_breakdown(user_id, force_refresh=False)
+    return {
+        'net_worth': nw['net_worth'],
+        'assets': nw['assets']['total'],
+        'liquid': nw['assets']['liquid'],
+        'receivables': nw['assets']['receivables'],
+        'liabilities': nw['liabilities']['total'],
+        'payables': nw['liabilities']['payables'],
+    }
+
+
+@user_cached('accounts', 'abono_reserve', 'iou', 'investments', 'market_cache', timeout=60)
+def investments_panel(user_id):
+    """Valor del portafolio y ganancia del día (depende de los precios de mercado)."""
+    inv_total = dm.get_net_worth_breakdown(user_id, force_refresh=False)['assets']['investments']
+    stocks = dm.get_stocks_data(user_id, force_refresh=False)
+    day_gain_usd = sum((s['market_value'] - (s['market_value'] / (1 + s['day_change_pct']/100))) for s in stocks if s.get('day_change_pct'))
+    day_gain_pct = (day_gain_usd / (inv_total - day_gain_usd) * 100) if (inv_total - day_gain_usd) != 0 else 0
+    return {'total': inv_total, 'day_gain_usd': day_gain_usd, 'day_gain_pct': day_gain_pct}
+
+
+@user_cached('accounts', 'installments', timeout=120)
+def credit_panel(user_id):
+    """Límite y deuda total de tarjetas."""
+    cred = dm.get_credit_summary_data(user_id)
+    return {'total_limit': cred['total_limit'], 'total_debt': cred['total_debt']}
+
+
+@user_cached('transactions', 'categories', timeout=120)
+def month_panel(user_id, month):
+    """Ingresos y gastos del mes 'YYYY-MM' (sin categorías excluidas)."""
+    income, expense = dm.get_dashboard_metrics(user_id, month)
+    return {'income': income, 'expense': expense}
+
+
+def get_empty_fig(title):
+    return go.Figure().update_layout(template="plotly_dark", plot_bgcolor="rgba(0,0,0,0)", paper_bgcolor="rgba(0,0,0,0)", title={'text': title, 'x':0.5, 'xanchor':'center'}, xaxis={'visible': False}, yaxis={'visible': False})
+
+
+def make_pie(df_source, type_filter, group_col, color_seq, title_empty):
+    if df_source.empty: return get_empty_fig(title_empty)
+    df_f = df_source[df_source['type'] == type_filter]
+    # Sin subcategoría se guarda como '' (antes NULL, que groupby descartaba)
+    df_f = df_f[df_f[group_col] != '']
+    # Agrupa filas ya sumadas por mes/categoría: O(categorías), no O(transacciones)
+    df_g = df_f.groupby(group_col)['amount'].sum().reset_index()
+    df_g = df_g[df_g['amount'] > 0].sort_values(by='amount', ascending=False)
+    if df_g.empty: return get_empty_fig(title_empty)
+    fig = px.pie(df_g, names=group_col, values='amount', hole=0.5, color_discrete_sequence=color_seq)
+    fig.update_layout(
+        template="plotly_dark", 
+        plot_bgcolor="rgba(0,0,0,0)", 
+        paper_bgcolor="rgba(0,0,0,0)", 
+        margin=dict(t=20, b=20, l=20, r=20), 
+        legend=dict(orientation="h", y=-0.1, font=dict(color="white")), 
+        font=dict(color="white"),
+        hoverlabel=HOVER_STYLE 
+    )
+    fig.update_traces(textposition='inside', textinfo='percent+label', textfont_size=11)
+    return fig
+
+
+# 4A. PATRIMONIO (también destapa el contenido principal)
 @callback(
-    # --- 1. OUTPUTS DE VISIBILIDAD (2) ---
-    [Output("dashboard-loading-spinner", "style"), 
+    [Output("dashboard-loading-spinner", "style"),
      Output("dashboard-main-content", "style"),
-     # --- 2. OUTPUTS DE DATOS (21) ---
      Output("nw-total", "children"), Output("nw-total", "className"),
      Output("nw-assets-total", "children"), Output("nw-assets-liquid", "children"),
-     Output("nw-assets-investments-container", "children"), Output("nw-assets-receivable", "children"),
-     Output("nw-liabilities-total", "children"), Output("nw-liabilities-credit-container", "children"),
-     Output("nw-liabilities-payable", "children"), Output("kpi-month-income", "children"),
-     Output("kpi-month-label-inc", "children"), Output("kpi-month-expense", "children"),
-     Output("kpi-month-label-exp", "children"), Output("kpi-savings-rate", "children"),       
-     Output("kpi-savings-bar-container", "children"), Output("graph-cashflow", "figure"),
-     Output("pie-inc-cat", "figure"),
-     Output("pie-inc-sub", "figure"), Output("pie-exp-cat", "figure"),
-     Output("pie-exp-sub", "figure"), Output("last-updated-dash-label", "children")],
-    [Input("url", "pathname"), Input("dashboard-update-signal", "data")] 
+     Output("nw-assets-receivable", "children"),
+     Output("nw-liabilities-total", "children"), Output("nw-liabilities-payable", "children")],
+    PANEL_INPUTS
 )
-def update_static_dashboard_elements(pathname, update_signal):
-    # Si no estamos en home, devolvemos 23 no_updates
-    if pathname != "/": return [no_update] * 23
-    
+def update_networth_panel(pathname, update_signal):
+    if pathname != "/": return [no_update] * 9
     uid = dm.get_uid()
-    if not uid: return [no_update] * 23
-    
-    # --- BLOQUE SEGURO START ---
+    if not uid: return [no_update] * 9
+
+    visible = ({'display': 'none'}, {'display': 'block', 'animation': 'fadein 1s'})
     try:
-        # 1. CÁLCULOS
-        df_trans = dm.get_transactions_df(uid) # Pasar UID corregido
-        nw_data = dm.get_net_worth_breakdown(uid, force_refresh=False)
-        
-        last_ts = dm.get_data_timestamp()
-        update_label = f"Precios: {last_ts}"
-        
-        net_worth = nw_data['net_worth']
-        nw_str = f"${net_worth:,.2f}"
-        if net_worth == 0: nw_class = "card-value display-4 fw-bold text-muted"
-        elif net_worth > 0: nw_class = "card-value display-4 fw-bold text-success"
-        else: nw_class = "card-value display-4 fw-bold text-danger"
-
-        assets_str = f"${nw_data['assets']['total']:,.2f}"
-        liquid_str = f"${nw_data['assets']['liquid']:,.2f}"
-        recv_str = f"${nw_data['assets']['receivables']:,.2f}"
-        liab_str = f"${nw_data['liabilities']['total']:,.2f}"
-        pay_str = f"${nw_data['liabilities']['payables']:,.2f}"
-
-        stocks = dm.get_stocks_data(uid, force_refresh=False)
-        
-        inv_total = nw_data['assets']['investments']
-        day_gain_usd = sum((s['market_value'] - (s['market_value'] / (1 + s['day_change_pct']/100))) for s in stocks if s.get('day_change_pct'))
-        day_gain_pct = (day_gain_usd / (inv_total - day_gain_usd) * 100) if (inv_total - day_gain_usd) != 0 else 0
-        inv_color = "text-success" if day_gain_usd >= 0 else "text-danger"
-        inv_sign = "+" if day_gain_usd >= 0 else ""
-        investments_display = dbc.Row([
-            dbc.Col("Inversiones:", className="text-muted"),
-            dbc.Col([html.Div(f"${inv_total:,.2f}", className="fw-bold text-info"), html.Small(f"{inv_sign}${abs(day_gain_usd):,.2f} ({inv_sign}{day_gain_pct:.2f}%) hoy", className=f"d-block small {inv_color} fw-bold")], className="text-end")
-        ], className="mb-1 align-items-center")
-
-        cred_data = dm.get_credit_summary_data()
-        total_limit = cred_data['total_limit']
-        total_debt = cred_data['total_debt']
-        utilization = (total_debt / total_limit * 100) if total_limit > 0 else 0
-        credit_display = html.Div([
-            dbc.Row([dbc.Col("Límite Total TC:", className="text-muted"), dbc.Col(f"${total_limit:,.2f}", className="text-end fw-bold")], className="mb-1"),
-            dbc.Progress([dbc.Progress(value=utilization, color="danger", bar=True), dbc.Progress(value=100-utilization, color="success" if total_debt > 0 else "secondary", bar=True)], style={"height": "10px", "backgroundColor": "#222"}, className="mb-1"),
-            dbc.Row([dbc.Col(f"Deuda: ${total_debt:,.2f}", className="text-muted small"), dbc.Col(f"Uso: {utilization:.1f}%", className="text-end small fw-bold text-muted")])
-        ])
-
-        EXCLUDED_CATS = dm.get_excluded_categories_list()
-        month_income, month_expense = 0.0, 0.0
-        if not df_trans.empty:
-            df_trans['date_dt'] = pd.to_datetime(df_trans['date'], format='mixed')
-            today_d = date.today()
-            df_curr = df_trans[(df_trans['date_dt'].dt.month == today_d.month) & (df_trans['date_dt'].dt.year == today_d.year)]
-            month_income = df_curr[(df_curr['type'] == 'Income') & (~df_curr['category'].isin(EXCLUDED_CATS))]['amount'].sum()
-            month_expense = df_curr[(df_curr['type'] == 'Expense') & (~df_curr['category'].isin(EXCLUDED_CATS))]['amount'].sum()
-
-        savings = month_income - month_expense
-        savings_rate = (savings / month_income * 100) if month_income > 0 else 0
-        current_month_name = date.today().strftime("%B %Y").capitalize()
-        label_month = f"Total en {current_month_name}"
-        income_str = f"${month_income:,.2f}"
-        expense_str = f"${month_expense:,.2f}"
-        savings_str = f"{savings_rate:.1f}%"
-        sav_color = "success" if savings_rate >= 20 else ("warning" if savings_rate > 0 else "danger")
-        savings_bar = html.Div([
-            dbc.Progress(value=max(0, savings_rate), color=sav_color, striped=True, className="mb-2", style={"height": "15px"}),
-            html.Div([html.Small(f"Ahorro Neto: ${savings:,.2f}", className=f"text-{sav_color} fw-bold")], className="d-flex justify-content-between")
-        ])
-
-        def get_empty_fig(title):
-            return go.Figure().update_layout(template="plotly_dark", plot_bgcolor="rgba(0,0,0,0)", paper_bgcolor="rgba(0,0,0,0)", title={'text': title, 'x':0.5, 'xanchor':'center'}, xaxis={'visible': False}, yaxis={'visible': False})
-
-        def make_pie(df_source, type_filter, group_col, color_seq, title_empty):
-            if df_source.empty: return get_empty_fig(title_empty)
-            df_f = df_source[(df_source['type'] == type_filter) & (~df_source['category'].isin(EXCLUDED_CATS)) & (df_source['amount'] > 0)]
-            if df_f.empty: return get_empty_fig(title_empty)
-            df_g = df_f.groupby(group_col)['amount'].sum().reset_index().sort_values(by='amount', ascending=False)
-            fig = px.pie(df_g, names=group_col, values='amount', hole=0.5, color_discrete_sequence=color_seq)
-            fig.update_layout(
-                template="plotly_dark", 
-                plot_bgcolor="rgba(0,0,0,0)", 
-                paper_bgcolor="rgba(0,0,0,0)", 
-                margin=dict(t=20, b=20, l=20, r=20), 
-                legend=dict(orientation="h", y=-0.1, font=dict(color="white")), 
-                font=dict(color="white"),
-                hoverlabel=HOVER_STYLE 
-            )
-            fig.update_traces(textposition='inside', textinfo='percent+label', textfont_size=11)
-            return fig
-
-        fig_inc_cat = make_pie(df_trans, 'Income', 'category', px.colors.qualitative.Pastel, "Sin Ingresos")
-        fig_inc_sub = make_pie(df_trans, 'Income', 'subcategory', px.colors.qualitative.Pastel, "Sin Subcategorías")
-        fig_exp_cat = make_pie(df_trans, 'Expense', 'category', px.colors.qualitative.Set3, "Sin Gastos")
-        fig_exp_sub = make_pie(df_trans, 'Expense', 'subcategory', px.colors.qualitative.Set3, "Sin Subcategorías")
-
-        df_summary = dm.get_monthly_summary(uid)
-        if df_summary.empty: fig_cash = get_empty_fig("Sin datos")
-        else:
-            fig_cash = px.bar(df_summary, x="Month", y="amount", color="type", barmode="group", color_discrete_map={"Income": "#00C851", "Expense": "#ff4444"})
-            fig_cash.update_layout(
-                template="plotly_dark", 
-                plot_bgcolor="rgba(0,0,0,0)", 
-                paper_bgcolor="rgba(0,0,0,0)", 
-                legend_orientation="h", legend_y=1.02, 
-                font=dict(color="white"),
-                hoverlabel=HOVER_STYLE
-            )
+        nw = networth_panel(uid)
+    except Exception as e:
+        print(f"🔥 ERROR EN PANEL DE PATRIMONIO: {e}")
+        return (*visible, "Error", "", "$0.00", "$0.00", "$0.00", "$0.00", "$0.00")
 
-        # --- RETORNO FINAL EXITOSO (23 ELEMENTOS) ---
-        return (
-            {'display': 'none'},   # 1. Spinner oculto
-            {'display': 'block', 'animation': 'fadein 1s'},  # 2. Contenido visible
-            nw_str, nw_class, assets_str, liquid_str, investments_display, recv_str, 
-            liab_str, credit_display, pay_str, 
-            income_str, label_month, expense_str, label_month, 
-            savings_str, savings_bar, 
-            fig_cash,
-            fig_inc_cat, fig_inc_sub, fig_exp_cat, fig_exp_sub,
-            update_label
-        )
+    net_worth = nw['net_worth']
+    if net_worth == 0: nw_class = "card-value display-4 fw-bold text-muted"
+    elif net_worth > 0: nw_class = "card-value display-4 fw-bold text-success"
+    else: nw_class = "card-value display-4 fw-bold text-danger"
 
+    return (
+        *visible,
+        f"${net_worth:,.2f}", nw_class,
+        f"${nw['assets']:,.2f}", f"${nw['liquid']:,.2f}", f"${nw['receivables']:,.2f}",
+        f"${nw['liabilities']:,.2f}", f"${nw['payables']:,.2f}",
+    )
+
+
+# 4B. INVERSIONES (la parte que depende de precios de mercado)
+@callback(
+    [Output("nw-assets-investments-container", "children"),
+     Output("last-updated-dash-label", "children")],
+    PANEL_INPUTS
+)
+def update_investments_panel(pathname, update_signal):
+    if pathname != "/": return no_update, no_update
+    uid = dm.get_uid()
+    if not uid: return no_update, no_update
+
+    try:
+        inv = investments_panel(uid)
+        update_label = f"Precios: {dm.get_data_timestamp()}"
     except Exception as e:
-        print(f"🔥 ERROR FATAL EN DASHBOARD: {e}")
-        # --- RETORNO DE EMERGENCIA (23 ELEMENTOS) ---
-        # Si falla, ocultamos el spinner para que no se trabe y mostramos contenido vacío o de error
-        # Devolvemos valores "seguros" para evitar romper el UI
-        empty_fig = go.Figure().update_layout(template="plotly_dark", title="Error de Carga")
-        
-        return (
-            {'display': 'none'}, # 1. Ocultar Spinner
-            {'display': 'block'},# 2. Mostrar Contenido (con errores)
-            "Error", "", "$0.00", "$0.00", "Error", "$0.00", 
-            "$0.00", "Error", "$0.00", 
-            "$0.00", "", "$0.00", "", "0%", "", 
-            empty_fig, empty_fig, empty_fig, empty_fig, empty_fig, 
-            "Error de datos"
-        )
-    # --- FIN BLOQUE SEGURO ---
+        print(f"🔥 ERROR EN PANEL DE INVERSIONES: {e}")
+        return "Error", "Error de datos"
+
+    day_gain_usd, day_gain_pct = inv['day_gain_usd'], inv['day_gain_pct']
+    inv_color = "text-success" if day_gain_usd >= 0 else "text-danger"
+    inv_sign = "+" if day_gain_usd >= 0 else ""
+    investments_display = dbc.Row([
+        dbc.Col("Inversiones:", className="text-muted"),
+        dbc.Col([html.Div(f"${inv['total']:,.2f}", className="fw-bold text-info"), html.Small(f"{inv_sign}${abs(day_gain_usd):,.2f} ({inv_sign}{day_gain_pct:.2f}%) hoy", className=f"d-block small {inv_color} fw-bold")], className="text-end")
+    ], className="mb-1 align-items-center")
+    return investments_display, update_label
+
+
+# 4C. CRÉDITO
+@callback(Output("nw-liabilities-credit-container", "children"), PANEL_INPUTS)
+def update_credit_panel(pathname, update_signal):
+    if pathname != "/": return no_update
+    uid = dm.get_uid()
+    if not uid: return no_update
+
+    try:
+        cred = credit_panel(uid)
+    except Exception as e:
+        print(f"🔥 ERROR EN PANEL DE CRÉDITO: {e}")
+        return "Error"
+
+    total_limit, total_debt = cred['total_limit'], cred['total_debt']
+    utilization = (total_debt / total_limit * 100) if total_limit > 0 else 0
+    return html.Div([
+        dbc.Row([dbc.Col("Límite Total TC:", className="text-muted"), dbc.Col(f"${total_limit:,.2f}", className="text-end fw-bold")], className="mb-1"),
+        dbc.Progress([dbc.Progress(value=utilization, color="danger", bar=True), dbc.Progress(value=100-utilization, color="success" if total_debt > 0 else "secondary", bar=True)], style={"height": "10px", "backgroundColor": "#222"}, className="mb-1"),
+        dbc.Row([dbc.Col(f"Deuda: ${total_debt:,.2f}", className="text-muted small"), dbc.Col(f"Uso: {utilization:.1f}%", className="text-end small fw-bold text-muted")])
+    ])
+
+
+# 4D. MONITOR DEL MES
+@callback(
+    [Output("kpi-month-income", "children"), Output("kpi-month-label-inc", "children"),
+     Output("kpi-month-expense", "children"), Output("kpi-month-label-exp", "children"),
+     Output("kpi-savings-rate", "children"), Output("kpi-savings-bar-container", "children")],
+    PANEL_INPUTS
+)
+def update_month_panel(pathname, update_signal):
+    if pathname != "/": return [no_update] * 6
+    uid = dm.get_uid()
+    if not uid: return [no_update] * 6
+
+    today_d = date.today()
+    try:
+        # El mes va en la clave del caché: al cambiar de mes se recalcula solo
+        kpi = month_panel(uid, today_d.strftime('%Y-%m'))
+    except Exception as e:
+        print(f"🔥 ERROR EN PANEL DEL MES: {e}")
+        return "$0.00", "", "$0.00", "", "0%", ""
+
+    month_income, month_expense = kpi['income'], kpi['expense']
+    savings = month_income - month_expense
+    savings_rate = (savings / month_income * 100) if month_income > 0 else 0
+    label_month = f"Total en {today_d.strftime('%B %Y').capitalize()}"
+    sav_color = "success" if savings_rate >= 20 else ("warning" if savings_rate > 0 else "danger")
+    savings_bar = html.Div([
+        dbc.Progress(value=max(0, savings_rate), color=sav_color, striped=True, className="mb-2", style={"height": "15px"}),
+        html.Div([html.Small(f"Ahorro Neto: ${savings:,.2f}", className=f"text-{sav_color} fw-bold")], className="d-flex justify-content-between")
+    ])
+    return (f"${month_income:,.2f}", label_month, f"${month_expense:,.2f}", label_month,
+            f"{savings_rate:.1f}%", savings_bar)
+
+
+# 4E. FLUJO DE CAJA
+def build_cashflow_figure(user_id):
+    df_summary = dm.get_monthly_summary(user_id)
+    if df_summary.empty: return get_empty_fig("Sin datos")
+    fig_cash = px.bar(df_summary, x="Month", y="amount", color="type", barmode="group", color_discrete_map={"Income": "#00C851", "Expense": "#ff4444"})
+    fig_cash.update_layout(
+        template="plotly_dark", 
+        plot_bgcolor="rgba(0,0,0,0)", 
+        paper_bgcolor="rgba(0,0,0,0)", 
+        legend_orientation="h", legend_y=1.02, 
+        font=dict(color="white"),
+        hoverlabel=HOVER_STYLE
+    )
+    return fig_cash
+
+
+@callback(Output("graph-cashflow", "figure"), PANEL_INPUTS)
+def update_cashflow_panel(pathname, update_signal):
+    if pathname != "/": return no_update
+    uid = dm.get_uid()
+    if not uid: return no_update
+
+    try:
+        return cached_figure(uid, 'cashflow', ROLLUP_TABLES, lambda: build_cashflow_figure(uid))
+    except Exception as e:
+        print(f"🔥 ERROR EN PANEL DE FLUJO DE CAJA: {e}")
+        return go.Figure().update_layout(template="plotly_dark", title="Error de Carga")
+
+
+# 4F. DESGLOSE POR CATEGORÍA (4 pies)
+@callback(
+    [Output("pie-inc-cat", "figure"), Output("pie-inc-sub", "figure"),
+     Output("pie-exp-cat", "figure"), Output("pie-exp-sub", "figure")],
+    PANEL_INPUTS
+)
+def update_breakdown_panel(pathname, update_signal):
+    if pathname != "/": return [no_update] * 4
+    uid = dm.get_uid()
+    if not uid: return [no_update] * 4
+
+    # Resumen pre-agregado (transaction_rollups): no se lee la tabla transactions completa
+    pies = [
+        ('Income', 'category', px.colors.qualitative.Pastel, "Sin Ingresos"),
+        ('Income', 'subcategory', px.colors.qualitative.Pastel, "Sin Subcategorías"),
+        ('Expense', 'category', px.colors.qualitative.Set3, "Sin Gastos"),
+        ('Expense', 'subcategory', px.colors.qualitative.Set3, "Sin Subcategorías"),
+    ]
+    try:
+        return [
+            cached_figure(uid, f"pie-{t_type}-{group_col}", ROLLUP_TABLES,
+                          lambda t=t_type, g=group_col, c=colors, e=empty: make_pie(dm.get_category_breakdown(uid), t, g, c, e))
+            for t_type, group_col, colors, empty in pies
+        ]
+    except Exception as e:
+        print(f"🔥 ERROR EN PANEL DE DESGLOSE: {e}")
+        return [go.Figure().update_layout(template="plotly_dark", title="Error de Carga")] * 4
+
+
 # ------------------------------------------------------------------------------
 # 5. CALLBACK DINÁMICO (SOLO PARA GRÁFICO HISTÓRICO)
 # ------------------------------------------------------------------------------
@@ -458,7 +577,15 @@ def update_history_chart_only(pathname, signal, start_date, end_date):
     if not end_date: end_date = date.today()
     if not start_date: start_date = date(date.today().year, 1, 1)
 
-    df_history = dm.get_historical_networth_trend(str(start_date), str(end_date))
+    uid = dm.get_uid()
+    # El historial agrega el día de hoy: la fecha actual también va en la clave
+    return cached_figure(uid, 'networth-history', HISTORY_TABLES,
+                         lambda: build_history_figure(start_date, end_date),
+                         extra=(str(start_date), str(end_date), date.today().isoformat()))
+
+
+def build_history_figure(start_date, end_date):
+    df_history = dm.get_historical_networth_trend(str(start_date), str(end_date), max_points=HISTORY_MAX_POINTS)
     fig_nw = go.Figure()
     
     if df_history.empty:
@@ -2,6 +2,7 @@ import dash
 from dash import dcc, html, callback, Input, Output, State, no_update, ctx, ALL
 import dash_bootstrap_components as dbc
 import backend.data_manager as dm
+from backend import payment_calendar
 from utils import ui_helpers 
 from datetime import datetime # Necesario para timestamps
 
@@ -176,10 +177,7 @@ def update_dash(acc_id, sig):
         virtual_total, monthly_need = 0.0, 0.0
     else:
         virtual_total = df['current_allocation'].sum()
-        def calc_need(row):
-            base = row['min_amount'] if row.get('is_percentage', 0) else row['amount']
-            return base / row['frequency']
-        monthly_need = df.apply(calc_need, axis=1).sum()
+        monthly_need = payment_calendar.monthly_need(df)
 
     gap = real_bal - virtual_total
     gap_class = "fw-bold text-success" if gap >= 0 else "fw-bold text-danger"
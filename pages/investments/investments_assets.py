@@ -9,10 +9,14 @@ import plotly.graph_objects as go
 import pandas as pd
 import time 
 import json 
+from backend.figure_cache import cached_figure, input_digest
 
 
 from . import investments_transactions 
 
+# Tablas que alimentan los gráficos del portafolio (invalidan la figura cacheada)
+ASSET_TABLES = ('investments', 'market_cache')
+
 
 # ------------------------------------------------------------------------------
 # 1. FUNCIONES AUXILIARES (Definidas antes del Layout)
@@ -185,6 +189,8 @@ delete_confirm_modal = dbc.Modal([
 layout = dbc.Container([
     # STORES COMPARTIDOS (Visibles globalmente)
     dcc.Store(id="asset-update-signal", data=0),
+    dcc.Store(id="asset-refresh-request", data=None),
+    dcc.Interval(id="asset-refresh-interval", interval=1000, disabled=True),
     dcc.Store(id="asset-viewing-id", data=None),
     dcc.Store(id="assets-data-cache", data='{}'),
     dcc.Store(id="trans-asset-ticker-store", data=None),
@@ -362,26 +368,52 @@ def fetch_and_cache_assets(pathname, signal):
      Output("asset-toast", "children", allow_duplicate=True),
      Output("asset-toast", "icon", allow_duplicate=True),
      # 🚨 NUEVO OUTPUT: Apuntamos al div invisible dentro del spinner
-     Output("dummy-spinner-target", "children")], 
+     Output("dummy-spinner-target", "children"),
+     Output("asset-refresh-request", "data"),
+     Output("asset-refresh-interval", "disabled")], 
     Input("btn-refresh-investments", "n_clicks"),
     State("asset-update-signal", "data"),
     prevent_initial_call=True
 )
 def manual_refresh_handler(n_clicks, signal):
-    # Ajustamos el retorno de no_update para que coincida con la cantidad de outputs (5)
-    if not n_clicks: return no_update, no_update, no_update, no_update, no_update
+    # Ajustamos el retorno de no_update para que coincida con la cantidad de outputs (7)
+    if not n_clicks: return no_update, no_update, no_update, no_update, no_update, no_update, no_update
     
-    # 1. Llamar a la función robusta del backend (Aquí es donde tarda y gira la rueda)
-    success, msg = dm.manual_price_refresh()
+    # 1. Llamar al backend: con planificador solo deja el pedido y retorna al toque
+    success, msg, pending = dm.manual_price_refresh()
+    if pending:
+        # El intervalo consulta el resultado (poll_refresh_handler) sin bloquear el worker
+        return no_update, *ui_helpers.mensaje_alerta_exito("info", msg), "", pending, False
     
     # 2. Incrementar señal
     new_signal = (signal or 0) + 1
     
     # 🚨 NOTA: Agregamos "" al final de los return para llenar el dummy-spinner-target
     if success:
-        return new_signal, *ui_helpers.mensaje_alerta_exito("success", msg), ""
+        return new_signal, *ui_helpers.mensaje_alerta_exito("success", msg), "", None, True
     else:
-        return new_signal, *ui_helpers.mensaje_alerta_exito("danger", msg), ""
+        return new_signal, *ui_helpers.mensaje_alerta_exito("danger", msg), "", None, True
+
+# 0-C. Resultado del pedido al planificador (polling)
+@callback(
+    [Output("asset-update-signal", "data", allow_duplicate=True),
+     Output("asset-toast", "is_open", allow_duplicate=True),
+     Output("asset-toast", "children", allow_duplicate=True),
+     Output("asset-toast", "icon", allow_duplicate=True),
+     Output("asset-refresh-request", "data", allow_duplicate=True),
+     Output("asset-refresh-interval", "disabled", allow_duplicate=True)],
+    Input("asset-refresh-interval", "n_intervals"),
+    [State("asset-refresh-request", "data"),
+     State("asset-update-signal", "data")],
+    prevent_initial_call=True
+)
+def poll_refresh_handler(n, requested_at, signal):
+    if not requested_at: return no_update, no_update, no_update, no_update, None, True
+    result = dm.price_refresh_result(requested_at)
+    if result is None: return no_update, no_update, no_update, no_update, no_update, no_update
+    success, msg = result
+    new_signal = (signal or 0) + 1
+    return new_signal, *ui_helpers.mensaje_alerta_exito("success" if success else "danger", msg), None, True
 # 1. Abrir/Cerrar Modal Agregar
 
 @callback(
@@ -624,9 +656,15 @@ def render_portfolio_summary(json_assets):
         return fig
     # Lógica de creación de gráficos (usando las variables calculadas en el else)
     # Las definiciones completas de estas funciones deben estar en tu archivo.
-    fig_stock = get_figure_data(df_stock, "Valor por Activo", px.colors.qualitative.Pastel)
-    fig_industry = get_figure_data(df_industry, "Distribución por Industria", px.colors.qualitative.Vivid)
-    fig_type = get_figure_data(df_asset_type, "Distribución por Tipo", px.colors.qualitative.Bold)
+    # Figuras cacheadas ya serializadas: la clave lleva la huella de los activos recibidos
+    uid = dm.get_uid()
+    extra = (input_digest(json_assets),)
+    fig_stock = cached_figure(uid, 'assets-pie-stock', ASSET_TABLES,
+                              lambda: get_figure_data(df_stock, "Valor por Activo", px.colors.qualitative.Pastel), extra)
+    fig_industry = cached_figure(uid, 'assets-pie-industry', ASSET_TABLES,
+                                 lambda: get_figure_data(df_industry, "Distribución por Industria", px.colors.qualitative.Vivid), extra)
+    fig_type = cached_figure(uid, 'assets-pie-type', ASSET_TABLES,
+                             lambda: get_figure_data(df_asset_type, "Distribución por Tipo", px.colors.qualitative.Bold), extra)
     
     return final_layout, fig_stock, fig_industry, fig_type
 
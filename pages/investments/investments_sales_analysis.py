@@ -12,6 +12,10 @@ import json
 from utils import ui_helpers 
 from io import StringIO
 import time
+from backend.figure_cache import cached_figure, input_digest
+
+# Tablas que alimentan el gráfico de P/L realizado (invalidan la figura cacheada)
+PL_TABLES = ('investment_transactions', 'pl_adjustments')
 
 # --- FUNCIONES AUXILIARES ---
 
@@ -197,6 +201,27 @@ def save_pl_adjustment(n_clicks, ticker, amount):
 # CALLBACKS: ANÁLISIS (KPIs y GRÁFICOS)
 # ==============================================================================
 
+def build_pl_bar(df_combined):
+    df_combined = df_combined.copy()
+    df_combined['display_ticker'] = df_combined['ticker'].apply(dm.clean_ticker_display)
+    df_pl_by_ticker = df_combined.groupby('display_ticker')['realized_pl'].sum().reset_index()
+    
+    if df_pl_by_ticker.empty:
+        return create_empty_bar("Sin P/L.")
+
+    df_pl_by_ticker['color'] = df_pl_by_ticker['realized_pl'].apply(lambda x: '#00C851' if x >= 0 else '#ff4444')
+    df_pl_by_ticker = df_pl_by_ticker.sort_values(by='realized_pl', ascending=False)
+    
+    fig_bar = px.bar(df_pl_by_ticker, x='display_ticker', y='realized_pl', 
+                     title='P/L Realizado por Ticker', color='color', 
+                     color_discrete_map={'#00C851': '#00C851', '#ff4444': '#ff4444'})
+    fig_bar.update_layout(template="plotly_dark", plot_bgcolor="rgba(0,0,0,0)", paper_bgcolor="rgba(0,0,0,0)",
+                          margin=dict(t=30, b=40, l=10, r=10), height=350, showlegend=False,
+                          xaxis=dict(showgrid=False, tickangle=-45), yaxis=dict(showgrid=True, gridcolor='#333'))
+    fig_bar.update_traces(hovertemplate='<b>%{x}</b><br>$%{y:,.2f}<extra></extra>')
+    return fig_bar
+
+
 @callback(
     [Output("kpi-total-realized-pl", "children"),
      Output("realized-pl-bar-chart", "figure")],
@@ -270,23 +295,9 @@ def render_realized_pl_summary(json_history):
         ])
     ])
 
-    # 4. Gráfico
-    df_combined['display_ticker'] = df_combined['ticker'].apply(dm.clean_ticker_display)
-    df_pl_by_ticker = df_combined.groupby('display_ticker')['realized_pl'].sum().reset_index()
-    
-    if df_pl_by_ticker.empty:
-        fig_bar = create_empty_bar("Sin P/L.")
-    else:
-        df_pl_by_ticker['color'] = df_pl_by_ticker['realized_pl'].apply(lambda x: '#00C851' if x >= 0 else '#ff4444')
-        df_pl_by_ticker = df_pl_by_ticker.sort_values(by='realized_pl', ascending=False)
-        
-        fig_bar = px.bar(df_pl_by_ticker, x='display_ticker', y='realized_pl', 
-                         title='P/L Realizado por Ticker', color='color', 
-                         color_discrete_map={'#00C851': '#00C851', '#ff4444': '#ff4444'})
-        fig_bar.update_layout(template="plotly_dark", plot_bgcolor="rgba(0,0,0,0)", paper_bgcolor="rgba(0,0,0,0)",
-                              margin=dict(t=30, b=40, l=10, r=10), height=350, showlegend=False,
-                              xaxis=dict(showgrid=False, tickangle=-45), yaxis=dict(showgrid=True, gridcolor='#333'))
-        fig_bar.update_traces(hovertemplate='<b>%{x}</b><br>$%{y:,.2f}<extra></extra>')
+    # 4. Gráfico (cacheado ya serializado; la clave lleva la huella del historial de ventas)
+    fig_bar = cached_figure(dm.get_uid(), 'realized-pl-bar', PL_TABLES,
+                            lambda: build_pl_bar(df_combined), extra=(input_digest(json_history),))
 
     return kpi_content, fig_bar
 
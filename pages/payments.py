@@ -0,0 +1,129 @@
+# pages/payments.py
+from dash import dcc, html, callback, Input, Output
+from dash import dash_table
+import dash_bootstrap_components as dbc
+import pandas as pd
+from datetime import date, timedelta
+import backend.data_manager as dm
+from backend import payment_calendar
+
+KIND_OPTIONS = [{"label": label, "value": kind} for kind, label in payment_calendar.KIND_LABELS.items()]
+KIND_COLORS = {
+    'card_payment': 'rgba(100, 0, 0, 0.3)',
+    'card_cutoff': 'rgba(60, 60, 60, 0.4)',
+    'installment': 'rgba(0, 60, 120, 0.3)',
+    'fixed_cost': 'rgba(120, 90, 0, 0.3)',
+}
+
+layout = dbc.Container([
+    html.H2("Próximos Pagos", className="mb-3 text-primary"),
+
+    # 1. FILTROS
+    dbc.Card(dbc.CardBody([
+        dbc.Row([
+            dbc.Col([
+                dcc.DatePickerRange(
+                    id='payments-date-picker',
+                    display_format='DD/MM/YYYY',
+                    start_date=date.today(),
+                    end_date=(pd.Timestamp(date.today()) + pd.DateOffset(months=payment_calendar.HORIZON_MONTHS)).date(),
+                    style={'zIndex': 100, 'width': '100%'}
+                )
+            ], lg=5, md=12, className="mb-2 mb-lg-0"),
+            dbc.Col([
+                dbc.Checklist(
+                    id="payments-kinds",
+                    options=KIND_OPTIONS,
+                    value=[o["value"] for o in KIND_OPTIONS],
+                    inline=True,
+                    switch=True,
+                    className="small"
+                )
+            ], lg=7, md=12),
+        ], className="align-items-center g-2"),
+    ], className="py-3"), className="mb-4 shadow-sm"),
+
+    # 2. RESUMEN
+    dbc.Row(id="payments-summary", className="mb-2"),
+
+    # 3. LISTA
+    dbc.Card([
+        dbc.CardHeader([html.I(className="bi bi-calendar-event me-2"), "Vencimientos"], className="fw-bold py-2"),
+        dbc.CardBody(html.Div(id="payments-table-container"), className="p-0"),
+    ], className="shadow-sm"),
+], fluid=True, className="py-3")
+
+
+def _metric(title, value, color, note=None):
+    body = [
+        html.H5(title, className="card-title text-muted small text-uppercase fw-bold"),
+        html.H3(value, className=f"card-value {color} mb-0 fw-bold"),
+    ]
+    if note:
+        body.append(html.Small(note, className="text-muted"))
+    return dbc.Col(dbc.Card(dbc.CardBody(body), className="metric-card h-100 shadow-sm border-0"),
+                   lg=4, md=12, className="mb-3")
+
+
+def render_summary(events):
+    known = events['amount'].sum(min_count=1) if not events.empty else 0.0
+    known = 0.0 if pd.isna(known) else known
+    week_end = pd.Timestamp(date.today() + timedelta(days=7))
+    week = events[events['date'] <= week_end]['amount'].sum() if not events.empty else 0.0
+
+    monthly = payment_calendar.totals_by_month(events)
+    by_month = monthly.groupby('month')['amount'].sum() if not monthly.empty else pd.Series(dtype=float)
+    heaviest = f"{by_month.idxmax()} (${by_month.max():,.2f})" if not by_month.empty else "-"
+
+    return [
+        _metric("Total en el Rango", f"${known:,.2f}", "text-danger", f"{len(events)} vencimientos"),
+        _metric("Próximos 7 Días", f"${week:,.2f}", "text-warning"),
+        _metric("Mes Más Cargado", heaviest, "text-info",
+                "El pago de tarjeta solo incluye el exigible del próximo corte."),
+    ]
+
+
+def render_table(events):
+    if events.empty:
+        return html.Div("No hay vencimientos en el rango seleccionado.", className="text-muted fst-italic text-center py-4")
+
+    data = events.assign(
+        fecha=events['date'].dt.strftime('%d/%m/%Y'),
+        detail=events['detail'].fillna(''),
+    )[['fecha', 'kind', 'label', 'name', 'detail', 'amount']]
+
+    return dash_table.DataTable(
+        id='payments-table',
+        data=data.to_dict('records'),
+        style_table={'overflowX': 'auto', 'minWidth': '100%', 'maxHeight': '60vh', 'overflowY': 'auto'},
+        fixed_rows={'headers': True},
+        columns=[
+            {"name": "Fecha", "id": "fecha"},
+            {"name": "Tipo", "id": "label"},
+            {"name": "Concepto", "id": "name"},
+            {"name": "Detalle", "id": "detail"},
+            {"name": "Monto", "id": "amount", "type": "numeric", "format": {"specifier": "$,.2f"}},
+        ],
+        style_header={'backgroundColor': '#333', 'color': 'white', 'fontWeight': 'bold'},
+        style_data={'backgroundColor': '#1E1E1E', 'color': '#E0E0E0'},
+        style_data_conditional=[
+            {'if': {'filter_query': f'{{kind}} = "{kind}"'}, 'backgroundColor': color}
+            for kind, color in KIND_COLORS.items()
+        ],
+        style_cell={'border': '1px solid #444', 'padding': '10px'},
+        page_action='none', page_size=9999,
+    )
+
+
+@callback(
+    [Output("payments-summary", "children"), Output("payments-table-container", "children")],
+    [Input("payments-date-picker", "start_date"), Input("payments-date-picker", "end_date"),
+     Input("payments-kinds", "value")]
+)
+def update_payments(start_date, end_date, kinds):
+    if not kinds:
+        events = pd.DataFrame(columns=payment_calendar.COLUMNS + ['label'])
+    else:
+        events = dm.get_upcoming_payments(start_date, end_date, kinds)
+    events['date'] = pd.to_datetime(events['date'])
+    return render_summary(events), render_table(events)
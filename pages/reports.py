@@ -3,10 +3,8 @@ import dash
 from dash import dcc, html, callback, Input, Output, State, no_update, ctx
 import dash_bootstrap_components as dbc
 import backend.data_manager as dm
+from backend import report_export, columnar_export
 from datetime import date
-import pandas as pd
-import io
-import time 
 
 # --- LISTA MAESTRA DE REPORTES ---
 REPORT_OPTIONS = [
@@ -19,6 +17,10 @@ REPORT_OPTIONS = [
     ("savings", "Metas de Ahorro"),
 ]
 
+# Parquet solo si pyarrow está instalado (es opcional, ver backend/columnar_export.py)
+PARQUET_OK = columnar_export.parquet_available()
+PARQUET_LABEL = "Parquet (.zip, respaldo / análisis)" if PARQUET_OK else "Parquet (requiere instalar pyarrow)"
+
 # 🚨 AJUSTE CLAVE: Usamos 'style' para darle una altura que se ajuste mejor al contenido vertical
 layout = dbc.Container([
     html.H2("Centro de Reportes", className="mb-3 text-primary"),
@@ -94,12 +96,38 @@ layout = dbc.Container([
             ], className="mb-2"), # Margen inferior reducido
 
 
+            html.Hr(className="my-3"),
+
+            # 2B. FORMATO DE SALIDA
+            dbc.Row([
+                dbc.Col(html.H6("Formato", className="text-info mb-0"), lg=3, md=12),
+                dbc.Col([
+                    dbc.RadioItems(
+                        id="report-format",
+                        options=[
+                            {"label": "Excel (.xlsx)", "value": "xlsx"},
+                            {"label": PARQUET_LABEL, "value": "parquet", "disabled": not PARQUET_OK},
+                        ],
+                        value="xlsx",
+                        inline=True,
+                        className="small"
+                    ),
+                    html.Div("Parquet incluye Transacciones, Patrimonio, Portafolio, Trading y Cuentas.",
+                             className="text-muted small"),
+                ], lg=9, md=12),
+            ], className="mb-3 align-items-center g-2"),
+
             html.Hr(className="my-3"),
 
             # 3. BOTÓN DE DESCARGA (Fila 3)
             dbc.Row([
-                # Mensaje de Estado
-                dbc.Col(html.Div(id="report-status-msg", className="text-center text-danger small pt-2"), lg=6, md=12),
+                # Mensaje de Estado + Progreso del reporte en segundo plano
+                dbc.Col([
+                    html.Div(id="report-status-msg", className="text-center text-danger small pt-2"),
+                    dbc.Progress(id="report-progress", value=0, striped=True, animated=True,
+                                 className="mt-2", style={"display": "none"}),
+                    html.Div(id="report-download-link", className="text-center mt-2"),
+                ], lg=6, md=12),
                 
                 # Botón de Descarga
                 dbc.Col(
@@ -107,13 +135,38 @@ layout = dbc.Container([
                                id="btn-download-report", color="success", size="lg", className="w-100 fw-bold"),
                     lg=6, md=12
                 ),
-            ], className="g-3 align-items-center")
+            ], className="g-3 align-items-center"),
+
+            html.Hr(className="my-3"),
+
+            # 4. IMPORTAR RESPALDO PARQUET (mismo rango de fechas)
+            dbc.Row([
+                dbc.Col(html.H6("4. Importar Respaldo (.zip Parquet)", className="text-info mb-0"), lg=3, md=12),
+                dbc.Col([
+                    dcc.Loading(type="circle", color="#28a745", children=[
+                        dcc.Upload(
+                            id="report-import-upload",
+                            children=html.Div(["Arrastra el respaldo o ", html.A("Selecciónalo")]),
+                            style={
+                                'width': '100%', 'height': '50px', 'lineHeight': '50px',
+                                'borderWidth': '1px', 'borderStyle': 'dashed',
+                                'borderRadius': '5px', 'textAlign': 'center',
+                                'borderColor': '#666'
+                            },
+                            multiple=False,
+                            disabled=not PARQUET_OK
+                        ),
+                    ]),
+                    html.Div(id="report-import-msg", className="text-center small pt-2"),
+                ], lg=9, md=12),
+            ], className="align-items-center g-2")
             
         ])
     ], className="shadow-lg border-light mb-0"),
     
-    # Componente invisible que maneja la descarga
-    dcc.Download(id="download-dataframe-xlsx"),
+    # El reporte se arma en segundo plano: guardamos el job y consultamos su avance
+    dcc.Store(id="report-job-id", data=None),
+    dcc.Interval(id="report-progress-interval", interval=1000, disabled=True),
 
 ], fluid=True, className="p-0 m-0 page-container")
 
@@ -147,96 +200,81 @@ def toggle_selection(n_all, n_none):
     return no_update
 
 
-# 3. GENERAR Y DESCARGAR EXCEL (Lógica Principal)
+# 3. GENERAR EXCEL EN SEGUNDO PLANO (backend/report_export.py)
+# Las fechas se filtran en SQL y el libro se escribe fila a fila a disco;
+# el callback solo encola el trabajo y no bloquea el worker.
 @callback(
-    [Output("download-dataframe-xlsx", "data"),
-     Output("report-status-msg", "children")],
+    [Output("report-job-id", "data"),
+     Output("report-progress-interval", "disabled"),
+     Output("report-status-msg", "children"),
+     Output("report-download-link", "children"),
+     Output("btn-download-report", "disabled")],
     Input("btn-download-report", "n_clicks"),
     [State("report-selection-list", "value"),
      State("report-date-picker", "start_date"),
-     State("report-date-picker", "end_date")],
+     State("report-date-picker", "end_date"),
+     State("report-format", "value")],
     prevent_initial_call=True
 )
-def generate_excel_report(n, selected_reports, start_date, end_date):
-    if not n: return no_update, ""
+def generate_excel_report(n, selected_reports, start_date, end_date, fmt):
+    if not n: return no_update, no_update, "", no_update, no_update
     if not selected_reports:
-        return no_update, "⚠️ Selecciona al menos un tipo de reporte para descargar."
+        return no_update, no_update, "⚠️ Selecciona al menos un tipo de reporte para descargar.", no_update, no_update
 
-    output = io.BytesIO()
-    
-    try:
-        with pd.ExcelWriter(output, engine='xlsxwriter') as writer:
-            has_data = False
-
-            def filter_df_by_date(df, start_date, end_date):
-                if df.empty: return df
-                df['date_dt'] = pd.to_datetime(df['date'], format='mixed', errors='coerce')
-                mask = (df['date_dt'] >= pd.to_datetime(start_date)) & (df['date_dt'] <= pd.to_datetime(end_date))
-                return df.loc[mask].drop(columns=['date_dt'], errors='ignore')
-
-            # 1. TRANSACCIONES
-            if "transactions" in selected_reports:
-                df = dm.get_transactions_df()
-                df_final = filter_df_by_date(df, start_date, end_date).drop(columns=['user_id', 'account_id'], errors='ignore')
-                if not df_final.empty:
-                    df_final.to_excel(writer, sheet_name='Transacciones', index=False)
-                    has_data = True
-
-            # 2. PATRIMONIO NETO
-            if "net_worth" in selected_reports:
-                df = dm.get_historical_networth_trend(start_date, end_date)
-                if not df.empty:
-                    df.to_excel(writer, sheet_name='Historial Patrimonio', index=False)
-                    has_data = True
-
-            # 3. PORTAFOLIO ACTUAL (Ignora Fechas)
-            if "investments_current" in selected_reports:
-                data = dm.get_stocks_data(force_refresh=False)
-                if data:
-                    df = pd.DataFrame(data)
-                    cols = ['ticker', 'name', 'shares', 'avg_price', 'current_price', 'market_value', 'total_gain', 'asset_type', 'sector']
-                    cols = [c for c in cols if c in df.columns]
-                    df[cols].to_excel(writer, sheet_name='Portafolio Actual', index=False)
-                    has_data = True
-
-            # 4. HISTORIAL TRADING
-            if "investments_history" in selected_reports:
-                df = dm.get_investment_transactions_df()
-                df_final = filter_df_by_date(df, start_date, end_date).drop(columns=['user_id'], errors='ignore')
-                if not df_final.empty:
-                    df_final.to_excel(writer, sheet_name='Historial Trading', index=False)
-                    has_data = True
-
-            # 5. CUENTAS (Ignora Fechas)
-            if "accounts" in selected_reports:
-                df_acc = dm.get_accounts_by_category("Debit")
-                df_cred = dm.get_accounts_by_category("Credit")
-                df = pd.concat([df_acc, df_cred], ignore_index=True)
-                if not df.empty:
-                    df.drop(columns=['user_id'], errors='ignore').to_excel(writer, sheet_name='Estado Cuentas', index=False)
-                    has_data = True
-
-            # 6. COSTOS FIJOS (Ignora Fechas)
-            if "fixed_costs" in selected_reports:
-                df = dm.get_fixed_costs_df()
-                if not df.empty:
-                    df.drop(columns=['user_id'], errors='ignore').to_excel(writer, sheet_name='Costos Fijos', index=False)
-                    has_data = True
-
-            # 7. AHORROS (Ignora Fechas)
-            if "savings" in selected_reports:
-                df = dm.get_savings_goals_df()
-                if not df.empty:
-                    df.drop(columns=['user_id'], errors='ignore').to_excel(writer, sheet_name='Metas Ahorro', index=False)
-                    has_data = True
-
-            if not has_data:
-                return no_update, "⚠️ No se encontraron datos en los filtros aplicados. Intenta con un rango más amplio."
-
-    except Exception as e:
-        return no_update, f"Error generando Excel: {str(e)}"
-
-    # Preparar descarga
-    data = output.getvalue()
-    filename = f"Reporte_Pivot_{date.today().strftime('%Y-%m-%d')}.xlsx"
-    return dcc.send_bytes(data, filename), ""
\ No newline at end of file
+    uid = dm.get_uid()
+    if not uid: return no_update, no_update, "Sesión no válida.", no_update, no_update
+    if fmt == 'parquet' and not PARQUET_OK:
+        return no_update, no_update, "⚠️ La exportación Parquet requiere pyarrow en el servidor.", no_update, no_update
+
+    job_id = report_export.start_report(uid, selected_reports, start_date, end_date, fmt=fmt or 'xlsx')
+    return job_id, False, "", "", True
+
+
+# 4. AVANCE DEL REPORTE (polling mientras el job corre)
+@callback(
+    [Output("report-progress", "value"),
+     Output("report-progress", "label"),
+     Output("report-progress", "style"),
+     Output("report-status-msg", "children", allow_duplicate=True),
+     Output("report-download-link", "children", allow_duplicate=True),
+     Output("report-progress-interval", "disabled", allow_duplicate=True),
+     Output("btn-download-report", "disabled", allow_duplicate=True)],
+    Input("report-progress-interval", "n_intervals"),
+    State("report-job-id", "data"),
+    prevent_initial_call=True
+)
+def poll_report_progress(n, job_id):
+    status = report_export.get_status(job_id, dm.get_uid())
+    hidden = {"display": "none"}
+    if not status:
+        return 0, "", hidden, "El reporte expiró o no existe. Genéralo de nuevo.", "", True, False
+
+    pct = int(status.get('progress', 0) * 100)
+    state = status.get('state')
+    if state in ('queued', 'running'):
+        msg = html.Span(status.get('message', ''), className="text-muted")
+        return pct, f"{pct}%", {"display": "flex"}, msg, "", False, True
+    if state == 'done':
+        link = html.A([html.I(className="bi bi-download me-2"), f"Descargar {status['filename']}"],
+                      href=status['url'], className="btn btn-outline-success btn-sm", download=status['filename'])
+        msg = html.Span(status.get('message', ''), className="text-success")
+        return 100, "100%", hidden, msg, link, True, False
+    # 'empty' o 'error'
+    return 0, "", hidden, status.get('message', ''), "", True, False
+
+
+# 5. IMPORTAR RESPALDO PARQUET
+@callback(
+    [Output("report-import-msg", "children"),
+     Output("report-import-upload", "contents")],
+    Input("report-import-upload", "contents"),
+    [State("report-import-upload", "filename"),
+     State("report-date-picker", "start_date"),
+     State("report-date-picker", "end_date")],
+    prevent_initial_call=True
+)
+def import_dataset_callback(contents, filename, start_date, end_date):
+    if contents is None: return no_update, no_update
+    success, msg = dm.import_user_dataset(contents, filename, start_date, end_date)
+    # Limpiamos el Upload para poder subir el mismo archivo otra vez
+    return html.Span(msg, className="text-success" if success else "text-danger"), None
@@ -8,6 +8,7 @@ import backend.data_manager as dm
 import time 
 from utils import ui_helpers 
 import pandas as pd
+import re
 
 # LISTA FIJA DE CATEGORÍAS MACRO
 MAIN_CATEGORIES = [
@@ -108,11 +109,176 @@ trans_delete_modal = dbc.Modal([
     ])
 ], id="trans-delete-modal", is_open=False, centered=True, size="sm")
 
+# --- MODAL 4: IMPORTAR EXTRACTO BANCARIO ---
+trans_import_modal = dbc.Modal([
+    dbc.ModalHeader(dbc.ModalTitle("Importar Extracto Bancario")),
+    dbc.ModalBody([
+        dbc.Alert([
+            html.H6("Formatos: CSV, OFX o Excel (.xlsx)", className="alert-heading"),
+            html.Ul([
+                html.Li("Columnas de fecha y monto (o cargo / abono); descripción y categoría opcionales."),
+                html.Li("Montos negativos = gasto, positivos = ingreso."),
+                html.Li("Los movimientos que ya existen en la cuenta no se duplican."),
+            ], className="small mb-0")
+        ], color="info"),
+        dbc.Label("Cuenta:", className="small mb-0"),
+        dcc.Dropdown(id="trans-import-account-dd", placeholder="Cuenta del extracto...",
+                     className="text-dark small-dropdown mb-2", optionHeight=65),
+        dbc.Label("Categoría (si el archivo no trae):", className="small mb-0"),
+        dcc.Dropdown(id="trans-import-category-dd", placeholder="Importado",
+                     className="text-dark small-dropdown mb-2"),
+        dbc.Label("Orden de la fecha:", className="small mb-0"),
+        dbc.RadioItems(id="trans-import-dayfirst", value=True, inline=True, className="small mb-3",
+                       options=[{"label": "DD/MM/AAAA", "value": True}, {"label": "MM/DD/AAAA", "value": False}]),
+        dcc.Loading(type="circle", color="#28a745", children=[
+            dcc.Upload(
+                id='trans-import-upload',
+                children=html.Div(['Arrastra un archivo o ', html.A('Selecciónalo')]),
+                style={
+                    'width': '100%', 'height': '60px', 'lineHeight': '60px',
+                    'borderWidth': '1px', 'borderStyle': 'dashed',
+                    'borderRadius': '5px', 'textAlign': 'center',
+                    'borderColor': '#666'
+                },
+                multiple=False
+            ),
+        ]),
+    ]),
+    dbc.ModalFooter(
+        dbc.Button("Cerrar", id="trans-import-close", className="ms-auto", outline=True)
+    ),
+], id="trans-import-modal", is_open=False, centered=True)
+
+# --- FUNCIONES AUXILIARES GLOBALES ---
+PAGE_SIZE = 10
+TYPE_LABELS = {'Expense': 'Gasto', 'Income': 'Ingreso', 'Transfer': 'Mov. Interno'}
+
+# Operadores del filter_query de DataTable -> operador que entiende data_manager
+_FILTER_OPERATORS = {
+    'eq': '=', '=': '=', 'ne': '!=', '!=': '!=',
+    'lt': '<', '<': '<', 'le': '<=', '<=': '<=',
+    'gt': '>', '>': '>', 'ge': '>=', '>=': '>=',
+    'contains': 'contains', 'datestartswith': 'datestartswith',
+}
+_FILTER_PART_RE = re.compile(r"^\{(?P<col>[^}]+)\}\s+(?P<op>\S+)\s+(?P<val>.+)$")
+
+
+def parse_filter_query(filter_query):
+    """
+    Traduce el filter_query de la tabla (ej. '{category} contains "Comida" && {amount} > 50')
+    a [(columna, operador, valor)]. Las partes que no se entienden se ignoran.
+    """
+    filters = []
+    for part in (filter_query or '').split(' && '):
+        m = _FILTER_PART_RE.match(part.strip())
+        if not m:
+            continue
+        op = m.group('op')
+        # Variantes sensibles/insensibles a mayúsculas: 'icontains', 's=', 'ieq'...
+        if op not in _FILTER_OPERATORS and op[:1] in ('i', 's') and op[1:] in _FILTER_OPERATORS:
+            op = op[1:]
+        if op not in _FILTER_OPERATORS:
+            continue
+        raw = m.group('val').strip()
+        if len(raw) >= 2 and raw[0] == raw[-1] and raw[0] in ('"', "'", '`'):
+            value = raw[1:-1].replace('\\' + raw[0], raw[0])
+        else:
+            try:
+                value = float(raw)
+            except ValueError:
+                value = raw
+        filters.append((m.group('col'), _FILTER_OPERATORS[op], value))
+    return filters
+
+
+def format_table_rows(rows):
+    """Filas crudas de dm.get_transactions_page -> registros listos para la tabla."""
+    if not rows:
+        # Fila dummy para evitar errores visuales
+        return [{
+            'id': -1, 'date_display': '-', 'type_label': '',
+            'category': 'No hay transacciones registradas.',
+            'subcategory': '', 'amount': 0.0, 'action': 'N/A', 'type': 'Expense'
+        }]
+    records = []
+    dates = pd.to_datetime(pd.Series([r['date'] for r in rows]), format='mixed', errors='coerce')
+    for row, dt in zip(rows, dates):
+        records.append({
+            'id': row['id'],
+            # Fecha + hora (los registros viejos solo tienen fecha)
+            'date_display': dt.strftime('%Y-%m-%d %H:%M') if not pd.isna(dt) else row['date'],
+            'type': row['type'],
+            'type_label': TYPE_LABELS.get(row['type'], row['type']),
+            'category': row['category'],
+            'subcategory': row['subcategory'] or '',
+            'amount': row['amount'],
+            'action': "ℹ️",
+        })
+    return records
+
+
+def generate_table():
+    """
+    Tabla vacía con paginación, orden y filtro del lado del servidor: solo viaja
+    al navegador la página visible (ver update_trans_table).
+    """
+    return dash_table.DataTable(
+        id='trans-data-table',
+        data=[],
+        columns=[
+            {"name": "ID", "id": "id"},
+            {"name": "Fecha", "id": "date_display"},
+            {"name": "Tipo", "id": "type_label"},
+            {"name": "Categoría", "id": "category"},
+            {"name": "Subcategoría", "id": "subcategory"},
+            {"name": "Monto", "id": "amount", "type": "numeric", "format": {"specifier": "$,.2f"}},
+            {"name": "Info", "id": "action", "deletable": False, "selectable": False, "filter_options": {"placeholder_text": ""}}
+        ],
+        page_current=0,
+        page_size=PAGE_SIZE,
+        page_count=1,
+        page_action='custom',
+        sort_action='custom',
+        sort_mode='single',
+        sort_by=[],
+        filter_action='custom',
+        filter_query='',
+        style_header={'backgroundColor': '#333', 'color': 'white'},
+        style_data={'backgroundColor': '#2A2A2A', 'color': 'white'},
+        style_filter={'backgroundColor': '#2A2A2A', 'color': 'white'},
+        style_table={'overflowX': 'auto', 'minWidth': '100%'},
+        style_cell={
+            'textAlign': 'left', 'border': '1px solid #444', 'whiteSpace': 'normal',
+            'overflow': 'hidden', 'textOverflow': 'ellipsis', 'padding': '8px'
+        },
+        style_data_conditional=[
+            {'if': {'column_id': 'id'}, 'display': 'none'},
+
+            # Ajustes para la fila "No data"
+            {'if': {'row_index': 0, 'filter_query': '{id} = -1'}, 'color': '#888', 'fontStyle': 'italic', 'height': '60px'},
+            {'if': {'row_index': 0, 'filter_query': '{id} = -1', 'column_id': 'amount'}, 'display': 'none'},
+            {'if': {'row_index': 0, 'filter_query': '{id} = -1', 'column_id': 'action'}, 'display': 'none'},
+            {'if': {'row_index': 0, 'filter_query': '{id} = -1', 'column_id': 'date_display'}, 'display': 'none'}, # Ocultar fecha en vacío
+
+            # Colores según tipo
+            {'if': {'filter_query': '{type} = "Income"'}, 'color': '#00C851', 'fontWeight': 'bold'},
+            {'if': {'filter_query': '{type} = "Expense"'}, 'color': '#ff4444', 'fontWeight': 'bold'},
+            {'if': {'filter_query': '{type} = "Transfer"'}, 'color': '#33b5e5', 'fontWeight': 'bold'},
+
+            {'if': {'column_id': 'action'}, 'textAlign': 'center', 'cursor': 'pointer', 'fontWeight': 'bold', 'color': '#33b5e5'}
+        ],
+        style_header_conditional=[{'if': {'column_id': 'id'}, 'display': 'none'}],
+        style_filter_conditional=[{'if': {'column_id': 'id'}, 'display': 'none'}],
+    )
+
+
 # --- LAYOUT PRINCIPAL ---
 layout = dbc.Container([
     # STORES
     dcc.Store(id='trans-viewing-id', data=None), 
     dcc.Store(id='trans-edit-success', data=0),
+    dcc.Store(id='trans-table-refresh', data=0),
+    dcc.Store(id='trans-page-cursors', data=None),
     dcc.Store(id='global-update-signal', data=0),
     ui_helpers.get_feedback_toast("trans-feedback-toast"),
     
@@ -121,8 +287,12 @@ layout = dbc.Container([
     subcat_modal,
     trans_detail_modal,
     trans_delete_modal,
+    trans_import_modal,
 
-    html.H2("Registro de Transacciones", className="mb-4"),
+    html.Div([
+        html.H2("Registro de Transacciones", className="mb-0"),
+        dbc.Button("Importar extracto", id="btn-open-trans-import", color="primary", outline=True, size="sm"),
+    ], className="d-flex justify-content-between align-items-center mb-4"),
 
     dbc.Row([
         # --- COLUMNA IZQUIERDA: FORMULARIO COMPACTO ---
@@ -257,7 +427,7 @@ layout = dbc.Container([
         # --- COLUMNA DERECHA: TABLA ---
         dbc.Col([
             dbc.Card([
-                dbc.CardBody(id="trans-table-container", 
+                dbc.CardBody(generate_table(), id="trans-table-container", 
                             style={"padding": "0", "maxHeight": "70vh", "overflowY": "auto"}) 
             ],) 
         ], lg=7, md=12)
@@ -265,85 +435,6 @@ layout = dbc.Container([
 ], fluid=True, className="page-container")
 
 
-# --- FUNCIONES AUXILIARES GLOBALES ---
-# transactions.py - Sustituye la función generate_table con esta:
-
-# transactions.py
-
-def generate_table(dataframe):
-    if dataframe.empty:
-        # Fila dummy para evitar errores visuales
-        data_to_render = [{
-            'id': -1, 'date_display': '-', 'type_label': '', 
-            'category': 'No hay transacciones registradas.', 
-            'subcategory': '', 'amount': 0.0, 'action': 'N/A', 'type': 'Expense'
-        }]
-        is_empty = True
-    else:
-        # 1. ASEGURAR ORDEN CRONOLÓGICO (FECHA + HORA)
-        # Convertimos a datetime real para que el ordenamiento respete la hora
-        dataframe['date'] = pd.to_datetime(dataframe['date'], format='mixed')
-        
-        # Ordenamos descendente (Lo más reciente arriba)
-        dataframe = dataframe.sort_values(by='date', ascending=False)
-
-        # 2. CREAR COLUMNA VISUAL (CON HORA)
-        # Cambiamos el formato para incluir hora y minuto
-        dataframe['date_display'] = dataframe['date'].dt.strftime('%Y-%m-%d %H:%M')
-
-        dataframe['action'] = "ℹ️"
-        dataframe['subcategory'] = dataframe['subcategory'].fillna('')
-        
-        # Mapeo de tipos
-        type_map = {'Expense': 'Gasto', 'Income': 'Ingreso', 'Transfer': 'Mov. Interno'}
-        dataframe['type_label'] = dataframe['type'].map(type_map).fillna(dataframe['type'])
-        
-        data_to_render = dataframe.to_dict('records')
-        is_empty = False
-
-    style_header_final = {'display': 'none'} if is_empty else {'backgroundColor': '#333', 'color': 'white'}
-    style_data_final = {'display': 'none'} if is_empty else {'backgroundColor': '#2A2A2A', 'color': 'white'}
-
-    return dash_table.DataTable(
-        id='trans-data-table',
-        data=data_to_render,
-        columns=[
-            {"name": "ID", "id": "id"}, 
-            # --- AQUÍ MOSTRAMOS LA FECHA LIMPIA (date_display) ---
-            {"name": "Fecha", "id": "date_display"}, 
-            {"name": "Tipo", "id": "type_label"}, 
-            {"name": "Categoría", "id": "category"},
-            {"name": "Subcategoría", "id": "subcategory"},
-            {"name": "Monto", "id": "amount", "type": "numeric", "format": {"specifier": "$,.2f"}},
-            {"name": "Info", "id": "action", "deletable": False, "selectable": False}
-        ],
-        style_header=style_header_final,
-        style_data=style_data_final,
-        style_table={'overflowX': 'auto', 'minWidth': '100%'},
-        style_cell={
-            'textAlign': 'left', 'border': '1px solid #444', 'whiteSpace': 'normal', 
-            'overflow': 'hidden', 'textOverflow': 'ellipsis', 'padding': '8px'
-        },
-        style_data_conditional=[
-            {'if': {'column_id': 'id'}, 'display': 'none'},
-            
-            # Ajustes para la fila "No data"
-            {'if': {'row_index': 0, 'filter_query': '{id} = -1'}, 'color': '#888', 'fontStyle': 'italic', 'height': '60px'},
-            {'if': {'row_index': 0, 'filter_query': '{id} = -1', 'column_id': 'amount'}, 'display': 'none'},
-            {'if': {'row_index': 0, 'filter_query': '{id} = -1', 'column_id': 'action'}, 'display': 'none'},
-            {'if': {'row_index': 0, 'filter_query': '{id} = -1', 'column_id': 'date_display'}, 'display': 'none'}, # Ocultar fecha en vacío
-            
-            # Colores según tipo
-            {'if': {'filter_query': '{type} = "Income"'}, 'color': '#00C851', 'fontWeight': 'bold'},
-            {'if': {'filter_query': '{type} = "Expense"'}, 'color': '#ff4444', 'fontWeight': 'bold'},
-            {'if': {'filter_query': '{type} = "Transfer"'}, 'color': '#33b5e5', 'fontWeight': 'bold'}, 
-            
-            {'if': {'column_id': 'action'}, 'textAlign': 'center', 'cursor': 'pointer', 'fontWeight': 'bold', 'color': '#33b5e5'}
-        ],
-        style_header_conditional=[{'if': {'column_id': 'id'}, 'display': 'none'}],
-        page_size=10,
-    )
-
 # ------------------------------------------------------------------------------
 # CALLBACKS
 # ------------------------------------------------------------------------------
@@ -385,6 +476,16 @@ def load_initial_data(pathname, signal):
 def sync_modal_dropdowns(acc_opts, cat_opts):
     return acc_opts, cat_opts
 
+# 1B. Listas del modal de importación (mismas opciones del formulario)
+@callback(
+    [Output("trans-import-account-dd", "options"),
+     Output("trans-import-category-dd", "options")],
+    [Input("input-account-dd", "options"),
+     Input("input-category", "options")]
+)
+def sync_import_dropdowns(acc_opts, cat_opts):
+    return acc_opts, cat_opts
+
 # --- NUEVO: CONTROL VISIBILIDAD PARA TRANSFERENCIAS ---
 @callback(
     [Output("dest-account-container", "style"),
@@ -400,6 +501,43 @@ def toggle_transfer_controls(trans_type):
         # Ocultar destino, Mostrar categorías, etiqueta normal
         return {"display": "none"}, {"display": "block"}, "Cuenta"
 
+# --- IMPORTAR EXTRACTO BANCARIO ---
+@callback(
+    Output("trans-import-modal", "is_open"),
+    [Input("btn-open-trans-import", "n_clicks"), Input("trans-import-close", "n_clicks")],
+    prevent_initial_call=True
+)
+def toggle_import_modal(open_c, close_c):
+    return ctx.triggered_id == "btn-open-trans-import"
+
+@callback(
+    [Output("trans-feedback-toast", "is_open", allow_duplicate=True),
+     Output("trans-feedback-toast", "children", allow_duplicate=True),
+     Output("trans-feedback-toast", "icon", allow_duplicate=True),
+     Output("trans-table-refresh", "data", allow_duplicate=True),
+     Output("trans-import-modal", "is_open", allow_duplicate=True),
+     Output("trans-import-upload", "contents")],
+    Input("trans-import-upload", "contents"),
+    [State("trans-import-upload", "filename"),
+     State("trans-import-account-dd", "value"),
+     State("trans-import-category-dd", "value"),
+     State("trans-import-dayfirst", "value")],
+    prevent_initial_call=True
+)
+def import_statement_callback(contents, filename, acc_id, category, dayfirst):
+    if contents is None: return no_update, no_update, no_update, no_update, no_update, no_update
+    if not acc_id:
+        is_open, msg, icon = ui_helpers.mensaje_alerta_exito("warning", "Elige la cuenta del extracto antes de subirlo.")
+        return is_open, msg, icon, no_update, True, None
+
+    success, text_msg = dm.import_bank_statement(contents, filename, acc_id, category, bool(dayfirst))
+    if success:
+        is_open, msg, icon = ui_helpers.mensaje_alerta_exito("success", text_msg)
+        # Limpiamos el Upload para poder subir el mismo archivo otra vez
+        return is_open, msg, icon, int(time.time() * 1000), False, None
+    is_open, msg, icon = ui_helpers.mensaje_alerta_exito("danger", text_msg)
+    return is_open, msg, icon, no_update, True, None
+
 # --- GESTIÓN DE CATEGORÍAS (MODAL CAT) ---
 @callback(
     Output("cat-modal", "is_open"),
@@ -485,7 +623,7 @@ def update_subcats_modal(parent, sig):
 # 2. Registrar Transacción
 @callback(
     [Output("msg-add-trans", "children"),
-     Output("trans-table-container", "children"),
+     Output("trans-table-refresh", "data"),
      Output("input-name", "value"),
      Output("input-amount", "value"),
      Output("dummy-trans-submit", "children")], # Output del loading
@@ -505,36 +643,87 @@ def add_transaction_callback(n_clicks, date_val, time_val, name, amount, categor
     uid = dm.get_uid()
     if not uid: return "", no_update, no_update, no_update, "" # Seguridad
 
-    # 2. USAR UID
-    df = dm.get_transactions_df(uid) 
-    
-    if not n_clicks: return "", generate_table(df), no_update, no_update, no_update
+    # La tabla se carga sola (update_trans_table); aquí solo avisamos que cambió
+    if not n_clicks: return "", no_update, no_update, no_update, no_update
 
     if not all([date_val, amount, t_type, acc_id]):
-        return html.Span("Faltan campos.", className="text-danger"), generate_table(df), no_update, no_update, ""
+        return html.Span("Faltan campos.", className="text-danger"), no_update, no_update, no_update, ""
     
     final_time = time_val if time_val else "00:00"
     full_date_str = f"{date_val} {final_time}"
 
     try: amt = float(amount)
-    except: return html.Span("Monto inválido", className="text-danger"), generate_table(df), no_update, no_update, ""
+    except: return html.Span("Monto inválido", className="text-danger"), no_update, no_update, no_update, ""
     
     final_name = name if name else "-"
 
     if t_type == "Transfer":
-        if not dest_acc_id: return html.Span("Falta destino.", className="text-danger"), generate_table(df), no_update, no_update, ""
-        if str(acc_id) == str(dest_acc_id): return html.Span("Cuentas iguales.", className="text-danger"), generate_table(df), no_update, no_update, ""
+        if not dest_acc_id: return html.Span("Falta destino.", className="text-danger"), no_update, no_update, no_update, ""
+        if str(acc_id) == str(dest_acc_id): return html.Span("Cuentas iguales.", className="text-danger"), no_update, no_update, no_update, ""
         success, msg = dm.add_transfer(full_date_str, final_name, amt, acc_id, dest_acc_id)
     else:
-        if not category: return html.Span("Falta categoría.", className="text-danger"), generate_table(df), no_update, no_update, ""
+        if not category: return html.Span("Falta categoría.", className="text-danger"), no_update, no_update, no_update, ""
         success, msg = dm.add_transaction(full_date_str, final_name, amt, category, t_type, acc_id, subcat)
 
     if success:
-        # 3. USAR UID PARA RECARGAR TABLA
-        df_new = dm.get_transactions_df(uid) 
-        return html.Span(msg, className="text-success"), generate_table(df_new), "", "", ""
+        # 3. AVISAR A LA TABLA QUE RECARGUE LA PÁGINA
+        return html.Span(msg, className="text-success"), int(time.time() * 1000), "", "", ""
     else:
-        return html.Span(msg, className="text-danger"), generate_table(df), no_update, no_update, ""
+        return html.Span(msg, className="text-danger"), no_update, no_update, no_update, ""
+
+
+# 2B. Tabla paginada del lado del servidor (solo viaja la página visible)
+@callback(
+    [Output("trans-data-table", "data"),
+     Output("trans-data-table", "page_count"),
+     Output("trans-data-table", "page_current"),
+     Output("trans-page-cursors", "data")],
+    [Input("trans-data-table", "page_current"),
+     Input("trans-data-table", "page_size"),
+     Input("trans-data-table", "sort_by"),
+     Input("trans-data-table", "filter_query"),
+     Input("trans-table-refresh", "data"),
+     Input("url", "pathname")],
+    [State("trans-page-cursors", "data")]
+)
+def update_trans_table(page_current, page_size, sort_by, filter_query, refresh, pathname, cursors):
+    if pathname != "/transacciones": return no_update, no_update, no_update, no_update
+    uid = dm.get_uid()
+    if not uid: return [], 1, 0, None
+
+    page_size = page_size or PAGE_SIZE
+    # Cambió el orden, el filtro o los datos: volvemos a la primera página
+    if "trans-data-table.page_current" not in (ctx.triggered_prop_ids or {}):
+        page_current = 0
+    page_current = page_current or 0
+
+    sort = (sort_by[0]['column_id'], sort_by[0]['direction']) if sort_by else None
+    filters = parse_filter_query(filter_query)
+
+    # Cursores (keyset) de las páginas ya vistas con este mismo orden/filtro/datos
+    signature = repr((sort, filter_query or '', refresh))
+    if not cursors or cursors.get('sig') != signature:
+        cursors = {'sig': signature, 'keys': {}}
+    after = cursors['keys'].get(str(page_current - 1)) if page_current > 0 else None
+
+    page = dm.get_transactions_page(
+        uid, page_size=page_size, offset=page_current * page_size,
+        sort_by=sort, filters=filters, after=tuple(after) if after else None
+    )
+
+    total = page['total']
+    page_count = max(1, -(-total // page_size))
+    if page_current >= page_count and total:
+        # La página pedida ya no existe (ej. se borraron filas): mostramos la última
+        page_current = page_count - 1
+        page = dm.get_transactions_page(uid, page_size=page_size, offset=page_current * page_size,
+                                        sort_by=sort, filters=filters)
+
+    if page['last_key'] is not None:
+        cursors['keys'][str(page_current)] = list(page['last_key'])
+    return format_table_rows(page['rows']), page_count, page_current, cursors
+
+
 # 3. CAPTURAR ID y ABRIR MODAL
 @callback(
     [Output('trans-viewing-id', 'data'),
@@ -603,7 +792,7 @@ def open_delete_modal(trigger_del, cancel_del):
 @callback(
     [Output('trans-edit-success', 'data'), 
      Output("trans-delete-modal", "is_open", allow_duplicate=True),
-     Output("trans-table-container", "children", allow_duplicate=True),
+     Output("trans-table-refresh", "data", allow_duplicate=True),
      Output("trans-feedback-toast", "is_open"),
      Output("trans-feedback-toast", "children"),
      Output("trans-feedback-toast", "icon")],
@@ -640,16 +829,16 @@ def handle_save_delete_flow(save_click, delete_click, trans_id, date, name, amou
         success, msg = dm.update_transaction(trans_id, date, final_name, amt, category, t_type, acc_id, subcat)
         
         if success: 
-            # 2. PASAR UID AL RECARGAR
-            return ts, False, generate_table(dm.get_transactions_df(uid)), *ui_helpers.mensaje_alerta_exito("success", msg)
+            # 2. LA TABLA RECARGA SU PÁGINA
+            return ts, False, ts, *ui_helpers.mensaje_alerta_exito("success", msg)
         else: 
             return no_update, no_update, no_update, *ui_helpers.mensaje_alerta_exito("danger", msg)
 
     if trig_id == "trans-btn-del-confirm":
         success, msg = dm.delete_transaction(trans_id)
         if success: 
-            # 3. PASAR UID AL RECARGAR
-            return ts, False, generate_table(dm.get_transactions_df(uid)), *ui_helpers.mensaje_alerta_exito("success", msg)
+            # 3. LA TABLA RECARGA SU PÁGINA
+            return ts, False, ts, *ui_helpers.mensaje_alerta_exito("success", msg)
         else: 
             return no_update, False, no_update, *ui_helpers.mensaje_alerta_exito("danger", msg)
 
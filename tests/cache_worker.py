@@ -0,0 +1,46 @@
+# tests/cache_worker.py
+"""
+Proceso "worker de gunicorn" para test_cache_sharing.py: caché configurado con
+build_cache_config() (el CACHE_DIR del entorno) y una función memoizada por
+usuario que cuenta cuántas veces se calculó de verdad.
+
+Lee un comando por línea en stdin y responde una línea JSON:
+    compute <uid>      -> {"value", "computed", "version"}
+    invalidate <uid>   -> {"version"}
+"""
+import json
+import sys
+
+from flask import Flask
+
+from backend import cache_deps
+from backend.extensions import cache, build_cache_config
+
+app = Flask(__name__)
+cache.init_app(app, config=build_cache_config())
+calls = []
+
+
+@cache_deps.user_cached('transactions')
+def expensive(user_id):
+    calls.append(user_id)
+    return f"valor-{user_id}-{len(calls)}"
+
+
+def main():
+    with app.app_context():
+        for line in sys.stdin:
+            command, uid = line.split()
+            reply = {}
+            if command == 'compute':
+                before = len(calls)
+                reply['value'] = expensive(uid)
+                reply['computed'] = len(calls) > before
+            elif command == 'invalidate':
+                cache_deps.invalidate(uid, 'transactions')
+            reply['version'] = cache_deps.table_versions(uid, ['transactions'])[0]
+            print(json.dumps(reply), flush=True)
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,203 @@
+# tests/conftest.py
+"""
+Configuración compartida de la suite.
+
+- Nunca se toca data/pivot.db ni el caché real: cada test que necesita base
+  o caché arma la suya en un directorio temporal.
+- Sin hilos de fondo (planificador de precios y snapshot diario apagados).
+- En proceso siempre se usa SQLite (DATABASE_URL se ignora). Lo que corre
+  contra Postgres usa el fixture pg_url: TEST_DATABASE_URL (ej. un service
+  container en CI) o, si no, un servidor local de `pgserver`; sin ninguno de
+  los dos esos tests se saltan.
+"""
+import os
+import subprocess
+import sys
+import threading
+import uuid
+from collections import Counter
+
+import pytest
+
+ROOT = os.path.dirname(os.path.dirname(os.path.abspath(__file__)))
+
+os.environ.setdefault("FLASK_SECRET_KEY", "test")
+os.environ["SNAPSHOT_JOB"] = "off"
+os.environ["MARKET_SCHEDULER"] = "off"
+os.environ.pop("DATABASE_URL", None)
+for _var in ("CACHE_TYPE", "CACHE_REDIS_URL", "REDIS_URL"):
+    os.environ.pop(_var, None)
+
+
+def subprocess_env(**overrides):
+    """Entorno para un proceso hijo que importa el código del repo (None = quitar la variable)."""
+    env = {**os.environ, "PYTHONPATH": ROOT, **overrides}
+    return {k: v for k, v in env.items() if v is not None}
+
+
+def migrate(workdir, database_url=None):
+    """
+    Aplica las migraciones en un proceso hijo (python -m backend.migrations) con cwd=workdir:
+    SQLite en workdir/data/pivot.db o, con database_url, esa base Postgres.
+    Retorna la ruta del archivo SQLite (o None).
+    """
+    os.makedirs(os.path.join(workdir, "data"), exist_ok=True)
+    result = subprocess.run([sys.executable, "-m", "backend.migrations"], cwd=workdir, capture_output=True,
+                            text=True, env=subprocess_env(DATABASE_URL=database_url), timeout=300)
+    assert result.returncode == 0, result.stdout + result.stderr
+    return None if database_url else os.path.join(workdir, "data", "pivot.db")
+
+
+@pytest.fixture(scope="session")
+def pg_url(tmp_path_factory):
+    """URL de una base Postgres vacía para la sesión de tests."""
+    url = os.getenv("TEST_DATABASE_URL")
+    if url:
+        yield url
+        return
+    pgserver = pytest.importorskip("pgserver", reason="Sin TEST_DATABASE_URL ni pgserver instalado")
+    server = pgserver.get_server(str(tmp_path_factory.mktemp("pg")), cleanup_mode="stop")
+    try:
+        yield server.get_uri()
+    finally:
+        server.cleanup()
+
+
+@pytest.fixture(scope="session")
+def server(tmp_path_factory):
+    """
+    La app real (app.py + páginas) sobre una base y un caché temporales.
+    get_connection() usa data/pivot.db relativo: el cwd queda en el directorio
+    temporal toda la sesión (una sola base por sesión).
+    """
+    workdir = tmp_path_factory.mktemp("app")
+    migrate(str(workdir))
+    os.environ["CACHE_DIR"] = str(workdir / "data" / "cache")
+    previous = os.getcwd()
+    os.chdir(workdir)
+    try:
+        import index  # noqa: F401  (registra las páginas y sus callbacks)
+        from app import server
+        yield server
+    finally:
+        from backend import db_pool
+        db_pool.close_thread_connections()
+        os.chdir(previous)
+
+
+def user_id_by_name(username):
+    import backend.data_manager as dm
+    conn = dm.get_connection()
+    try:
+        return conn.execute("SELECT id FROM users WHERE username = ?", (username,)).fetchone()[0]
+    finally:
+        conn.close()
+
+
+@pytest.fixture
+def user(server):
+    """Usuario nuevo, logueado en un request de prueba mientras dura el test. Retorna su id."""
+    import backend.data_manager as dm
+    from flask_login import login_user
+    from backend.models import get_user_by_id
+
+    username = f"test-{uuid.uuid4().hex[:8]}"
+    ok, msg = dm.register_user(username, "secreto123", f"{username}@test.local")
+    assert ok, msg
+    uid = user_id_by_name(username)
+    with server.test_request_context('/'):
+        login_user(get_user_by_id(uid))
+        yield uid
+
+
+class FinnhubError(Exception):
+    """Error de la API con status HTTP (como finnhub.FinnhubAPIException)."""
+
+    def __init__(self, status_code):
+        super().__init__(f"status {status_code}")
+        self.status_code = status_code
+
+
+class FakeFinnhub:
+    """
+    Cliente Finnhub falso (sin red). calls cuenta las llamadas por (método, ticker);
+    fail = {(método, ticker): [status, ...]} lanza esos errores en orden antes de responder.
+    """
+
+    def __init__(self, fail=None):
+        self.calls = Counter()
+        self.candle_ranges = []
+        self.fail = {k: list(v) for k, v in (fail or {}).items()}
+        self._lock = threading.Lock()
+
+    def _hit(self, method, ticker):
+        with self._lock:
+            self.calls[(method, ticker)] += 1
+            pending = self.fail.get((method, ticker))
+            if pending:
+                raise FinnhubError(pending.pop(0))
+
+    def total(self, method=None):
+        return sum(n for (m, _), n in self.calls.items() if method in (None, m))
+
+    def quote(self, ticker):
+        self._hit('quote', ticker)
+        return {'c': 100.0, 'd': 1.0, 'dp': 1.0, 'h': 101.0, 'l': 99.0}
+
+    def company_profile2(self, symbol):
+        self._hit('company_profile2', symbol)
+        return {'name': f"{symbol} Inc", 'marketCapitalization': 1000, 'finnhubIndustry': 'Tech',
+                'country': 'US', 'currency': 'USD'}
+
+    def company_basic_financials(self, ticker, metric):
+        self._hit('company_basic_financials', ticker)
+        return {'metric': {'52WeekHigh': 120, '52WeekLow': 80, 'peBasicExclExtraTTM': 20,
+                           'dividendYieldIndicatedAnnual': 1.5, 'beta': 1.1}}
+
+    def company_news(self, ticker, _from, to):
+        self._hit('company_news', ticker)
+        return [{'headline': f"{ticker} sube"}]
+
+    def stock_candles(self, ticker, resolution, frm, to):
+        """Una vela diaria por cada 86400 s del tramo pedido."""
+        self._hit('stock_candles', ticker)
+        self.candle_ranges.append((frm, to))
+        ts = list(range(frm - frm % 86400, to + 1, 86400))
+        ts = [t for t in ts if frm <= t <= to]
+        if not ts:
+            return {'s': 'no_data'}
+        return {'s': 'ok', 't': ts, 'o': [1.0] * len(ts), 'h': [2.0] * len(ts), 'l': [0.5] * len(ts),
+                'c': [1.5] * len(ts), 'v': [10] * len(ts)}
+
+
+@pytest.fixture
+def finnhub(server, monkeypatch):
+    """FakeFinnhub como cliente del motor de mercado, sin cuota ni esperas entre reintentos."""
+    from backend import market_data
+
+    client = FakeFinnhub()
+    monkeypatch.setattr(market_data, "_client", client)
+    monkeypatch.setattr(market_data, "_limiter", market_data.TokenBucket(10000, 10000))
+    for group, (attempts, _) in list(market_data.RETRY_POLICY.items()):
+        monkeypatch.setitem(market_data.RETRY_POLICY, group, (attempts, 0.0))
+    return client
+
+
+class Worker:
+    """Proceso hijo con un protocolo de una línea por comando (ver tests/cache_worker.py)."""
+
+    def __init__(self, script, env, cwd=None):
+        self.proc = subprocess.Popen([sys.executable, script], stdin=subprocess.PIPE, stdout=subprocess.PIPE,
+                                     text=True, env=env, cwd=cwd or ROOT)
+
+    def send(self, line):
+        import json
+        self.proc.stdin.write(line + "\n")
+        self.proc.stdin.flush()
+        reply = self.proc.stdout.readline()
+        assert reply, f"El proceso hijo terminó (código {self.proc.poll()})"
+        return json.loads(reply)
+
+    def close(self):
+        self.proc.stdin.close()
+        self.proc.wait(timeout=20)
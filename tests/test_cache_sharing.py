@@ -0,0 +1,40 @@
+# tests/test_cache_sharing.py
+"""Dos procesos con el mismo FileSystemCache: la invalidación de uno llega al otro."""
+import os
+
+import pytest
+
+from conftest import ROOT, Worker, subprocess_env
+
+WORKER = os.path.join(ROOT, "tests", "cache_worker.py")
+
+
+@pytest.fixture
+def workers(tmp_path):
+    env = subprocess_env(CACHE_TYPE="FileSystemCache", CACHE_DIR=str(tmp_path / "cache"),
+                         CACHE_REDIS_URL=None, REDIS_URL=None)
+    pair = [Worker(WORKER, env, cwd=str(tmp_path)) for _ in range(2)]
+    yield pair
+    for worker in pair:
+        worker.close()
+
+
+def test_invalidate_in_one_process_bumps_version_in_the_other(workers):
+    reader, writer = workers
+
+    first = reader.send("compute 7")
+    assert first["computed"]
+    assert reader.send("compute 7") == {**first, "computed": False}
+    # El otro proceso lee la misma entrada: el caché es compartido, no por worker
+    assert writer.send("compute 7") == {**first, "computed": False}
+    other_user = reader.send("compute 8")
+
+    bumped = writer.send("invalidate 7")
+    assert bumped["version"] != first["version"]
+
+    again = reader.send("compute 7")
+    assert again["version"] == bumped["version"]
+    assert again["computed"] and again["value"] != first["value"]
+
+    # Solo se invalidó el usuario 7
+    assert reader.send("compute 8") == {**other_user, "computed": False}
@@ -0,0 +1,88 @@
+# tests/test_columnar_export.py
+"""Respaldo Parquet: exportar de un usuario e importar en otro deja posiciones y cuentas coherentes."""
+import uuid
+
+import pytest
+
+import backend.data_manager as dm
+from backend import columnar_export
+
+from conftest import user_id_by_name
+
+pytest.importorskip("pyarrow")
+
+
+@pytest.fixture
+def portfolio(user):
+    """Usuario con una cuenta, un gasto y una posición armada con compras y una venta."""
+    dm.add_account("Respaldo Débito", 'Debit', 500.0)
+    account_id = int(dm.get_accounts_by_category('Debit', user)['id'].iloc[0])
+    assert dm.add_transaction("2026-01-10", "Súper", 40.0, "Libres", 'Expense', account_id)[0]
+    assert dm.add_buy("RSPLD", 10, 100.0)[0]
+    assert dm.add_buy("RSPLD", 10, 200.0)[0]
+    assert dm.add_sale("RSPLD", 5, 250.0)[0]
+    return user
+
+
+def _other_user():
+    name = f"import-{uuid.uuid4().hex[:8]}"
+    assert dm.register_user(name, "secreto123", f"{name}@test.local")[0]
+    return user_id_by_name(name)
+
+
+def _import(path, user_id):
+    conn = dm.get_connection()
+    try:
+        summary = columnar_export.import_dataset(str(path), user_id, conn=conn)
+        conn.commit()
+        return summary
+    finally:
+        conn.close()
+
+
+def _position(user_id, ticker):
+    conn = dm.get_connection()
+    try:
+        return conn.execute("SELECT shares, avg_price, total_investment FROM investments WHERE user_id = ? AND ticker = ?",
+                            (user_id, ticker)).fetchone()
+    finally:
+        conn.close()
+
+
+def test_full_backup_imports_positions(portfolio, tmp_path):
+    path = tmp_path / "full.zip"
+    written = columnar_export.build_dataset(path, portfolio)
+    assert written['investments'] == 1
+
+    target = _other_user()
+    summary = _import(path, target)
+    assert summary['positions_created'] == 1
+    assert summary['investment_transactions']['inserted'] == 3
+    assert summary['transactions']['skipped'] == 0
+    assert _position(target, "RSPLD") == _position(portfolio, "RSPLD")
+
+    # Reimportar no duplica nada
+    again = _import(path, target)
+    assert again['positions_created'] == 0 and again['investment_transactions']['inserted'] == 0
+
+
+def test_trades_only_backup_rebuilds_positions(portfolio, tmp_path):
+    path = tmp_path / "trades.zip"
+    columnar_export.build_dataset(path, portfolio, tables=['investment_transactions'])
+
+    target = _other_user()
+    summary = _import(path, target)
+    assert summary['positions_created'] == 1
+    shares, avg_price, total = _position(target, "RSPLD")
+    assert shares == pytest.approx(15)
+    assert avg_price == pytest.approx(150.0)
+    assert total == pytest.approx(15 * 150.0)
+
+
+def test_transactions_without_their_account_are_reported(portfolio, tmp_path):
+    path = tmp_path / "tx.zip"
+    columnar_export.build_dataset(path, portfolio, tables=['transactions'])
+
+    summary = _import(path, _other_user())
+    assert summary['transactions']['inserted'] == 0
+    assert summary['transactions']['skipped'] == 1
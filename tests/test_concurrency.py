@@ -0,0 +1,108 @@
+# tests/test_concurrency.py
+"""
+Escrituras concurrentes sobre las mismas filas (ver backend/concurrency.py):
+varios hilos, cada uno con su request logueado, contra la misma tarjeta,
+la misma cuenta de origen y la misma posición. Se conserva el dinero, ninguna
+actualización se pierde y el libro de saldos queda sin diferencias.
+"""
+import random
+from concurrent.futures import ThreadPoolExecutor
+from datetime import date
+
+import pytest
+
+import backend.data_manager as dm
+from backend import balance_ledger, db_pool
+
+THREADS = 16
+
+
+@pytest.fixture
+def hammer(server, user):
+    """Corre jobs (callables sin argumentos que retornan (ok, msg)) repartidos en THREADS hilos."""
+    from flask_login import login_user
+    from backend.models import get_user_by_id
+
+    def run(chunk):
+        try:
+            with server.test_request_context('/'):
+                login_user(get_user_by_id(user))
+                return [job() for job in chunk]
+        finally:
+            db_pool.close_thread_connections()
+
+    def go(jobs):
+        chunks = [jobs[i::THREADS] for i in range(THREADS)]
+        with ThreadPoolExecutor(THREADS) as pool:
+            return [res for part in pool.map(run, chunks) for res in part]
+    return go
+
+
+def _accounts(user_id):
+    conn = dm.get_connection()
+    try:
+        return dict(conn.execute("SELECT name, id FROM accounts WHERE user_id = ?", (user_id,)).fetchall())
+    finally:
+        conn.close()
+
+
+def _balance(account_id):
+    conn = dm.get_connection()
+    try:
+        return conn.execute("SELECT current_balance FROM accounts WHERE id = ?", (account_id,)).fetchone()[0]
+    finally:
+        conn.close()
+
+
+def _assert_no_drift(user_id):
+    conn = dm.get_connection()
+    try:
+        drift = balance_ledger.verify(conn, [user_id])
+    finally:
+        conn.close()
+    assert drift.empty, drift.to_dict('records')
+
+
+def test_card_limit_under_concurrent_expenses(user, hammer):
+    dm.add_account("Stress Tarjeta", 'Credit', 0.0, credit_limit=100.0)
+    card = _accounts(user)["Stress Tarjeta"]
+    today = date.today().isoformat()
+
+    # 100 / 7 -> solo caben 14 gastos
+    res = hammer([lambda: dm.add_transaction(today, "Stress", 7.0, "Libres", 'Expense', card)] * 60)
+    assert sum(ok for ok, _ in res) == 14
+    assert _balance(card) == pytest.approx(98.0)
+    _assert_no_drift(user)
+
+
+def test_transfers_conserve_money(user, hammer):
+    dm.add_account("Stress Origen", 'Debit', 100.0)
+    dm.add_account("Stress Destino", 'Debit', 0.0)
+    accounts = _accounts(user)
+    src, dst = accounts["Stress Origen"], accounts["Stress Destino"]
+    today = date.today().isoformat()
+
+    # 100 / 3 -> caben 33 transferencias y el total se conserva
+    res = hammer([lambda: dm.add_transfer(today, "-", 3.0, src, dst)] * 60)
+    assert sum(ok for ok, _ in res) == 33
+    assert _balance(src) >= 0
+    assert _balance(src) + _balance(dst) == pytest.approx(100.0)
+    _assert_no_drift(user)
+
+
+def test_position_has_no_lost_updates(user, hammer):
+    assert dm.add_stock("STRSS", 20, 2000.0)[0]
+    jobs = ([lambda p=p: dm.add_buy("STRSS", 1, float(p)) for p in range(100, 140)]
+            + [lambda: dm.add_sale("STRSS", 1, 150.0)] * 20)
+    random.shuffle(jobs)
+
+    res = hammer(jobs)
+    assert [msg for ok, msg in res if not ok] == []
+    conn = dm.get_connection()
+    try:
+        shares, = conn.execute("SELECT shares FROM investments WHERE ticker = 'STRSS' AND user_id = ?",
+                               (user,)).fetchone()
+    finally:
+        conn.close()
+    assert shares == pytest.approx(40)
+    _assert_no_drift(user)
@@ -0,0 +1,29 @@
+# tests/test_dashboard_panels.py
+"""Paneles del dashboard memoizados por tabla: cada escritura recalcula los paneles que leen esa tabla."""
+import backend.data_manager as dm
+from pages.dashboard import credit_panel
+
+
+def test_credit_panel_recomputes_after_installment_writes(user, monkeypatch):
+    calls = []
+    real = dm.get_credit_summary_data
+    monkeypatch.setattr(dm, "get_credit_summary_data", lambda uid: calls.append(uid) or real(uid))
+
+    dm.add_account("Tarjeta Panel", 'Credit', 0.0, credit_limit=500.0)
+    account_id = int(dm.get_accounts_by_category('Credit', user)['id'].iloc[0])
+    credit_panel(user)
+    credit_panel(user)
+    assert len(calls) == 1  # la segunda lectura sale del caché
+
+    assert dm.add_installment(account_id, "TV", 300.0, 0.0, 6, 0, 15)[0]
+    credit_panel(user)
+    assert len(calls) == 2
+
+    installment_id = int(dm.get_installments(account_id)['id'].iloc[0])
+    assert dm.update_installment(installment_id, "TV", 360.0, 0.0, 6, 1, 15)[0]
+    credit_panel(user)
+    assert len(calls) == 3
+
+    assert dm.delete_installment(installment_id)[0]
+    credit_panel(user)
+    assert len(calls) == 4
@@ -0,0 +1,71 @@
+# tests/test_db_pool.py
+"""on_commit: lo encolado por una escritura anidada corre recién tras el commit real del caller externo."""
+import pytest
+
+from backend import db_pool
+
+
+@pytest.fixture
+def db(tmp_path):
+    path = str(tmp_path / "pool.db")
+    conn = db_pool.get_sqlite_connection(path)
+    conn.execute("CREATE TABLE t (v INTEGER)")
+    conn.commit()
+    conn.close()
+    yield path
+    db_pool.close_thread_connections()
+
+
+def _nested_write(path, calls):
+    """Como un helper de data_manager: escribe, confirma y avisa (commit diferido si está anidado)."""
+    conn = db_pool.get_sqlite_connection(path)
+    try:
+        conn.execute("INSERT INTO t (v) VALUES (1)")
+        conn.commit()
+        db_pool.on_commit(lambda: calls.append(conn.in_transaction))
+    finally:
+        conn.close()
+
+
+def test_runs_immediately_without_outer_unit_of_work(db):
+    calls = []
+    _nested_write(db, calls)
+    assert calls == [False]
+
+
+def test_nested_write_waits_for_outer_commit(db):
+    calls = []
+    outer = db_pool.get_sqlite_connection(db)
+    try:
+        _nested_write(db, calls)
+        assert calls == []  # el commit del helper quedó diferido
+        outer.execute("INSERT INTO t (v) VALUES (2)")
+        outer.commit()
+        assert calls == [False]  # corrió con la transacción ya confirmada
+    finally:
+        outer.close()
+
+
+def test_deferred_commit_flushes_when_outer_releases(db):
+    calls = []
+    outer = db_pool.get_sqlite_connection(db)
+    _nested_write(db, calls)
+    assert calls == []
+    outer.close()  # el externo no llamó commit, pero el anidado sí: se confirma al soltar
+    assert calls == [False]
+
+
+def test_rollback_discards_queued(db):
+    calls = []
+    outer = db_pool.get_sqlite_connection(db)
+    try:
+        _nested_write(db, calls)
+        outer.rollback()
+    finally:
+        outer.close()
+    assert calls == []
+    conn = db_pool.get_sqlite_connection(db)
+    try:
+        assert conn.execute("SELECT COUNT(*) FROM t").fetchone()[0] == 0
+    finally:
+        conn.close()
@@ -0,0 +1,51 @@
+# tests/test_ledger_history.py
+"""Patrimonio reconstruido: la lectura no escribe; rebuild() completa ledger_daily con los mismos valores."""
+import sqlite3
+from datetime import date, timedelta
+
+import numpy as np
+
+import backend.data_manager as dm
+from backend import ledger_history
+
+
+def _ledger_rows(user_id):
+    conn = dm.get_connection()
+    try:
+        return conn.execute("SELECT COUNT(*) FROM ledger_daily WHERE user_id = ?", (user_id,)).fetchone()[0]
+    finally:
+        conn.close()
+
+
+def test_read_path_is_write_free_and_rebuild_fills_cache(user):
+    dm.add_account("Libro Débito", 'Debit', 1000.0)
+    account_id = int(dm.get_accounts_by_category('Debit', user)['id'].iloc[0])
+    for days_ago, amount in ((20, 50.0), (10, 25.0), (3, 5.0)):
+        day = (date.today() - timedelta(days=days_ago)).isoformat()
+        assert dm.add_transaction(day, "Gasto", amount, "Libres", 'Expense', account_id)[0]
+
+    today = date.today().toordinal()
+    lo, hi = today - 30, today
+
+    # Una conexión de solo lectura: cualquier escritura en la lectura fallaría
+    readonly = sqlite3.connect("file:data/pivot.db?mode=ro", uri=True)
+    try:
+        before = ledger_history.networth_values(user, lo, hi, conn=readonly)
+        assert ledger_history.daily_networth(user, conn=readonly)['net_worth'].iloc[-1] == before[-1]
+    finally:
+        readonly.close()
+    assert _ledger_rows(user) == 0
+
+    written = ledger_history.rebuild(user)
+    assert written > 0 and _ledger_rows(user) == written
+    assert ledger_history.rebuild(user) == 0  # ya estaba al día
+
+    after = ledger_history.networth_values(user, lo, hi)
+    np.testing.assert_allclose(after, before)
+    assert after[-1] == 1000.0 - 80.0
+
+    # Un movimiento viejo descarta los días desde su fecha y el valor sigue cuadrando sin rebuild
+    assert dm.add_transaction((date.today() - timedelta(days=15)).isoformat(), "Gasto", 100.0, "Libres",
+                              'Expense', account_id)[0]
+    assert ledger_history.networth_values(user, lo, hi)[-1] == 1000.0 - 180.0
+    assert _ledger_rows(user) < written
@@ -0,0 +1,201 @@
+# tests/test_market_data.py
+"""Motor de datos de mercado con un cliente Finnhub falso: refresco en paralelo, reintentos y UPSERT."""
+import time
+import uuid
+from datetime import datetime, timedelta, timezone
+
+import pytest
+
+import backend.data_manager as dm
+from backend import market_data
+from backend.market_data import ALL_GROUPS, GROUP_STAMP, METRICS, NEWS, PROFILE, QUOTE, TS_FORMAT
+
+NOW = datetime(2026, 3, 2, 12, 0, tzinfo=timezone.utc)
+
+
+def _tickers(n):
+    """Tickers nuevos: market_cache es global y la base se comparte en la sesión."""
+    return [f"T{uuid.uuid4().hex[:6].upper()}" for _ in range(n)]
+
+
+@pytest.fixture
+def conn(server):
+    conn = dm.get_connection()
+    yield conn
+    conn.close()
+
+
+def _row(conn, ticker, *cols):
+    return conn.execute(f"SELECT {', '.join(cols)} FROM market_cache WHERE ticker = ?", (ticker,)).fetchone()
+
+
+def test_token_bucket_waits_when_empty():
+    bucket = market_data.TokenBucket(rate=20, capacity=2)
+    start = time.monotonic()
+    bucket.acquire()
+    bucket.acquire()
+    assert time.monotonic() - start < 0.04
+    bucket.acquire()  # sin tokens: espera ~1/rate
+    assert time.monotonic() - start >= 0.04
+
+
+def test_cold_refresh_writes_every_group(finnhub, conn):
+    tickers = _tickers(3)
+    res = market_data.refresh_stale(tickers, conn=conn)
+    assert sorted(res['updated']) == sorted(tickers) and res['errors'] == {}
+    assert finnhub.total() == len(tickers) * len(ALL_GROUPS)
+
+    stamps = [GROUP_STAMP[g] for g in ALL_GROUPS]
+    for t in tickers:
+        price, name, pe, news, *marks = _row(conn, t, 'price', 'company_name', 'pe_ratio', 'news', *stamps)
+        assert (price, name, pe) == (100.0, f"{t} Inc", 20)
+        assert t in news
+        assert all(marks)
+
+    # Todo fresco: el segundo refresco no llama a la API
+    again = market_data.refresh_stale(tickers, conn=conn)
+    assert again['updated'] == [] and again['errors'] == {}
+    assert finnhub.total() == len(tickers) * len(ALL_GROUPS)
+
+
+def test_rate_limited_quote_is_retried(finnhub, conn):
+    t, = _tickers(1)
+    finnhub.fail[('quote', t)] = [429, 503]
+    res = market_data.refresh_tickers([t], groups=(QUOTE,), conn=conn)
+    assert res['updated'] == [t]
+    assert finnhub.calls[('quote', t)] == 3
+    assert _row(conn, t, 'price') == (100.0,)
+
+
+def test_forbidden_group_is_stamped_without_retry(finnhub, conn):
+    t, = _tickers(1)
+    finnhub.fail[('company_profile2', t)] = [403, 403]
+    res = market_data.refresh_stale([t], conn=conn)
+    assert res['updated'] == [t]
+    assert finnhub.calls[('company_profile2', t)] == 1
+    name, stamp = _row(conn, t, 'company_name', GROUP_STAMP[PROFILE])
+    assert name is None and stamp is not None
+
+    # Marcado como fresco: no se vuelve a pedir hasta que venza su TTL
+    market_data.refresh_stale([t], conn=conn)
+    assert finnhub.calls[('company_profile2', t)] == 1
+
+
+def test_invalid_ticker_quote_is_not_retried(finnhub, conn):
+    t, = _tickers(1)
+    finnhub.fail[('quote', t)] = [404]
+    res = market_data.refresh_tickers([t], groups=(QUOTE,), conn=conn)
+    assert list(res['errors']) == [t] and res['updated'] == []
+    assert finnhub.calls[('quote', t)] == 1
+
+
+def test_failed_upsert_rolls_back(server, conn):
+    ok, bad = _tickers(2)
+    fetched = {
+        ok: {QUOTE: (10.0, 0.1, 1.0, 11.0, 9.0)},
+        bad: {QUOTE: (10.0, 0.1, 1.0, 11.0, 9.0), PROFILE: ('Falta', 'columnas')},  # forma inválida
+    }
+    with pytest.raises(Exception):
+        market_data._upsert_rows(conn, fetched)
+    assert _row(conn, ok, 'price') is None  # el primer lote no quedó a medias
+
+
+# --- Planificación por grupo (stale_groups) ---
+
+def _ago(**delta):
+    return NOW - timedelta(**delta)
+
+
+# quote vencida (TTL 5 min), profile fresco (1 día), metrics vencida, news nunca bajada
+STAMPS = {QUOTE: _ago(minutes=10), PROFILE: _ago(hours=1), METRICS: _ago(days=2), NEWS: None}
+FRESH = {QUOTE: _ago(seconds=30), PROFILE: _ago(hours=1), METRICS: _ago(hours=1), NEWS: _ago(minutes=5)}
+
+
+class _PostgresRows:
+    """Conexión mínima que entrega las marcas como datetime, igual que psycopg2."""
+
+    def __init__(self, rows):
+        self.rows = rows
+
+    def cursor(self):
+        return self
+
+    def execute(self, sql, params):
+        pass
+
+    def fetchall(self):
+        return self.rows
+
+
+def _insert_stamps(conn, ticker, stamps):
+    cols = [GROUP_STAMP[g] for g in stamps]
+    values = [s.strftime(TS_FORMAT) if s else None for s in stamps.values()]
+    conn.execute(f"INSERT INTO market_cache (ticker, {', '.join(cols)}) VALUES (?, {', '.join('?' * len(cols))})",
+                 [ticker] + values)
+    conn.commit()
+
+
+def test_stale_groups_with_sqlite_text_stamps(server, conn):
+    old, fresh, missing = _tickers(3)
+    _insert_stamps(conn, old, STAMPS)
+    _insert_stamps(conn, fresh, FRESH)
+
+    plan = market_data.stale_groups(conn, [old, fresh, missing], now=NOW)
+    assert plan == {old: (QUOTE, METRICS, NEWS), missing: ALL_GROUPS}
+
+    forced = market_data.stale_groups(conn, [old, fresh], force=(PROFILE,), now=NOW)
+    assert forced == {old: ALL_GROUPS, fresh: (PROFILE,)}
+    assert market_data.stale_groups(conn, [fresh], groups=(QUOTE, NEWS), now=NOW) == {}
+
+
+def test_stale_groups_with_datetime_stamps():
+    # Postgres devuelve datetime (naive, con microsegundos) en vez de texto
+    as_pg = lambda stamps: tuple(s.replace(tzinfo=None, microsecond=123456) if s else None
+                                 for s in stamps.values())
+    conn = _PostgresRows([('OLD',) + as_pg(STAMPS), ('FRESH',) + as_pg(FRESH)])
+
+    plan = market_data.stale_groups(conn, ['OLD', 'FRESH'], now=NOW)
+    assert plan == {'OLD': (QUOTE, METRICS, NEWS)}
+    assert market_data.stale_groups(conn, ['OLD', 'FRESH'], force=(QUOTE,), now=NOW) == {
+        'OLD': (QUOTE, METRICS, NEWS), 'FRESH': (QUOTE,)}
+
+
+# --- Velas (price_history) ---
+
+DAY = 86400
+END = 1_767_225_600  # 2026-01-01 UTC
+YEAR = 365 * DAY
+
+
+def test_candles_ask_only_the_missing_range(finnhub, conn):
+    t, = _tickers(1)
+    one_year = market_data.get_candles(t, 'D', END - YEAR, END, conn=conn)
+    assert finnhub.candle_ranges == [(END - YEAR, END)]
+    assert len(one_year) == 366
+
+    # 1Y -> 5Y: consulta local + una sola llamada por la cabeza que falta
+    five_years = market_data.get_candles(t, 'D', END - 5 * YEAR, END, conn=conn)
+    assert finnhub.candle_ranges[1:] == [(END - 5 * YEAR, END - YEAR)]
+    assert len(five_years) == 5 * 365 + 1
+    assert five_years['ts'].is_monotonic_increasing and five_years['ts'].is_unique
+
+    # Ya cubierto: cero llamadas
+    market_data.get_candles(t, 'D', END - 5 * YEAR, END, conn=conn)
+    assert finnhub.total('stock_candles') == 2
+
+
+def test_candles_tail_is_refetched_after_ttl(finnhub, conn):
+    t, = _tickers(1)
+    market_data.get_candles(t, 'D', END - YEAR, END, conn=conn)
+    later = END + 2 * DAY
+
+    # La cola se pidió hace nada: todavía no se vuelve a pedir
+    assert len(market_data.get_candles(t, 'D', END - YEAR, later, conn=conn)) == 366
+    assert finnhub.total('stock_candles') == 1
+
+    conn.execute("UPDATE price_history_coverage SET fetched_at = fetched_at - ? WHERE ticker = ?",
+                 (market_data.CANDLE_TTL['D'], t))
+    conn.commit()
+    df = market_data.get_candles(t, 'D', END - YEAR, later, conn=conn)
+    assert finnhub.candle_ranges[1:] == [(END, later)]
+    assert len(df) == 368
@@ -0,0 +1,61 @@
+# tests/test_market_scheduler.py
+"""Planificador de mercado: un ciclo a mano (run_cycle) con el cliente Finnhub falso."""
+import time
+import uuid
+
+import pytest
+
+import backend.data_manager as dm
+from backend import market_data, market_scheduler
+
+
+@pytest.fixture
+def scheduler(user, finnhub, monkeypatch):
+    """Sin fallos previos ni pedidos pendientes de otros tests."""
+    monkeypatch.setattr(market_scheduler, "_failed", {})
+    monkeypatch.setattr(market_scheduler, "is_running", lambda: True)
+    monkeypatch.setattr(dm, "finnhub_client", finnhub)
+    market_scheduler.cache.delete(market_scheduler.REQUEST_KEY)
+    return finnhub
+
+
+def _ticker():
+    t = f"S{uuid.uuid4().hex[:6].upper()}"
+    assert dm.add_stock(t, 1, 100.0)[0]
+    return t
+
+
+def test_forced_request_is_served(scheduler):
+    t = _ticker()
+    market_scheduler.run_cycle()
+    quotes = scheduler.calls[('quote', t)]
+    assert quotes == 1
+
+    # El botón "Actualizar" no espera: deja el pedido y la página consulta después
+    ok, _, pending = dm.manual_price_refresh()
+    assert ok and pending
+    assert market_scheduler.finished_refresh(pending) is None
+    assert dm.price_refresh_result(pending) is None
+
+    status = market_scheduler.run_cycle()
+    assert scheduler.calls[('quote', t)] == quotes + 1  # la cotización estaba fresca, pero se pidió
+    assert status['request_at'] == pending and t in status['updated_tickers']
+    assert market_scheduler.finished_refresh(pending) == status
+    ok, msg = dm.price_refresh_result(pending)
+    assert ok, msg
+
+
+def test_failed_ticker_waits_for_quote_ttl(scheduler):
+    bad = _ticker()
+    scheduler.fail[('quote', bad)] = [404] * 3
+    now = time.time()
+
+    status = market_scheduler.run_cycle(now=now)
+    assert bad in status['errors']
+    assert scheduler.calls[('quote', bad)] == 1
+
+    market_scheduler.run_cycle(now=now + 10)
+    assert scheduler.calls[('quote', bad)] == 1
+
+    market_scheduler.run_cycle(now=now + market_data.GROUP_TTL[market_data.QUOTE])
+    assert scheduler.calls[('quote', bad)] == 2
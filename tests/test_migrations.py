@@ -0,0 +1,65 @@
+# tests/test_migrations.py
+"""
+Migraciones sobre una base vacía: el esquema queda al día, reaplicarlas no hace
+nada y cada consulta caliente usa su índice (EXPLAIN QUERY PLAN de SQLite).
+"""
+import sqlite3
+import subprocess
+import sys
+
+import pytest
+
+from backend.migrations import HOT_QUERIES, MIGRATIONS, check_hot_query_indexes
+
+from conftest import migrate, subprocess_env
+
+
+@pytest.fixture(scope="module")
+def workdir(tmp_path_factory):
+    path = str(tmp_path_factory.mktemp("migrations"))
+    migrate(path)
+    return path
+
+
+@pytest.fixture
+def conn(workdir):
+    conn = sqlite3.connect(f"{workdir}/data/pivot.db")
+    yield conn
+    conn.close()
+
+
+def test_all_migrations_applied(conn):
+    applied = [row[0] for row in conn.execute("SELECT version FROM schema_migrations ORDER BY version")]
+    assert applied == [version for version, _, _ in MIGRATIONS]
+
+
+def test_rerun_is_noop(workdir, conn):
+    before = conn.execute("SELECT COUNT(*) FROM schema_migrations").fetchone()[0]
+    migrate(workdir)
+    assert conn.execute("SELECT COUNT(*) FROM schema_migrations").fetchone()[0] == before
+
+
+@pytest.mark.parametrize("sql, n_params, index", HOT_QUERIES, ids=[q[2] for q in HOT_QUERIES])
+def test_hot_query_uses_index(conn, sql, n_params, index):
+    plan = " | ".join(str(row[-1]) for row in conn.execute("EXPLAIN QUERY PLAN " + sql, (None,) * n_params))
+    assert index in plan, plan
+
+
+def test_check_helper_and_cli_agree(workdir, conn):
+    assert check_hot_query_indexes(conn) == {}
+    result = subprocess.run([sys.executable, "-m", "backend.migrations", "--check"], cwd=workdir,
+                            capture_output=True, text=True, env=subprocess_env(DATABASE_URL=None))
+    assert result.returncode == 0, result.stdout + result.stderr
+
+
+def test_hot_query_indexes_exist_on_postgres(pg_url, tmp_path):
+    psycopg2 = pytest.importorskip("psycopg2")
+    migrate(str(tmp_path), database_url=pg_url)
+    conn = psycopg2.connect(pg_url)
+    try:
+        cursor = conn.cursor()
+        cursor.execute("SELECT indexname FROM pg_indexes WHERE schemaname = current_schema()")
+        existing = {row[0] for row in cursor.fetchall()}
+    finally:
+        conn.close()
+    assert {index for _, _, index in HOT_QUERIES} <= existing
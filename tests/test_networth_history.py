@@ -0,0 +1,82 @@
+# tests/test_networth_history.py
+"""Serie diaria de patrimonio: carga incremental, ventanas y reducción con LTTB."""
+from datetime import date, timedelta
+
+import numpy as np
+import pytest
+
+import backend.data_manager as dm
+from backend import networth_history
+from backend.cache_deps import invalidate
+
+TODAY = date.today()
+
+
+def _write(user_id, rows):
+    """Filas {días atrás: patrimonio} en historical_net_worth, como un snapshot (sube la versión)."""
+    conn = dm.get_connection()
+    try:
+        for days_ago, value in rows.items():
+            day = (TODAY - timedelta(days=days_ago)).isoformat()
+            conn.execute("DELETE FROM historical_net_worth WHERE user_id = ? AND date = ?", (user_id, day))
+            conn.execute("INSERT INTO historical_net_worth (user_id, date, net_worth) VALUES (?, ?, ?)",
+                         (user_id, day, value))
+        conn.commit()
+    finally:
+        conn.close()
+    invalidate(user_id, 'historical_net_worth')
+
+
+def test_incremental_series_equals_full_reload(user, monkeypatch):
+    _write(user, {30: 100.0, 25: 110.0, 20: 105.0})
+    first = networth_history.get_series(user)
+    assert first['last_row'] == (TODAY - timedelta(days=20)).toordinal()
+
+    reads = []
+    load_rows = networth_history._load_rows
+    monkeypatch.setattr(networth_history, "_load_rows",
+                        lambda conn, uid, since=None: reads.append(since) or load_rows(conn, uid, since))
+
+    # El último día cambia y llegan días nuevos: solo se relee desde last_row
+    _write(user, {20: 107.0, 10: 130.0, 5: 125.0})
+    incremental = networth_history.get_series(user)
+    assert reads == [first['last_row']]
+
+    networth_history.reset(user)
+    full = networth_history.get_series(user)
+    assert reads[-1] is None
+    assert (incremental['start'], incremental['last_row']) == (full['start'], full['last_row'])
+    np.testing.assert_array_equal(incremental['values'], full['values'])
+    np.testing.assert_array_equal(incremental['observed'], full['observed'])
+    assert full['values'][10] == 107.0 and full['values'][-1] == 125.0
+    assert full['observed'].sum() == 5
+
+
+def test_window_downsampled_keeps_endpoints(user):
+    _write(user, {d: 1000.0 + (d % 7) * 10 for d in range(1, 401)})
+    start, end = TODAY - timedelta(days=380), TODAY - timedelta(days=10)
+
+    full = networth_history.window(user, start, end)
+    assert len(full) == (end - start).days + 1
+
+    small = networth_history.window(user, start, end, max_points=50)
+    assert len(small) == 50
+    assert (small['date'].iloc[0], small['date'].iloc[-1]) == (start, end)
+    assert small['net_worth'].iloc[0] == full['net_worth'].iloc[0]
+    assert small['net_worth'].iloc[-1] == full['net_worth'].iloc[-1]
+
+
+def test_today_value_replaces_last_point(user):
+    _write(user, {2: 200.0, 0: 210.0})
+    df = networth_history.window(user, TODAY - timedelta(days=2), today_value=250.0)
+    assert df['date'].tolist() == [TODAY - timedelta(days=d) for d in (2, 1, 0)]
+    assert df['net_worth'].tolist() == [200.0, 200.0, 250.0]
+    assert df['net_change'].iloc[-1] == pytest.approx(50.0)
+
+
+def test_lttb_keeps_the_spike():
+    y = np.zeros(1000)
+    y[437] = 50.0
+    keep = networth_history.lttb(np.arange(1000), y, 20)
+    assert len(keep) == 20 and keep[0] == 0 and keep[-1] == 999
+    assert 437 in keep
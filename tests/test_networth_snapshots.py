@@ -0,0 +1,53 @@
+# tests/test_networth_snapshots.py
+"""Índice único (user_id, date) de historical_net_worth (migración 008): ningún escritor choca con él."""
+from datetime import date, timedelta
+
+import pandas as pd
+
+import backend.data_manager as dm
+from backend import networth_history, snapshot_job
+
+
+def _snapshots(user_id):
+    conn = dm.get_connection()
+    try:
+        return conn.execute("SELECT date, net_worth FROM historical_net_worth WHERE user_id = ? ORDER BY date",
+                            (user_id,)).fetchall()
+    finally:
+        conn.close()
+
+
+def test_batch_snapshot_twice_same_day_keeps_one_row(user):
+    dm.add_account("Snapshot Débito", 'Debit', 250.0)
+    today = date.today().isoformat()
+    assert user in snapshot_job.run_batch(user_ids=[user])
+    assert snapshot_job.run_batch(user_ids=[user]) == []  # sin cambios no escribe
+
+    dm.add_account("Snapshot Efectivo", 'Cash', 50.0)
+    assert snapshot_job.run_batch(user_ids=[user]) == [user]
+    assert _snapshots(user) == [(today, 300.0)]
+
+
+def test_import_historical_data_with_repeated_dates(user):
+    df = pd.DataFrame({'Date': ['2025-01-01', '2025-01-02', '2025-01-02', 'no-es-fecha'],
+                       'Net_Worth': [100, 110, 120, 5]})
+    ok, msg = dm.import_historical_data(df)
+    assert ok, msg
+    assert _snapshots(user) == [('2025-01-01', 100.0), ('2025-01-02', 120.0)]
+
+    # Reimportar reemplaza el historial (sin chocar con las filas que ya estaban)
+    ok, msg = dm.import_historical_data(df.iloc[:2])
+    assert ok, msg
+    assert _snapshots(user) == [('2025-01-01', 100.0), ('2025-01-02', 110.0)]
+
+
+def test_backfilled_past_day_reaches_cached_series(user):
+    dm.add_account("Backfill Débito", 'Debit', 120.0)
+    past = date.today() - timedelta(days=15)
+    assert snapshot_job.run_batch(day=date.today() - timedelta(days=20), user_ids=[user]) == [user]
+    assert snapshot_job.run_batch(user_ids=[user]) == [user]
+    assert networth_history.window(user, past, past)['net_worth'].tolist() == [120.0]  # queda en caché
+
+    dm.add_account("Backfill Efectivo", 'Cash', 380.0)
+    assert snapshot_job.run_batch(day=past, user_ids=[user]) == [user]
+    assert networth_history.window(user, past, past)['net_worth'].tolist() == [500.0]
@@ -0,0 +1,24 @@
+# tests/test_payment_calendar.py
+"""Calendario de pagos: el exigible de la tarjeta va solo en su próximo vencimiento."""
+from datetime import timedelta
+
+import pandas as pd
+
+import backend.data_manager as dm
+from backend import payment_calendar
+
+
+def test_card_payable_only_on_next_due(user):
+    dm.add_account("Calendario Tarjeta", 'Credit', 300.0, credit_limit=1000.0, payment_day=15, cutoff_day=1)
+    next_due = pd.Timestamp(payment_calendar.next_due(15))
+
+    events = payment_calendar.upcoming(user, kinds=['card_payment'])
+    assert len(events) > 1
+    first, later = events.iloc[0], events.iloc[1:]
+    assert first['date'] == next_due and first['amount'] == 300.0
+    assert later['amount'].isna().all()
+
+    # Una ventana que empieza después del próximo vencimiento no hereda la deuda de hoy
+    window = payment_calendar.upcoming(user, start=(next_due + timedelta(days=1)).date(), kinds=['card_payment'])
+    assert not window.empty
+    assert window['amount'].isna().all()
@@ -0,0 +1,85 @@
+# tests/test_report_export.py
+"""Exportación de reportes a Excel en segundo plano: rango de fechas, reporte vacío y descarga solo del dueño."""
+import time
+import uuid
+
+import openpyxl
+import pytest
+
+import backend.data_manager as dm
+from backend import report_export
+
+from conftest import user_id_by_name
+
+
+@pytest.fixture
+def report_dir(tmp_path, monkeypatch):
+    monkeypatch.setattr(report_export, "REPORT_DIR", tmp_path / "reports")
+    return tmp_path / "reports"
+
+
+@pytest.fixture
+def expenses(user):
+    """Usuario con un gasto por mes en enero, febrero y marzo de 2026."""
+    dm.add_account("Reporte Débito", 'Debit', 1000.0)
+    account_id = int(dm.get_accounts_by_category('Debit', user)['id'].iloc[0])
+    for day in ("2026-01-15", "2026-02-15", "2026-03-15"):
+        assert dm.add_transaction(day, f"Gasto {day}", 10.0, "Libres", 'Expense', account_id)[0]
+    return user
+
+
+def _wait(job_id, user_id, timeout=30):
+    deadline = time.time() + timeout
+    while time.time() < deadline:
+        status = report_export.get_status(job_id, user_id)
+        if status and status['state'] not in ('queued', 'running'):
+            return status
+        time.sleep(0.05)
+    raise AssertionError(f"El reporte {job_id} no terminó")
+
+
+def test_date_range_limits_rows(expenses, tmp_path):
+    path = tmp_path / "rango.xlsx"
+    written = report_export.build_report(path, expenses, ['transactions'], "2026-02-01", "2026-03-15")
+    assert written == {'Transacciones': 2}
+
+    sheet = openpyxl.load_workbook(path, read_only=True)['Transacciones']
+    rows = list(sheet.iter_rows(values_only=True))
+    header, body = rows[0], rows[1:]
+    dates = sorted(str(r[header.index('date')])[:10] for r in body)
+    assert dates == ["2026-02-15", "2026-03-15"]  # el último día entra completo
+    assert not path.with_suffix(".xlsx.part").exists()
+
+
+def test_empty_range_leaves_no_file(expenses, report_dir):
+    job_id = report_export.start_report(expenses, ['transactions'], "2020-01-01", "2020-12-31")
+    status = _wait(job_id, expenses)
+    assert status['state'] == 'empty'
+    assert list(report_dir.iterdir()) == []
+
+
+def test_download_only_for_owner(expenses, server, report_dir):
+    job_id = report_export.start_report(expenses, ['transactions'], "2026-01-01", "2026-12-31")
+    status = _wait(job_id, expenses)
+    assert status['state'] == 'done' and status['rows'] == 3
+
+    name = f"otro-{uuid.uuid4().hex[:8]}"
+    assert dm.register_user(name, "secreto123", f"{name}@test.local")[0]
+    other = user_id_by_name(name)
+    assert report_export.get_status(job_id, other) is None
+
+    client = server.test_client()
+
+    def download(uid=None):
+        if uid is not None:
+            with client.session_transaction() as session:
+                session['_user_id'] = str(uid)
+        # Contexto de app propio: si no, el request hereda el usuario logueado del fixture
+        with server.app_context():
+            return client.get(status['url'])
+
+    assert download().status_code == 401
+    assert download(other).status_code == 404
+    response = download(expenses)
+    assert response.status_code == 200 and response.data[:2] == b"PK"
+    response.close()
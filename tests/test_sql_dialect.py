@@ -0,0 +1,76 @@
+# tests/test_sql_dialect.py
+"""
+Cada consulta registrada con register_query se EJECUTA en SQLite y en Postgres
+sobre el esquema real (migraciones aplicadas a una base vacía), dentro de una
+transacción que se descarta.
+"""
+import sqlite3
+
+import pytest
+
+import backend.data_manager  # noqa: F401  (registra las consultas)
+from backend.sql_dialect import SQLITE, POSTGRES, count_placeholders, registered_queries, to_pyformat
+
+from conftest import migrate
+
+# Parámetros de ejemplo por consulta: una consulta nueva sin ejemplo hace fallar test_every_query_has_sample
+SAMPLE_PARAMS = {
+    'dashboard_metrics': (1, '2026-01', 1),
+    'transactions_all': (1,),
+    'transactions_range': (1, '2026-01-01', '2026-12-31'),
+    'monthly_summary': (1, 1),
+    'category_summary': (1, 1),
+    'category_breakdown': (1, 1),
+    'insert_user': ('dialect-test', 'hash', 'dialect@test.local', 'Dialect', '2026-01-01 00:00:00'),
+}
+
+QUERIES = sorted(registered_queries())
+
+
+@pytest.fixture(scope="module")
+def sqlite_conn(tmp_path_factory):
+    path = migrate(str(tmp_path_factory.mktemp("sqlite")))
+    conn = sqlite3.connect(path)
+    yield conn
+    conn.close()
+
+
+@pytest.fixture(scope="module")
+def pg_conn(pg_url, tmp_path_factory):
+    psycopg2 = pytest.importorskip("psycopg2")
+    migrate(str(tmp_path_factory.mktemp("pg-work")), database_url=pg_url)
+    conn = psycopg2.connect(pg_url)
+    yield conn
+    conn.close()
+
+
+def _execute(conn, sql, params):
+    cursor = conn.cursor()
+    try:
+        cursor.execute(sql, params)
+        return cursor.fetchall() if cursor.description else []
+    finally:
+        cursor.close()
+        conn.rollback()
+
+
+def test_every_query_has_sample():
+    assert set(QUERIES) == set(SAMPLE_PARAMS)
+
+
+@pytest.mark.parametrize("name", QUERIES)
+def test_runs_on_sqlite(sqlite_conn, name):
+    sql = registered_queries()[name].render(SQLITE)
+    params = SAMPLE_PARAMS[name]
+    assert count_placeholders(sql) == len(params)
+    _execute(sqlite_conn, sql, params)
+
+
+@pytest.mark.parametrize("name", QUERIES)
+def test_runs_on_postgres(pg_conn, name):
+    sql = registered_queries()[name].render(POSTGRES)
+    params = SAMPLE_PARAMS[name]
+    assert count_placeholders(sql) == len(params)
+    rows = _execute(pg_conn, to_pyformat(sql), params)
+    if name == 'insert_user':
+        assert len(rows) == 1  # RETURNING id (reemplaza a cursor.lastrowid)
@@ -0,0 +1,47 @@
+# tests/test_statement_import.py
+"""Montos de extractos bancarios: separadores de miles y decimales de cada formato."""
+import math
+
+import pandas as pd
+import pytest
+
+from backend.statement_import import normalize_chunk, parse_amounts
+
+
+def _parse(values):
+    return parse_amounts(pd.Series(values, dtype=object)).tolist()
+
+
+@pytest.mark.parametrize("raw, expected", [
+    ('1.234,56', 1234.56),
+    ('1,234.56', 1234.56),
+    ('1.234.567', 1234567.0),
+    ('1,234,567.8', 1234567.8),
+    ('12,5', 12.5),
+    ('12.50', 12.5),
+    ('1.234', 1234.0),   # un separador + 3 dígitos = miles
+    ('1,234', 1234.0),
+    ('0.125', 0.125),    # parte entera 0: decimal
+    ('$ -12', -12.0),
+    ('(12.00)', -12.0),
+    ('12-', -12.0),
+])
+def test_single_value(raw, expected):
+    assert _parse([raw]) == [expected]
+
+
+def test_ambiguous_value_follows_column_format():
+    # La columna usa punto decimal ('12.50'): '1.234' es uno coma dos tres cuatro
+    assert _parse(['1.234', '12.50']) == [1.234, 12.5]
+    # La columna usa coma decimal: el punto es de miles
+    assert _parse(['1.234', '12,50']) == [1234.0, 12.5]
+
+
+def test_invalid_values_are_nan():
+    assert all(math.isnan(v) for v in _parse(['', None, 'abc']))
+
+
+def test_normalize_chunk_thousands_amount():
+    chunk = pd.DataFrame({'date': ['05/01/2026', '06/01/2026'], 'amount': ['-1.234', '2.500'], 'name': ['Renta', 'Sueldo']})
+    out = normalize_chunk(chunk)
+    assert out['amount'].tolist() == [-1234.0, 2500.0]
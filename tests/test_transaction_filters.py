@@ -0,0 +1,60 @@
+# tests/test_transaction_filters.py
+"""Filtros de la tabla de transacciones: el texto buscado es literal (sin comodines de LIKE) en ambos dialectos."""
+import sqlite3
+
+import pytest
+
+from backend.data_manager import _transaction_filter_sql
+from backend.sql_dialect import to_pyformat
+
+NAMES = ["Descuento 50%", "Descuento 500", "pago_luz", "pagoXluz", "ruta\\casa", "ruta casa"]
+
+CASES = [
+    ([('name', 'contains', '50%')], ["Descuento 50%"]),
+    ([('name', 'contains', 'o_l')], ["pago_luz"]),
+    ([('name', 'contains', 'a\\c')], ["ruta\\casa"]),
+    ([('name', 'contains', 'PAGO')], ["pago_luz", "pagoXluz"]),
+    ([('date_display', 'datestartswith', '2026-0_')], []),
+    ([('date_display', 'datestartswith', '2026-01')], NAMES),
+]
+
+
+def _matching(conn, filters, translate=lambda sql: sql):
+    clauses, params = _transaction_filter_sql(filters)
+    sql = "SELECT t.name FROM transactions t WHERE " + " AND ".join(clauses) + " ORDER BY t.id"
+    cursor = conn.cursor()
+    cursor.execute(translate(sql), params)
+    return [row[0] for row in cursor.fetchall()]
+
+
+def _seed(cursor, placeholder):
+    cursor.execute("CREATE TEMPORARY TABLE transactions (id INTEGER PRIMARY KEY, name TEXT, date TEXT)")
+    for i, name in enumerate(NAMES, start=1):
+        cursor.execute(f"INSERT INTO transactions VALUES ({placeholder}, {placeholder}, '2026-01-15')", (i, name))
+
+
+@pytest.fixture(scope="module")
+def sqlite_conn():
+    conn = sqlite3.connect(":memory:")
+    _seed(conn.cursor(), "?")
+    yield conn
+    conn.close()
+
+
+@pytest.fixture(scope="module")
+def pg_conn(pg_url):
+    psycopg2 = pytest.importorskip("psycopg2")
+    conn = psycopg2.connect(pg_url)
+    _seed(conn.cursor(), "%s")
+    yield conn
+    conn.close()
+
+
+@pytest.mark.parametrize("filters, expected", CASES)
+def test_filters_on_sqlite(sqlite_conn, filters, expected):
+    assert _matching(sqlite_conn, filters) == expected
+
+
+@pytest.mark.parametrize("filters, expected", CASES)
+def test_filters_on_postgres(pg_conn, filters, expected):
+    assert _matching(pg_conn, filters, to_pyformat) == expected